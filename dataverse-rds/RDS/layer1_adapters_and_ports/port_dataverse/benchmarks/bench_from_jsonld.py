@@ -0,0 +1,96 @@
+"""Measures the latency of one framing call like in Util.from_jsonld.
+
+The old way parsed the frame file on every call and let pyld fetch the RO-Crate context
+with its requests document loader, which it did not keep between calls. Here the context
+is served by a local stub, which delays every response by --latency to stand in for
+w3id.org. The new way uses the bundled contexts and the cached frame, the 1.0 context,
+which is not bundled, is loaded from the stub once per process.
+
+    python benchmarks/bench_from_jsonld.py --calls 200 --latency 0.05
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(f"{os.getcwd()}/src")
+sys.path.append(f"{os.getcwd()}/tests")
+
+from pyld import jsonld
+
+from lib import jsonld_loader
+from lib.jsonld_loader import frame
+from stub_server import StubServer
+
+context_url = "https://w3id.org/ro/crate/1.0/context"
+
+crate = {
+    "@context": [context_url, {"@vocab": "https://schema.org/"}],
+    "@graph": [
+        {"@id": "ro-crate-metadata.json", "@type": "CreativeWork", "about": {"@id": "./"}},
+        {
+            "@id": "./",
+            "@type": "Dataset",
+            "name": "testtitle",
+            "description": "testdescription",
+            "datePublished": "2020-09-29",
+            "creator": [{"@id": "#alice"}, {"@id": "#bob"}],
+        },
+        {"@id": "#alice", "@type": "Person", "name": "Alice", "affiliation": {"@id": "#wwu"}},
+        {"@id": "#bob", "@type": "Person", "name": "Bob"},
+        {"@id": "#wwu", "@type": "Organization", "name": "WWU"},
+    ],
+}
+
+
+def measure(name, call, calls):
+    durations = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start)
+    print(
+        f"{name:>4}: median {statistics.median(durations) * 1000:.2f} ms, "
+        f"mean {statistics.mean(durations) * 1000:.2f} ms per call"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds until the remote context is served")
+    args = parser.parse_args()
+
+    # the terms of the published 1.1 context stand in for the 1.0 context
+    context = {"@context": jsonld_loader.document_loader("https://w3id.org/ro/crate/1.1/context")["document"]["@context"]}
+
+    def serve_context(request):
+        time.sleep(args.latency)
+        return 200, context
+
+    with StubServer() as stub:
+        stub.route("GET", "^/ro/crate/1.0/context$", serve_context)
+        remote = lambda document: json.loads(json.dumps(document).replace(context_url, f"{stub.url}/ro/crate/1.0/context"))
+        remote_crate = remote(crate)
+        loader = jsonld.requests_document_loader()
+        jsonld_loader.remote_loader = lambda url: loader(url.replace(context_url, f"{stub.url}/ro/crate/1.0/context"))
+
+        def old():
+            with open("src/lib/fdataverse.jsonld") as f:
+                remote_frame = remote(json.load(f))
+            return jsonld.frame(remote_crate, remote_frame, options={"documentLoader": loader})
+
+        def new():
+            return frame(crate, "fdataverse.jsonld")
+
+        assert old()["name"] == new()["name"]
+        print(f"{args.calls} calls, {args.latency * 1000:.0f} ms until the remote context is served")
+        measure("old", old, args.calls)
+        print(f"      {stub.count('GET') / (args.calls + 1):.0f} context requests per call")
+        measure("new", new, args.calls)
+
+
+if __name__ == "__main__":
+    main()
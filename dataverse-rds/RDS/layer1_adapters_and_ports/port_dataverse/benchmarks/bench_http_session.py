@@ -0,0 +1,84 @@
+"""Compares unpooled `requests.request` calls with the pooled session of lib.http_session.
+
+Runs against a local stub server, so the numbers show the connection setup cost only.
+Pass --certfile and --keyfile to serve TLS and include the handshake in the measurement.
+
+    python benchmarks/bench_http_session.py --requests 500
+"""
+import argparse
+import os
+import ssl
+import statistics
+import sys
+import time
+
+sys.path.append(f"{os.getcwd()}/src")
+sys.path.append(f"{os.getcwd()}/tests")
+
+import requests
+import urllib3
+from lib.http_session import create_session
+from stub_server import StubServer
+
+
+def measure(call, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    print(
+        f"{name:>10}: mean {statistics.mean(timings) * 1000:.3f} ms, "
+        f"median {statistics.median(timings) * 1000:.3f} ms, "
+        f"p95 {sorted(timings)[int(len(timings) * 0.95)] * 1000:.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--certfile")
+    parser.add_argument("--keyfile")
+    args = parser.parse_args()
+
+    with StubServer() as stub:
+        stub.route("GET", "^/api/datasets/", (200, {"status": "OK", "data": {}}))
+        url = f"{stub.url}/api/datasets/1"
+        verify = True
+
+        if args.certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(args.certfile, args.keyfile)
+            stub._server.socket = context.wrap_socket(stub._server.socket, server_side=True)
+            url = url.replace("http://", "https://")
+            verify = False
+            urllib3.disable_warnings()
+
+        session = create_session()
+        # warm up both paths
+        requests.request("GET", url, verify=verify)
+        session.get(url, verify=verify)
+
+        connections = stub.connections
+        unpooled = measure(lambda: requests.request("GET", url, verify=verify), args.requests)
+        unpooled_connections = stub.connections - connections
+
+        connections = stub.connections
+        pooled = measure(lambda: session.get(url, verify=verify), args.requests)
+        pooled_connections = stub.connections - connections
+
+    report("unpooled", unpooled)
+    report("pooled", pooled)
+    print(f"connections opened: unpooled {unpooled_connections}, pooled {pooled_connections}")
+    print(
+        "latency saved per request: "
+        f"{(statistics.mean(unpooled) - statistics.mean(pooled)) * 1000:.3f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Measures the logging overhead of one request like in Util.require_api_key and api/project/files.py.
+
+The old way builds f-strings with inspect.getframeinfo for every "Entering at" line and
+formats the whole request data, even if the record is dropped. The new way logs constant
+messages and lazy fields through lib.logs. Both write to os.devnull, so only the work in
+the process is measured. The old default level was DEBUG, the new one is INFO.
+
+    python benchmarks/bench_logging.py --requests 2000 --payload 100000
+"""
+import argparse
+import inspect
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(f"{os.getcwd()}/src")
+
+from lib.logs import configure, get_logger
+
+
+def measure(name, call, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    print(
+        f"{name:>14}: mean {statistics.mean(timings) * 1e6:.1f} us, "
+        f"median {statistics.median(timings) * 1e6:.1f} us per request"
+    )
+
+
+def old_config(level, stream):
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--payload", type=int, default=100000, help="size of the metadata in the request data")
+    parser.add_argument("--calls", type=int, default=8, help="functions with an entering line per request")
+    args = parser.parse_args()
+
+    req = {"userId": "port-dataverse://alice:secret", "filename": "data.csv", "metadata": "x" * args.payload}
+    project_id = "ZG9pOjEwLjUwNzIvRksyL0FCQw=="
+    old_log = logging.getLogger("bench.old")
+    new_log = get_logger("bench.new")
+
+    def old():
+        old_log.debug("got request data: {}".format(req))
+        old_log.debug(f"{req['userId']}, {req['userId'].split(':')[-1]}")
+        for _ in range(args.calls):
+            old_log.debug(f"Entering at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            old_log.debug(f"### project_id files post: {project_id}")
+
+    def new():
+        new_log.debug("got request data", data=req)
+        new_log.debug("found userId")
+        for _ in range(args.calls):
+            new_log.debug("Entering at api/project/files.py post")
+            new_log.debug("### project_id files post: %s", project_id)
+
+    print(f"{args.requests} requests, {args.payload} bytes of request data, {args.calls} entering lines")
+    with open(os.devnull, "w") as devnull:
+        for level in ("DEBUG", "INFO"):
+            old_config(level, devnull)
+            measure(f"old {level}", old, args.requests)
+        for level in ("DEBUG", "INFO"):
+            configure(level, levels="", handler=logging.StreamHandler(devnull))
+            measure(f"new {level}", new, args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Measures the time and the peak memory until the first byte of an uploaded file can be sent upstream.
+
+The old way is the one of Util.require_api_key before: request.get_json(force=True) on the
+multipart body, then request.form, which parses the whole body with werkzeug, before the
+file is read. The new way uses lib.request_data with the StreamingRequest, which reads only
+the fields in front of the file.
+
+    python benchmarks/bench_request_data.py --sizes 16 64 256
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.append(f"{os.getcwd()}/src")
+
+from flask import Flask, Request, request
+from werkzeug.test import EnvironBuilder
+
+from lib.request_data import StreamingRequest, user_id
+
+chunk_size = 1024 * 1024
+
+
+def old_user_id():
+    try:
+        req = request.get_json(force=True)
+    except Exception:
+        req = request.form.to_dict()
+    return req.get("userId")
+
+
+def first_byte(app, environ, find_user_id):
+    with app.request_context(dict(environ, **{"wsgi.input": io.BytesIO(environ["body"])})):
+        start = time.perf_counter()
+        assert find_user_id()
+        assert request.files["file"].read(chunk_size)
+        return time.perf_counter() - start
+
+
+def measure(name, app, environ, find_user_id, count):
+    timings = [first_byte(app, environ, find_user_id) for _ in range(count)]
+    tracemalloc.start()
+    first_byte(app, environ, find_user_id)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(
+        f"{name:>14}: mean {statistics.mean(timings) * 1e3:.2f} ms, "
+        f"median {statistics.median(timings) * 1e3:.2f} ms, peak {peak / 1024 / 1024:.1f} MiB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256], help="file sizes in MiB")
+    parser.add_argument("--requests", type=int, default=5)
+    args = parser.parse_args()
+
+    old_app, new_app = Flask("old"), Flask("new")
+    old_app.request_class, new_app.request_class = Request, StreamingRequest
+
+    for size in args.sizes:
+        builder = EnvironBuilder(method="POST", data={
+            "userId": "port-dataverse://alice:secret", "filename": "data.csv",
+            "file": (io.BytesIO(b"x" * size * 1024 * 1024), "data.csv"),
+        })
+        environ = builder.get_environ()
+        # the body is kept outside of the measured requests, like the data in the socket
+        environ["body"] = environ["wsgi.input"].read()
+
+        print(f"{size} MiB file")
+        measure("old", old_app, environ, old_user_id, args.requests)
+        measure("new", new_app, environ, user_id, args.requests)
+
+
+if __name__ == "__main__":
+    main()
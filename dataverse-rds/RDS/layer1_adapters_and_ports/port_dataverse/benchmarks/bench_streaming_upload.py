@@ -0,0 +1,70 @@
+"""Uploads synthetic files through Dataverse.upload_new_file_to_dataset to a local stub.
+
+The files are generated on the fly and never exist on disk or in memory as a whole,
+so the peak memory of the process shows the memory used by the upload pipeline.
+
+    python benchmarks/bench_streaming_upload.py --sizes 1,2,5,10
+    python benchmarks/bench_streaming_upload.py --sizes 1 --spool
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+
+sys.path.append(f"{os.getcwd()}/src")
+sys.path.append(f"{os.getcwd()}/tests")
+
+from lib.upload_dataverse import Dataverse
+from stub_server import StubServer
+
+GB = 1024 ** 3
+
+
+class SyntheticStream(object):
+    """Unseekable stream of `size` bytes, like the wsgi input of a file upload."""
+
+    def __init__(self, size):
+        self.remaining = size
+        self._block = os.urandom(1024 * 1024)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        size = min(size, len(self._block))
+        self.remaining -= size
+        return self._block[:size]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1,2,5,10", help="comma separated file sizes in GB")
+    parser.add_argument("--spool", action="store_true", help="use the spool-to-tempfile fallback")
+    args = parser.parse_args()
+
+    with StubServer() as stub:
+        stub.route("POST", "/add", (200, {"status": "OK"}))
+        dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+        print(f"peak rss before: {peak_rss_mb():.1f} MB")
+
+        for size in [float(size) for size in args.sizes.split(",")]:
+            start = time.perf_counter()
+            response = dataverse.upload_new_file_to_dataset(
+                "doi:10.5072/FK2/BENCH", "synthetic.bin", SyntheticStream(int(size * GB)),
+                return_response=True, spool=args.spool,
+            )
+            duration = time.perf_counter() - start
+            received = stub.calls[-1].body_size
+
+            print(
+                f"{size:>5} GB: status {response.status_code}, {received / GB:.2f} GB received, "
+                f"{size * 1024 / duration:.0f} MB/s, peak rss {peak_rss_mb():.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,12 @@
 from connexion_plus import App, MultipleResourceResolver, Util
 
-import logging, os
+import os
 
-log_level = os.environ.get("LOGLEVEL", "DEBUG")
-logger = logging.getLogger("")
-logging.getLogger("").handlers = []
-logging.basicConfig(format="%(asctime)s %(message)s", level=log_level)
+from lib.logs import configure
+from lib.request_data import StreamingRequest
+
+# LOGLEVEL defaults to INFO, single modules can be set to DEBUG with LOGLEVELS
+configure()
 
 
 def bootstrap(name="MicroService", *args, **kwargs):
@@ -31,6 +32,8 @@ def bootstrap(name="MicroService", *args, **kwargs):
 
     app.app.dataverse_address = dataverse_address
     app.app.dataverse_api_address = dataverse_api_address
+    # the uploaded file is handed on as a stream, only the form fields in front of it are read beforehand
+    app.app.request_class = StreamingRequest
 
     for oai in list_openapi:
         app.add_api(
@@ -1,81 +1,103 @@
-import inspect
-import logging
 from lib.Util import require_api_key, decode_string, encode_string
+from lib.dedupe import bytes_saved
+from lib.transfer_jobs import get_runner, owner_of, register, wants_async
+from lib.upload_dataverse import request_email
 from flask import jsonify, request, g
+from lib.logs import get_logger
 
-logger = logging.getLogger()
+logger = get_logger(__name__)
+
+
+@register("upload")
+def upload_job(dataverse, params, file):
+    # the job runs outside of the request, so the user was read when it was submitted
+    return dataverse.upload_new_file_to_dataset(
+        params["project_id"], params["filename"], file, email=params.get("email"), size=params.get("size"))
 
 
 # FIXME: all endpoints need server tests, but POST cannot currently be tested through pactman, because it only supports json as content type
 @require_api_key
 def index(project_id):
-    logger.debug(f"Entering at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/files.py index")
 
-    logger.debug(f"### project_id files index: {project_id}")
+    logger.debug("### project_id files index: %s", project_id)
     project_id = decode_string(project_id)
-    logger.debug(f"### project_id files index: {project_id}")
+    logger.debug("### project_id files index: %s", project_id)
 
     return g.dataverse.get_files_from_dataset(project_id)
 
 
 @require_api_key
 def get(project_id, file_id):
-    logger.debug(f"Entering at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
-    logger.debug(f"### project_id files get: {project_id}")
+    logger.debug("Entering at api/project/files.py get")
+    logger.debug("### project_id files get: %s", project_id)
     project_id = decode_string(project_id)
-    logger.debug(f"### project_id files get: {project_id}")
+    logger.debug("### project_id files get: %s", project_id)
 
     return g.dataverse.get_files_from_dataset(project_id)[file_id]
 
 
 @require_api_key
 def post(project_id):
-    logger.debug(f"Entering at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
-    logger.debug(f"### project_id files post: {project_id}")
+    logger.debug("Entering at api/project/files.py post")
+    logger.debug("### project_id files post: %s", project_id)
     project_id = decode_string(project_id)
-    logger.debug(f"### project_id files post: {project_id}")
+    logger.debug("### project_id files post: %s", project_id)
 
     logger.debug("Read file from request")
     file = request.files['file']
 
+    # only the fields in front of the file are read, without filename the name of the file part is used
     req = request.form.to_dict()
-    filename = req["filename"]
-    logger.debug("file: {}, filename: {}".format(file, filename))
+    filename = req.get("filename") or file.filename
+    logger.debug("file: %s, filename: %s", file, filename)
+
+    if wants_async(req):
+        job = get_runner().submit(
+            "upload", g.dataverse, owner_of(g.dataverse.api_key),
+            {"project_id": project_id, "filename": filename, "email": request_email(), "size": request.content_length}, file
+        )
+        logger.debug("Queued file upload as transfer job %s", job.id)
+        return jsonify(job.status()), 202
 
     logger.debug("Start file upload")
+    # the streamed file has no size, the content length of the request decides about the direct upload
     resp = g.dataverse.upload_new_file_to_dataset(
-        project_id, filename, file)
+        project_id, filename, file, size=request.content_length)
     logger.debug("Finished file upload")
 
     if resp:
-        return jsonify({"success": True})
+        # a file, which is already in the project, is not uploaded again
+        return jsonify({"success": True, "bytesSaved": bytes_saved(resp)})
 
     else:
-        logger.error(f"Exception at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        logger.error("Exception at api/project/files.py post")
         raise ValueError("Upload failed.")
 
 
 @require_api_key
 def patch(project_id, file_id):
-    logger.error(f"Exception at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.error("Exception at api/project/files.py patch")
     
-    logger.debug(f"### project_id files patch: {project_id}")
+    logger.debug("### project_id files patch: %s", project_id)
     project_id = decode_string(project_id)
-    logger.debug(f"### project_id files patch: {project_id}")
+    logger.debug("### project_id files patch: %s", project_id)
 
     raise NotImplementedError()
 
 
 @require_api_key
 def delete(project_id, file_id=None):
-    logger.debug(f"Entering at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/files.py delete")
 
-    logger.debug(f"### project_id files delete: {project_id}")
+    logger.debug("### project_id files delete: %s", project_id)
     project_id = decode_string(project_id)
-    logger.debug(f"### project_id files delete: {project_id}")
+    logger.debug("### project_id files delete: %s", project_id)
 
     if file_id is None:
-        return g.dataverse.delete_all_files_from_dataset(project_id)
+        # the result of every file, a failed file does not stop the deletion of the others
+        results = g.dataverse.delete_files_from_dataset(project_id)
+        return jsonify({"success": all(result["success"] for result in results), "files": results})
 
-    logger.error(f"Exception at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.error("Exception at api/project/files.py delete")
     raise NotImplementedError()
@@ -1,5 +1,3 @@
-import inspect
-import logging
 import time
 
 from flask import jsonify, request, g
@@ -7,26 +5,34 @@ from RDS import ROParser
 from werkzeug.exceptions import abort
 
 from lib.Util import require_api_key, to_jsonld, encode_string, decode_string
+from lib.logs import get_logger
 
-logger = logging.getLogger()
+logger = get_logger(__name__)
 
 
 @require_api_key
 def index():
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py index")
     req = request.json.get("metadata")
     
     datasetResponse = g.dataverse.get_dataset(metadataFilter=req)['data']
-    logger.debug("dataset response: {}".format(datasetResponse))
+    logger.debug("dataset response", datasetResponse=datasetResponse)
+
+    persistent_ids = g.dataverse.get_persistent_ids(datasetResponse)
 
     output = []
     for dataset in datasetResponse:
+        project_id = persistent_ids.get(dataset.get("id"))
+        if project_id is None:
+            # without persistent_id the dataset cannot be addressed as project
+            logger.error("Skip dataset without persistent_id", dataset_id=dataset.get("id"))
+            continue
+        logger.debug("### project_id index: %s", project_id)
+
         try:
             metadata = to_jsonld(dataset)
-            project_id = g.dataverse.get_persistent_id_with_id(dataset["id"])
-            logger.debug(f"### project_id index: {project_id}")
         except Exception as e:
-            logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at api/project/project.py index")
             logger.error(e, exc_info=True)
             metadata = dataset
 
@@ -40,34 +46,34 @@ def index():
 
 @require_api_key
 def get(project_id):
-    logger.debug(f"### project_id get: {project_id}")
+    logger.debug("### project_id get: %s", project_id)
     project_id = decode_string(project_id)
-    logger.debug(f"### project_id get: {project_id}")
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("### project_id get: %s", project_id)
+    logger.debug("Entering at api/project/project.py get")
     req = request.json.get("metadata")
 
     datasetResponse = g.dataverse.get_dataset(
         persistent_id=project_id, metadataFilter=req)
 
-    logger.debug("dataset reponse: {}".format(datasetResponse))
+    logger.debug("dataset reponse", datasetResponse=datasetResponse)
 
     output = datasetResponse
     try:
         output = to_jsonld(datasetResponse.get("metadataBlocks") or datasetResponse)
 
     except Exception as e:
-        logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        logger.error("Exception at api/project/project.py get")
         logger.error(e, exc_info=True)
         output = datasetResponse
 
-    logger.debug("output: {}".format(output))
+    logger.debug("output", output=output)
 
     return jsonify(output)
 
 
 def dataverse(res):
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
-    logger.debug(f"### dataverse_res: {res}")
+    logger.debug("Entering at api/project/project.py dataverse")
+    logger.debug("### dataverse_res: %s", res)
 
     try:
         req = request.get_json(force=True)
@@ -202,20 +208,20 @@ def dataverse(res):
             }
         }
 
-    logger.debug(f"### dataverse_result: {result}")
+    logger.debug("### dataverse_result: %s", result)
     return result
 
 
 @require_api_key
 def post():
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py post")
     try:
         req = request.get_json(force=True)
         
-        logger.debug(f"### req: {req}")
+        logger.debug("### req", req=req)
         metadata = req.get("metadata")
 
-        logger.debug(f"### got metadata: {metadata}")
+        logger.debug("### got metadata: %s", metadata)
 
         # if metadata is not None:
         try:
@@ -226,17 +232,17 @@ def post():
                     doc = ROParser(metadata)
                     expanddoc = doc.getElement(
                         doc.rootIdentifier, expand=True, clean=False)
-                    logger.debug(f"### expanddoc: {expanddoc}")
+                    logger.debug("### expanddoc: %s", expanddoc)
                     metadata = dataverse(expanddoc)
                 except:
                     metadata = dataverse({})
         except Exception as e:
-            logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at api/project/project.py post")
             logger.error(f"### {e}", exc_info=True)
         # else:
         #     metadata = {}
 
-        logger.debug("### send metadata: {}".format(metadata))
+        logger.debug("### send metadata", metadata=metadata)
 
         datasetResponse = g.dataverse.create_new_dataset_internal(
             metadata=metadata, return_response=True
@@ -244,28 +250,28 @@ def post():
 
         if datasetResponse.status_code < 300:
             datasetResponse = datasetResponse.json()
-            logger.debug(f"### datasetResponse: {datasetResponse}")
+            logger.debug("### datasetResponse: %s", datasetResponse)
             result = jsonify(
                 {
                     "projectId": encode_string(str(datasetResponse["data"]["persistentId"])),
                     "metadata": metadata,
                 }
             )
-            logger.debug(f"### result: {result}")
+            logger.debug("### result: %s", result)
             return result
         abort(datasetResponse.status_code)
     except Exception as e:
-        logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}, outer exception")
+        logger.error("Exception at api/project/project.py post, outer exception")
         logger.error(e, exc_info=True)
         abort(500)
 
 
 @require_api_key
 def delete(project_id):
-    logger.debug(f"### project_id delete: {project_id}")
+    logger.debug("### project_id delete: %s", project_id)
     project_id = decode_string(project_id)
-    logger.debug(f"### project_id delete: {project_id}")
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("### project_id delete: %s", project_id)
+    logger.debug("Entering at api/project/project.py delete")
     if g.dataverse.remove_dataset_internal(str(project_id)):
         return "", 204
 
@@ -274,21 +280,21 @@ def delete(project_id):
 
 @require_api_key
 def patch(project_id):
-    logger.debug(f"### project_id patch: {project_id}")
+    logger.debug("### project_id patch: %s", project_id)
     project_id = decode_string(project_id)
-    logger.debug(f"### project_id patch: {project_id}")
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("### project_id patch: %s", project_id)
+    logger.debug("Entering at api/project/project.py patch")
     req = request.get_json(force=True)
-    logger.debug("### request data: {}".format(req))
+    logger.debug("### request data", req=req)
 
     metadata = req.get("metadata")
-    logger.debug("### original data: {}".format(metadata))
+    logger.debug("### original data", metadata=metadata)
     if metadata is not None:
         try:
             try:
                 doc = ROParser(metadata)
                 docexpanded = doc.getElement(doc.rootIdentifier, expand=True, clean=False)
-                logger.debug(f"### doc: {docexpanded}")
+                logger.debug("### doc: %s", docexpanded)
                 metadata = dataverse(docexpanded)
             except:
                 metadata = dataverse({})
@@ -296,26 +302,26 @@ def patch(project_id):
             logger.debug("Error ROParser")
             logger.error(e, exc_info=True)
 
-    logger.debug("### transformed data: {}".format(metadata))
+    logger.debug("### transformed data", metadata=metadata)
 
     datasetResponse = g.dataverse.change_metadata_in_dataset_internal(
         persistent_id=project_id, metadata=metadata, return_response=True
     )
-    logger.debug(f"### datasetResponse: {datasetResponse}")
+    logger.debug("### datasetResponse: %s", datasetResponse)
 
     if datasetResponse.status_code == 200:
         output = datasetResponse.json()
 
-        logger.debug("### output: {}".format(output))
+        logger.debug("### output", output=output)
 
         try:
             output["metadata"] = to_jsonld(output["metadata"])
 
         except Exception as e:
-            logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}, second exception")
+            logger.error("Exception at api/project/project.py patch, second exception")
             logger.error(e, exc_info=True)
 
-        logger.debug("### finished output: {}".format(output))
+        logger.debug("### finished output", output=output)
 
         return jsonify(output["metadata"])
 
@@ -324,10 +330,10 @@ def patch(project_id):
 
 @require_api_key
 def put(project_id):
-    logger.debug(f"### project_id put: {project_id}")
+    logger.debug("### project_id put: %s", project_id)
     project_id = decode_string(project_id)
-    logger.debug(f"### project_id put: {project_id}")
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("### project_id put: %s", project_id)
+    logger.debug("Entering at api/project/project.py put")
     if g.dataverse.publish_dataset_internal(persistent_id=project_id):
         return True, 200
 
@@ -1,14 +1,15 @@
 import base64
-import inspect
 from functools import wraps
 from lib.upload_dataverse import Dataverse
+from lib.connector_registry import connectors
 from flask import request, g, current_app, abort
-import logging
-from pyld import jsonld
-import json
+from werkzeug.exceptions import HTTPException
+from lib.jsonld_loader import frame
 from RDS import Util
+from lib.logs import get_logger
+from lib.request_data import user_id
 
-logger = logging.getLogger()
+logger = get_logger(__name__)
 
 
 def encode_string(s):
@@ -40,11 +41,8 @@ def require_api_key(api_method):
     def check_api_key(*args, **kwargs):
         g.dataverse = None
 
-        try:
-            req = request.get_json(force=True)
-        except:
-            req = request.form.to_dict()
-        logger.debug("got request data: {}".format(req))
+        # from the header or the fields in front of an upload, an uploaded file is not read here
+        userId = user_id()
         
         apiKey = None
         
@@ -52,26 +50,35 @@ def require_api_key(api_method):
             # DT: Here we need to implement our own matching between userId and apiKey
             #  look like the userId is stored like this:
             #  <port-name>://<username>:<password>
-            userId = req.get("userId")
             if apiKey is None:
                 # We can ask the user to supply the apikey as the password and use that.
                 # we can parse it from the userID
                 apiKey = userId.split(":")[-1]
         except Exception as e:
-            logger.error(f"Exception at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at lib/Util.py check_api_key")
             logger.error(e, exc_info=True)
         
-        logger.debug(f"{userId}, {apiKey}")
+        logger.debug("found userId")
 
         if apiKey is None:
-            logger.error(f"Exception at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at lib/Util.py check_api_key")
             logger.error("apiKey or userId not found.")
             abort(401)
 
         logger.debug("found apiKey")
-        g.dataverse = Dataverse(apiKey, api_address=current_app.dataverse_api_address)
+        credentials = (apiKey,)
+        g.dataverse = connectors.get(
+            "port-dataverse", current_app.dataverse_api_address, credentials,
+            lambda: Dataverse(apiKey, api_address=current_app.dataverse_api_address),
+        )
 
-        return api_method(*args, **kwargs)
+        try:
+            return api_method(*args, **kwargs)
+        except HTTPException as e:
+            if e.code in (401, 403):
+                # do not hand out an instance with rejected credentials again
+                connectors.invalidate("port-dataverse", current_app.dataverse_api_address, credentials)
+            raise
 
     return check_api_key
 
@@ -93,7 +100,7 @@ dataverse_to_jsonld = {
 
 
 def to_jsonld(metadata):
-    logger.debug(f"Entering at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at lib/Util.py to_jsonld")
     def parse_creator(user):
         output = {}
         errors = False
@@ -106,13 +113,13 @@ def to_jsonld(metadata):
             try:
                 output[dataverse_to_jsonld[parameter]] = creator[parameter]
             except KeyError as e:
-                logger.error(f"Exception at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+                logger.error("Exception at lib/Util.py parse_creator")
                 logger.error(e)
                 errors = True
 
         return output
 
-    logger.debug("got metadata {}".format(metadata))
+    logger.debug("got metadata", metadata=metadata)
 
     creators = []
 
@@ -146,7 +153,7 @@ def to_jsonld(metadata):
             try:
                 jsonld[dataverse_to_jsonld[parameter]] = metadata[parameter]
             except Exception as e:
-                logger.debug("key {} not found.".format(e))
+                logger.debug("key %s not found.", e)
 
     try:
         publicAccess = metadata["access_right"] == "open"
@@ -158,18 +165,13 @@ def to_jsonld(metadata):
 
 
 def from_jsonld(jsonld_data):
-    logger.debug(f"Entering at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at lib/Util.py from_jsonld")
     if jsonld_data is None:
         return
 
-    try:
-        frame = json.load(open("src/lib/fdataverse.jsonld"))
-    except:
-        frame = json.load(open("lib/fdataverse.jsonld"))
-
-    logger.debug("before transformation data: {}".format(jsonld_data))
-    data = jsonld.frame(jsonld_data, frame)
-    logger.debug("after framing: {}".format(data))
+    logger.debug("before transformation data", jsonld_data=jsonld_data)
+    data = frame(jsonld_data, "fdataverse.jsonld")
+    logger.debug("after framing", data=data)
 
     data["title"] = data[dataverse_to_jsonld["title"].replace(
         "https://schema.org/", "")]
@@ -188,7 +190,7 @@ def from_jsonld(jsonld_data):
             del creator["@id"]
             del creator["@type"]
         except Exception as e:
-            logger.error(f"Exception at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at lib/Util.py read_creator")
             logger.error(e, exc_info=True)
 
         try:
@@ -196,7 +198,7 @@ def from_jsonld(jsonld_data):
         except Exception as e:
             if "affiliation" in creator:
                 del creator["affiliation"]
-            logger.error(f"Exception at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at lib/Util.py read_creator")
             logger.error(e, exc_info=True)
 
         data["creators"].append(creator)
@@ -217,6 +219,6 @@ def from_jsonld(jsonld_data):
         pass
 
     data["description"] = data["description"].replace("\n", "<br>")
-    logger.debug("after transformation data: {}".format(data))
+    logger.debug("after transformation data", data=data)
 
     return data
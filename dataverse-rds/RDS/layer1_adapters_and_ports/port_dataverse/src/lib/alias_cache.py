@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from cachetools import LRUCache
+from prometheus_client import Counter
+
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+cache_size = int(os.getenv("DATAVERSE_ALIAS_CACHE_SIZE", 1024))
+cache_ttl = float(os.getenv("DATAVERSE_ALIAS_CACHE_TTL", 24 * 60 * 60))
+cache_file = os.getenv("DATAVERSE_ALIAS_CACHE_FILE", None)
+
+alias_cache_hits = Counter(
+    "dataverse_alias_cache_hits_total",
+    "Number of user dataverse lookups, which were answered by the cache.",
+)
+alias_cache_misses = Counter(
+    "dataverse_alias_cache_misses_total",
+    "Number of user dataverse lookups, which needed a create call to dataverse.",
+)
+
+
+class AliasCache(object):
+    """Bounded LRU cache with TTL, which remembers the dataverse aliases already ensured
+    on a dataverse installation.
+
+    If `path` is given, the entries are also written to this json file and loaded
+    again at startup, so they survive restarts of the port.
+    """
+
+    def __init__(self, maxsize=cache_size, ttl=cache_ttl, path=cache_file):
+        self.ttl = ttl
+        self.path = path
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _key(api_address, alias):
+        return f"{api_address.rstrip('/')}|{alias}"
+
+    def is_ensured(self, api_address, alias):
+        """Returns True, if `alias` was ensured on `api_address` within the last `ttl` seconds."""
+        key = self._key(api_address, alias)
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is not None and expires <= time.time():
+                del self._entries[key]
+                expires = None
+
+        if expires is None:
+            alias_cache_misses.inc()
+            return False
+
+        alias_cache_hits.inc()
+        return True
+
+    def mark_ensured(self, api_address, alias):
+        with self._lock:
+            self._entries[self._key(api_address, alias)] = time.time() + self.ttl
+        self.save()
+
+    def invalidate(self, api_address, alias):
+        with self._lock:
+            self._entries.pop(self._key(api_address, alias), None)
+        self.save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.save()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except Exception as e:
+            log.error(f"Could not load alias cache from {self.path}: {e}")
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, expires in sorted(entries.items(), key=lambda item: item[1]):
+                if expires > now:
+                    self._entries[key] = expires
+
+    def save(self):
+        if self.path is None:
+            return
+
+        with self._lock:
+            entries = dict(self._entries.items())
+
+        # write to a temporary file first, so a crash never leaves a broken cache file behind
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            log.error(f"Could not save alias cache to {self.path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+ensured_aliases = AliasCache()
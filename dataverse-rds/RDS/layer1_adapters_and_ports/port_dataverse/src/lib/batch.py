@@ -0,0 +1,144 @@
+import json
+import os
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort
+
+from lib.instrumentation import with_active_span
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+batch_workers = int(os.getenv("BATCH_UPLOAD_WORKERS", 4))
+batch_max_files = int(os.getenv("BATCH_UPLOAD_MAX_FILES", 1000))
+
+
+class BatchFile(object):
+    """One file of a batch upload.
+
+    Args:
+        filename (str): path of the file in the project.
+        file (file-like): stream with a read method.
+        size (int, optional): size in bytes, if known. Defaults to None.
+    """
+
+    def __init__(self, filename, file, size=None):
+        self.filename = filename
+        self.file = file
+        self.size = size
+
+
+def _size(stream):
+    try:
+        position = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(position)
+        return size
+    except (AttributeError, OSError):
+        return None
+
+
+def check_path(name):
+    """Returns `name`, aborts with 400, if it is no relative path inside the project.
+
+    Names of archive entries and manifests come from the client, e.g. "/etc/passwd" or
+    "../a.csv" would leave the project."""
+    parts = str(name).replace("\\", "/").split("/")
+    if not name or parts[0] == "" or re.match(r"^[A-Za-z]:", parts[0]) or ".." in parts:
+        abort(400, f"{name} is no relative path in the project.")
+    return name
+
+
+def _manifest(form):
+    """Returns the filenames listed in the json manifest of the form, or None without one.
+
+    The manifest is a list of filenames or of objects with a filename, otherwise it aborts with 400."""
+    if "manifest" not in form:
+        return None
+
+    try:
+        entries = json.loads(form["manifest"])
+    except ValueError:
+        abort(400, "manifest is no valid json.")
+    if not isinstance(entries, list):
+        abort(400, "manifest has to be a list of files.")
+
+    names = [entry.get("filename") if isinstance(entry, dict) else entry for entry in entries]
+    if not all(isinstance(name, str) and name for name in names):
+        abort(400, "Every file of the manifest needs a filename.")
+    return names
+
+
+def files_from_request(request):
+    """Returns the files of a batch upload request as list of BatchFile.
+
+    The request has either many file parts named `files`, or one zip file named `archive`.
+    A json list `manifest` in the form selects the files of the archive, otherwise all
+    files of the archive are uploaded. Aborts with 400, if the request has no files or a
+    filename, which is absolute or contains "..", see check_path.
+    """
+    form = request.form.to_dict()
+    archive = request.files.get("archive")
+
+    if archive is not None:
+        try:
+            bundle = zipfile.ZipFile(archive.stream)
+        except zipfile.BadZipFile:
+            abort(400, "archive is not a zip file.")
+
+        infos = {info.filename: info for info in bundle.infolist() if not info.is_dir()}
+        names = _manifest(form)
+        if names is None:
+            names = list(infos)
+
+        files = []
+        for name in names:
+            info = infos.get(check_path(name))
+            # a missing file is reported in the results of the batch, not as error of the request
+            files.append(BatchFile(name, None) if info is None else BatchFile(name, bundle.open(info), info.file_size))
+    else:
+        files = [BatchFile(check_path(f.filename), f.stream, _size(f.stream)) for f in request.files.getlist("files")]
+
+    if len(files) == 0:
+        abort(400, "No files given.")
+    if len(files) > batch_max_files:
+        abort(413, f"A batch can have at most {batch_max_files} files.")
+
+    return files
+
+
+def run_batch(files, upload, workers=None):
+    """Calls `upload(batch_file)` for all files with at most `workers` at the same time.
+
+    A file counts as uploaded, if `upload` returns a truthy value. If it returns the result of
+    lib.dedupe.skipped, the file was already in the project and the bytes saved are reported.
+
+    Returns:
+        list: one result for every file in the order of `files`, e.g.
+            {"filename": "data/a.csv", "success": False, "error": "..."}
+            {"filename": "data/b.csv", "success": True, "skipped": True, "bytesSaved": 1024}
+    """
+    def upload_one(batch_file):
+        result = {"filename": batch_file.filename, "success": False}
+        if batch_file.file is None:
+            result["error"] = "File not found in the request."
+            return result
+
+        try:
+            outcome = upload(batch_file)
+            result["success"] = bool(outcome)
+            if isinstance(outcome, dict) and outcome.get("skipped"):
+                result.update(skipped=True, bytesSaved=outcome.get("bytesSaved", 0))
+            if not result["success"]:
+                result["error"] = "Upload failed."
+        except Exception as e:
+            log.error(f"Upload of {batch_file.filename} failed: {e}")
+            result["error"] = str(e) or type(e).__name__
+        return result
+
+    workers = max(1, min(workers or batch_workers, len(files)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(with_active_span(upload_one), files))
@@ -0,0 +1,74 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+
+from cachetools import TTLCache
+
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+registry_size = int(os.getenv("CONNECTOR_REGISTRY_SIZE", 1000))
+registry_ttl = float(os.getenv("CONNECTOR_REGISTRY_TTL", 600))
+
+
+class ConnectorRegistry(object):
+    """Bounded LRU registry with TTL of connector instances, keyed by port, api address and credentials.
+
+    The credentials are only stored as a hmac with a random key of this process, so the keys
+    of the registry do not reveal them. An evicted or expired instance is only dropped, it stays
+    usable for the requests which still hold it and is collected afterwards.
+    """
+
+    def __init__(self, maxsize=registry_size, ttl=registry_ttl):
+        self._instances = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._secret = secrets.token_bytes(32)
+
+    def credential_hash(self, *credentials):
+        message = "\0".join(str(credential) for credential in credentials).encode("utf-8")
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()
+
+    def key(self, port, api_address, *credentials):
+        return port, str(api_address).rstrip("/"), self.credential_hash(*credentials)
+
+    def get(self, port, api_address, credentials, factory):
+        """Returns the instance for `credentials` on `api_address`, which is built
+        with `factory()`, if there is none or it has expired.
+
+        Args:
+            port (str): name of the port, which owns the instance.
+            api_address (str): api address of the upstream service.
+            credentials (tuple): everything, which authenticates the user.
+            factory (callable): builds a new instance.
+        """
+        key = self.key(port, api_address, *credentials)
+        with self._lock:
+            instance = self._instances.get(key)
+        if instance is not None:
+            return instance
+
+        # building happens outside the lock, at worst two requests build the same instance
+        instance = factory()
+        with self._lock:
+            return self._instances.setdefault(key, instance)
+
+    def invalidate(self, port, api_address, credentials):
+        """Drops the instance for `credentials`, e.g. because the upstream service rejected them."""
+        with self._lock:
+            self._instances.pop(self.key(port, api_address, *credentials), None)
+
+    def clear(self):
+        with self._lock:
+            self._instances.clear()
+
+    def __len__(self):
+        with self._lock:
+            # expire first, so the length does not count outdated instances
+            self._instances.expire()
+            return len(self._instances)
+
+
+connectors = ConnectorRegistry()
@@ -0,0 +1,180 @@
+import os
+import re
+import threading
+
+from lib.logs import get_logger
+from lib.rate_limiter import sleep
+
+log = get_logger(__name__)
+
+# first pause between two polls of the locks, it doubles while the dataset stays locked
+lock_poll_initial = float(os.getenv("DATAVERSE_LOCK_POLL_INITIAL", 0.2))
+lock_poll_max = float(os.getenv("DATAVERSE_LOCK_POLL_MAX", 5))
+# an ingest of a large tabular file can take minutes
+lock_timeout = float(os.getenv("DATAVERSE_LOCK_TIMEOUT", 600))
+# calls, which collide with a lock set in the meantime, are sent again after the next unlock
+lock_retries = int(os.getenv("DATAVERSE_LOCK_RETRIES", 3))
+
+_lock_message = re.compile(r"(?i)\block")
+
+
+class DatasetLocked(Exception):
+    """The dataset is still locked, e.g. by an ingest or a running workflow."""
+
+
+def is_lock_error(response):
+    """Returns True, if dataverse rejected the call, because the dataset is locked."""
+    return response.status_code in (400, 403, 409) and bool(_lock_message.search(response.text or ""))
+
+
+class LockWatcher(object):
+    """Polls /datasets/:persistentId/locks of one dataset with an adaptive backoff.
+
+    The pause between two polls doubles up to `max_delay` while the dataset is locked. The next
+    wait starts with half of the last pause, so short ingests are noticed quickly and long ones
+    are not polled every few milliseconds. An installation without the locks endpoint counts as unlocked.
+
+    Args:
+        session (requests.Session): the session of the Dataverse object.
+        api_address (str): the api address of the installation.
+        api_key (str): api key of the user.
+        persistent_id (str): the dataset to watch.
+        initial (float, optional): first pause in seconds. Defaults to DATAVERSE_LOCK_POLL_INITIAL.
+        max_delay (float, optional): longest pause in seconds. Defaults to DATAVERSE_LOCK_POLL_MAX.
+        timeout (float, optional): seconds to wait at most. Defaults to DATAVERSE_LOCK_TIMEOUT.
+        sleep (callable, optional): used to pause, tests pass a fake. Defaults to the sleep of gevent,
+            so the other greenlets of the worker go on.
+    """
+
+    def __init__(self, session, api_address, api_key, persistent_id, initial=None, max_delay=None,
+                 timeout=None, sleep=sleep):
+        self.session = session
+        self.api_address = api_address
+        self.api_key = api_key
+        self.persistent_id = persistent_id
+        self.initial = lock_poll_initial if initial is None else initial
+        self.max_delay = lock_poll_max if max_delay is None else max_delay
+        self.timeout = lock_timeout if timeout is None else timeout
+        self.sleep = sleep
+        self.delay = self.initial
+        self.polls = 0
+
+    def locks(self):
+        """Returns the lock types of the dataset, an empty list if it is not locked."""
+        r = self.session.get(
+            f"{self.api_address}/datasets/:persistentId/locks",
+            params={"persistentId": self.persistent_id},
+            headers={"X-Dataverse-key": self.api_key},
+        )
+        self.polls += 1
+        if r.status_code >= 300:
+            # nothing to wait for, the next call will tell, if the dataset can be changed
+            log.debug("locks answered with status %s", r.status_code)
+            return []
+        return [lock.get("lockType") for lock in r.json().get("data") or []]
+
+    def wait(self):
+        """Returns as soon as the dataset has no locks. Returns the seconds waited.
+
+        Raises:
+            DatasetLocked: if the dataset is still locked after `timeout` seconds.
+        """
+        waited, delay = 0, self.delay
+        while True:
+            locks = self.locks()
+            if not locks:
+                self.delay = max(self.initial, delay / 2)
+                return waited
+
+            if waited + delay > self.timeout:
+                raise DatasetLocked(f"Dataset {self.persistent_id} is locked ({', '.join(map(str, locks))}).")
+
+            log.debug("dataset is locked, poll again", locks=locks, delay=delay)
+            self.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, self.max_delay)
+
+
+class RegistrationQueue(object):
+    """Registers files, which were sent to the store, as soon as the dataset is unlocked.
+
+    Files are put into the queue, while other files are still sent to the store. A thread
+    waits for the unlock of the dataset and registers all files queued until then with
+    one call, so the number of calls and locks does not grow with the number of files.
+
+        with RegistrationQueue(register, watcher) as registrations:
+            registrations.put(filename, entry)
+        registrations.errors  # {filename: error} of the files, which were not added
+
+    Args:
+        register (callable): registers a list of entries, returns the error of every entry
+            not added by storage identifier. Raises DatasetLocked, if the call collided with a lock.
+        watcher (LockWatcher): the locks of the dataset.
+    """
+
+    def __init__(self, register, watcher):
+        self.register = register
+        self.watcher = watcher
+        self.errors = {}
+        self.calls = 0
+        self._entries = []
+        self._closed = False
+        self._changed = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="dataverse-registration", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def put(self, key, entry):
+        with self._changed:
+            self._entries.append((key, entry))
+            self._changed.notify()
+
+    def close(self):
+        """Registers the queued files and stops the thread."""
+        with self._changed:
+            self._closed = True
+            self._changed.notify()
+        self._thread.join()
+
+    def _take(self):
+        with self._changed:
+            batch, self._entries = self._entries, []
+            return batch
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while not self._entries and not self._closed:
+                    self._changed.wait()
+                if not self._entries:
+                    return
+
+            batch = []
+            try:
+                for attempt in range(lock_retries + 1):
+                    # files, which arrive while the dataset is locked, are registered together
+                    self.watcher.wait()
+                    batch = self._take()
+                    try:
+                        self.calls += 1
+                        errors = self.register([entry for _, entry in batch])
+                        break
+                    except DatasetLocked:
+                        if attempt == lock_retries:
+                            raise
+                        with self._changed:
+                            self._entries[:0] = batch
+                        batch = []
+            except Exception as e:
+                batch = batch or self._take()
+                log.error("Registration of %s files failed: %s", len(batch), e)
+                errors = {entry["storageIdentifier"]: str(e) or type(e).__name__ for _, entry in batch}
+
+            for key, entry in batch:
+                if entry["storageIdentifier"] in errors:
+                    self.errors[key] = errors[entry["storageIdentifier"]]
@@ -0,0 +1,148 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+from lib.dedupe import HashedUpload
+from lib.http_session import get_session
+from lib.instrumentation import with_active_span
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+# files with at least this size are uploaded directly to the store of the dataset, if it supports it
+direct_upload_threshold = int(os.getenv("DATAVERSE_DIRECT_UPLOAD_THRESHOLD", 256 * 1024 * 1024))
+direct_upload_enabled = os.getenv("DATAVERSE_DIRECT_UPLOAD", "True") == "True"
+direct_upload_workers = int(os.getenv("DATAVERSE_DIRECT_UPLOAD_WORKERS", 4))
+
+
+class DirectUploadNotSupported(Exception):
+    """The store of the dataset does not accept direct uploads, the file has to go through dataverse."""
+
+
+class DirectUploadFailed(Exception):
+    pass
+
+
+def use_direct_upload(size, threshold=None):
+    """Returns True, if a file of `size` bytes should be uploaded directly to the store."""
+    if threshold is None:
+        threshold = direct_upload_threshold
+    return direct_upload_enabled and size is not None and size >= threshold
+
+
+class HashedSpool(HashedUpload):
+    """HashedUpload, which always computes the md5 and reads parts of the temporary file at their offsets.
+
+    The parts can be sent in parallel. The same spool is compared with the files of the dataset,
+    see lib/dedupe.py, so a file is copied and hashed only once. Use it as a context manager, the
+    file is deleted on exit.
+    """
+
+    def __init__(self, fileobj, algorithms=(), dir=None):
+        super().__init__(fileobj, {"md5", *algorithms}, dir or os.getenv("DATAVERSE_UPLOAD_SPOOL_DIR", None))
+
+    @property
+    def md5(self):
+        return self.hexdigest("md5")
+
+    def part(self, offset, length):
+        return FilePart(self.file.fileno(), offset, min(length, self.size - offset))
+
+
+class FilePart(io.RawIOBase):
+    """Read-only view on `length` bytes at `offset` of the file descriptor `fd`.
+
+    It reads with pread, so many parts of the same file can be sent at the same time.
+    It is seekable, so urllib3 can rewind it for a retry."""
+
+    def __init__(self, fd, offset, length):
+        self.fd = fd
+        self.offset = offset
+        self.length = length
+        self.position = 0
+
+    def __len__(self):
+        return self.length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            position += self.position
+        elif whence == os.SEEK_END:
+            position += self.length
+        self.position = max(0, min(position, self.length))
+        return self.position
+
+    def read(self, size=-1):
+        remaining = self.length - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        data = os.pread(self.fd, size, self.offset + self.position) if size > 0 else b""
+        self.position += len(data)
+        return data
+
+
+def _put(url, data, headers=None):
+    r = get_session(url).put(url, data=data, headers=headers or {})
+    if r.status_code >= 300:
+        raise DirectUploadFailed(f"PUT to the store failed with status {r.status_code}")
+    return r
+
+
+def upload_to_store(upload_urls, spool, server_address, api_key, workers=None):
+    """PUTs the spooled file to the presigned urls, which dataverse returned from uploadurls.
+
+    A file, which fits into one part, is sent with one PUT. Otherwise all parts are sent with
+    at most `workers` at the same time and the multipart upload is completed with their ETags.
+    A failed multipart upload is aborted, so the store does not keep the parts.
+
+    Args:
+        upload_urls (dict): data of the uploadurls response.
+        spool (HashedSpool): the file to upload.
+        server_address (str): address of the dataverse installation, for the complete and abort urls.
+        api_key (str): api key for the complete and abort calls to dataverse.
+        workers (int, optional): parts sent at the same time. Defaults to DATAVERSE_DIRECT_UPLOAD_WORKERS.
+
+    Returns:
+        str: the storage identifier of the uploaded file
+    """
+    if "url" in upload_urls:
+        _put(upload_urls["url"], spool.part(0, spool.size), headers={"x-amz-tagging": "dv-state=temp"})
+        return upload_urls["storageIdentifier"]
+
+    part_size = int(upload_urls["partSize"])
+    urls = sorted(upload_urls["urls"].items(), key=lambda item: int(item[0]))
+    headers = {"X-Dataverse-key": api_key}
+
+    def put_part(item):
+        number, url = item
+        r = _put(url, spool.part((int(number) - 1) * part_size, part_size))
+        return number, r.headers.get("ETag", "").strip('"')
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers or direct_upload_workers, len(urls)))) as executor:
+            etags = dict(executor.map(with_active_span(put_part), urls))
+
+        complete = urljoin(server_address, upload_urls["complete"])
+        r = get_session(complete).put(complete, json=etags, headers=headers)
+        if r.status_code >= 300:
+            raise DirectUploadFailed(f"Completing the multipart upload failed with status {r.status_code}")
+    except Exception:
+        abort = urljoin(server_address, upload_urls["abort"])
+        log.debug("abort multipart upload")
+        try:
+            get_session(abort).delete(abort, headers=headers)
+        except Exception as e:
+            log.error(f"Could not abort the multipart upload: {e}")
+        raise
+
+    return upload_urls["storageIdentifier"]
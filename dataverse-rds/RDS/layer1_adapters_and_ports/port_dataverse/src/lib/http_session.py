@@ -0,0 +1,133 @@
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.util.retry import Retry
+
+from lib.instrumentation import InstrumentedHTTPAdapter
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+pool_size = int(os.getenv("DATAVERSE_HTTP_POOL_SIZE", 10))
+pool_block = os.getenv("DATAVERSE_HTTP_POOL_BLOCK", "False") == "True"
+retries = int(os.getenv("DATAVERSE_HTTP_RETRIES", 3))
+backoff_factor = float(os.getenv("DATAVERSE_HTTP_BACKOFF_FACTOR", 0.5))
+connect_timeout = float(os.getenv("DATAVERSE_HTTP_CONNECT_TIMEOUT", 10))
+read_timeout = float(os.getenv("DATAVERSE_HTTP_READ_TIMEOUT", 300))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(InstrumentedHTTPAdapter):
+    """HTTPAdapter, which applies a default timeout to every request,
+    which does not set one by itself. All requests are measured and traced."""
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def _host_key(url):
+    """Returns the (scheme, netloc) tuple, which identifies the pool for `url`."""
+    parts = urlsplit(url)
+    return parts.scheme.lower(), parts.netloc.lower()
+
+
+def create_session(
+    pool_size=pool_size,
+    pool_block=pool_block,
+    retries=retries,
+    backoff_factor=backoff_factor,
+    timeout=(connect_timeout, read_timeout),
+):
+    """Creates a new keep-alive session with a connection pool, retries and a default timeout.
+
+    Only idempotent requests are retried, so a POST which creates something upstream
+    will never be sent twice.
+
+    Args:
+        pool_size (int, optional): number of connections kept alive per host.
+        pool_block (bool, optional): block if all connections of the pool are in use instead of opening a new one.
+        retries (int, optional): number of retries for connection errors and 502, 503, 504 responses.
+        backoff_factor (float, optional): sleeps `backoff_factor * 2 ** (retry - 1)` seconds between retries.
+        timeout (tuple, optional): default (connect, read) timeout in seconds.
+
+    Returns:
+        requests.Session: the configured session
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(502, 503, 504),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        pool_block=pool_block,
+        max_retries=retry,
+        timeout=timeout,
+    )
+
+    session = requests.Session()
+    session.headers.update({"Connection": "keep-alive"})
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(url):
+    """Returns the shared session of this process for the host of `url`.
+
+    All `Dataverse` instances, which talk to the same host, share the same
+    session, so connections are reused across requests and users.
+
+    Args:
+        url (str): any url of the host, e.g. the api address
+
+    Returns:
+        requests.Session: the shared session for the host
+    """
+    key = _host_key(url)
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            log.debug("create pooled http session for %s://%s", *key)
+            session = create_session()
+            _sessions[key] = session
+    return session
+
+
+def close_sessions():
+    """Closes all shared sessions and their pooled connections."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _reset_after_fork():
+    # connections must not be shared between processes, so a forked worker starts with an empty pool
+    global _sessions_lock
+    _sessions.clear()
+    _sessions_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
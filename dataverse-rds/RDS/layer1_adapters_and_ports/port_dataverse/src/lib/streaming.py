@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import uuid
+
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+chunk_size = int(os.getenv("DATAVERSE_UPLOAD_CHUNK_SIZE", 1024 * 1024))
+
+
+def stream_size(fileobj):
+    """Returns the number of bytes left in `fileobj`, if it is seekable, otherwise None."""
+    try:
+        position = fileobj.tell()
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell() - position
+        fileobj.seek(position)
+        return size
+    except Exception:
+        return None
+
+
+class MultipartStream(object):
+    """A multipart/form-data body, which is generated on the fly.
+
+    The form fields are sent first, then the file is read from `fileobj` in chunks of
+    at most `chunk_size` bytes, so the memory usage does not depend on the file size.
+    If the size of the file is known, the stream has a length and requests will send
+    a Content-Length header, otherwise the body is sent with chunked transfer encoding.
+
+    Args:
+        fields (dict): form fields, which are sent before the file.
+        file_field (str): name of the form field for the file.
+        filename (str): the filename sent to the server.
+        fileobj (file-like): object with a read method, e.g. the wsgi input stream.
+        size (int, optional): size of the file in bytes. Will be detected for seekable files.
+        content_type (str, optional): content type of the file. Defaults to application/octet-stream.
+        chunk_size (int, optional): maximum bytes read from `fileobj` at once.
+    """
+
+    def __init__(
+        self, fields, file_field, filename, fileobj,
+        size=None, content_type="application/octet-stream", chunk_size=chunk_size,
+    ):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+
+        self._head = b"".join(
+            self._part_header(name) + str(value).encode("utf-8") + b"\r\n"
+            for name, value in fields.items()
+        ) + self._part_header(file_field, filename, content_type)
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+
+        self.size = size if size is not None else stream_size(fileobj)
+
+    def _part_header(self, name, filename=None, content_type=None):
+        disposition = f'form-data; name="{_quote(name)}"'
+        if filename is not None:
+            disposition += f'; filename="{_quote(filename)}"'
+
+        header = f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n"
+        if content_type is not None:
+            header += f"Content-Type: {content_type}\r\n"
+        return (header + "\r\n").encode("utf-8")
+
+    def __len__(self):
+        return len(self._head) + self.size + len(self._tail)
+
+    def has_length(self):
+        return self.size is not None
+
+    def __iter__(self):
+        yield self._head
+        while True:
+            chunk = self.fileobj.read(self.chunk_size)
+            if not chunk:
+                break
+            self.bytes_read += len(chunk)
+            yield chunk
+        yield self._tail
+
+    def body(self):
+        """Returns the object, which should be passed as `data` to requests.
+
+        Without a known size, a plain iterator is returned, so requests does not ask for the length
+        and uses chunked transfer encoding instead."""
+        return self if self.has_length() else iter(self)
+
+
+def _quote(value):
+    return str(value).replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+class SpooledUpload(object):
+    """Copies `fileobj` into an anonymous temporary file in chunks and deletes it on exit.
+
+    Use it for upstreams, which need the complete file before the upload starts
+    (e.g. for a Content-Length), without keeping the file in memory.
+
+        with SpooledUpload(request.files["file"]) as tmp:
+            ...
+    """
+
+    def __init__(self, fileobj, chunk_size=chunk_size, dir=None):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.dir = dir or os.getenv("DATAVERSE_UPLOAD_SPOOL_DIR", None)
+        self._tmp = None
+
+    def __enter__(self):
+        # TemporaryFile has no name in the filesystem, so it cannot leak even if the process dies
+        self._tmp = tempfile.TemporaryFile(dir=self.dir)
+        try:
+            shutil.copyfileobj(self.fileobj, self._tmp, self.chunk_size)
+            self._tmp.seek(0)
+        except Exception:
+            self._tmp.close()
+            raise
+        return self._tmp
+
+    def __exit__(self, *args):
+        self._tmp.close()
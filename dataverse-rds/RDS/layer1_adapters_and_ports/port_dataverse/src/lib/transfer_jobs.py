@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+job_dir = os.getenv("TRANSFER_JOB_DIR", os.path.join(tempfile.gettempdir(), "rds-transfer-jobs"))
+job_workers = int(os.getenv("TRANSFER_JOB_WORKERS", 4))
+jobs_per_user = int(os.getenv("TRANSFER_JOBS_PER_USER", 2))
+job_retention = float(os.getenv("TRANSFER_JOB_RETENTION", 24 * 60 * 60))
+progress_interval = float(os.getenv("TRANSFER_JOB_PROGRESS_INTERVAL", 1))
+# uploads are only queued, if the request asks for it, unless this is set to True
+async_default = os.getenv("TRANSFER_JOBS_ASYNC", "False") == "True"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+# the port was restarted while the job was queued or running, it continues with the next status request of its owner
+INTERRUPTED = "interrupted"
+
+# kind -> handler(connector, params, stream), the connectors register their handlers on import
+handlers = {}
+
+
+def register(kind):
+    """Registers the decorated function as handler for jobs of `kind`."""
+
+    def decorator(handler):
+        handlers[kind] = handler
+        return handler
+
+    return decorator
+
+
+def owner_of(*credentials):
+    """Returns the hash, which identifies the owner of a job, without storing the credentials."""
+    return hashlib.sha256("\0".join(str(credential) for credential in credentials).encode("utf-8")).hexdigest()
+
+
+def wants_async(form):
+    """Returns True, if the upload of the request with the form data `form` should become a job."""
+    value = form.get("async")
+    if value is None:
+        return async_default
+    return str(value).lower() in ("1", "true", "yes")
+
+
+class Job(object):
+    """One transfer with its persisted state. The payload is spooled to the job directory."""
+
+    def __init__(self, kind, owner, params, size=0, id=None, state=QUEUED, transferred=0,
+                 error=None, created=None, updated=None):
+        self.id = id or uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.params = params
+        self.size = size
+        self.state = state
+        self.transferred = transferred
+        self.error = error
+        self.created = created or time.time()
+        self.updated = updated or self.created
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def status(self):
+        """The state of the job as returned by the status endpoint."""
+        return {
+            "jobId": self.id,
+            "state": self.state,
+            "bytesTransferred": self.transferred,
+            "size": self.size,
+            "error": self.error,
+            "created": self.created,
+            "updated": self.updated,
+        }
+
+    @property
+    def finished(self):
+        return self.state in (SUCCEEDED, FAILED)
+
+
+class JobStore(object):
+    """Keeps every job as a json file next to its payload in `directory`."""
+
+    def __init__(self, directory=job_dir):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def state_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def data_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.data")
+
+    def save(self, job):
+        job.updated = time.time()
+        # write to a temporary file first, so a crash never leaves a broken state file behind
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(job.to_dict(), f)
+            os.replace(tmp_path, self.state_path(job.id))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load(self):
+        jobs = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    jobs.append(Job.from_dict(json.load(f)))
+            except Exception as e:
+                log.error(f"Could not load transfer job {name}: {e}")
+        return jobs
+
+    def remove_data(self, job_id):
+        if os.path.exists(self.data_path(job_id)):
+            os.remove(self.data_path(job_id))
+
+    def remove(self, job_id):
+        self.remove_data(job_id)
+        if os.path.exists(self.state_path(job_id)):
+            os.remove(self.state_path(job_id))
+
+
+class ProgressReader(object):
+    """Wraps the spooled payload and counts the bytes read by the connector."""
+
+    def __init__(self, f, callback):
+        self._f = f
+        self._callback = callback
+        self.name = getattr(f, "name", None)
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._callback(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+class JobRunner(object):
+    """Runs transfer jobs in a bounded pool of workers, with at most `per_user` jobs per owner at once.
+
+    The connectors plug in with `register`: a handler gets the connector instance of the owner,
+    the params of the job and the payload as file object. It returns a truthy value on success."""
+
+    def __init__(self, store=None, workers=job_workers, per_user=jobs_per_user, retention=job_retention,
+                 handlers=handlers):
+        self.store = store if store is not None else JobStore()
+        self.per_user = per_user
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transfer-job")
+        self._handlers = handlers
+        self._jobs = {}
+        self._running = defaultdict(int)
+        self._waiting = defaultdict(deque)
+        self._lock = threading.Lock()
+
+        for job in self.store.load():
+            if job.state in (QUEUED, RUNNING):
+                # the credentials were only kept in memory, so the owner has to come back for it
+                job.state = INTERRUPTED
+                self.store.save(job)
+            self._jobs[job.id] = job
+
+    def submit(self, kind, connector, owner, params, stream):
+        """Spools `stream` to the store and queues a job of `kind` for it. Returns the job."""
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for transfer jobs of kind {kind}.")
+
+        self.purge()
+        job = Job(kind, owner, params)
+        with open(self.store.data_path(job.id), "wb") as f:
+            shutil.copyfileobj(stream, f, 1024 * 1024)
+            job.size = f.tell()
+
+        self.store.save(job)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._enqueue(job, connector)
+        return job
+
+    def get(self, job_id, owner):
+        """Returns the job `job_id`, if it belongs to `owner`, otherwise None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    def resume(self, job, connector):
+        """Queues an interrupted job again with the `connector` of its owner."""
+        with self._lock:
+            if job.state != INTERRUPTED:
+                return job
+            job.state = QUEUED
+            job.transferred = 0
+        self.store.save(job)
+        self._enqueue(job, connector)
+        return job
+
+    def purge(self):
+        """Forgets finished jobs, which are older than the retention time."""
+        deadline = time.time() - self.retention
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job.finished and job.updated < deadline]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            self.store.remove(job.id)
+
+    def close(self):
+        """Waits for the running jobs and stops the workers."""
+        self._executor.shutdown(wait=True)
+
+    def _enqueue(self, job, connector):
+        with self._lock:
+            if self._running[job.owner] >= self.per_user:
+                self._waiting[job.owner].append((job, connector))
+                return
+            self._running[job.owner] += 1
+        self._executor.submit(self._run, job, connector)
+
+    def _next(self, owner):
+        with self._lock:
+            if self._waiting[owner]:
+                job, connector = self._waiting[owner].popleft()
+            else:
+                self._running[owner] -= 1
+                if self._running[owner] == 0:
+                    del self._running[owner]
+                    del self._waiting[owner]
+                return
+        self._executor.submit(self._run, job, connector)
+
+    def _run(self, job, connector):
+        last_save = time.monotonic()
+
+        def progress(count):
+            nonlocal last_save
+            job.transferred += count
+            if time.monotonic() - last_save >= progress_interval:
+                last_save = time.monotonic()
+                self.store.save(job)
+
+        try:
+            job.state = RUNNING
+            self.store.save(job)
+
+            with open(self.store.data_path(job.id), "rb") as f:
+                result = self._handlers[job.kind](connector, job.params, ProgressReader(f, progress))
+
+            if result:
+                job.state = SUCCEEDED
+            else:
+                job.state, job.error = FAILED, "Upload failed."
+        except HTTPException as e:
+            log.error(f"Transfer job {job.id} failed: {e}")
+            job.state, job.error = FAILED, f"{e.code} {e.name}"
+        except Exception as e:
+            log.error(f"Transfer job {job.id} failed: {e}", exc_info=True)
+            job.state, job.error = FAILED, str(e) or type(e).__name__
+        finally:
+            if job.finished:
+                self.store.remove_data(job.id)
+            self.store.save(job)
+            self._next(job.owner)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """Returns the job runner of this process, which loads the persisted jobs on first use."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
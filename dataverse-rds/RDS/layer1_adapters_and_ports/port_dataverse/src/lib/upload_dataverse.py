@@ -1,40 +1,71 @@
-import inspect
-import requests
+import contextlib
 import json
 import os
-import logging
-from flask import abort, request
-import functools
+import mimetypes
+from flask import abort
 import re
-import time
-
-log = logging.getLogger()
-
-
-def _rate_limit(func=None, per_second=1):
-    """Limit number of requests made per second.
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache
+from lib.http_session import get_session
+from lib.instrumentation import with_active_span
+from lib.alias_cache import ensured_aliases
+from lib.streaming import MultipartStream, SpooledUpload, stream_size
+from lib.direct_upload import (
+    DirectUploadFailed, DirectUploadNotSupported, HashedSpool, upload_to_store, use_direct_upload,
+)
+from lib.rate_limiter import rate_limit
+from lib.token_cache import checked_tokens
+from lib.batch import run_batch
+from lib.dataset_locks import DatasetLocked, LockWatcher, RegistrationQueue, is_lock_error, lock_retries
+from lib.dedupe import Manifest, Manifests, dedupe, normalize_checksum, skipped
+from lib.deletion import delete_files
+from lib.sync import RemoteFile, sync
+from lib.logs import get_logger
+from lib.request_data import user_id as request_user_id
+
+log = get_logger(__name__)
+
+lookup_workers = int(os.getenv("DATAVERSE_LOOKUP_WORKERS", 8))
+upload_spool = os.getenv("DATAVERSE_UPLOAD_SPOOL", "False") == "True"
+
+# memoized dataset id -> persistent_id map, keyed by (api address, dataset id)
+_persistent_ids = LRUCache(maxsize=int(os.getenv("DATAVERSE_PERSISTENT_ID_CACHE_SIZE", 10000)))
+_persistent_ids_lock = threading.Lock()
+
+
+def registration_errors(response):
+    """Returns the error of every file, which addFiles did not add, by storage identifier."""
+    return {
+        f.get("storageIdentifier"): f.get("errorMessage", "Registration failed.")
+        for f in response.json()["data"]["Files"] if f.get("status") != "ADDED"
+    }
+
+
+def _message(response):
+    try:
+        return response.json().get("message") or response.reason
+    except ValueError:
+        return response.text[:200] or response.reason
 
-    Will sleep for 1/``per_second`` seconds if the last request was
-    made too recently.
-    """
 
-    if not func:
-        return functools.partial(_rate_limit, per_second=per_second)
+def _position(file):
+    try:
+        return file.tell()
+    except Exception:
+        return None
 
-    @functools.wraps(func)
-    def wrapper(self, *args, **kwargs):
-        if hasattr(self, "last_request") and self.last_request is not None:
-            now = time.time()
-            delta = now - self.last_request
-            if delta < (1 / per_second):
-                waittimer = (1 / per_second) - delta
-                log.debug("rate limiter wait for {}ms", waittimer)
-                time.sleep(waittimer)
 
-        self.last_request = time.time()
-        return func(self, *args, **kwargs)
+def request_email():
+    """Returns the email in the userId of the current request.
 
-    return wrapper
+    Without a request or userId (for example in testing) the email of the parent dataverse is returned.
+    An asynchronous transfer job runs outside of the request, so it is read when the job is submitted."""
+    try:
+        user_id = request_user_id()
+        return user_id.split(":")[1].split("//")[1]
+    except:
+        return "surf@surf-rds.nl"
 
 
 class Dataverse(object):
@@ -47,6 +78,12 @@ class Dataverse(object):
             )
 
         self.api_key = api_key
+        self.session = get_session(self.dataverse_api_address)
+        # the instance is reused for the same credentials, so the backoff of a dataset is kept between requests
+        self._lock_watchers = LRUCache(maxsize=64)
+        self._lock_watchers_lock = threading.Lock()
+        # the files of a dataset are looked up once for all uploads of a transfer
+        self.manifests = Manifests(self.file_manifest)
 
         # monkeypatching all functions with internals
         self.get_dataset = self.get_dataset_internal
@@ -99,18 +136,23 @@ class Dataverse(object):
 
         Returns `True` if the token is correct and usable, otherwise `False`."""
         log.debug("Check token: Starts")
-        
-        response = cls(api_key, *args, **kwargs).create_new_dataset(return_response=True)
-        
-        persistent_id = response.json()['data']['persistentId']
+        dataverse = cls(api_key, *args, **kwargs)
+        return checked_tokens.check((dataverse.dataverse_api_address, api_key), dataverse.probe_token)
 
-        r = cls(api_key, *args, **kwargs).get_dataset(persistent_id=persistent_id, return_response=True)
-        log.debug(f"Check Token: Status Code: {r.status_code}")
+    def probe_token(self):
+        """Asks dataverse for the user, which owns the api key. This call changes nothing.
 
-        # cleanup
-        cls(api_key, *args, **kwargs).remove_dataset(persistent_id)
+        Returns `True` if the token is accepted, `False` if it is rejected.
+        Raises an HTTPError for any other answer, so it is not cached as invalid."""
+        r = self.session.request(
+            "GET", f"{self.dataverse_api_address}/users/:me", headers={"X-Dataverse-key": self.api_key}
+        )
+        log.debug("Check Token: Status Code: %s", r.status_code)
 
-        return r.status_code == 200
+        if r.status_code in (401, 403):
+            return False
+        r.raise_for_status()
+        return True
 
     def set_metadata(self, metadata=None):
         """Set the minimum required metadata if metadata is None
@@ -118,7 +160,7 @@ class Dataverse(object):
         Returns:
             dict: metadata for testing purposes
         """
-        log.debug(f"set_metadata in: {metadata}")
+        log.debug("set_metadata in: %s", metadata)
         if metadata is None:
             title = "untitled"
             authorName = "not set"
@@ -207,42 +249,40 @@ class Dataverse(object):
                         }
                     }
                 }
-        log.debug(f"set_metadata out: {metadata}")
+        log.debug("set_metadata out: %s", metadata)
         return metadata
 
 
-    def get_user_dataverse(self):
+    def get_user_dataverse(self, refresh=False, email=None):
         """This method will return a dataverse name based on the userId.
-        Each time it is called it will try to create a dataverse with the name
-        based on the userId. If it already exists, then it will not create a new
-        dataverse, but return the existing dataverse name.
+        If the dataverse was not already ensured recently (see lib.alias_cache),
+        it will try to create a dataverse with the name based on the userId.
+        If it already exists, then it will not create a new dataverse, but
+        return the existing dataverse name.
 
         If it is not possible to retreive a userId or create a new dataverse (for
         example in testing), then the parent dataverse name will be returned.
 
+        Args:
+            refresh (bool, optional): Set to True will ignore the cache and issue the create call,
+                e.g. after dataverse responded with 404 for the cached dataverse. Defaults to False.
+            email (str, optional): email of the user, e.g. of a transfer job, which runs outside of the request.
+                Defaults to the email in the userId of the request, see request_email.
+
         Returns:
             _str: name of the dataverse
         """
         # parent dataverse at demo.dataverse.nl is "root"
         parent_dataverse = "surf"
 
-        # get userid
-        try:
-            req = request.get_json(force=True)
-        except:
-            try:
-                req = request.form.to_dict()
-            except:
-                req = None
-        log.debug("got request data: {}".format(req))
+        if email is None:
+            email = request_email()
+        dataverse_user = re.sub('[\W\_]', '', email)
 
-        try:
-            user_id = req.get("userId")
-            email = user_id.split(":")[1].split("//")[1]
-            dataverse_user = re.sub('[\W\_]', '', email)
-        except:
-            email = "surf@surf-rds.nl"
-            dataverse_user = re.sub('[\W\_]', '', email)
+        if refresh:
+            ensured_aliases.invalidate(self.dataverse_api_address, dataverse_user)
+        elif ensured_aliases.is_ensured(self.dataverse_api_address, dataverse_user):
+            return dataverse_user
 
         # create a dataverse inside the parent dataverse of the installation
         # If it already exist it will not be created
@@ -264,8 +304,13 @@ class Dataverse(object):
         }
         url = f"{self.dataverse_api_address}/dataverses/{parent_dataverse}"
         payload = json.dumps(dataverse)
-        r = requests.request("POST", url, headers=headers, data=payload)
-        
+        r = self.session.request("POST", url, headers=headers, data=payload)
+
+        if r.status_code < 300 or "already exists" in r.text:
+            ensured_aliases.mark_ensured(self.dataverse_api_address, dataverse_user)
+        else:
+            log.debug("Could not ensure dataverse %s: Status Code: %s", dataverse_user, r.status_code)
+
         return dataverse_user
 
 
@@ -283,18 +328,73 @@ class Dataverse(object):
             'Content-Type': 'application/json'
         }
         
+        with _persistent_ids_lock:
+            persistent_id = _persistent_ids.get((self.dataverse_api_address, id))
+        if persistent_id is not None:
+            return persistent_id
+
         url = f"{self.dataverse_api_address}/datasets/{id}/"
         
-        r = requests.request("GET", url, headers=headers)
+        r = self.session.request("GET", url, headers=headers)
 
         persistent_id = r.json()["data"]["latestVersion"]["datasetPersistentId"]
+
+        with _persistent_ids_lock:
+            _persistent_ids[(self.dataverse_api_address, id)] = persistent_id
         
         return persistent_id
 
+    def get_persistent_ids(self, datasets: list):
+        """Will get the persistent_ids of many datasets at once.
+
+        The persistent_id is taken from the `protocol`, `authority` and `identifier`
+        fields of the dataverse contents payload, if they are present. Only for the
+        remaining datasets the ids are looked up, with at most `DATAVERSE_LOOKUP_WORKERS`
+        concurrent requests. Resolved ids are memoized, so a listing needs no extra
+        round-trips for known datasets.
+
+        Args:
+            datasets (list): items of the /dataverses/{alias}/contents response
+
+        Returns:
+            dict: dataset id -> persistent_id, datasets without id or which could not be resolved are missing
+        """
+        result = {}
+        missing = []
+
+        for dataset in datasets:
+            id = dataset.get("id")
+            if id is None:
+                continue
+            if all(dataset.get(key) for key in ("protocol", "authority", "identifier")):
+                result[id] = f"{dataset['protocol']}:{dataset['authority']}/{dataset['identifier']}"
+                with _persistent_ids_lock:
+                    _persistent_ids[(self.dataverse_api_address, id)] = result[id]
+            else:
+                missing.append(id)
+
+        if missing:
+            log.debug("lookup persistent_ids for %s datasets", len(missing))
+            def lookup(id):
+                try:
+                    return self.get_persistent_id_with_id(id)
+                except Exception as e:
+                    log.error(f"Could not get persistent_id for dataset {id}: {e}")
+
+            with ThreadPoolExecutor(max_workers=min(lookup_workers, len(missing))) as executor:
+                for id, persistent_id in zip(missing, executor.map(with_active_span(lookup), missing)):
+                    if persistent_id is not None:
+                        result[id] = persistent_id
 
-    def get_latest_persistent_id(self):
+        return result
+
+
+    def get_latest_persistent_id(self, email=None):
         """Gets the persistent_id of the latest dataset created
 
+        Args:
+            email (str, optional): email of the user, see get_user_dataverse. Defaults to None.
+
         Returns:
             str: persistent_id of the dataset
         """
@@ -304,18 +404,22 @@ class Dataverse(object):
             'Content-Type': 'application/json'
         }
         
-        user_dataverse = self.get_user_dataverse()
+        user_dataverse = self.get_user_dataverse(email=email)
         
         url = f"{self.dataverse_api_address}/dataverses/{user_dataverse}/contents"
         
-        r = requests.request("GET", url, headers=headers)
+        r = self.session.request("GET", url, headers=headers)
+        if r.status_code == 404:
+            user_dataverse = self.get_user_dataverse(refresh=True, email=email)
+            url = f"{self.dataverse_api_address}/dataverses/{user_dataverse}/contents"
+            r = self.session.request("GET", url, headers=headers)
         
         last_dataset_id = r.json()["data"][-1]['id']
 
         return self.get_persistent_id_with_id(last_dataset_id)
     
 
-    @_rate_limit(per_second=5)
+    @rate_limit(per_second=5, address="dataverse_api_address")
     def get_dataset_internal(
         self, persistent_id: str = None, return_response: bool = False, metadataFilter: dict = None
     ):
@@ -331,8 +435,7 @@ class Dataverse(object):
         Returns:
             json: : API response if return_response is set to True
         """
-        log.debug(
-            f"Entering at lib/upload_dataverse.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_dataverse.py get_dataset_internal")
 
         user_dataverse = self.get_user_dataverse()
 
@@ -346,7 +449,12 @@ class Dataverse(object):
                 url = f"{self.dataverse_api_address}/datasets/:persistentId/?persistentId={persistent_id}"
             else:
                 url = f"{self.dataverse_api_address}/dataverses/{user_dataverse}/contents"
-            r = requests.request("GET", url, headers=headers)
+            r = self.session.request("GET", url, headers=headers)
+            if r.status_code == 404 and persistent_id is None:
+                # the cached dataverse is gone, so create it again
+                user_dataverse = self.get_user_dataverse(refresh=True)
+                url = f"{self.dataverse_api_address}/dataverses/{user_dataverse}/contents"
+                r = self.session.request("GET", url, headers=headers)
             if return_response:
                 return r
             if r.status_code >= 300:
@@ -356,8 +464,7 @@ class Dataverse(object):
             return result
     
         except Exception as e:
-            log.error(
-                f"Exception at lib/upload_dataverse.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            log.error("Exception at lib/upload_dataverse.py get_dataset_internal")
             log.error(str(e))
 
 
@@ -372,10 +479,9 @@ class Dataverse(object):
         Returns:
             json: API response if return_response is set to True
         """
-        log.debug(
-            f"Entering at lib/upload_dataverse.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_dataverse.py create_new_dataset_internal")
         log.debug("Create new dataset: Starts")
-        log.debug(f"### metadata: {metadata}")
+        log.debug("### metadata: %s", metadata)
 
         user_dataverse = self.get_user_dataverse()
 
@@ -392,10 +498,13 @@ class Dataverse(object):
         metadata = self.set_metadata(metadata)
         metadata = { 'datasetVersion': metadata }
         payload = json.dumps(metadata)
-        r = requests.request("POST", url, headers=headers, data=payload)
+        r = self.session.request("POST", url, headers=headers, data=payload)
+        if r.status_code == 404:
+            user_dataverse = self.get_user_dataverse(refresh=True)
+            url = f"{self.dataverse_api_address}/dataverses/{user_dataverse}/datasets"
+            r = self.session.request("POST", url, headers=headers, data=payload)
 
-        log.debug(
-            f"Create new datasets: Status Code: {r.json()}")
+        log.debug("Create new datasets: Status Code: %s", r.json())
 
         return r.json() if not return_response else r
 
@@ -409,67 +518,390 @@ class Dataverse(object):
         Returns:
             json: API response if return_response is set to True
         """
-        log.debug(
-            f"Entering at lib/upload_dataverse.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_dataverse.py remove_dataset_internal")
         headers = {
             'X-Dataverse-key': self.api_key,
             'Content-Type': 'application/json'
         }
 
         url = f"{self.dataverse_api_address}/datasets/:persistentId/?persistentId={persistent_id}"
-        r = requests.request("DELETE", url, headers=headers)
+        r = self.session.request("DELETE", url, headers=headers)
 
         return r.status_code == 204 if not return_response else r
 
     def upload_new_file_to_dataset_internal(
-        self, persistent_id: str, path_to_file: str, file=None, return_response=False, test=False
+        self, persistent_id: str, path_to_file: str, file=None, return_response=False, test=False, spool=None,
+        email=None, size=None
     ):
         """Uploads a file to a dataset on Dataverse.
 
+        The file is streamed to dataverse in bounded chunks, so it is neither kept in memory
+        nor written to the working directory. A file of known size above DATAVERSE_DIRECT_UPLOAD_THRESHOLD
+        is sent directly to the store of the dataset instead, see direct_upload. The file is added or
+        registered as soon as the dataset is unlocked, see lib/dataset_locks.py. A file, which is already
+        in the dataset with the same name and checksum, is not uploaded again, see lib/dedupe.py.
+
         Args:
             persistent_id (str): id of the dataset to upload to
             path_to_file (str): path to the file to be uploaded. Example: ~/mydatapackage.csv
-            file (bytes, optional): file as a bytes object. Defaults to None.
+            file (file-like, optional): file object or stream with a read method. Defaults to None.
             return_response (bool, optional): Set to True will return the API response. Defaults to False.
+            spool (bool, optional): Set to True will copy the file into a temporary file first, which will be
+                removed afterwards. Defaults to the environment variable DATAVERSE_UPLOAD_SPOOL.
+            email (str, optional): email of the user, whose latest dataset is used without persistent_id,
+                see get_user_dataverse. Defaults to None.
+            size (int, optional): upper bound for the size of a stream, which cannot tell its size, e.g. the
+                content length of the request. It is only used to choose the direct upload. Defaults to None.
 
         Returns:
-            bool: Alternative: json if return_response=True
+            bool: Alternative: json if return_response=True, the result of lib.dedupe.skipped if the file was skipped
         """
-        log.debug(
-            f"Entering at lib/upload_dataverse.py {inspect.getframeinfo(inspect.currentframe()).function}")
-               
-        try:
-            if not test:
-                with open(path_to_file, 'wb') as ff:
-                    ff.write(file.read())
-
-            file_content = open(path_to_file, 'rb')
+        log.debug("Entering at lib/upload_dataverse.py upload_new_file_to_dataset_internal")
 
-            files = {'file': (path_to_file.split("/")[-1], file_content)}
+        if spool is None:
+            spool = upload_spool
 
-            params = dict()#dict(description='not set',
-                      #    categories=['other'])
-
-            params_as_json_string = json.dumps(params)
-
-            payload = dict(jsonData=params_as_json_string)
+        try:
             if persistent_id == "None" or persistent_id is None:
-                persistent_id = self.get_latest_persistent_id()
-
-            url_persistent_id = f"{self.dataverse_api_address}/datasets/:persistentId/add?persistentId={persistent_id}&key={self.api_key}"
-
-            response = requests.post(
-                url_persistent_id, data=payload, files=files)
+                persistent_id = self.get_latest_persistent_id(email=email)
+
+            with contextlib.ExitStack() as stack:
+                known_size = None if test else stream_size(file)
+                direct = not test and use_direct_upload(known_size if known_size is not None else size)
+                if not test and not direct:
+                    file, saved = stack.enter_context(
+                        dedupe(self.manifests, persistent_id, path_to_file, file, known_size))
+                    if file is None:
+                        return skipped(saved)
+
+                if test:
+                    # in testing we do not have a file object passed in
+                    file = stack.enter_context(open(path_to_file, 'rb'))
+                elif direct:
+                    # a stream without size is spooled by its hint, the spool knows the exact size. It is
+                    # hashed anyway, so it is compared with the dataset afterwards instead of in dedupe.
+                    checksums = self.manifests.candidate(persistent_id, path_to_file, known_size)
+                    spooled = stack.enter_context(HashedSpool(file, [algorithm for algorithm, _ in checksums]))
+                    if spooled.matches(checksums):
+                        return skipped(spooled.size)
+                    try:
+                        entry = self.direct_upload(persistent_id, path_to_file, spooled)
+                        self.dataset_locks(persistent_id).wait()
+                        response = self.register_files(persistent_id, [entry])
+                        errors = registration_errors(response)
+                        if errors:
+                            raise DirectUploadFailed(errors[entry["storageIdentifier"]])
+                        self.manifests.update(persistent_id, path_to_file, spooled.size, ("md5", spooled.md5))
+                        return response if return_response else {"success": True}
+                    except DirectUploadNotSupported as e:
+                        log.debug("Direct upload not possible, upload through dataverse: %s", e)
+                        file = spooled.file
+                        file.seek(0)
+                elif spool:
+                    file = stack.enter_context(SpooledUpload(file))
+
+                response = self.add_file(persistent_id, path_to_file, file)
+                self.manifests.update(persistent_id, path_to_file)
 
             if return_response:
                 return response
             return {"success": True}
 
         except Exception as e:
-            log.error(
-                f"Exception at lib/upload_dataverse.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            log.error("Exception at lib/upload_dataverse.py upload_new_file_to_dataset_internal")
             log.error(str(e))
 
+    def upload_files_to_dataset(self, persistent_id, files, workers=None):
+        """Uploads many files to a dataset on Dataverse.
+
+        The dataset is resolved once for the whole batch. Files above DATAVERSE_DIRECT_UPLOAD_THRESHOLD
+        are sent to the store of the dataset in parallel. Dataverse locks the dataset after every change,
+        so the stored files are queued and registered with one addFiles call each time the dataset is
+        unlocked, while the next files are still sent to the store. The other files are added through
+        dataverse one after another, each as soon as the dataset is unlocked. Files, which are already in
+        the dataset with the same name and checksum, are skipped, the files of the dataset are listed once.
+
+        Args:
+            persistent_id (str): id of the dataset to upload to
+            files (list): BatchFile objects, see lib/batch.py
+            workers (int, optional): files sent to the store at the same time. Defaults to BATCH_UPLOAD_WORKERS.
+
+        Returns:
+            list: one result for every file, see lib.batch.run_batch
+        """
+        if persistent_id == "None" or persistent_id is None:
+            persistent_id = self.get_latest_persistent_id()
+
+        direct = [f for f in files if f.file is not None and use_direct_upload(f.size)]
+        not_supported = set()
+        register = lambda entries: registration_errors(self.register_files(persistent_id, entries))
+
+        with RegistrationQueue(register, self.dataset_locks(persistent_id)) as registrations:
+            def send(batch_file):
+                position = batch_file.file.tell()
+                checksums = self.manifests.candidate(persistent_id, batch_file.filename, batch_file.size)
+                with HashedSpool(batch_file.file, [algorithm for algorithm, _ in checksums]) as spooled:
+                    # the spool hashes the file anyway, so it is compared with the dataset afterwards
+                    if spooled.matches(checksums):
+                        return skipped(spooled.size)
+                    try:
+                        registrations.put(
+                            batch_file.filename, self.direct_upload(persistent_id, batch_file.filename, spooled))
+                    except DirectUploadNotSupported:
+                        batch_file.file.seek(position)
+                        not_supported.add(batch_file.filename)
+                        raise
+                return True
+
+            results = {result["filename"]: result for result in run_batch(direct, send, workers)} if direct else {}
+
+        for filename, error in registrations.errors.items():
+            results[filename] = {"filename": filename, "success": False, "error": error}
+        log.debug("registered %s files with %s calls", len(direct) - len(not_supported), registrations.calls)
+
+        # the store does not accept direct uploads or the files are small, so they go through dataverse
+        remaining = [f for f in files if f.filename not in results or f.filename in not_supported]
+        def add(batch_file):
+            with dedupe(self.manifests, persistent_id, batch_file.filename, batch_file.file, batch_file.size) as (file, saved):
+                if file is None:
+                    return skipped(saved)
+                response = self.add_file(persistent_id, batch_file.filename, file)
+            self.manifests.update(persistent_id, batch_file.filename)
+            return response
+
+        for result in run_batch(remaining, add, workers=1) if remaining else []:
+            results[result["filename"]] = result
+
+        for f in direct:
+            if results[f.filename].get("success") and not results[f.filename].get("skipped"):
+                self.manifests.update(persistent_id, f.filename)
+        return [results[f.filename] for f in files]
+
+    def dataset_locks(self, persistent_id):
+        """Returns the LockWatcher of the dataset."""
+        with self._lock_watchers_lock:
+            watcher = self._lock_watchers.get(persistent_id)
+            if watcher is None:
+                watcher = LockWatcher(self.session, self.dataverse_api_address, self.api_key, persistent_id)
+                self._lock_watchers[persistent_id] = watcher
+        return watcher
+
+    def add_file(self, persistent_id, path_to_file, file):
+        """Adds a file through dataverse with the add call, as soon as the dataset is unlocked.
+
+        If the call collides with a lock, which was set in the meantime, it is sent again after the
+        next unlock, as long as the file can be read again.
+
+        Args:
+            persistent_id (str): id of the dataset to upload to
+            path_to_file (str): path of the file, the filename is sent to dataverse.
+            file (file-like): file object or stream with a read method.
+
+        Raises:
+            DatasetLocked: if the dataset stays locked.
+            ValueError: if dataverse rejects the file, with the message of dataverse.
+
+        Returns:
+            requests.Response: the response of the add call
+        """
+        url_persistent_id = f"{self.dataverse_api_address}/datasets/:persistentId/add?persistentId={persistent_id}&key={self.api_key}"
+        return self.send_file(persistent_id, url_persistent_id, path_to_file, file)
+
+    def replace_file(self, persistent_id, file_id, path_to_file, file):
+        """Replaces the file `file_id` of the dataset with the replace call, as soon as the dataset is unlocked.
+
+        The new version of the file may have another name or content type. It goes through
+        dataverse like add_file, also above DATAVERSE_DIRECT_UPLOAD_THRESHOLD.
+
+        Args:
+            persistent_id (str): id of the dataset
+            file_id (int): id of the file to replace
+            path_to_file (str): path of the file, the filename is sent to dataverse.
+            file (file-like): file object or stream with a read method.
+
+        Raises:
+            DatasetLocked: if the dataset stays locked.
+            ValueError: if dataverse rejects the file, with the message of dataverse.
+
+        Returns:
+            requests.Response: the response of the replace call
+        """
+        return self.send_file(
+            persistent_id, f"{self.dataverse_api_address}/files/{file_id}/replace", path_to_file, file, {"forceReplace": True})
+
+    def send_file(self, persistent_id, url, path_to_file, file, json_data=None):
+        """Posts a file as multipart form to `url` of the dataset, see add_file.
+
+        If the call collides with a lock, which was set in the meantime, it is sent again after the
+        next unlock, as long as the file can be read again.
+        """
+        watcher = self.dataset_locks(persistent_id)
+        position = _position(file)
+        filename = path_to_file.split("/")[-1]
+        payload = dict(jsonData=json.dumps(json_data or {}))
+
+        for attempt in range(lock_retries + 1):
+            watcher.wait()
+            stream = MultipartStream(payload, "file", filename, file)
+            response = self.session.post(
+                url, data=stream.body(), headers={"Content-Type": stream.content_type, "X-Dataverse-key": self.api_key})
+            log.debug("uploaded %s bytes, Status Code: %s", stream.bytes_read, response.status_code)
+
+            if not is_lock_error(response):
+                break
+            if position is None or attempt == lock_retries:
+                raise DatasetLocked(f"Dataset {persistent_id} is locked: {_message(response)}")
+            file.seek(position)
+
+        if response.status_code >= 300:
+            raise ValueError(f"Dataverse rejected {filename}: {_message(response)}")
+        return response
+
+    def direct_upload(self, persistent_id, path_to_file, spooled, workers=None):
+        """Sends a spooled file directly to the store of the dataset, without registering it.
+
+        Args:
+            persistent_id (str): id of the dataset to upload to
+            path_to_file (str): path of the file, the filename is used for the registration.
+            spooled (HashedSpool): the file with its size and md5.
+            workers (int, optional): parts sent at the same time. Defaults to DATAVERSE_DIRECT_UPLOAD_WORKERS.
+
+        Raises:
+            DirectUploadNotSupported: if dataverse returns no upload urls for the dataset.
+
+        Returns:
+            dict: the entry for register_files
+        """
+        r = self.session.get(
+            f"{self.dataverse_api_address}/datasets/:persistentId/uploadurls",
+            params={"persistentId": persistent_id, "size": spooled.size},
+            headers={"X-Dataverse-key": self.api_key},
+        )
+        if r.status_code >= 300:
+            raise DirectUploadNotSupported(f"uploadurls answered with status {r.status_code}")
+
+        # the urls for completing and aborting multipart uploads are relative to the installation
+        server_address = self.dataverse_api_address.rstrip("/")
+        if server_address.endswith("/api"):
+            server_address = server_address[:-len("/api")]
+
+        storage_identifier = upload_to_store(r.json()["data"], spooled, server_address + "/", self.api_key, workers)
+        log.debug("sent %s bytes directly to %s", spooled.size, storage_identifier)
+
+        filename = path_to_file.split("/")[-1]
+        return {
+            "storageIdentifier": storage_identifier,
+            "fileName": filename,
+            "mimeType": mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            "checksum": {"@type": "MD5", "@value": spooled.md5},
+        }
+
+    def register_files(self, persistent_id, entries):
+        """Registers files, which were sent directly to the store, in the dataset with one addFiles call.
+
+        Args:
+            persistent_id (str): id of the dataset
+            entries (list): entries returned by direct_upload
+
+        Raises:
+            DatasetLocked: if the call collided with a lock of the dataset.
+            DirectUploadFailed: if dataverse rejects the call.
+
+        Returns:
+            requests.Response: the addFiles response with the state of every file
+        """
+        r = self.session.post(
+            f"{self.dataverse_api_address}/datasets/:persistentId/addFiles",
+            params={"persistentId": persistent_id},
+            files={"jsonData": (None, json.dumps(entries))},
+            headers={"X-Dataverse-key": self.api_key},
+        )
+        log.debug("registered %s files, Status Code: %s", len(entries), r.status_code)
+        if is_lock_error(r):
+            raise DatasetLocked(f"Dataset {persistent_id} is locked: {_message(r)}")
+        if r.status_code >= 300:
+            raise DirectUploadFailed(f"addFiles answered with status {r.status_code}")
+        return r
+
+    def remote_files(self, persistent_id):
+        """Returns the files in the latest version of the dataset with one call.
+
+        Ingested tabular files are renamed by dataverse, they are returned with the name and the
+        size of the uploaded original, which their checksum belongs to.
+
+        Args:
+            persistent_id (str): id of the dataset
+
+        Raises:
+            ValueError: if the files cannot be listed.
+
+        Returns:
+            list: RemoteFile objects with the file id, see lib/sync.py
+        """
+        r = self.session.get(
+            f"{self.dataverse_api_address}/datasets/:persistentId/versions/:latest/files",
+            params={"persistentId": persistent_id},
+            headers={"X-Dataverse-key": self.api_key},
+        )
+        if r.status_code >= 300:
+            raise ValueError(f"Files of {persistent_id} answered with status {r.status_code}")
+
+        result = []
+        for f in r.json().get("data") or []:
+            data_file = f.get("dataFile", {})
+            checksum = data_file.get("checksum") or {"type": "MD5", "value": data_file.get("md5")}
+            result.append(RemoteFile(
+                data_file.get("originalFileName") or f.get("label") or data_file.get("filename", ""),
+                data_file.get("originalFileSize", data_file.get("filesize")),
+                normalize_checksum(checksum.get("value"), checksum.get("type")),
+                data_file.get("id"),
+            ))
+        return result
+
+    def file_manifest(self, persistent_id):
+        """Returns the Manifest of the files in the latest version of the dataset, see lib/dedupe.py.
+
+        It is empty, if the dataset cannot be read, so every file is uploaded."""
+        try:
+            files = self.remote_files(persistent_id)
+        except ValueError as e:
+            log.debug(str(e))
+            files = []
+        return Manifest((f.name, f.size, f.checksum) for f in files)
+
+    def sync_dataset(self, persistent_id, entries, files, dry_run=False, workers=None):
+        """Makes the dataset contain exactly the files of the manifest `entries`, see lib/sync.py.
+
+        Only the differences are applied: new files are uploaded like a batch, changed files are
+        replaced with a new version and the other files are deleted.
+
+        Args:
+            persistent_id (str): id of the dataset
+            entries (list): SyncEntry objects of the manifest
+            files (dict): path -> BatchFile with the data of the new and changed files
+            dry_run (bool, optional): Set to True will only return the changes. Defaults to False.
+            workers (int, optional): replacements and deletions at the same time. Defaults to SYNC_WORKERS.
+
+        Returns:
+            dict: the changes and the result of every change
+        """
+        if persistent_id == "None" or persistent_id is None:
+            persistent_id = self.get_latest_persistent_id()
+
+        try:
+            return sync(
+                entries, self.remote_files(persistent_id), files,
+                add=lambda batch_files: self.upload_files_to_dataset(persistent_id, batch_files),
+                replace=lambda remote, batch_file: self.replace_file(
+                    persistent_id, remote.id, batch_file.filename, batch_file.file),
+                delete=lambda remote: self.delete_file(persistent_id, remote.id),
+                # the first deletion creates the draft of a published dataset
+                delete_all=lambda remotes, workers: self.delete_remote_files(persistent_id, remotes, workers),
+                dry_run=dry_run, workers=workers,
+            )
+        finally:
+            self.manifests.invalidate(persistent_id)
+
     def get_files_from_dataset(self, persistent_id):
         """will get all the files metadata from the dataset requested.
 
@@ -505,8 +937,7 @@ class Dataverse(object):
             ]
         ```
         """
-        log.debug(
-            f"Entering at lib/upload_dataverse.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_dataverse.py get_files_from_dataset")
 
         response = self.get_dataset(
             persistent_id=persistent_id, return_response=True)
@@ -529,8 +960,7 @@ class Dataverse(object):
         Returns:
             object: response of the PUT request to the datasets endpoint
         """
-        log.debug(
-            f"### Entering at lib/upload_dataverse.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("### Entering at lib/upload_dataverse.py change_metadata_in_dataset_internal")
 
         headers = {
             'X-Dataverse-key': self.api_key,
@@ -539,18 +969,18 @@ class Dataverse(object):
 
         url = f"{self.dataverse_api_address}/datasets/:persistentId/versions/:draft?persistentId={persistent_id}"
 
-        log.debug(f"### metadata change_metadata_in_dataset_internal: {metadata}")
+        log.debug("### metadata change_metadata_in_dataset_internal: %s", metadata)
 
         
         metadata = self.set_metadata(metadata)
-        print(metadata)
+        log.debug("metadata", metadata=metadata)
         payload = json.dumps(metadata)
 
-        log.debug(f"### payload: {payload}")
+        log.debug("### payload: %s", payload)
 
-        r = requests.request("PUT", url, headers=headers, data=payload)
+        r = self.session.request("PUT", url, headers=headers, data=payload)
         
-        log.debug(f"### r: {r}") 
+        log.debug("### r: %s", r) 
 
         return r.status_code == 204 if not return_response else r
 
@@ -564,8 +994,7 @@ class Dataverse(object):
         Returns:
             object: response of the POST request to the datasets publish endpoint
         """
-        log.debug(
-            f"Entering at lib/upload_dataverse.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_dataverse.py publish_dataset_internal")
         headers = {
             'X-Dataverse-key': self.api_key,
             'Content-Type': 'application/json'
@@ -573,10 +1002,76 @@ class Dataverse(object):
 
         url = f"{self.dataverse_api_address}/datasets/:persistentId/actions/:publish?persistentId={persistent_id}&type=major"
 
-        r = requests.request("POST", url, headers=headers)
+        r = self.session.request("POST", url, headers=headers)
 
         return r.status_code == 204 if not return_response else r
 
+    def delete_file(self, persistent_id, file_id):
+        """Deletes a file from the draft version of the dataset with the native delete call.
+
+        Args:
+            persistent_id (str): id of the dataset
+            file_id (int): id of the file
+
+        Raises:
+            DatasetLocked: if the dataset stays locked.
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        watcher = self.dataset_locks(persistent_id)
+        for attempt in range(lock_retries + 1):
+            watcher.wait()
+            r = self.session.delete(
+                f"{self.dataverse_api_address}/files/{file_id}", headers={"X-Dataverse-key": self.api_key})
+            if not is_lock_error(r):
+                break
+            if attempt == lock_retries:
+                raise DatasetLocked(f"Dataset {persistent_id} is locked: {_message(r)}")
+
+        log.debug("deleted file %s, Status Code: %s", file_id, r.status_code)
+        return r.status_code < 300
+
+    def delete_files_from_dataset(self, persistent_id, workers=None):
+        """Deletes all files from the draft version of the dataset, see lib/deletion.py.
+
+        The files are listed with one call. The first deletion creates the draft of a published
+        dataset, so it runs alone, the other files are deleted with at most `workers` at the same time.
+
+        Args:
+            persistent_id (str): id of the dataset
+            workers (int, optional): deletions at the same time. Defaults to DELETE_WORKERS.
+
+        Raises:
+            ValueError: if the files cannot be listed.
+
+        Returns:
+            list: the result of every file, e.g. {"filename": "a.csv", "success": True}
+        """
+        files = self.remote_files(persistent_id)
+        log.debug("delete files from dataset", persistent_id=persistent_id, files=len(files))
+
+        try:
+            return self.delete_remote_files(persistent_id, files, workers)
+        finally:
+            self.manifests.invalidate(persistent_id)
+
+    def delete_remote_files(self, persistent_id, files, workers=None):
+        """Deletes the RemoteFiles `files` of the dataset, see delete_files_from_dataset.
+
+        The first deletion runs alone, because it creates the draft of a published dataset.
+        If it fails, the other files are not tried."""
+        def delete(remote):
+            return self.delete_file(persistent_id, remote.id)
+
+        results = delete_files(files[:1], delete, workers=1)
+        if not all(result["success"] for result in results):
+            # without a draft, every other deletion fails the same way
+            return results + [{"filename": remote.name, "success": False,
+                              "error": "Not deleted, because the first deletion failed."}
+                              for remote in files[1:]]
+        return results + delete_files(files[1:], delete, workers)
+
     def delete_all_files_from_dataset_internal(self, persistent_id):
         """Will delete all files from an dataset.
 
@@ -586,19 +1081,17 @@ class Dataverse(object):
         Returns:
             bool: True if successful, False if not
         """
-        log.debug(
-            f"Entering at lib/upload_dataverse.py {inspect.getframeinfo(inspect.currentframe()).function}")
-        for file in self.get_files_from_dataset(persistent_id):
-            log.debug(f"found file: {file}")
-
-            if not self.delete_file_from_dataset_internal(persistent_id, file["dataFile"]["id"]):
-                return False
+        log.debug("Entering at lib/upload_dataverse.py delete_all_files_from_dataset_internal")
+        try:
+            results = self.delete_files_from_dataset(persistent_id)
+        except ValueError as e:
+            log.error(str(e))
+            return False
 
-        return True
+        return all(result["success"] for result in results)
 
     def delete_file_from_dataset_internal(self, persistent_id, file_id):
-        """Not supported
-        Will delete a file from an dataset
+        """Will delete a file from an dataset
 
         Args:
             persistent_id (int): id of the dataset
@@ -607,11 +1100,14 @@ class Dataverse(object):
         Returns:
             bool: True if successful, False if not
         """
-        log.debug(
-            f"Entering at lib/upload_dataverse.py {inspect.getframeinfo(inspect.currentframe()).function}")
-        log.debug("Deletion of dataset files is not supported by the Dataverse API")
-
-        return False
+        log.debug("Entering at lib/upload_dataverse.py delete_file_from_dataset_internal")
+        try:
+            return self.delete_file(persistent_id, file_id)
+        except DatasetLocked as e:
+            log.error(str(e))
+            return False
+        finally:
+            self.manifests.invalidate(persistent_id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import time
+import unittest
+
+from lib.alias_cache import AliasCache, ensured_aliases, alias_cache_hits, alias_cache_misses
+from lib.upload_dataverse import Dataverse
+from stub_server import StubServer
+
+api_address = "https://demo.dataverse.nl/api"
+
+
+class TestAliasCache(unittest.TestCase):
+    """Tests for the cache of already ensured user dataverses."""
+
+    def setUp(self):
+        ensured_aliases.clear()
+
+    def test_ensured_alias(self):
+        cache = AliasCache(path=None)
+        self.assertFalse(cache.is_ensured(api_address, "user"))
+
+        cache.mark_ensured(api_address, "user")
+
+        self.assertTrue(cache.is_ensured(api_address, "user"))
+        self.assertTrue(cache.is_ensured(api_address + "/", "user"))
+        self.assertFalse(cache.is_ensured("https://other.dataverse.nl/api", "user"))
+
+    def test_ttl(self):
+        cache = AliasCache(ttl=0.05, path=None)
+        cache.mark_ensured(api_address, "user")
+        time.sleep(0.1)
+
+        self.assertFalse(cache.is_ensured(api_address, "user"))
+
+    def test_bounded(self):
+        cache = AliasCache(maxsize=2, path=None)
+        for alias in ["first", "second", "third"]:
+            cache.mark_ensured(api_address, alias)
+
+        self.assertFalse(cache.is_ensured(api_address, "first"))
+        self.assertTrue(cache.is_ensured(api_address, "third"))
+
+    def test_persistent_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "aliases.json")
+            AliasCache(path=path).mark_ensured(api_address, "user")
+
+            cache = AliasCache(path=path)
+
+            self.assertTrue(cache.is_ensured(api_address, "user"))
+            self.assertEqual(os.listdir(tmpdir), ["aliases.json"])
+
+    def test_metrics(self):
+        cache = AliasCache(path=None)
+        hits, misses = alias_cache_hits._value.get(), alias_cache_misses._value.get()
+
+        cache.is_ensured(api_address, "user")
+        cache.mark_ensured(api_address, "user")
+        cache.is_ensured(api_address, "user")
+
+        self.assertEqual(alias_cache_hits._value.get() - hits, 1)
+        self.assertEqual(alias_cache_misses._value.get() - misses, 1)
+
+    def test_create_call_only_on_miss(self):
+        with StubServer() as stub:
+            stub.route("POST", "^/api/dataverses/surf$", (201, {"status": "OK"}))
+            stub.route("GET", "/contents$", (200, {"status": "OK", "data": []}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            for _ in range(3):
+                dataverse.get_dataset()
+
+            self.assertEqual(stub.count("POST", "^/api/dataverses/surf$"), 1)
+            self.assertEqual(stub.count("GET", "/contents$"), 3)
+
+    def test_already_existing_dataverse_is_cached(self):
+        with StubServer() as stub:
+            stub.route("POST", "^/api/dataverses/surf$", (400, {
+                "status": "ERROR", "message": "A dataverse with alias surfsurfrdsnl already exists"
+            }))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            dataverse.get_user_dataverse()
+            dataverse.get_user_dataverse()
+
+            self.assertEqual(stub.count("POST"), 1)
+
+    def test_create_call_after_404(self):
+        contents = [(404, {"status": "ERROR"}), (200, {"status": "OK", "data": []})]
+
+        with StubServer() as stub:
+            stub.route("POST", "^/api/dataverses/surf$", (201, {"status": "OK"}))
+            stub.route("GET", "/contents$", lambda request: contents.pop(0))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+            ensured_aliases.mark_ensured(dataverse.dataverse_api_address, "surfsurfrdsnl")
+
+            result = dataverse.get_dataset()
+
+            self.assertEqual(result, {"status": "OK", "data": []})
+            self.assertEqual(stub.count("POST", "^/api/dataverses/surf$"), 1)
+            self.assertEqual(stub.count("GET", "/contents$"), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
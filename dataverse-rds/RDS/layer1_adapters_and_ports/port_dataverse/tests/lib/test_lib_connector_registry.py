@@ -0,0 +1,65 @@
+import time
+import unittest
+
+from lib.connector_registry import ConnectorRegistry
+
+
+class Connector(object):
+    def __init__(self, api_key, api_address):
+        self.api_key = api_key
+        self.api_address = api_address
+
+
+class TestConnectorRegistry(unittest.TestCase):
+    """Tests for the registry, which reuses connector instances across requests."""
+
+    def get(self, registry, api_key, api_address="https://upstream.local/api", port="port-test"):
+        return registry.get(port, api_address, (api_key,), lambda: Connector(api_key, api_address))
+
+    def test_instance_is_reused(self):
+        registry = ConnectorRegistry()
+        first = self.get(registry, "key")
+
+        self.assertIs(self.get(registry, "key"), first)
+        self.assertIs(self.get(registry, "key", api_address="https://upstream.local/api/"), first)
+        self.assertIsNot(self.get(registry, "other"), first)
+        self.assertIsNot(self.get(registry, "key", api_address="https://second.local/api"), first)
+        self.assertIsNot(self.get(registry, "key", port="port-other"), first)
+        self.assertEqual(len(registry), 4)
+
+    def test_least_recently_used_is_evicted(self):
+        registry = ConnectorRegistry(maxsize=2)
+        first = self.get(registry, "first")
+        self.get(registry, "second")
+        self.get(registry, "first")
+        self.get(registry, "third")
+
+        self.assertIs(self.get(registry, "first"), first)
+        self.assertEqual(len(registry), 2)
+
+    def test_instance_expires(self):
+        registry = ConnectorRegistry(ttl=0.05)
+        first = self.get(registry, "key")
+        time.sleep(0.1)
+
+        self.assertEqual(len(registry), 0)
+        self.assertIsNot(self.get(registry, "key"), first)
+
+    def test_invalidate(self):
+        registry = ConnectorRegistry()
+        first = self.get(registry, "key")
+        registry.invalidate("port-test", "https://upstream.local/api", ("key",))
+
+        self.assertIsNot(self.get(registry, "key"), first)
+
+    def test_keys_do_not_contain_credentials(self):
+        registry = ConnectorRegistry()
+        self.get(registry, "secret-token")
+
+        key = registry.key("port-test", "https://upstream.local/api", "secret-token")
+        self.assertNotIn("secret-token", repr(key))
+        self.assertNotEqual(ConnectorRegistry().credential_hash("secret-token"), key[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
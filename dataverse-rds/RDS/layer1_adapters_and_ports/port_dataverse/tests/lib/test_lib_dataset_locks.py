@@ -0,0 +1,170 @@
+import io
+import unittest
+from unittest import mock
+
+from lib.batch import BatchFile
+from lib.dataset_locks import DatasetLocked, LockWatcher, RegistrationQueue
+from lib.http_session import close_sessions, get_session
+from lib import rate_limiter
+from lib.upload_dataverse import Dataverse
+from stub_server import StubServer
+
+persistent_id = "doi:10.5072/FK2/ABC"
+locked = (200, {"status": "OK", "data": [{"lockType": "Ingest", "date": "2023-02-07"}]})
+unlocked = (200, {"status": "OK", "data": []})
+lock_error = (409, {"status": "ERROR", "message": "Dataset cannot be edited due to dataset lock."})
+
+
+def responses(*answers):
+    """Handler, which answers with `answers` one after another and repeats the last one."""
+    answers = list(answers)
+    return lambda request: answers.pop(0) if len(answers) > 1 else answers[0]
+
+
+class FakeWatcher(object):
+    def __init__(self):
+        self.waits = 0
+
+    def wait(self):
+        self.waits += 1
+        return 0
+
+
+class TestLockWatcher(unittest.TestCase):
+    """Tests for polling the locks of a dataset."""
+
+    def tearDown(self):
+        close_sessions()
+
+    def watcher(self, stub, **kwargs):
+        self.sleeps = []
+        kwargs.setdefault("initial", 0.1)
+        kwargs.setdefault("max_delay", 0.5)
+        return LockWatcher(
+            get_session(f"{stub.url}/api"), f"{stub.url}/api", "key", persistent_id, sleep=self.sleeps.append, **kwargs
+        )
+
+    def test_backoff(self):
+        with StubServer() as stub:
+            stub.route("GET", "/locks\\?persistentId=doi", responses(locked, locked, locked, locked, locked, unlocked))
+            watcher = self.watcher(stub)
+
+            self.assertAlmostEqual(watcher.wait(), 1.7)
+            self.assertEqual(self.sleeps, [0.1, 0.2, 0.4, 0.5, 0.5])
+            self.assertEqual(watcher.polls, 6)
+            # the next wait starts with half of the last pause
+            self.assertEqual(watcher.delay, 0.25)
+
+    def test_pause_does_not_block_the_worker(self):
+        watcher = LockWatcher(None, "https://dataverse.local/api", "key", persistent_id)
+
+        # the sleep of gevent, if it is installed
+        self.assertIs(watcher.sleep, rate_limiter.sleep)
+
+    def test_unlocked_dataset_is_polled_once(self):
+        with StubServer() as stub:
+            stub.route("GET", "/locks", unlocked)
+            watcher = self.watcher(stub)
+
+            self.assertEqual(watcher.wait(), 0)
+            self.assertEqual((watcher.polls, self.sleeps), (1, []))
+
+    def test_timeout(self):
+        with StubServer() as stub:
+            stub.route("GET", "/locks", locked)
+            watcher = self.watcher(stub, timeout=1)
+
+            with self.assertRaises(DatasetLocked):
+                watcher.wait()
+            self.assertEqual(self.sleeps, [0.1, 0.2, 0.4])
+
+    def test_installation_without_locks_endpoint(self):
+        with StubServer() as stub:
+            self.assertEqual(self.watcher(stub).wait(), 0)
+
+
+class TestRegistrationQueue(unittest.TestCase):
+    """Tests for registering stored files after the unlock of the dataset."""
+
+    def entry(self, name):
+        return {"storageIdentifier": f"s3://bucket:{name}", "fileName": name}
+
+    def test_lock_collision_is_registered_again(self):
+        calls = []
+
+        def register(entries):
+            calls.append([entry["fileName"] for entry in entries])
+            if len(calls) == 1:
+                raise DatasetLocked("locked")
+            return {"s3://bucket:b.csv": "Duplicate file"}
+
+        watcher = FakeWatcher()
+        with RegistrationQueue(register, watcher) as registrations:
+            registrations.put("a.csv", self.entry("a.csv"))
+            registrations.put("b.csv", self.entry("b.csv"))
+
+        self.assertEqual(calls[-1], ["a.csv", "b.csv"])
+        self.assertEqual(registrations.errors, {"b.csv": "Duplicate file"})
+        self.assertEqual(registrations.calls, len(calls))
+
+    def test_failed_registration_is_reported_for_every_file(self):
+        def register(entries):
+            raise ValueError("addFiles answered with status 500")
+
+        with mock.patch("lib.dataset_locks.lock_retries", 0):
+            with RegistrationQueue(register, FakeWatcher()) as registrations:
+                registrations.put("a.csv", self.entry("a.csv"))
+
+        self.assertEqual(registrations.errors, {"a.csv": "addFiles answered with status 500"})
+
+
+class TestDataverseLocks(unittest.TestCase):
+    """Tests for uploads through dataverse, which wait for the unlock of the dataset."""
+
+    def setUp(self):
+        patcher = mock.patch("lib.dataset_locks.lock_poll_initial", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        close_sessions()
+
+    def test_add_waits_for_unlock(self):
+        with StubServer() as stub:
+            stub.route("GET", "/locks", responses(locked, locked, unlocked))
+            stub.route("POST", "/add", (200, {"status": "OK"}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            self.assertEqual(dataverse.upload_new_file_to_dataset(persistent_id, "a.csv", io.BytesIO(b"a")), {"success": True})
+            self.assertEqual(stub.count("GET", "/locks"), 3)
+            self.assertEqual(stub.count("POST", "/add"), 1)
+
+    def test_lock_collision_is_sent_again(self):
+        with StubServer() as stub:
+            stub.route("GET", "/locks", unlocked)
+            stub.route("POST", "/add", responses(lock_error, (200, {"status": "OK"})))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            self.assertEqual(dataverse.upload_new_file_to_dataset(persistent_id, "a.csv", io.BytesIO(b"x" * 1000)), {"success": True})
+            add = [call for call in stub.calls if call.method == "POST"]
+            self.assertEqual(len(add), 2)
+            self.assertIn(b"x" * 1000, add[1].body)
+
+    def test_rejected_files_are_reported(self):
+        with StubServer() as stub:
+            stub.route("POST", "/add", responses(
+                (200, {"status": "OK"}), (400, {"status": "ERROR", "message": "This file already exists in the dataset."})))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            self.assertIsNotNone(dataverse.upload_new_file_to_dataset(persistent_id, "a.csv", io.BytesIO(b"a")))
+            self.assertIsNone(dataverse.upload_new_file_to_dataset(persistent_id, "a.csv", io.BytesIO(b"a")))
+
+            results = dataverse.upload_files_to_dataset(persistent_id, [BatchFile("b.csv", io.BytesIO(b"b"))])
+            self.assertEqual(results, [{
+                "filename": "b.csv", "success": False,
+                "error": "Dataverse rejected b.csv: This file already exists in the dataset.",
+            }])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import hashlib
+import io
+import unittest
+from unittest import mock
+
+from lib.batch import BatchFile, run_batch
+from lib.dedupe import HashedUpload, Manifest, Manifests, dedupe, normalize_checksum, skipped
+from lib.http_session import close_sessions
+from lib.upload_dataverse import Dataverse
+from stub_server import StubServer
+
+persistent_id = "doi:10.5072/FK2/ABC"
+data = b"a,b\n1,2\n"
+
+
+def md5(value):
+    return ("md5", hashlib.md5(value).hexdigest())
+
+
+class UnreadableStream(object):
+    def read(self, *args):
+        raise AssertionError("stream was read")
+
+
+class TestDedupe(unittest.TestCase):
+    """Tests for skipping files, which are already in the project."""
+
+    def test_normalize_checksum(self):
+        self.assertEqual(normalize_checksum("ABC", "MD5"), ("md5", "abc"))
+        self.assertEqual(normalize_checksum("abc", "SHA-256"), ("sha256", "abc"))
+        self.assertEqual(normalize_checksum("sha2:" + "q83vEjRWeJA=", "md5"), ("sha256", "abcdef1234567890"))
+        self.assertIsNone(normalize_checksum("abc", "UNF"))
+        self.assertIsNone(normalize_checksum(None))
+
+    def test_candidate_by_name_and_size(self):
+        manifest = Manifest([("a.csv", 8, md5(data)), ("b.csv", None, md5(b"b")), ("c.csv", 1, None)])
+
+        self.assertEqual(manifest.candidate("data/a.csv"), [md5(data)])
+        self.assertEqual(manifest.candidate("a.csv", size=8), [md5(data)])
+        self.assertEqual(manifest.candidate("a.csv", size=9), [])
+        self.assertEqual(manifest.candidate("b.csv", size=9), [md5(b"b")])
+        # files without checksum cannot be compared
+        self.assertEqual(manifest.candidate("c.csv"), [])
+        self.assertEqual(len(manifest), 2)
+
+    def test_manifest_is_loaded_once(self):
+        load = mock.Mock(side_effect=lambda project: Manifest([("a.csv", 8, md5(data))]))
+        manifests = Manifests(load, ttl=60)
+
+        for _ in range(3):
+            self.assertEqual(manifests.candidate("project", "a.csv"), [md5(data)])
+        load.assert_called_once_with("project")
+
+        manifests.update("project", "a.csv")
+        self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        manifests.invalidate("project")
+        self.assertEqual(manifests.candidate("project", "a.csv"), [md5(data)])
+        self.assertEqual(load.call_count, 2)
+
+    def test_failed_load_is_not_cached(self):
+        load = mock.Mock(side_effect=[ValueError("down"), Manifest()])
+        manifests = Manifests(load, ttl=60)
+
+        self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        self.assertEqual(load.call_count, 2)
+
+    def test_new_file_is_streamed(self):
+        manifests = Manifests(lambda project: Manifest([("a.csv", 8, md5(data))]))
+        stream = UnreadableStream()
+
+        with dedupe(manifests, "project", "b.csv", stream) as (file, saved):
+            self.assertIs(file, stream)
+            self.assertIsNone(saved)
+
+    def test_identical_file_is_skipped(self):
+        manifests = Manifests(lambda project: Manifest([("a.csv", 8, md5(data))]))
+
+        with dedupe(manifests, "project", "a.csv", io.BytesIO(data)) as (file, saved):
+            self.assertIsNone(file)
+            self.assertEqual(saved, len(data))
+
+        with dedupe(manifests, "project", "a.csv", io.BytesIO(b"a,b\n1,3\n")) as (file, saved):
+            self.assertEqual(file.read(), b"a,b\n1,3\n")
+            self.assertIsNone(saved)
+
+    def test_disabled(self):
+        manifests = Manifests(mock.Mock())
+        with mock.patch("lib.dedupe.dedupe_enabled", False):
+            self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        manifests.load.assert_not_called()
+
+    def test_batch_reports_bytes_saved(self):
+        results = run_batch([BatchFile("a.csv", io.BytesIO(data))], lambda batch_file: skipped(len(data)))
+        self.assertEqual(results, [{"filename": "a.csv", "success": True, "skipped": True, "bytesSaved": len(data)}])
+
+
+class TestDataverseDedupe(unittest.TestCase):
+    """Tests for uploads to a dataset, which has some of the files already."""
+
+    def setUp(self):
+        patcher = mock.patch("lib.dataset_locks.lock_poll_initial", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        close_sessions()
+
+    def route(self, stub):
+        stub.route("GET", "/versions/:latest/files", (200, {"status": "OK", "data": [
+            {"label": "a.csv", "dataFile": {"filesize": len(data), "checksum": {"type": "MD5", "value": md5(data)[1]}}},
+            {"label": "b.tab", "dataFile": {"filesize": 100, "md5": md5(b"b")[1],
+                                            "originalFileName": "b.csv", "originalFileSize": 1}},
+        ]}))
+        stub.route("POST", "/add", (200, {"status": "OK"}))
+
+    def test_present_file_is_not_uploaded(self):
+        with StubServer() as stub:
+            self.route(stub)
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            self.assertEqual(dataverse.upload_new_file_to_dataset(persistent_id, "data/a.csv", io.BytesIO(data)),
+                             skipped(len(data)))
+            # the original of an ingested tabular file
+            self.assertEqual(dataverse.upload_new_file_to_dataset(persistent_id, "b.csv", io.BytesIO(b"b")), skipped(1))
+            self.assertEqual(stub.count("POST"), 0)
+
+            self.assertEqual(dataverse.upload_new_file_to_dataset(persistent_id, "a.csv", io.BytesIO(b"changed")),
+                             {"success": True})
+            add = [call for call in stub.calls if call.method == "POST"]
+            self.assertEqual(len(add), 1)
+            self.assertIn(b"changed", add[0].body)
+            self.assertEqual(stub.count("GET", "/versions/:latest/files"), 1)
+
+    @mock.patch("lib.direct_upload.direct_upload_threshold", 1)
+    def test_direct_upload_is_hashed_once(self):
+        enter = HashedUpload.__enter__
+        with StubServer() as stub, mock.patch.object(
+                HashedUpload, "__enter__", autospec=True, side_effect=enter) as spooled:
+            self.route(stub)
+            stub.route("GET", "uploadurls", (400, {"status": "ERROR", "message": "Direct upload not supported"}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            self.assertEqual(dataverse.upload_new_file_to_dataset(persistent_id, "a.csv", io.BytesIO(data)),
+                             skipped(len(data)))
+            self.assertEqual(dataverse.upload_new_file_to_dataset(persistent_id, "a.csv", io.BytesIO(b"changed")),
+                             {"success": True})
+
+            # the spool of the direct upload is compared with the dataset
+            self.assertEqual(spooled.call_count, 2)
+            self.assertEqual(stub.count("GET", "uploadurls"), 1)
+            self.assertIn(b"changed", [call for call in stub.calls if call.method == "POST"][0].body)
+
+    def test_batch(self):
+        with StubServer() as stub:
+            self.route(stub)
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            results = dataverse.upload_files_to_dataset(
+                persistent_id, [BatchFile("a.csv", io.BytesIO(data)), BatchFile("c.csv", io.BytesIO(b"c"))])
+
+            self.assertEqual(results, [
+                {"filename": "a.csv", "success": True, "skipped": True, "bytesSaved": len(data)},
+                {"filename": "c.csv", "success": True},
+            ])
+            self.assertEqual(stub.count("POST", "/add"), 1)
+            self.assertEqual(stub.count("GET", "/versions/:latest/files"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from lib.deletion import delete_files
+from lib.http_session import close_sessions
+from lib.sync import RemoteFile
+from lib.upload_dataverse import Dataverse
+from stub_server import StubServer
+
+persistent_id = "doi:10.5072/FK2/ABC"
+
+
+def remote(count):
+    return [RemoteFile(f"{i}.csv", id=i) for i in range(count)]
+
+
+class TestDeletion(unittest.TestCase):
+    """Tests for deleting many files of a project."""
+
+    def test_failed_deletion_is_retried(self):
+        sleeps, attempts = [], {}
+
+        def delete(f):
+            attempts[f.id] = attempts.get(f.id, 0) + 1
+            if f.id == 1 and attempts[f.id] < 3:
+                raise ConnectionError("reset")
+            return True
+
+        results = delete_files(remote(2), delete, retries=3, backoff=0.5, sleep=sleeps.append)
+
+        self.assertEqual(results, [{"filename": "0.csv", "success": True}, {"filename": "1.csv", "success": True}])
+        self.assertEqual(attempts, {0: 1, 1: 3})
+        self.assertEqual(sleeps, [0.5, 1.0])
+
+    def test_failed_file_does_not_stop_the_others(self):
+        def delete(f):
+            if f.id == 0:
+                raise ValueError("forbidden")
+            return f.id != 1
+
+        results = delete_files(remote(3), delete, retries=1, backoff=0, sleep=lambda delay: None)
+
+        self.assertEqual(results, [
+            {"filename": "0.csv", "success": False, "error": "forbidden"},
+            {"filename": "1.csv", "success": False, "error": "Delete failed."},
+            {"filename": "2.csv", "success": True},
+        ])
+
+    def test_concurrency_is_bounded(self):
+        lock, running, peak = threading.Lock(), [0], [0]
+
+        def delete(f):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return True
+
+        results = delete_files(remote(40), delete, workers=4)
+
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual([result["filename"] for result in results], [f"{i}.csv" for i in range(40)])
+        self.assertTrue(1 < peak[0] <= 4)
+
+    def test_nothing_to_delete(self):
+        self.assertEqual(delete_files([], mock.Mock()), [])
+
+
+class TestDataverseDeletion(unittest.TestCase):
+    """Tests for deleting all files of a dataset with the native delete call."""
+
+    def setUp(self):
+        patcher = mock.patch("lib.dataset_locks.lock_poll_initial", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        close_sessions()
+
+    def route(self, stub, count):
+        stub.route("GET", "/versions/:latest/files", (200, {"status": "OK", "data": [
+            {"label": f"{i}.csv", "dataFile": {"id": i, "filesize": 1}} for i in range(count)
+        ]}))
+
+    def test_all_files_are_deleted(self):
+        with StubServer() as stub:
+            self.route(stub, 20)
+            stub.route("DELETE", "/files/\\d+$", (200, {"status": "OK"}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            results = dataverse.delete_files_from_dataset(persistent_id, workers=4)
+
+            self.assertTrue(all(result["success"] for result in results))
+            self.assertEqual(len(results), 20)
+            deletes = [call for call in stub.calls if call.method == "DELETE"]
+            self.assertEqual(sorted(call.path for call in deletes), sorted(f"/api/files/{i}" for i in range(20)))
+            # the first deletion creates the draft, before the others are sent
+            self.assertEqual(deletes[0].path, "/api/files/0")
+            self.assertEqual(stub.count("GET", "/versions/:latest/files"), 1)
+            self.assertTrue(dataverse.delete_all_files_from_dataset_internal(persistent_id))
+
+    @mock.patch("lib.deletion.delete_backoff", 0)
+    def test_failed_files_are_reported(self):
+        with StubServer() as stub:
+            self.route(stub, 3)
+            stub.route("DELETE", "/files/[02]$", (200, {"status": "OK"}))
+            stub.route("DELETE", "/files/1$", (403, {"status": "ERROR", "message": "forbidden"}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            results = dataverse.delete_files_from_dataset(persistent_id)
+
+            self.assertEqual(results, [
+                {"filename": "0.csv", "success": True},
+                {"filename": "1.csv", "success": False, "error": "Delete failed."},
+                {"filename": "2.csv", "success": True},
+            ])
+            self.assertEqual(stub.count("DELETE", "/files/1$"), 4)
+            self.assertFalse(dataverse.delete_all_files_from_dataset_internal(persistent_id))
+
+    @mock.patch("lib.deletion.delete_retries", 0)
+    def test_failed_first_deletion_stops(self):
+        with StubServer() as stub:
+            self.route(stub, 3)
+            stub.route("DELETE", "/files/", (401, {"status": "ERROR", "message": "Bad api key"}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            results = dataverse.delete_files_from_dataset(persistent_id)
+
+            self.assertEqual([result["success"] for result in results], [False, False, False])
+            self.assertEqual(stub.count("DELETE"), 1)
+
+    def test_single_file(self):
+        with StubServer() as stub:
+            stub.route("DELETE", "/files/7$", (200, {"status": "OK"}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            self.assertTrue(dataverse.delete_file_from_dataset_internal(persistent_id, 7))
+            self.assertFalse(dataverse.delete_file_from_dataset_internal(persistent_id, 8))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import hashlib
+import io
+import os
+import unittest
+from unittest import mock
+
+from flask import Flask, request
+
+from lib.batch import BatchFile
+from lib.dataset_locks import RegistrationQueue
+from lib.direct_upload import FilePart, HashedSpool
+from lib.request_data import StreamingRequest
+from lib.upload_dataverse import Dataverse
+from s3_stub import DirectUploadStub
+from stub_server import StubServer
+
+persistent_id = "doi:10.5072/FK2/ABC"
+
+app = Flask(__name__)
+app.request_class = StreamingRequest
+
+
+class TestDirectUpload(unittest.TestCase):
+    """Tests for uploads directly to the store of the dataset, against an S3 stand-in."""
+
+    def setUp(self):
+        for name, value in (("lib.direct_upload.direct_upload_threshold", 1024), ("lib.dataset_locks.lock_poll_initial", 0.01)):
+            patcher = mock.patch(name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload(self, stub, content):
+        dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+        return dataverse.upload_new_file_to_dataset(persistent_id, "data/file.bin", io.BytesIO(content))
+
+    def test_small_file_goes_through_dataverse(self):
+        with StubServer() as stub:
+            DirectUploadStub(stub).route()
+            self.assertEqual(self.upload(stub, b"x" * 100), {"success": True})
+
+            self.assertEqual(stub.count("POST", "/add\\?"), 1)
+            self.assertEqual(stub.count("GET", "uploadurls"), 0)
+
+    def test_single_part(self):
+        content = os.urandom(10 * 1024)
+
+        with StubServer() as stub:
+            store = DirectUploadStub(stub, part_size=64 * 1024).route()
+            self.assertEqual(self.upload(stub, content), {"success": True})
+
+            put = [call for call in stub.calls if call.method == "PUT"]
+            self.assertEqual(len(put), 1)
+            self.assertEqual(put[0].headers["x-amz-tagging"], "dv-state=temp")
+            self.assertNotIn("X-Dataverse-key", put[0].headers)
+            self.assertEqual(stub.count("POST", "/add\\?"), 0)
+
+        self.assertEqual(len(store.registered), 1)
+        entry = store.registered[0]
+        self.assertEqual(entry["fileName"], "file.bin")
+        self.assertEqual(entry["checksum"], {"@type": "MD5", "@value": hashlib.md5(content).hexdigest()})
+        self.assertEqual(store.content(entry), content)
+
+    def test_multipart(self):
+        content = os.urandom(300 * 1024)
+
+        with StubServer() as stub:
+            store = DirectUploadStub(stub, part_size=64 * 1024).route()
+            self.assertEqual(self.upload(stub, content), {"success": True})
+
+            self.assertEqual(stub.count("PUT", "partNumber="), 5)
+            self.assertEqual(stub.count("PUT", "^/api/datasets/mpupload"), 1)
+            self.assertEqual(stub.count("POST", "addFiles"), 1)
+
+        self.assertEqual(store.content(store.registered[0]), content)
+
+    def test_failed_part_aborts_the_upload(self):
+        with StubServer() as stub:
+            store = DirectUploadStub(stub, part_size=64 * 1024, fail_part=3).route()
+            self.assertIsNone(self.upload(stub, os.urandom(300 * 1024)))
+
+            self.assertEqual(stub.count("DELETE", "^/api/datasets/mpupload"), 1)
+            self.assertEqual(stub.count("POST", "addFiles"), 0)
+
+        self.assertEqual(store.parts, {})
+
+    def test_store_without_direct_upload(self):
+        content = os.urandom(10 * 1024)
+
+        with StubServer() as stub:
+            stub.route("GET", "uploadurls", (400, {"status": "ERROR", "message": "Direct upload not supported"}))
+            stub.route("POST", "/add", (200, {"status": "OK"}))
+            self.assertEqual(self.upload(stub, content), {"success": True})
+
+            add = [call for call in stub.calls if call.method == "POST"]
+            self.assertEqual(len(add), 1)
+            self.assertIn(content, add[0].body)
+
+    def test_streamed_request(self):
+        for content, direct in ((os.urandom(10 * 1024), True), (b"x" * 100, False)):
+            with StubServer() as stub:
+                store = DirectUploadStub(stub, part_size=64 * 1024).route()
+                with app.test_request_context("/", method="POST", content_type="multipart/form-data", data={
+                        "filename": "data/file.bin", "file": (io.BytesIO(content), "file.bin")}):
+                    # like POST /project/{id}/files, the file is read from the connection
+                    dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+                    self.assertEqual(dataverse.upload_new_file_to_dataset(
+                        persistent_id, request.form["filename"], request.files["file"], size=request.content_length),
+                        {"success": True})
+
+                self.assertEqual(stub.count("POST", "addFiles"), int(direct))
+                self.assertEqual(stub.count("POST", "/add\\?"), int(not direct))
+            if direct:
+                self.assertEqual(store.content(store.registered[0]), content)
+
+    def test_batch_registers_once(self):
+        contents = [os.urandom(100 * 1024) for _ in range(3)]
+
+        with StubServer() as stub:
+            store = DirectUploadStub(stub, part_size=64 * 1024).route()
+            # the dataset stays locked until all files are queued, so they are registered together
+            queued = []
+            put = RegistrationQueue.put
+            patcher = mock.patch.object(RegistrationQueue, "put", lambda queue, *args: (put(queue, *args), queued.append(args)))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+            stub.route("GET", "/locks\\?", lambda request: (
+                200, {"status": "OK", "data": [{"lockType": "Ingest"}] if len(queued) < 3 else []}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+            files = [BatchFile(f"big{i}.bin", io.BytesIO(content), len(content)) for i, content in enumerate(contents)]
+            files.append(BatchFile("small.txt", io.BytesIO(b"small"), 5))
+
+            results = dataverse.upload_files_to_dataset(persistent_id, files, workers=3)
+
+            self.assertEqual([result["filename"] for result in results], ["big0.bin", "big1.bin", "big2.bin", "small.txt"])
+            self.assertEqual([result["success"] for result in results], [True] * 4)
+            self.assertEqual(stub.count("POST", "addFiles"), 1)
+            self.assertEqual(stub.count("POST", "/add\\?"), 1)
+
+        stored = {entry["fileName"]: store.content(entry) for entry in store.registered}
+        self.assertEqual(stored, {f"big{i}.bin": content for i, content in enumerate(contents)})
+
+    def test_file_part(self):
+        with HashedSpool(io.BytesIO(b"0123456789")) as spooled:
+            part = spooled.part(4, 4)
+            self.assertEqual((len(part), part.read(), part.read()), (4, b"4567", b""))
+            part.seek(0)
+            self.assertEqual(part.read(2), b"45")
+            self.assertEqual(spooled.part(8, 4).read(), b"89")
+            self.assertEqual(spooled.md5, hashlib.md5(b"0123456789").hexdigest())
+            self.assertIsInstance(part, FilePart)
+
+
+if __name__ == '__main__':
+    unittest.main()
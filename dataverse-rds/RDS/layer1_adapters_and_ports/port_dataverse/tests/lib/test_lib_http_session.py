@@ -0,0 +1,71 @@
+import unittest
+
+from lib import http_session
+from lib.http_session import get_session, create_session, close_sessions
+from lib.upload_dataverse import Dataverse
+from stub_server import StubServer
+
+
+class TestHttpSession(unittest.TestCase):
+    """Tests for the pooled http sessions against a local stub server."""
+
+    def tearDown(self):
+        close_sessions()
+
+    def test_session_is_shared_per_host(self):
+        first = get_session("https://demo.dataverse.nl/api")
+        second = get_session("https://DEMO.dataverse.nl/api/datasets/1")
+        other = get_session("https://demo.dataverse.org/api")
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+    def test_dataverse_instances_share_session(self):
+        first = Dataverse("key1", api_address="https://demo.dataverse.nl/api")
+        second = Dataverse("key2", api_address="https://demo.dataverse.nl/api")
+
+        self.assertIs(first.session, second.session)
+
+    def test_connections_are_reused(self):
+        with StubServer() as stub:
+            stub.route("GET", "^/api/datasets/", (200, {"status": "OK"}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            for id in range(10):
+                dataverse.session.request("GET", f"{dataverse.dataverse_api_address}/datasets/{id}")
+
+            self.assertEqual(stub.count("GET"), 10)
+            self.assertEqual(stub.connections, 1)
+
+    def test_retry_on_unavailable(self):
+        responses = [(503, {}), (503, {}), (200, {"status": "OK"})]
+
+        with StubServer() as stub:
+            stub.route("GET", "^/flaky", lambda request: responses.pop(0))
+            session = create_session(retries=3, backoff_factor=0)
+
+            r = session.get(f"{stub.url}/flaky")
+
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(stub.count("GET", "^/flaky"), 3)
+
+    def test_post_is_not_retried(self):
+        with StubServer() as stub:
+            stub.route("POST", "^/create", (503, {}))
+            session = create_session(retries=3, backoff_factor=0)
+
+            r = session.post(f"{stub.url}/create", data="{}")
+
+            self.assertEqual(r.status_code, 503)
+            self.assertEqual(stub.count("POST"), 1)
+
+    def test_default_timeout(self):
+        session = create_session(timeout=(1, 2))
+        adapter = session.get_adapter("https://demo.dataverse.nl")
+
+        self.assertEqual(adapter.timeout, (1, 2))
+        self.assertEqual(adapter._pool_maxsize, http_session.pool_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
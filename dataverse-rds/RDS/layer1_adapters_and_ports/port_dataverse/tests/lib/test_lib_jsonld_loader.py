@@ -0,0 +1,120 @@
+import unittest
+from unittest import mock
+
+from pyld import jsonld
+
+from lib import jsonld_loader
+from lib.jsonld_loader import frame, document_loader
+
+crate = {
+    "@context": [
+        "https://w3id.org/ro/crate/1.1/context",
+        {"@vocab": "https://schema.org/"},
+    ],
+    "@graph": [
+        {
+            "@id": "ro-crate-metadata.json",
+            "@type": "CreativeWork",
+            "about": {"@id": "./"},
+            "conformsTo": {"@id": "https://w3id.org/ro/crate/1.1"},
+        },
+        {
+            "@id": "./",
+            "@type": "Dataset",
+            "name": "testtitle",
+            "description": "testdescription",
+            "datePublished": "2020-09-29",
+            "creator": [{"@id": "#alice"}],
+        },
+        {
+            "@id": "#alice",
+            "@type": "Person",
+            "name": "Alice",
+            "affiliation": {"@id": "#wwu"},
+        },
+        {"@id": "#wwu", "@type": "Organization", "name": "WWU"},
+    ],
+}
+
+published_context = "https://w3id.org/ro/crate/1.1/context"
+remote_context = "https://w3id.org/ro/crate/1.0/context"
+
+
+def serve(url, options=None):
+    # stands in for w3id.org with the terms of the published 1.1 context
+    return {"document": {"@context": document_loader(published_context)["document"]["@context"]}}
+
+
+class TestJsonLdLoader(unittest.TestCase):
+    """Tests for framing with the bundled contexts."""
+
+    def setUp(self):
+        # neither the loader nor pyld may know a context from an earlier test
+        jsonld._resolved_context_cache.clear()
+        jsonld_loader._remote_documents.clear()
+        self.addCleanup(jsonld_loader._remote_documents.clear)
+
+    def test_published_context_is_bundled(self):
+        with mock.patch("requests.get", side_effect=AssertionError("network access")), \
+                mock.patch("requests.Session.request", side_effect=AssertionError("network access")):
+            document = document_loader(published_context)["document"]
+
+        self.assertEqual(document["@id"], published_context)
+        self.assertNotIn("@vocab", document["@context"])
+        self.assertEqual(document["@context"]["name"], "http://schema.org/name")
+
+    def test_frame(self):
+        with mock.patch("lib.jsonld_loader.remote_loader", side_effect=serve) as remote:
+            data = frame(crate, "fdataverse.jsonld")
+            frame(crate, "fdataverse.jsonld")
+
+        remote.assert_called_once_with(remote_context)
+
+        self.assertEqual(data["name"], "testtitle")
+        self.assertEqual(data["description"], "testdescription")
+        self.assertEqual(data["datePublished"], "2020-09-29")
+        self.assertEqual(data["creator"]["name"], "Alice")
+        self.assertEqual(data["creator"]["affiliation"]["name"], "WWU")
+
+    def test_context_not_bundled_is_loaded_from_the_network(self):
+        with mock.patch("lib.jsonld_loader.remote_loader", side_effect=serve) as remote:
+            document_loader("https://example.org/context")
+            document_loader("https://example.org/context")
+
+        remote.assert_called_once_with("https://example.org/context")
+
+    def test_failed_remote_context(self):
+        error = jsonld.JsonLdError("not found", "jsonld.LoadDocumentError", code="loading document failed")
+        document = dict(crate, **{"@context": "https://example.org/context"})
+
+        with mock.patch("lib.jsonld_loader.remote_loader", side_effect=error):
+            with self.assertRaises(jsonld.JsonLdError):
+                frame(document, "fdataverse.jsonld")
+
+            with self.assertRaises(jsonld.JsonLdError):
+                document_loader("https://example.org/context")
+
+    def test_context_urls_are_normalized(self):
+        for url in ("http://w3id.org/ro/crate/1.1/context", "https://w3id.org/ro/crate/1.1/context/"):
+            self.assertEqual(document_loader(url)["document"]["@id"], published_context)
+
+    def test_frame_is_parsed_once(self):
+        with mock.patch("lib.jsonld_loader.remote_loader", side_effect=serve):
+            frame(crate, "fdataverse.jsonld")
+
+            with mock.patch("json.load") as load:
+                first = frame(crate, "fdataverse.jsonld")
+                second = frame(crate, "fdataverse.jsonld")
+
+        load.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_cached_frame_is_not_changed(self):
+        loaded = jsonld_loader.load_frame("fdataverse.jsonld")
+        loaded["@type"] = "Person"
+
+        self.assertEqual(jsonld_loader.load_frame("fdataverse.jsonld")["@type"], "Dataset")
+
+
+if __name__ == '__main__':
+    unittest.main()
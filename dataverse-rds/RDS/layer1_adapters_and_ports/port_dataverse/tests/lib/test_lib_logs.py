@@ -0,0 +1,101 @@
+import io
+import logging
+import unittest
+
+from lib.logs import Fields, configure, get_logger, parse_levels, redact, truncate
+
+
+class Expensive(object):
+    """Counts how often it is formatted."""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "expensive"
+
+
+class TestLogs(unittest.TestCase):
+    """Tests for the structured logger with lazy fields."""
+
+    def setUp(self):
+        root = logging.getLogger()
+        self.handlers, self.level = root.handlers, root.level
+        self.stream = io.StringIO()
+
+    def tearDown(self):
+        root = logging.getLogger()
+        root.handlers, root.level = self.handlers, self.level
+        for name in ("test.logs", "test.logs.verbose"):
+            logging.getLogger(name).setLevel(logging.NOTSET)
+
+    def configure(self, level="INFO", levels=""):
+        configure(level, levels=levels, handler=logging.StreamHandler(self.stream))
+
+    def test_parse_levels(self):
+        self.assertEqual(
+            parse_levels("lib.upload=debug, urllib3=WARNING,broken,=INFO"),
+            {"lib.upload": "DEBUG", "urllib3": "WARNING"},
+        )
+
+    def test_secrets_are_redacted(self):
+        data = {
+            "userId": "port://alice:secret",
+            "metadata": {"title": "Data", "apiKey": "secret"},
+            "files": [{"Authorization": "token secret", "name": "a.csv"}],
+        }
+
+        self.assertEqual(redact(data), {
+            "userId": "***",
+            "metadata": {"title": "Data", "apiKey": "***"},
+            "files": [{"Authorization": "***", "name": "a.csv"}],
+        })
+        self.assertNotIn("secret", str(Fields({"data": data, "password": "secret"})))
+
+    def test_values_are_truncated(self):
+        self.assertEqual(truncate("x" * 10, 5), "xxxxx...(10 chars)")
+        self.assertEqual(truncate("short", 5), "short")
+
+        line = str(Fields({"data": {"metadata": "x" * 100000}, "text": "y" * 100000}))
+        self.assertLess(len(line), 1000)
+        self.assertIn("text=" + "y" * 200 + "...(100000 chars)", line)
+
+    def test_fields_are_formatted_lazily(self):
+        self.configure("INFO")
+        log = get_logger("test.logs")
+        value = Expensive()
+
+        log.debug("skipped", value=value)
+        self.assertEqual(value.formatted, 0)
+        self.assertEqual(self.stream.getvalue(), "")
+
+        log.info("upload file", value=value, size=10)
+        self.assertEqual(value.formatted, 1)
+        self.assertIn("INFO test.logs test_fields_are_formatted_lazily: upload file value=expensive size=10", self.stream.getvalue())
+
+    def test_module_levels(self):
+        self.configure("INFO", levels="test.logs.verbose=DEBUG")
+
+        get_logger("test.logs").debug("quiet")
+        get_logger("test.logs.verbose").debug("loud %s", "message")
+        logging.getLogger("test.logs.verbose").debug("plain logger")
+
+        output = self.stream.getvalue()
+        self.assertNotIn("quiet", output)
+        self.assertIn("loud message", output)
+        self.assertIn("plain logger", output)
+
+    def test_exc_info_is_passed_on(self):
+        self.configure("INFO")
+
+        try:
+            raise ValueError("broken")
+        except ValueError as e:
+            get_logger("test.logs").error(e, exc_info=True)
+
+        self.assertIn("Traceback", self.stream.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
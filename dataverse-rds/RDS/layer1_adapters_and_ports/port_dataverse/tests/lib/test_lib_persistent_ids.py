@@ -0,0 +1,72 @@
+import unittest
+
+from lib import upload_dataverse
+from lib.upload_dataverse import Dataverse
+from stub_server import StubServer
+
+
+def dataset_response(request):
+    id = request.path.split("/")[-2]
+    return 200, {"status": "OK", "data": {"latestVersion": {"datasetPersistentId": f"doi:10.5072/FK2/{id}"}}}
+
+
+class TestPersistentIds(unittest.TestCase):
+    """Tests for the batched resolution of persistent ids in the project listing."""
+
+    def setUp(self):
+        upload_dataverse._persistent_ids.clear()
+
+    def test_ids_from_contents_payload(self):
+        datasets = [
+            {"id": id, "type": "dataset", "protocol": "doi", "authority": "10.5072", "identifier": f"FK2/{id}"}
+            for id in range(300)
+        ]
+
+        with StubServer() as stub:
+            stub.route("GET", "^/api/datasets/", dataset_response)
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            result = dataverse.get_persistent_ids(datasets)
+
+            self.assertEqual(stub.count("GET", "^/api/datasets/"), 0)
+            self.assertEqual(result[42], "doi:10.5072/FK2/42")
+            self.assertEqual(len(result), 300)
+
+    def test_lookup_fallback_is_memoized(self):
+        datasets = [{"id": id, "type": "dataset"} for id in range(20)]
+
+        with StubServer() as stub:
+            stub.route("GET", "^/api/datasets/", dataset_response)
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            result = dataverse.get_persistent_ids(datasets)
+            dataverse.get_persistent_ids(datasets)
+
+            self.assertEqual(stub.count("GET", "^/api/datasets/"), 20)
+            self.assertEqual(result[7], "doi:10.5072/FK2/7")
+            self.assertEqual(dataverse.get_persistent_id_with_id(7), "doi:10.5072/FK2/7")
+            self.assertEqual(stub.count("GET", "^/api/datasets/"), 20)
+
+    def test_failed_lookup_is_left_out(self):
+        with StubServer() as stub:
+            stub.route("GET", "^/api/datasets/1/", dataset_response)
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            result = dataverse.get_persistent_ids([{"id": 1}, {"id": 2}])
+
+            self.assertEqual(result, {1: "doi:10.5072/FK2/1"})
+
+    def test_dataset_without_id_is_left_out(self):
+        with StubServer() as stub:
+            stub.route("GET", "^/api/datasets/", dataset_response)
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            # e.g. the metadataFilter of the listing dropped the id
+            result = dataverse.get_persistent_ids([{"title": "no id"}, {"id": 3}])
+
+            self.assertEqual(result, {3: "doi:10.5072/FK2/3"})
+            self.assertEqual(stub.count("GET", "^/api/datasets/"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
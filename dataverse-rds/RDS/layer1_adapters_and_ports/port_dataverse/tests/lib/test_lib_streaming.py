@@ -0,0 +1,109 @@
+import io
+import os
+import tempfile
+import unittest
+
+from werkzeug.formparser import parse_form_data
+
+from lib.streaming import MultipartStream, SpooledUpload
+from lib.upload_dataverse import Dataverse
+from stub_server import StubServer
+
+
+class UnseekableStream(object):
+    """Stream without seek and tell, like the wsgi input."""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+        self.max_read = 0
+
+    def read(self, size=-1):
+        self.max_read = max(self.max_read, size)
+        return self._data.read(size)
+
+
+def parse(body, content_type):
+    environ = {
+        "wsgi.input": io.BytesIO(body),
+        "CONTENT_LENGTH": str(len(body)),
+        "CONTENT_TYPE": content_type,
+        "REQUEST_METHOD": "POST",
+    }
+    _, form, files = parse_form_data(environ)
+    return form, files
+
+
+class TestStreaming(unittest.TestCase):
+    """Tests for the streaming multipart upload to dataverse."""
+
+    def test_multipart_body(self):
+        data = os.urandom(300 * 1024)
+        stream = MultipartStream({"jsonData": "{}"}, "file", 'my "file".bin', io.BytesIO(data), chunk_size=64 * 1024)
+
+        chunks = list(stream)
+        body = b"".join(chunks)
+        form, files = parse(body, stream.content_type)
+
+        self.assertEqual(len(body), len(stream))
+        self.assertTrue(max(len(chunk) for chunk in chunks[1:-1]) <= 64 * 1024)
+        self.assertEqual(form["jsonData"], "{}")
+        self.assertEqual(files["file"].read(), data)
+        self.assertEqual(files["file"].filename, 'my "file".bin')
+
+    def test_unknown_size_is_chunked(self):
+        stream = MultipartStream({}, "file", "file.bin", UnseekableStream(b"data"))
+
+        self.assertFalse(stream.has_length())
+        self.assertNotIsInstance(stream.body(), MultipartStream)
+
+    def test_spooled_upload_is_removed(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with SpooledUpload(UnseekableStream(b"x" * 1000), dir=tmpdir) as tmp:
+                self.assertEqual(tmp.read(), b"x" * 1000)
+                self.assertEqual(os.listdir(tmpdir), [])
+
+            self.assertTrue(tmp.closed)
+
+    def test_upload_streams_file(self):
+        data = os.urandom(3 * 1024 * 1024 + 17)
+
+        with StubServer() as stub:
+            stub.route("POST", "/add", (200, {"status": "OK"}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+            source = UnseekableStream(data)
+
+            cwd = os.getcwd()
+            with tempfile.TemporaryDirectory() as tmpdir:
+                os.chdir(tmpdir)
+                try:
+                    response = dataverse.upload_new_file_to_dataset(
+                        "doi:10.5072/FK2/ABC", "file.bin", source, return_response=True)
+                finally:
+                    os.chdir(cwd)
+                self.assertEqual(os.listdir(tmpdir), [])
+
+            request = stub.calls[-1]
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(request.headers.get("Transfer-Encoding"), "chunked")
+            self.assertTrue(source.max_read <= 1024 * 1024)
+            self.assertTrue(request.body_size > len(data))
+            self.assertIn(b'filename="file.bin"', request.body)
+
+    def test_upload_with_spool(self):
+        data = os.urandom(1024)
+
+        with StubServer() as stub:
+            stub.route("POST", "/add", (200, {"status": "OK"}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            dataverse.upload_new_file_to_dataset(
+                "doi:10.5072/FK2/ABC", "file.bin", UnseekableStream(data), spool=True)
+
+            request = stub.calls[-1]
+            form, files = parse(request.body, request.headers["Content-Type"])
+            self.assertIn("Content-Length", request.headers)
+            self.assertEqual(files["file"].read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from lib.token_cache import TokenCache
+from lib.upload_dataverse import Dataverse
+from stub_server import StubServer
+
+
+class TestTokenCache(unittest.TestCase):
+    """Tests for the cache of token checks."""
+
+    def test_results_are_cached(self):
+        cache = TokenCache()
+        probe = mock.Mock(return_value=True)
+
+        self.assertTrue(cache.check(("address", "key"), probe))
+        self.assertTrue(cache.check(("address", "key"), probe))
+        self.assertEqual(probe.call_count, 1)
+
+        self.assertFalse(cache.check(("address", "other"), mock.Mock(return_value=False)))
+        self.assertFalse(cache.check(("address", "other"), probe))
+        self.assertEqual(probe.call_count, 1)
+
+    def test_invalid_tokens_expire_first(self):
+        cache = TokenCache(positive_ttl=10, negative_ttl=0.05)
+        cache.check(("address", "valid"), lambda: True)
+        cache.check(("address", "invalid"), lambda: False)
+        time.sleep(0.1)
+
+        probe = mock.Mock(return_value=True)
+        self.assertTrue(cache.check(("address", "valid"), probe))
+        self.assertTrue(cache.check(("address", "invalid"), probe))
+        self.assertEqual(probe.call_count, 1)
+
+    def test_errors_are_not_cached(self):
+        cache = TokenCache()
+
+        self.assertFalse(cache.check(("address", "key"), mock.Mock(side_effect=ConnectionError())))
+        self.assertTrue(cache.check(("address", "key"), lambda: True))
+
+    def test_concurrent_checks_share_one_probe(self):
+        cache = TokenCache()
+        calls = []
+
+        def probe():
+            calls.append(1)
+            time.sleep(0.1)
+            return True
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.check(("address", "key"), probe))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [True] * 5)
+        self.assertEqual(len(calls), 1)
+
+
+class TestDataverseCheckToken(unittest.TestCase):
+    """Tests for check_token, which only asks dataverse for the user of the token."""
+
+    def users_me(self, request):
+        if request.headers.get("X-Dataverse-key") == "valid":
+            return 200, {"status": "OK", "data": {"identifier": "@alice"}}
+        return 401, {"status": "ERROR", "message": "Bad api key"}
+
+    def test_check_token(self):
+        with StubServer() as stub, mock.patch("lib.upload_dataverse.checked_tokens", TokenCache()):
+            stub.route("GET", "^/api/users/:me$", self.users_me)
+            address = f"{stub.url}/api"
+
+            for _ in range(3):
+                self.assertTrue(Dataverse.check_token("valid", api_address=address))
+                self.assertFalse(Dataverse.check_token("invalid", api_address=address))
+
+            self.assertEqual(stub.count("GET", "^/api/users/:me$"), 2)
+            self.assertEqual(len(stub.calls), 2)
+
+    def test_server_error_is_not_cached(self):
+        with StubServer() as stub, mock.patch("lib.upload_dataverse.checked_tokens", TokenCache()):
+            stub.route("GET", "^/api/users/:me$", (500, {"status": "ERROR"}))
+            address = f"{stub.url}/api"
+
+            self.assertFalse(Dataverse.check_token("valid", api_address=address))
+            self.assertFalse(Dataverse.check_token("valid", api_address=address))
+            self.assertEqual(stub.count("GET"), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from lib.http_session import close_sessions
+from lib.transfer_jobs import (
+    Job, JobRunner, JobStore, owner_of, wants_async,
+    QUEUED, RUNNING, SUCCEEDED, FAILED, INTERRUPTED,
+)
+from lib.upload_dataverse import Dataverse, request_email
+from stub_server import StubServer
+
+app = Flask(__name__)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+
+class TestTransferJobs(unittest.TestCase):
+    """Tests for the runner of asynchronous transfer jobs."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = JobStore(self.tmpdir.name)
+        self.uploads = []
+        self.release = threading.Event()
+        self.release.set()
+        self.handlers = {"upload": self.upload, "broken": self.broken, "rejected": lambda *args: False}
+        self.runners = []
+
+    def tearDown(self):
+        self.release.set()
+        for runner in self.runners:
+            runner.close()
+        self.tmpdir.cleanup()
+
+    def upload(self, connector, params, file):
+        self.release.wait()
+        self.uploads.append((connector, params["filename"], file.read()))
+        return {"success": True}
+
+    def broken(self, connector, params, file):
+        raise ValueError("upstream is gone")
+
+    def runner(self, **kwargs):
+        runner = JobRunner(store=self.store, handlers=self.handlers, **kwargs)
+        self.runners.append(runner)
+        return runner
+
+    def persisted(self, job):
+        with open(self.store.state_path(job.id)) as f:
+            return json.load(f)
+
+    def test_job_runs_in_background(self):
+        runner = self.runner()
+        job = runner.submit("upload", "connector", "alice", {"filename": "a.bin"}, io.BytesIO(b"a" * 100))
+        runner.close()
+
+        self.assertEqual(job.state, SUCCEEDED)
+
+        self.assertEqual(self.uploads, [("connector", "a.bin", b"a" * 100)])
+        self.assertEqual(job.status()["bytesTransferred"], 100)
+        self.assertEqual(job.status()["size"], 100)
+        self.assertEqual(self.persisted(job)["state"], SUCCEEDED)
+        self.assertFalse(os.path.exists(self.store.data_path(job.id)))
+
+    def test_failures_are_reported(self):
+        runner = self.runner()
+        broken = runner.submit("broken", "connector", "alice", {}, io.BytesIO(b"a"))
+        rejected = runner.submit("rejected", "connector", "alice", {}, io.BytesIO(b"a"))
+        wait_for(lambda: broken.finished and rejected.finished)
+
+        self.assertEqual((broken.state, broken.error), (FAILED, "upstream is gone"))
+        self.assertEqual((rejected.state, rejected.error), (FAILED, "Upload failed."))
+
+        with self.assertRaises(ValueError):
+            runner.submit("unknown", "connector", "alice", {}, io.BytesIO(b"a"))
+
+    def test_jobs_per_user_are_limited(self):
+        self.release.clear()
+        runner = self.runner(workers=4, per_user=1)
+        first = runner.submit("upload", "connector", "alice", {"filename": "1"}, io.BytesIO(b"1"))
+        second = runner.submit("upload", "connector", "alice", {"filename": "2"}, io.BytesIO(b"2"))
+        other = runner.submit("upload", "connector", "bob", {"filename": "3"}, io.BytesIO(b"3"))
+        wait_for(lambda: first.state == RUNNING and other.state == RUNNING)
+
+        self.assertEqual(second.state, QUEUED)
+
+        self.release.set()
+        wait_for(lambda: all(job.state == SUCCEEDED for job in (first, second, other)))
+        self.assertEqual(sorted(upload[1] for upload in self.uploads), ["1", "2", "3"])
+
+    def test_jobs_are_only_visible_to_their_owner(self):
+        runner = self.runner()
+        job = runner.submit("upload", "connector", owner_of("alice", "secret"), {"filename": "a"}, io.BytesIO(b"a"))
+
+        self.assertIs(runner.get(job.id, owner_of("alice", "secret")), job)
+        self.assertIsNone(runner.get(job.id, owner_of("alice", "other")))
+        self.assertIsNone(runner.get("unknown", owner_of("alice", "secret")))
+        self.assertNotIn("secret", json.dumps(self.persisted(job)))
+
+    def test_interrupted_job_is_resumed(self):
+        job = Job("upload", "alice", {"filename": "a.bin"}, size=3, state=RUNNING, transferred=1)
+        with open(self.store.data_path(job.id), "wb") as f:
+            f.write(b"abc")
+        self.store.save(job)
+
+        runner = self.runner()
+        restored = runner.get(job.id, "alice")
+        self.assertEqual(restored.state, INTERRUPTED)
+        self.assertEqual(self.persisted(job)["state"], INTERRUPTED)
+
+        runner.resume(restored, "new connector")
+        wait_for(lambda: restored.state == SUCCEEDED)
+        self.assertEqual(self.uploads, [("new connector", "a.bin", b"abc")])
+        self.assertEqual(restored.transferred, 3)
+
+    def test_finished_jobs_are_purged(self):
+        runner = self.runner(retention=0)
+        job = runner.submit("upload", "connector", "alice", {"filename": "a"}, io.BytesIO(b"a"))
+        runner.close()
+        runner.purge()
+
+        self.assertIsNone(runner.get(job.id, "alice"))
+        self.assertFalse(os.path.exists(self.store.state_path(job.id)))
+
+    def test_wants_async(self):
+        self.assertTrue(wants_async({"async": "true"}))
+        self.assertTrue(wants_async({"async": True}))
+        self.assertFalse(wants_async({"async": "false"}))
+        self.assertFalse(wants_async({}))
+
+
+
+class TestDataverseJobs(unittest.TestCase):
+    """Tests for asynchronous uploads to dataverse, which run outside of the request."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        patcher = mock.patch("lib.dataset_locks.lock_poll_initial", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        close_sessions()
+
+    def test_upload_to_the_latest_dataset_of_the_user(self):
+        with StubServer() as stub:
+            stub.route("POST", "^/api/dataverses/surf$", (201, {"status": "OK"}))
+            stub.route("GET", "^/api/dataverses/aliceexampleorg/contents$", (200, {"data": [{"id": 4711}]}))
+            stub.route("GET", "^/api/datasets/4711/$", (200, {"data": {"latestVersion": {
+                "datasetPersistentId": "doi:10.5072/FK2/ALICE"}}}))
+            stub.route("GET", "/versions/:latest/files", (200, {"status": "OK", "data": []}))
+            stub.route("POST", "/add\\?persistentId=doi:10.5072/FK2/ALICE", (200, {"status": "OK"}))
+            dataverse = Dataverse("key", api_address=f"{stub.url}/api")
+
+            # the same as api/project/files.py
+            def upload(connector, params, file):
+                return connector.upload_new_file_to_dataset(
+                    params["project_id"], params["filename"], file, email=params.get("email"))
+
+            with app.test_request_context("/", method="POST", data={"userId": "port-dataverse://alice@example.org:secret"}):
+                params = {"project_id": "None", "filename": "a.csv", "email": request_email()}
+            runner = JobRunner(store=JobStore(self.tmpdir.name), handlers={"upload": upload})
+            job = runner.submit("upload", dataverse, "alice", params, io.BytesIO(b"a,b"))
+            runner.close()
+
+            self.assertEqual(job.state, SUCCEEDED)
+            self.assertEqual(stub.count("POST", "/add\\?persistentId=doi:10.5072/FK2/ALICE"), 1)
+            created = [call.json() for call in stub.calls if call.path == "/api/dataverses/surf"]
+            self.assertEqual(created[0]["alias"], "aliceexampleorg")
+
+if __name__ == '__main__':
+    unittest.main()
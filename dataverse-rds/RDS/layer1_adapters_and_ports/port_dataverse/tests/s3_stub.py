@@ -0,0 +1,134 @@
+import email
+import hashlib
+import itertools
+import json
+import threading
+from urllib.parse import urlparse, parse_qs
+
+
+class DirectUploadStub(object):
+    """Dataverse with direct upload to an S3 compatible store, on top of a StubServer.
+
+    The store accepts presigned PUTs for single files and for the parts of multipart uploads,
+    answers with the md5 of the data as ETag and assembles the parts on complete. Dataverse
+    hands out the upload urls and registers the stored files with addFiles, which checks
+    the md5 the client sent against the stored object.
+
+    Args:
+        stub (StubServer): the running stub server.
+        part_size (int): maximum size of one part, larger files get a multipart upload.
+        fail_part (int, optional): number of the part, which the store rejects.
+    """
+
+    def __init__(self, stub, part_size=64 * 1024, fail_part=None):
+        self.stub = stub
+        self.part_size = part_size
+        self.fail_part = fail_part
+        self.objects = {}
+        self.parts = {}
+        self.aborted = []
+        self.registered = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def route(self):
+        self.stub.route("GET", "^/api/datasets/:persistentId/uploadurls\\?", self.upload_urls)
+        self.stub.route("PUT", "^/s3/", self.put)
+        self.stub.route("PUT", "^/api/datasets/mpupload\\?", self.complete)
+        self.stub.route("DELETE", "^/api/datasets/mpupload\\?", self.abort)
+        self.stub.route("POST", "^/api/datasets/:persistentId/addFiles\\?", self.add_files)
+        self.stub.route("POST", "/add", (200, {"status": "OK"}))
+        return self
+
+    def upload_urls(self, request):
+        query = parse_qs(urlparse(request.path).query)
+        size = int(query["size"][0])
+        with self._lock:
+            key = f"object{next(self._ids)}"
+        storage_identifier = f"s3://bucket:{key}"
+
+        if size <= self.part_size:
+            return 200, {"status": "OK", "data": {
+                "url": f"{self.stub.url}/s3/bucket/{key}?X-Amz-Signature=abc",
+                "partSize": self.part_size,
+                "storageIdentifier": storage_identifier,
+            }}
+
+        count = -(-size // self.part_size)
+        upload = f"globalid={query['persistentId'][0]}&uploadid=upload-{key}&storageidentifier={storage_identifier}"
+        return 200, {"status": "OK", "data": {
+            "urls": {
+                str(number): f"{self.stub.url}/s3/bucket/{key}?uploadId=upload-{key}&partNumber={number}&X-Amz-Signature=abc"
+                for number in range(1, count + 1)
+            },
+            "abort": f"/api/datasets/mpupload?{upload}",
+            "complete": f"/api/datasets/mpupload?{upload}",
+            "partSize": self.part_size,
+            "storageIdentifier": storage_identifier,
+        }}
+
+    def put(self, request):
+        parsed = urlparse(request.path)
+        key = parsed.path.split("/")[-1]
+        query = parse_qs(parsed.query)
+        etag = f'"{hashlib.md5(request.body).hexdigest()}"'
+
+        if "partNumber" not in query:
+            with self._lock:
+                self.objects[key] = request.body
+            return 200, b"", {"ETag": etag}
+
+        number = int(query["partNumber"][0])
+        if number == self.fail_part:
+            return 500, b"<Error><Code>InternalError</Code></Error>"
+        with self._lock:
+            self.parts.setdefault(key, {})[number] = (etag.strip('"'), request.body)
+        return 200, b"", {"ETag": etag}
+
+    def _key(self, request):
+        return parse_qs(urlparse(request.path).query)["storageidentifier"][0].split(":")[-1]
+
+    def complete(self, request):
+        key = self._key(request)
+        etags = request.json()
+        with self._lock:
+            parts = self.parts.pop(key, {})
+            if sorted(int(number) for number in etags) != sorted(parts) or any(
+                parts[int(number)][0] != etag for number, etag in etags.items()
+            ):
+                return 400, {"status": "ERROR", "message": "parts do not match"}
+            self.objects[key] = b"".join(parts[number][1] for number in sorted(parts))
+        return 200, {"status": "OK"}
+
+    def abort(self, request):
+        key = self._key(request)
+        with self._lock:
+            self.parts.pop(key, None)
+            self.aborted.append(key)
+        return 204, b""
+
+    def add_files(self, request):
+        message = email.message_from_bytes(
+            f"Content-Type: {request.headers['Content-Type']}\r\n\r\n".encode("utf-8") + request.body
+        )
+        entries = json.loads(message.get_payload()[0].get_payload(decode=True))
+
+        files = []
+        for entry in entries:
+            content = self.objects.get(entry["storageIdentifier"].split(":")[-1])
+            ok = content is not None and hashlib.md5(content).hexdigest() == entry["checksum"]["@value"]
+            files.append(dict(
+                {"storageIdentifier": entry["storageIdentifier"], "fileName": entry["fileName"]},
+                **({"status": "ADDED"} if ok else {"status": "ERROR", "errorMessage": "checksum mismatch"})
+            ))
+            if ok:
+                self.registered.append(entry)
+
+        return 200, {"status": "OK", "data": {"Files": files, "Result": {
+            "Total number of files": len(files),
+            "Number of files successfully added": len([f for f in files if f["status"] == "ADDED"]),
+        }}}
+
+    def content(self, entry):
+        return self.objects[entry["storageIdentifier"].split(":")[-1]]
+
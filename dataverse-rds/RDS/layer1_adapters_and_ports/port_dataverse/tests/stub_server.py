@@ -0,0 +1,145 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer(object):
+    """Small local HTTP/1.1 server with keep-alive, which answers with canned responses.
+
+    Routes are registered with `route(method, path_regex, handler)`. A handler gets the
+    `StubRequest` and returns a tuple of (status, body[, headers]). A dict or list as body
+    will be sent as json. Every request is recorded in `calls`, every accepted tcp
+    connection is counted in `connections`.
+
+    Use it as a context manager, the base url is available as `url`.
+    """
+
+    def __init__(self):
+        self.routes = []
+        self.calls = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def route(self, method, path, handler):
+        if not callable(handler):
+            response = handler
+            handler = lambda request: response
+        self.routes.append((method.upper(), re.compile(path), handler))
+
+    def count(self, method=None, path=None):
+        return len([
+            call for call in self.calls
+            if (method is None or call.method == method.upper())
+            and (path is None or re.search(path, call.path))
+        ])
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def handle_one_request(self):
+                try:
+                    super().handle_one_request()
+                except ConnectionError:
+                    self.close_connection = True
+
+            def _handle(self):
+                request = StubRequest(self)
+                with stub._lock:
+                    stub.calls.append(request)
+
+                for method, pattern, handler in stub.routes:
+                    if method == request.method and pattern.search(request.path):
+                        result = handler(request)
+                        break
+                else:
+                    result = (404, {"status": "ERROR", "message": "not found"})
+
+                status, body, headers = (tuple(result) + ({},))[:3]
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body)
+                    headers = dict({"Content-Type": "application/json"}, **headers)
+                if isinstance(body, str):
+                    body = body.encode("utf-8")
+                body = body or b""
+
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = _handle
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StubRequest(object):
+    """A recorded request, the body is read completely or in chunks if it was chunked."""
+
+    def __init__(self, handler):
+        self.method = handler.command
+        self.path = handler.path
+        self.headers = dict(handler.headers)
+        self.body_size = 0
+        self.body = b""
+
+        if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            self._read_chunked(handler.rfile)
+        else:
+            length = int(handler.headers.get("Content-Length") or 0)
+            self._read(handler.rfile, length)
+
+    def _keep(self, data):
+        self.body_size += len(data)
+        # large bodies are only counted, so the stub can be used for big uploads
+        if len(self.body) < 1024 * 1024:
+            self.body += data
+
+    def _read(self, rfile, length):
+        while length > 0:
+            data = rfile.read(min(length, 1024 * 1024))
+            if not data:
+                break
+            self._keep(data)
+            length -= len(data)
+
+    def _read_chunked(self, rfile):
+        while True:
+            size = int(rfile.readline().split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                rfile.readline()
+                break
+            self._read(rfile, size)
+            rfile.readline()
+
+    def json(self):
+        return json.loads(self.body)
@@ -0,0 +1,75 @@
+"""Compares the file I/O of the figshare ingest with and without the hashing tee.
+
+The old ingest wrote the upload to disk and read it again in get_file_check_data for
+md5 and size. The new ingest hashes the stream while it is written. The I/O is taken
+from the rchar/wchar counters in /proc/self/io, so this benchmark needs Linux.
+
+    python benchmarks/bench_ingest_io.py --size 512
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(f"{os.getcwd()}/src")
+
+from lib.hashing import HashingTee
+from lib.upload_figshare import Figshare
+
+MB = 1024 * 1024
+
+
+def io_counters():
+    with open("/proc/self/io") as f:
+        counters = dict(line.split(": ") for line in f.read().splitlines())
+    return int(counters["rchar"]), int(counters["wchar"])
+
+
+def measure(name, ingest, data, path):
+    stream = io.BytesIO(data)
+    read_before, written_before = io_counters()
+    start = time.perf_counter()
+    md5, size = ingest(stream, path)
+    duration = time.perf_counter() - start
+    read_after, written_after = io_counters()
+
+    file_io = (read_after - read_before) + (written_after - written_before)
+    print(
+        f"{name:>8}: {file_io / MB:.0f} MB file I/O "
+        f"({(read_after - read_before) / MB:.0f} MB read, {(written_after - written_before) / MB:.0f} MB written), "
+        f"{duration:.2f} s"
+    )
+    return file_io, md5, size
+
+
+def ingest_old(stream, path):
+    with open(path, "wb") as ff:
+        ff.write(stream.read())
+    return Figshare("key").get_file_check_data(path)
+
+
+def ingest_new(stream, path):
+    with open(path, "wb") as ff:
+        tee = HashingTee(stream).copy_to(ff)
+    return tee.hexdigest("md5"), tee.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=512, help="file size in MB")
+    args = parser.parse_args()
+
+    data = os.urandom(args.size * MB)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "upload.bin")
+        old_io, old_md5, old_size = measure("old", ingest_old, data, path)
+        new_io, new_md5, new_size = measure("new", ingest_new, data, path)
+
+    assert (old_md5, old_size) == (new_md5, new_size)
+    print(f"file I/O of the new ingest: {new_io / old_io * 100:.0f} % of the old one")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Uploads a file with Figshare.upload_parts to a local figshare upload stub.
+
+The stub delays every part by a fixed latency plus the time, a single connection with
+--mbit bandwidth needs for the part, so the benchmark shows how the number of workers
+scales the throughput of a multipart upload.
+
+    python benchmarks/bench_upload_parts.py --size 200 --workers 1,2,4,8
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(f"{os.getcwd()}/src")
+sys.path.append(f"{os.getcwd()}/tests")
+
+from lib.upload_figshare import Figshare
+from stub_server import StubServer
+
+MB = 1024 * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=200, help="file size in MB")
+    parser.add_argument("--part-size", type=int, default=10, help="part size in MB, figshare uses 10 MB")
+    parser.add_argument("--latency", type=float, default=0.05, help="latency per part in seconds")
+    parser.add_argument("--mbit", type=float, default=400, help="bandwidth of a single connection")
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    size = args.size * MB
+    part_size = args.part_size * MB
+    parts = [
+        {"partNo": no + 1, "startOffset": offset, "endOffset": min(offset + part_size, size) - 1, "status": "PENDING"}
+        for no, offset in enumerate(range(0, size, part_size))
+    ]
+
+    def put(request):
+        time.sleep(args.latency + request.body_size * 8 / (args.mbit * 1000 * 1000))
+        return 200, ""
+
+    with tempfile.NamedTemporaryFile() as f, StubServer() as stub:
+        for _ in range(args.size):
+            f.write(os.urandom(MB))
+        f.flush()
+
+        stub.route("GET", "^/upload/bench$", (200, {"token": "bench", "parts": parts}))
+        stub.route("PUT", "^/upload/bench/", put)
+        figshare = Figshare("key", api_address=f"{stub.url}/v2")
+
+        print(f"{args.size} MB in {len(parts)} parts, {args.latency * 1000:.0f} ms latency, {args.mbit} Mbit/s per connection")
+        for workers in [int(workers) for workers in args.workers.split(",")]:
+            start = time.perf_counter()
+            figshare.upload_parts({"upload_url": f"{stub.url}/upload/bench"}, f.name, workers=workers)
+            duration = time.perf_counter() - start
+            print(f"{workers:>3} workers: {duration:.2f} s, {args.size / duration:.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,87 @@
-import inspect
+import itertools
+import json
 import time
 from RDS import ROParser
-import logging
-from lib.upload_figshare import Figshare
-from flask import jsonify, request, g, current_app
+from lib.upload_figshare import Figshare, filter_metadata
+from flask import jsonify, request, g, current_app, Response, stream_with_context
 from werkzeug.exceptions import abort
 from lib.Util import require_api_key, to_jsonld, from_jsonld
+from lib.logs import get_logger
 
-logger = logging.getLogger()
+logger = get_logger(__name__)
 
 
 @require_api_key
 def index():
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py index")
     req = request.json.get("metadata")
-    
-    articleResponse = g.figshare.get_article(metadataFilter=req)
-    logger.debug("article response: {}".format(articleResponse))
 
-    output = []
-    for article in articleResponse:
+    # the articles are read page by page while the response is streamed
+    articles = g.figshare.iter_article_metadata()
+    # an error of the first page still aborts with its status code
+    first = next(articles, None)
+
+    def project(article):
+        # the id is read before the filter, which may drop it
+        recid = (article.get("prereserve_doi") or {}).get("recid")
+        if recid is None:
+            logger.error("Skip article without prereserved doi", title=article.get("title"))
+            return None
+        article = filter_metadata(article, req)
+
         try:
             metadata = to_jsonld(article)
 
         except Exception as e:
-            logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at api/project/project.py project")
             logger.error(e, exc_info=True)
             metadata = article
 
-        output.append({
-            "projectId": str(article["prereserve_doi"]["recid"]),
+        return {
+            "projectId": str(recid),
             "metadata": metadata
-        })
+        }
 
-    return jsonify(output)
+    def generate():
+        yield "["
+        separator = ""
+        for article in itertools.chain([first], articles) if first is not None else ():
+            output = project(article)
+            if output is not None:
+                yield separator + json.dumps(output)
+                separator = ","
+        yield "]"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
 
 
 @require_api_key
 def get(project_id):
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py get")
     req = request.json.get("metadata")
 
     articleResponse = g.figshare.get_article(
         id=int(project_id), metadataFilter=req)
 
-    logger.debug("article reponse: {}".format(articleResponse))
+    logger.debug("article reponse", articleResponse=articleResponse)
 
     output = articleResponse
     try:
         output = to_jsonld(articleResponse.get("metadata") or articleResponse)
 
     except Exception as e:
-        logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        logger.error("Exception at api/project/project.py get")
         logger.error(e, exc_info=True)
         output = articleResponse
 
-    logger.debug("output: {}".format(output))
+    logger.debug("output", output=output)
 
     return jsonify(output)
 
 
 def figshare(res):
-    logger.debug(f"figshare_res: {res}")
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("figshare_res: %s", res)
+    logger.debug("Entering at api/project/project.py figshare")
   
     req = request.get_json(force=True)
     userId = req.get("userId")
@@ -133,18 +152,18 @@ def figshare(res):
         pass
 
 
-    logger.debug(f"figshare_res: {result}")
+    logger.debug("figshare_res: %s", result)
     return result
 
 
 @require_api_key
 def post():
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py post")
     try:
         req = request.get_json(force=True)
         metadata = req.get("metadata")
 
-        logger.debug(f"got metadata: {metadata}")
+        logger.debug("got metadata: %s", metadata)
 
         if metadata is not None:
             try:
@@ -152,16 +171,16 @@ def post():
                 metadata = figshare(doc.getElement(
                     doc.rootIdentifier, expand=True, clean=True))
             except Exception as e:
-                logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+                logger.error("Exception at api/project/project.py post")
                 logger.error(e, exc_info=True)
 
-        logger.debug("send metadata: {}".format(metadata))
+        logger.debug("send metadata", metadata=metadata)
 
         articleResponse = g.figshare.create_new_article_internal(
             metadata=metadata, return_response=True
         )
 
-        logger.debug(f"### articleResponse: {articleResponse}, {articleResponse.json()} ###")
+        logger.debug("### articleResponse: %s, %s ###", articleResponse, articleResponse.json())
 
         if articleResponse.status_code < 300:
 
@@ -178,19 +197,19 @@ def post():
                 }
             )
             
-            logger.debug(f"### post: {article_id}, {metadata} ###")
+            logger.debug("### post: %s, %s ###", article_id, metadata)
             return result
 
         abort(articleResponse.status_code)
     except Exception as e:
-        logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}, outer exception")
+        logger.error("Exception at api/project/project.py post, outer exception")
         logger.error(e, exc_info=True)
         abort(500)
 
 
 @require_api_key
 def delete(project_id):
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py delete")
     if g.figshare.remove_article_internal(int(project_id)):
         return "", 204
 
@@ -199,18 +218,18 @@ def delete(project_id):
 
 @require_api_key
 def patch(project_id):
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py patch")
     req = request.get_json(force=True)
-    logger.debug("request data: {}".format(req))
+    logger.debug("request data", req=req)
 
     metadata = req.get("metadata")
-    logger.debug("original data: {}".format(metadata))
+    logger.debug("original data", metadata=metadata)
     if metadata is not None:
         try:
             try:
                 doc = ROParser(metadata)
                 docexpanded = doc.getElement(doc.rootIdentifier, expand=True, clean=False)
-                logger.debug(f"doc: {docexpanded}")
+                logger.debug("doc: %s", docexpanded)
                 metadata = figshare(doc.getElement(
                     doc.rootIdentifier, expand=True, clean=False))
             except:
@@ -219,7 +238,7 @@ def patch(project_id):
             logger.debug("Error ROParser")
             logger.error(e, exc_info=True)
 
-    logger.debug("transformed data: {}".format(metadata))
+    logger.debug("transformed data", metadata=metadata)
 
     articleResponse = g.figshare.change_metadata_in_article_internal(
         article_id=int(project_id), metadata=metadata, return_response=True
@@ -228,16 +247,16 @@ def patch(project_id):
     if articleResponse.status_code == 200:
         output = articleResponse.json()
 
-        logger.debug("output: {}".format(output))
+        logger.debug("output", output=output)
 
         try:
             output["metadata"] = to_jsonld(output["metadata"])
 
         except Exception as e:
-            logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}, second exception")
+            logger.error("Exception at api/project/project.py patch, second exception")
             logger.error(e, exc_info=True)
 
-        logger.debug("finished output: {}".format(output))
+        logger.debug("finished output", output=output)
 
         return jsonify(output["metadata"])
 
@@ -246,7 +265,7 @@ def patch(project_id):
 
 @require_api_key
 def put(project_id):
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py put")
     if g.figshare.publish_article_internal(article_id=int(project_id)):
         return True, 200
 
@@ -0,0 +1,18 @@
+from lib.Util import require_api_key
+from lib.sync import sync_request
+from flask import jsonify, request, g
+from lib.logs import get_logger
+
+logger = get_logger(__name__)
+
+
+@require_api_key
+def post(project_id):
+    logger.debug("Entering at api/project/sync.py post")
+
+    entries, files, dry_run = sync_request(request)
+    logger.debug("Start sync of %s files", len(entries))
+    result = g.figshare.sync_article(project_id, entries, files, dry_run=dry_run)
+    logger.debug("Finished sync")
+
+    return jsonify(result)
@@ -1,15 +1,16 @@
-import inspect
 from functools import wraps
 from lib.upload_figshare import Figshare
+from lib.connector_registry import connectors
 from flask import request, g, current_app, abort
+from werkzeug.exceptions import HTTPException
 import os
 import requests
-import logging
-from pyld import jsonld
-import json
+from lib.jsonld_loader import frame
 from RDS import Util
+from lib.logs import get_logger
+from lib.request_data import user_id
 
-logger = logging.getLogger()
+logger = get_logger(__name__)
 
 
 def require_api_key(api_method):
@@ -17,31 +18,36 @@ def require_api_key(api_method):
     def check_api_key(*args, **kwargs):
         g.figshare = None
 
-        try:
-            req = request.get_json(force=True)
-        except Exception as e:
-            logger.error(f"Exception at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
-            logger.error(e, exc_info=True)
-            req = request.form.to_dict()
-        logger.debug("got request data: {}".format(req))
+        # from the header or the fields in front of an upload, an uploaded file is not read here
+        userId = user_id()
 
         try:
-            service, userId, apiKey = Util.parseUserId(req.get("userId"))
+            service, userId, apiKey = Util.parseUserId(userId)
         except Exception as e:
-            logger.error(f"Exception at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at lib/Util.py check_api_key")
             logger.error(e, exc_info=True)
             apiKey = Util.loadToken(
-                req.get("userId"), "port-figshare").access_token
+                userId, "port-figshare").access_token
 
         if apiKey is None:
-            logger.error(f"Exception at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at lib/Util.py check_api_key")
             logger.error("apiKey or userId not found.")
             abort(401)
 
         logger.debug("found apiKey")
-        g.figshare = Figshare(apiKey, api_address=current_app.figshare_api_address)
+        credentials = (apiKey,)
+        g.figshare = connectors.get(
+            "port-figshare", current_app.figshare_api_address, credentials,
+            lambda: Figshare(apiKey, api_address=current_app.figshare_api_address),
+        )
 
-        return api_method(*args, **kwargs)
+        try:
+            return api_method(*args, **kwargs)
+        except HTTPException as e:
+            if e.code in (401, 403):
+                # do not hand out an instance with rejected credentials again
+                connectors.invalidate("port-figshare", current_app.figshare_api_address, credentials)
+            raise
 
     return check_api_key
 
@@ -63,7 +69,7 @@ figshare_to_jsonld = {
 
 
 def to_jsonld(metadata):
-    logger.debug(f"Entering at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at lib/Util.py to_jsonld")
     def parse_creator(user):
         output = {}
         errors = False
@@ -76,13 +82,13 @@ def to_jsonld(metadata):
             try:
                 output[figshare_to_jsonld[parameter]] = creator[parameter]
             except KeyError as e:
-                logger.error(f"Exception at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+                logger.error("Exception at lib/Util.py parse_creator")
                 logger.error(e)
                 errors = True
 
         return output
 
-    logger.debug("got metadata {}".format(metadata))
+    logger.debug("got metadata", metadata=metadata)
 
     try:
         figsharecategory = "{}/{}".format(
@@ -130,7 +136,7 @@ def to_jsonld(metadata):
             try:
                 jsonld[figshare_to_jsonld[parameter]] = metadata[parameter]
             except Exception as e:
-                logger.debug("key {} not found.".format(e))
+                logger.debug("key %s not found.", e)
 
     try:
         publicAccess = metadata["access_right"] == "open"
@@ -142,18 +148,13 @@ def to_jsonld(metadata):
 
 
 def from_jsonld(jsonld_data):
-    logger.debug(f"Entering at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at lib/Util.py from_jsonld")
     if jsonld_data is None:
         return
 
-    try:
-        frame = json.load(open("src/lib/ffigshare.jsonld"))
-    except:
-        frame = json.load(open("lib/ffigshare.jsonld"))
-
-    logger.debug("before transformation data: {}".format(jsonld_data))
-    data = jsonld.frame(jsonld_data, frame)
-    logger.debug("after framing: {}".format(data))
+    logger.debug("before transformation data", jsonld_data=jsonld_data)
+    data = frame(jsonld_data, "ffigshare.jsonld")
+    logger.debug("after framing", data=data)
 
     data["title"] = data[figshare_to_jsonld["title"].replace(
         "https://schema.org/", "")]
@@ -172,7 +173,7 @@ def from_jsonld(jsonld_data):
             del creator["@id"]
             del creator["@type"]
         except Exception as e:
-            logger.error(f"Exception at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at lib/Util.py read_creator")
             logger.error(e, exc_info=True)
 
         try:
@@ -180,7 +181,7 @@ def from_jsonld(jsonld_data):
         except Exception as e:
             if "affiliation" in creator:
                 del creator["affiliation"]
-            logger.error(f"Exception at lib/Util.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at lib/Util.py read_creator")
             logger.error(e, exc_info=True)
 
         data["creators"].append(creator)
@@ -206,6 +207,6 @@ def from_jsonld(jsonld_data):
         pass
 
     data["description"] = data["description"].replace("\n", "<br>")
-    logger.debug("after transformation data: {}".format(data))
+    logger.debug("after transformation data", data=data)
 
     return data
@@ -0,0 +1,51 @@
+import hashlib
+import shutil
+
+chunk_size = 1048576
+
+
+class HashingTee(object):
+    """Wraps a readable stream and hashes every byte, which is read through it.
+
+    Use it to compute checksums and the size of an incoming upload while it is
+    written somewhere else, so the data has not to be read a second time.
+
+        tee = HashingTee(request.files["file"])
+        with open(path, "wb") as f:
+            tee.copy_to(f)
+        md5, size = tee.hexdigest(), tee.size
+
+    Args:
+        stream (file-like): the object to read from.
+        algorithms (tuple, optional): names of the hashlib algorithms to compute. Defaults to ("md5",).
+    """
+
+    def __init__(self, stream, algorithms=("md5",)):
+        self.stream = stream
+        self.size = 0
+        self.hashes = {name: hashlib.new(name) for name in algorithms}
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if data:
+            self.size += len(data)
+            for h in self.hashes.values():
+                h.update(data)
+        return data
+
+    def copy_to(self, dst, chunk_size=chunk_size):
+        """Copies the rest of the stream to `dst` in chunks of `chunk_size` bytes."""
+        shutil.copyfileobj(self, dst, chunk_size)
+        return self
+
+    def drain(self, chunk_size=chunk_size):
+        """Reads the rest of the stream only to hash it."""
+        while self.read(chunk_size):
+            pass
+        return self
+
+    def hexdigest(self, algorithm="md5"):
+        return self.hashes[algorithm].hexdigest()
+
+    def digest(self, algorithm="md5"):
+        return self.hashes[algorithm].digest()
@@ -0,0 +1,179 @@
+import functools
+import re
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from prometheus_client import Counter, Histogram
+from requests.adapters import HTTPAdapter
+
+try:
+    import opentracing
+except ImportError:
+    # without opentracing only the metrics are recorded
+    opentracing = None
+
+
+upstream_latency = Histogram(
+    "upstream_request_seconds",
+    "Latency of calls to the upstream service.",
+    ["host", "method", "endpoint", "status"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, float("inf")),
+)
+upstream_bytes = Counter(
+    "upstream_bytes_total",
+    "Bytes sent to and received from the upstream service.",
+    ["host", "direction"],
+)
+upstream_retries = Counter(
+    "upstream_retries_total",
+    "Calls to the upstream service, which were sent again after an error.",
+    ["host", "method", "endpoint"],
+)
+
+# a path segment with a digit is an id, except api versions like v2
+_id_segment = re.compile(r"^(?!v\d+$).*\d")
+
+
+def endpoint_template(url):
+    """Returns the path of `url` with ids replaced by {id} and without the query, e.g.
+    https://api.figshare.com/v2/account/articles/123/files?page=2 -> /v2/account/articles/{id}/files
+
+    It is used as label, so the number of label values does not grow with the number of files."""
+    path = urlsplit(url).path
+    return "/".join("{id}" if _id_segment.match(segment) else segment for segment in path.split("/")) or "/"
+
+
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+
+@contextmanager
+def span(operation, **tags):
+    """Starts a child span of the active span, if opentracing is available. Yields the span or None."""
+    if opentracing is None:
+        yield None
+        return
+
+    with opentracing.global_tracer().start_active_span(operation, tags=tags) as scope:
+        yield scope.span
+
+
+def with_active_span(fn):
+    """Returns `fn`, which runs with the span, that is active now, as active span.
+
+    The scope manager of opentracing is thread-local, so the spans started in the workers of a
+    ThreadPoolExecutor would be root spans. Wrap the function before it is submitted:
+
+        executor.map(with_active_span(upload), parts)
+    """
+    if opentracing is None:
+        return fn
+
+    tracer = opentracing.global_tracer()
+    parent = tracer.active_span
+    if parent is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        # the spans of fn are children of `parent`, which is finished by the caller
+        with tracer.scope_manager.activate(parent, finish_on_close=False):
+            return fn(*args, **kwargs)
+    return run
+
+
+class UpstreamCall(object):
+    """One call to the upstream service, which is measured by `upstream_call`."""
+
+    def __init__(self, host, span=None):
+        self.host = host
+        self.span = span
+        self.status = None
+
+    def set_status(self, status):
+        self.status = str(status)
+        if self.span is not None:
+            self.span.set_tag("http.status_code" if isinstance(status, int) else "status", status)
+
+    def sent(self, size):
+        if size:
+            upstream_bytes.labels(self.host, "sent").inc(size)
+
+    def received(self, size):
+        if size:
+            upstream_bytes.labels(self.host, "received").inc(size)
+
+
+@contextmanager
+def upstream_call(host, method, endpoint, **tags):
+    """Measures one call to the upstream service in a child span.
+
+    The latency is recorded with the status set by the caller, or "ok" if it did not set one.
+    If the call raises, the status is the name of the exception.
+
+        with upstream_call(host, "put", "data_objects.put") as call:
+            call.sent(size)
+    """
+    tags.setdefault("span.kind", "client")
+    tags.setdefault("peer.hostname", host)
+    start = time.monotonic()
+
+    with span(f"{method} {endpoint}", **tags) as active:
+        call = UpstreamCall(host, active)
+        try:
+            yield call
+        except BaseException as e:
+            call.status = type(e).__name__
+            raise
+        finally:
+            upstream_latency.labels(host, method, endpoint, call.status or "ok").observe(time.monotonic() - start)
+
+
+def count_retry(method, url):
+    """Counts a retry, which the caller sent by itself instead of the retries of the adapter."""
+    upstream_retries.labels(host_of(url), method, endpoint_template(url)).inc()
+
+
+def _content_length(headers):
+    try:
+        return int(headers.get("Content-Length", 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter, which records latency, bytes and retries of every request and traces it in a child span.
+
+    Bytes are taken from the Content-Length headers, so chunked bodies are not counted."""
+
+    def send(self, request, **kwargs):
+        host = host_of(request.url)
+        endpoint = endpoint_template(request.url)
+        tags = {
+            "component": "requests",
+            "http.method": request.method,
+            # the query is left out, because presigned urls carry their signature in it
+            "http.url": request.url.split("?", 1)[0],
+        }
+
+        with upstream_call(host, request.method, endpoint, **tags) as call:
+            call.sent(_content_length(request.headers))
+            response = super().send(request, **kwargs)
+            call.set_status(response.status_code)
+            call.received(_content_length(response.headers))
+
+            retries = getattr(response.raw, "retries", None)
+            if retries is not None and retries.history:
+                upstream_retries.labels(host, request.method, endpoint).inc(len(retries.history))
+            return response
+
+
+def instrumented_session(adapter=None):
+    """Returns a requests session, which sends all requests through an InstrumentedHTTPAdapter."""
+    adapter = adapter or InstrumentedHTTPAdapter()
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,190 @@
+import io
+import os
+
+from flask import Request, request
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser, default_stream_factory
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+# the userId can be sent in this header, then the body is not read for the credentials at all
+user_id_header = os.getenv("USER_ID_HEADER", "X-User-Id")
+# bytes read from the request at once, so a part is never held in memory as a whole
+chunk_size = 64 * 1024
+
+_form_types = ("multipart/form-data", "application/x-www-form-urlencoded")
+
+
+def user_id(req=None):
+    """Returns the userId of the request `req` (defaults to the current request) or None.
+
+    It is taken from the USER_ID_HEADER header, if it is set. Otherwise it is the field
+    userId of a form or the key userId of a json body. A form is never decoded as json,
+    with a StreamingRequest only the fields in front of the uploaded file are read."""
+    req = req or request
+    value = req.headers.get(user_id_header)
+    if value:
+        log.debug("found userId in header", header=user_id_header)
+        return value
+
+    if req.mimetype in _form_types:
+        return req.form.get("userId")
+
+    data = req.get_json(force=True, silent=True)
+    return data.get("userId") if isinstance(data, dict) else None
+
+
+class PartStream(object):
+    """The data of one multipart part, which is read from the request while it is consumed.
+
+    It cannot seek and has no size, like the wsgi input stream it reads from."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = bytearray()
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def _fill(self, size):
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            try:
+                self._buffer.extend(next(self._chunks))
+            except StopIteration:
+                self._done = True
+
+    def read(self, size=-1):
+        size = -1 if size is None else size
+        self._fill(size)
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        self._done = True
+
+
+class StreamingMultipart(object):
+    """Reads a multipart/form-data body from `stream` in order and stops at the upload.
+
+    Fields are read into memory and other file parts are spooled with `stream_factory`, like
+    werkzeug does. The file part named `stream_field` is not read: it is handed out as a
+    FileStorage over a PartStream, so the upload can start with its first bytes. Parts after
+    it are never looked at, so clients have to send all fields in front of the file.
+
+        fields, files = StreamingMultipart(request.stream, boundary).read_parts()
+
+    Args:
+        stream (file-like): the body of the request, e.g. the wsgi input stream.
+        boundary (bytes): the boundary of the parts from the content type.
+        stream_field (str, optional): name of the file part to hand out as stream. Defaults to "file".
+        max_form_memory_size (int, optional): upper bound for the size of one field. Defaults to None.
+        stream_factory (callable, optional): creates the files for spooled parts. Defaults to the one of werkzeug.
+        content_length (int, optional): the content length of the request. Defaults to None.
+    """
+
+    def __init__(self, stream, boundary, stream_field="file", max_form_memory_size=None,
+                 stream_factory=None, content_length=None):
+        self.stream = stream
+        self.stream_field = stream_field
+        self.max_form_memory_size = max_form_memory_size
+        self.stream_factory = stream_factory or default_stream_factory
+        self.content_length = content_length
+        self.decoder = MultipartDecoder(boundary, max_form_memory_size)
+
+    def _next_event(self):
+        event = self.decoder.next_event()
+        while isinstance(event, NeedData):
+            # an empty read is the end of the body, the decoder raises a ValueError if it is incomplete
+            self.decoder.receive_data(self.stream.read(chunk_size) or None)
+            event = self.decoder.next_event()
+        return event
+
+    def _chunks(self):
+        """Yields the data of the current part."""
+        while True:
+            event = self._next_event()
+            if not isinstance(event, Data):
+                raise ValueError(f"Unexpected {type(event).__name__} in the data of a part.")
+            if event.data:
+                yield event.data
+            if not event.more_data:
+                return
+
+    def _read_field(self, event):
+        data, size = [], 0
+        for chunk in self._chunks():
+            size += len(chunk)
+            if self.max_form_memory_size is not None and size > self.max_form_memory_size:
+                raise RequestEntityTooLarge()
+            data.append(chunk)
+        return b"".join(data).decode("utf-8", "replace")
+
+    def _spool_file(self, event):
+        container = self.stream_factory(
+            total_content_length=self.content_length,
+            content_type=event.headers.get("content-type"),
+            filename=event.filename,
+            content_length=None,
+        )
+        for chunk in self._chunks():
+            container.write(chunk)
+        container.seek(0)
+        return FileStorage(container, event.filename, event.name, headers=event.headers)
+
+    def read_parts(self):
+        """Reads all parts up to the streamed file or the end of the body. Returns the lists of fields and files."""
+        fields, files = [], []
+        event = self._next_event()
+        while not isinstance(event, Epilogue):
+            if isinstance(event, Field):
+                fields.append((event.name, self._read_field(event)))
+            elif isinstance(event, File) and event.name == self.stream_field:
+                log.debug("stream file part", name=event.name, filename=event.filename)
+                stream = PartStream(self._chunks())
+                files.append((event.name, FileStorage(stream, event.filename, event.name, headers=event.headers)))
+                break
+            elif isinstance(event, File):
+                files.append((event.name, self._spool_file(event)))
+            event = self._next_event()
+        return fields, files
+
+
+class StreamingFormDataParser(FormDataParser):
+    """FormDataParser, which reads multipart bodies with StreamingMultipart."""
+
+    stream_field = "file"
+
+    def _parse_multipart(self, stream, mimetype, content_length, options):
+        boundary = options.get("boundary", "").encode("ascii")
+        if not boundary:
+            raise ValueError("Missing boundary")
+
+        fields, files = StreamingMultipart(
+            stream, boundary, self.stream_field, self.max_form_memory_size, self.stream_factory, content_length
+        ).read_parts()
+        # the rest of the body belongs to the streamed file, so get_data must not read it
+        return io.BytesIO(), self.cls(fields), self.cls(files)
+
+    # werkzeug < 3 looks the parse functions up in this dict instead of calling _parse_multipart
+    parse_functions = dict(getattr(FormDataParser, "parse_functions", {}), **{"multipart/form-data": _parse_multipart})
+
+
+class StreamingRequest(Request):
+    """Flask request, which hands the file part "file" of a multipart body on as a stream.
+
+    `request.form` holds the fields in front of the file and `request.files["file"]` reads the
+    upload from the connection, so neither the time to the first byte sent upstream nor the memory
+    depends on the size of the file. Set it with `app.request_class = StreamingRequest`."""
+
+    form_data_parser_class = StreamingFormDataParser
@@ -0,0 +1,93 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+
+from cachetools import TTLCache
+
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+cache_size = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+positive_ttl = float(os.getenv("TOKEN_CACHE_POSITIVE_TTL", 300))
+negative_ttl = float(os.getenv("TOKEN_CACHE_NEGATIVE_TTL", 30))
+
+
+class TokenCache(object):
+    """Remembers the results of token checks for a short time, keyed by a hmac of the credentials.
+
+    Valid and invalid tokens have their own TTL, so a token which was just fixed by
+    the user is accepted again soon. A probe which raises, e.g. because the upstream service
+    is not reachable, is not cached. Concurrent checks of the same token share one probe.
+    """
+
+    def __init__(self, maxsize=cache_size, positive_ttl=positive_ttl, negative_ttl=negative_ttl):
+        self._valid = TTLCache(maxsize=maxsize, ttl=positive_ttl)
+        self._invalid = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._secret = secrets.token_bytes(32)
+
+    def key(self, *credentials):
+        message = "\0".join(str(credential) for credential in credentials).encode("utf-8")
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()
+
+    def _cached(self, key):
+        if key in self._valid:
+            return True
+        if key in self._invalid:
+            return False
+        return None
+
+    def check(self, credentials, probe):
+        """Returns the cached result for `credentials` or calls `probe()`, which returns
+        True for a usable token and False for a rejected one.
+
+        Args:
+            credentials (tuple): api address and everything, which authenticates the user.
+            probe (callable): cheap read-only call to the upstream service.
+        """
+        key = self.key(*credentials)
+        while True:
+            with self._lock:
+                result = self._cached(key)
+                if result is not None:
+                    return result
+
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+
+            # another request probes the same token right now, use its result
+            pending.wait()
+
+        result = None
+        try:
+            result = bool(probe())
+        except Exception as e:
+            log.error(f"Token check failed: {e}")
+        finally:
+            with self._lock:
+                if result is not None:
+                    (self._valid if result else self._invalid)[key] = True
+                del self._pending[key]
+            pending.set()
+
+        return bool(result)
+
+    def invalidate(self, *credentials):
+        key = self.key(*credentials)
+        with self._lock:
+            self._valid.pop(key, None)
+            self._invalid.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._valid.clear()
+            self._invalid.clear()
+
+
+checked_tokens = TokenCache()
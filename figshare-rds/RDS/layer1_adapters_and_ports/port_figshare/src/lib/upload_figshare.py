@@ -1,41 +1,52 @@
 import hashlib
-import inspect
-import requests
 import json
 import os
-import logging
 from flask import abort
-import functools
+import tempfile
 import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
 from requests.exceptions import HTTPError
+from lib.hashing import HashingTee
+from lib.rate_limiter import rate_limit
+from lib.token_cache import checked_tokens
+from lib.batch import run_batch
+from lib.dedupe import Manifest, Manifests, normalize_checksum, skipped
+from lib.deletion import delete_files
+from lib.sync import RemoteFile, sync
+from lib.instrumentation import count_retry, instrumented_session, with_active_span
+from lib.logs import get_logger
 
-log = logging.getLogger()
+log = get_logger(__name__)
 
+# all calls to figshare share one keep-alive session, which measures and traces them
+http = instrumented_session()
 
-def _rate_limit(func=None, per_second=1):
-    """Limit number of requests made per second.
+upload_workers = int(os.getenv("FIGSHARE_UPLOAD_WORKERS", 4))
+upload_part_retries = int(os.getenv("FIGSHARE_UPLOAD_PART_RETRIES", 3))
+upload_part_backoff = float(os.getenv("FIGSHARE_UPLOAD_PART_BACKOFF", 1))
 
-    Will sleep for 1/``per_second`` seconds if the last request was
-    made too recently.
-    """
+# uploads are spooled into anonymous temporary files in this directory, figshare needs their md5 before the upload
+upload_spool_dir = os.getenv("FIGSHARE_UPLOAD_SPOOL_DIR")
 
-    if not func:
-        return functools.partial(_rate_limit, per_second=per_second)
+articles_page_size = int(os.getenv("FIGSHARE_PAGE_SIZE", 100))
+articles_page_prefetch = int(os.getenv("FIGSHARE_PAGE_PREFETCH", 4))
 
-    @functools.wraps(func)
-    def wrapper(self, *args, **kwargs):
-        if hasattr(self, "last_request") and self.last_request is not None:
-            now = time.time()
-            delta = now - self.last_request
-            if delta < (1 / per_second):
-                waittimer = (1 / per_second) - delta
-                log.debug("rate limiter wait for {}ms", waittimer)
-                time.sleep(waittimer)
+# upload sessions are kept for the files of one project transfer, which arrive as separate requests
+_upload_sessions = TTLCache(
+    maxsize=int(os.getenv("FIGSHARE_UPLOAD_SESSION_CACHE_SIZE", 1000)),
+    ttl=float(os.getenv("FIGSHARE_UPLOAD_SESSION_TTL", 3600)),
+)
+_upload_sessions_lock = threading.Lock()
 
-        self.last_request = time.time()
-        return func(self, *args, **kwargs)
 
-    return wrapper
+def filter_metadata(metadata, metadataFilter=None):
+    """Returns the metadata of an article with only the keys of `metadataFilter`, all of it without a filter."""
+    if metadataFilter is None:
+        return metadata
+    return {key: metadata[key] for key in metadataFilter.keys() if key in metadata}
 
 
 class Figshare(object):
@@ -48,6 +59,8 @@ class Figshare(object):
             )
 
         self.api_key = api_key
+        # the files of an article are looked up once for all uploads of a transfer
+        self.manifests = Manifests(self.file_manifest)
 
         # monkeypatching all functions with internals
         self.get_article = self.get_article_internal
@@ -80,24 +93,21 @@ class Figshare(object):
         Returns:
             json: the response content.
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_figshare.py raw_issue_request")
         headers = {'Authorization': 'token ' + self.api_key}
         if data is not None and not binary:
             data = json.dumps(data)
-        response = requests.request(method, url, headers=headers, data=data)
+        response = http.request(method, url, headers=headers, data=data)
         try:
             response.raise_for_status()
             try:
                 data = json.loads(response.content)
             except ValueError:
-                log.error(
-                    f"Exception at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+                log.error("Exception at lib/upload_figshare.py raw_issue_request")
                 log.error("Could not load response content as json, therefore we will return it as is.")
                 data = response.content
         except HTTPError as error:
-            log.error(
-                f"Exception at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            log.error("Exception at lib/upload_figshare.py raw_issue_request")
             log.error(f'Caught an HTTPError: {error}')
             log.error(f'Body: {response.content}')
             raise HTTPError
@@ -114,8 +124,7 @@ class Figshare(object):
         Returns:
             json: the response content.
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_figshare.py issue_request")
         return self.raw_issue_request(method, self.figshare_api_address+"{}".format(endpoint), *args, **kwargs)
 
     def get_file_check_data(self, file_path):
@@ -127,8 +136,7 @@ class Figshare(object):
         Returns:
             tuple: hash and filesize
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_figshare.py get_file_check_data")
         with open(file_path, 'rb') as fin:
             md5 = hashlib.md5()
             size = 0
@@ -140,26 +148,28 @@ class Figshare(object):
                 data = fin.read(chunk_size)
             return md5.hexdigest(), size
 
-    def initiate_new_upload(self, article_id, file_path):
+    def initiate_new_upload(self, article_id, file_path, check_data=None, name=None):
         """will initiate a new upload by calling an endpoint that will return
         a location (url) for uploading
 
         Args:
-            article_id (_type_): _description_
-            file_path (_type_): _description_
+            article_id (int): id of the article to upload to
+            file_path (str): path to the file to be uploaded
+            check_data (tuple, optional): md5 hash and filesize, if they are already known.
+                Otherwise they will be computed by reading the file. Defaults to None.
+            name (str, optional): filename in the article. Defaults to the name of file_path.
 
         Returns:
             json: result of the call to location
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_figshare.py initiate_new_upload")
         endpoint = f'/account/articles/{article_id}/files'
-        md5, size = self.get_file_check_data(file_path)
-        data = {'name': file_path,
+        md5, size = check_data if check_data is not None else self.get_file_check_data(file_path)
+        data = {'name': name or os.path.basename(file_path),
                 'md5': md5,
                 'size': size}
         result = self.issue_request('POST', endpoint, data=data)
-        log.debug(f"Initiated file upload: {result['location']}")
+        log.debug("Initiated file upload: %s", result['location'])
         result = self.raw_issue_request('GET', result['location'])
         return result
 
@@ -170,17 +180,22 @@ class Figshare(object):
             article_id (int): the id of the article that was uploaded to
             file_id (int): the id of the file that was uploaded
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_figshare.py complete_upload")
         self.issue_request(
             'POST', f'/account/articles/{article_id}/files/{file_id}')
 
-    def upload_parts(self, file_info, file_path):
+    def upload_parts(self, file_info, file_path, workers=None):
         """Will upload the possibly multiple parts of a file
 
+        The parts are uploaded concurrently by `workers` threads. Every worker reads only the
+        part it uploads, so at most `workers` parts are held in memory at the same time.
+        Parts, which are already marked as COMPLETE by figshare, are skipped, so an
+        interrupted upload can be resumed.
+
         Args:
             file_info (dict): dictionary with relevant file info gotten from the call to the location url as retuirned by initiate_new_upload
             file_path (str): path to the file to be uploaded
+            workers (int, optional): number of parts uploaded at the same time. Defaults to FIGSHARE_UPLOAD_WORKERS.
 
         Raises:
             Exception: raised if file cannot be opened or uploaded.
@@ -188,33 +203,63 @@ class Figshare(object):
         Returns:
             json: response content of GET request to upload url
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_figshare.py upload_parts")
         # retrieve upload url from file_info
         url = '{upload_url}'.format(**file_info)
         result = self.raw_issue_request('GET', url)
-        log.debug('Uploading parts:')
-        try:
+
+        parts = [part for part in result['parts'] if part.get('status') != 'COMPLETE']
+        log.debug("Uploading parts: %s of %s, %s already complete", len(parts), len(result['parts']), len(result['parts']) - len(parts))
+
+        def upload(part):
             with open(file_path, 'rb') as fin:
-                for part in result['parts']:
-                    self.upload_part(file_info, fin, part)
+                self.upload_part_with_retry(file_info, fin, part)
+
+        try:
+            workers = max(1, min(workers or upload_workers, len(parts) or 1))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # consuming the results raises the first exception of a part
+                for _ in executor.map(with_active_span(upload), parts):
+                    pass
             return result
         except Exception as e:
-            log.error(
-                f"Exception at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            log.error("Exception at lib/upload_figshare.py upload_parts")
             log.error(str(e))
             raise Exception
 
+    def upload_part_with_retry(self, file_info, stream, part, retries=None, backoff=None):
+        """Will upload one part of a file and retry it with exponential backoff, if it fails.
+
+        Args:
+            file_info (dict): file info as returned by initiate_new_upload
+            stream (file-like): opened file to upload from
+            part (dict): part info as returned by the upload url
+            retries (int, optional): number of retries. Defaults to FIGSHARE_UPLOAD_PART_RETRIES.
+            backoff (float, optional): seconds to wait before the first retry, doubled for every retry.
+                Defaults to FIGSHARE_UPLOAD_PART_BACKOFF.
+        """
+        retries = upload_part_retries if retries is None else retries
+        backoff = upload_part_backoff if backoff is None else backoff
+
+        for attempt in range(retries + 1):
+            try:
+                return self.upload_part(file_info, stream, part)
+            except Exception as e:
+                if attempt >= retries:
+                    raise
+                log.debug("Upload of part %s failed, retry %s of %s: %s", part['partNo'], attempt + 1, retries, e)
+                count_retry("PUT", f"{file_info['upload_url']}/{part['partNo']}")
+                time.sleep(backoff * 2 ** attempt)
+
     def upload_part(self, file_info, stream, part):
         """Will upload one part of a file
 
         Args:
-            file_info (_type_): _description_
-            stream (_type_): _description_
-            part (_type_): _description_
+            file_info (dict): file info as returned by initiate_new_upload
+            stream (file-like): opened file to upload from
+            part (dict): part info as returned by the upload url
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_figshare.py upload_part")
         udata = file_info.copy()
         udata.update(part)
         # retrieve upload url from file_info
@@ -267,12 +312,26 @@ class Figshare(object):
 
         Returns `True` if the token is correct and usable, otherwise `False`."""
         log.debug("Check token: Starts")
-        r = cls(api_key, *args, **kwargs).get_article(return_response=True)
-        log.debug(f"Check Token: Status Code: {r.status_code}")
+        figshare = cls(api_key, *args, **kwargs)
+        return checked_tokens.check((figshare.figshare_api_address, api_key), figshare.probe_token)
+
+    def probe_token(self):
+        """Asks figshare for the account, which owns the api key. This call changes nothing.
 
-        return r.status_code == 200
+        Returns `True` if the token is accepted, `False` if it is rejected.
+        Raises an HTTPError for any other answer, so it is not cached as invalid."""
+        r = http.get(
+            f"{self.figshare_api_address}/account",
+            headers={'authorization': f"token {self.api_key}"}
+        )
+        log.debug("Check Token: Status Code: %s", r.status_code)
 
-    @_rate_limit(per_second=5)
+        if r.status_code in (401, 403):
+            return False
+        r.raise_for_status()
+        return True
+
+    @rate_limit(per_second=5, address="figshare_api_address")
     def get_article_internal(
         self, id: int = None, return_response: bool = False, metadataFilter: dict = None
     ):
@@ -403,64 +462,41 @@ class Figshare(object):
                 "timeline": {}
                 }
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
-        log.debug(
-            f"get articles from figshare, id? {id}, return response? {return_response}, metadata? {metadataFilter}"
-        )
+        log.debug("Entering at lib/upload_figshare.py get_article_internal")
+        log.debug("get articles from figshare, id? %s, return response? %s, metadata? %s", id, return_response, metadataFilter)
         headers = {'authorization': f"token {self.api_key}"}
 
-        log.debug(headers)
+        log.debug("request headers", headers=headers)
 
-        if id is not None:
-            r = requests.get(
-                f"{self.figshare_api_address}/account/articles/{id}",
-                headers=headers
-            )
+        if id is None and not return_response:
+            # all articles are read page by page
+            result = list(self.iter_article_metadata(metadataFilter=metadataFilter))
         else:
-            r = requests.get(
-                f"{self.figshare_api_address}/account/articles",
-                headers=headers
-            )
-            log.debug(
-                f"Get Articles: Status Code: {r.status_code}")
-
-        if return_response:
-            return r
-
-        if r.status_code >= 300:
-            abort(r.status_code)
-
-        result = r.json()
+            if id is not None:
+                r = http.get(
+                    f"{self.figshare_api_address}/account/articles/{id}",
+                    headers=headers
+                )
+            else:
+                r = http.get(
+                    f"{self.figshare_api_address}/account/articles",
+                    headers=headers
+                )
+                log.debug("Get Articles: Status Code: %s", r.status_code)
 
-        if id is not None:
-            result = [result]
-        log.debug(f"filter only metadata, {result}")
-
-        metadataList = []
-        for res in result:
-            if (
-                "submitted" in res
-                and res["submitted"]
-                or "submitted" in res["metadata"]
-                and res["metadata"]["submitted"]
-            ):
-                continue
+            if return_response:
+                return r
 
-            metadataList.append(res["metadata"])
+            if r.status_code >= 300:
+                abort(r.status_code)
 
-        result = metadataList
+            result = r.json()
 
-        log.debug("apply filter")
-        if metadataFilter is not None:
-            result = {
-                key: res[key]
-                for res in result
-                for key in metadataFilter.keys()
-                if key in res
-            }
+            if id is not None:
+                result = [result]
+            log.debug("filter only metadata, %s", result)
 
-        log.debug("finished applying filter")
+            result = [filter_metadata(res["metadata"], metadataFilter) for res in result if not self._is_submitted(res)]
 
         log.debug("return results")
 
@@ -469,6 +505,90 @@ class Figshare(object):
 
         return result
 
+    @staticmethod
+    def _is_submitted(res):
+        return (
+            "submitted" in res
+            and res["submitted"]
+            or "submitted" in res["metadata"]
+            and res["metadata"]["submitted"]
+        )
+
+    def get_articles_page(self, page, page_size=None):
+        """Get one page of the articles of the account.
+
+        Args:
+            page (int): number of the page, starting with 1.
+            page_size (int, optional): articles per page. Defaults to FIGSHARE_PAGE_SIZE.
+
+        Returns:
+            list: the articles of the page, an empty list after the last page
+        """
+        r = http.get(
+            f"{self.figshare_api_address}/account/articles",
+            params={"page": page, "page_size": page_size or articles_page_size},
+            headers={'authorization': f"token {self.api_key}"}
+        )
+        log.debug("Get Articles page %s: Status Code: %s", page, r.status_code)
+
+        if r.status_code >= 300:
+            abort(r.status_code)
+
+        return r.json()
+
+    def iter_articles(self, page_size=None, prefetch=None):
+        """Yields all articles of the account, while the next pages are fetched in the background.
+
+        At most `prefetch` pages are requested or waiting to be consumed at the same time, so
+        the memory is bounded by `prefetch` pages, no matter how many articles the account has.
+        The iteration stops at the first page, which is not full.
+
+        Args:
+            page_size (int, optional): articles per page. Defaults to FIGSHARE_PAGE_SIZE.
+            prefetch (int, optional): maximum number of pages in flight. Defaults to FIGSHARE_PAGE_PREFETCH.
+        """
+        page_size = page_size or articles_page_size
+        prefetch = max(1, prefetch or articles_page_prefetch)
+
+        executor = ThreadPoolExecutor(max_workers=prefetch)
+        get_page = with_active_span(self.get_articles_page)
+        pending = deque()
+        next_page = 1
+        try:
+            for _ in range(prefetch):
+                pending.append(executor.submit(get_page, next_page, page_size))
+                next_page += 1
+
+            while pending:
+                articles = pending.popleft().result()
+                if len(articles) == page_size:
+                    pending.append(executor.submit(get_page, next_page, page_size))
+                    next_page += 1
+                else:
+                    # this is the last page, the pages after it are not needed
+                    for future in pending:
+                        future.cancel()
+                    pending.clear()
+
+                yield from articles
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def iter_article_metadata(self, metadataFilter=None, **kwargs):
+        """Yields the metadata of all articles, which are not submitted, one by one.
+
+        Args:
+            metadataFilter (dict, optional): only the keys of this filter are kept in every metadata. Defaults to None.
+            kwargs: passed on to iter_articles.
+        """
+        for res in self.iter_articles(**kwargs):
+            if self._is_submitted(res):
+                continue
+
+            yield filter_metadata(res["metadata"], metadataFilter)
+
     def create_new_article_internal(self, metadata=None, return_response=False):
         """Creates a new untitled article. You can get the id with r.json()['id']
         If metadata is specified, it will changes metadata after creating.
@@ -492,8 +612,7 @@ class Figshare(object):
                 "warnings": []
                 }
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_figshare.py create_new_article_internal")
         log.debug("Create new article: Starts")
 
         headers = {
@@ -501,7 +620,7 @@ class Figshare(object):
             'authorization': f"token {self.api_key}",
         }
 
-        log.debug(headers)
+        log.debug("request headers", headers=headers)
 
         url = f"{self.figshare_api_address}/account/articles"
 
@@ -511,20 +630,19 @@ class Figshare(object):
 
         log.debug(payload)
 
-        r = requests.post(
+        r = http.post(
             url,
             data=json.dumps(payload),
             headers=headers
         )
 
-        log.debug(
-            f"Create new articles: Status Code: {r.status_code}")
+        log.debug("Create new articles: Status Code: %s", r.status_code)
 
         if r.status_code != 201:
             return {} if not return_response else r
 
-        log.debug(f"### Metadata: {metadata}")
-        log.debug(f"### Response: {r.json()}")
+        log.debug("### Metadata: %s", metadata)
+        log.debug("### Response: %s", r.json())
         if metadata is not None and isinstance(metadata, dict):
             log.debug(metadata)
             return self.change_metadata_in_article_internal(
@@ -551,9 +669,8 @@ class Figshare(object):
             API response:
                 HTTP/1.1 204 No Content
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
-        r = requests.delete(
+        log.debug("Entering at lib/upload_figshare.py remove_article_internal")
+        r = http.delete(
             f"{self.figshare_api_address}/account/articles/{id}",
             headers={"Authorization": f"token {self.api_key}"},
             verify=(os.environ.get("VERIFY_SSL", "True") == "True"),
@@ -562,6 +679,26 @@ class Figshare(object):
 
         return r.status_code == 204 if not return_response else r
 
+    def upload_session(self, article_id):
+        """Returns the upload session for the article `article_id`.
+
+        The session is created on the first file of a project transfer and reused for all
+        further files with the same api-key and article, so the upload path never has to
+        look up the article.
+
+        Args:
+            article_id (int): id of the article to upload to
+
+        Returns:
+            UploadSession: the session bound to the article
+        """
+        key = (hashlib.sha256(self.api_key.encode("utf-8")).hexdigest(), self.figshare_api_address, int(article_id))
+        with _upload_sessions_lock:
+            session = _upload_sessions.get(key)
+            if session is None:
+                session = _upload_sessions[key] = UploadSession(self, article_id)
+            return session
+
     def upload_new_file_to_article_internal(
         self, article_id, path_to_file, file=None, return_response=False, test=False
     ):
@@ -570,34 +707,121 @@ class Figshare(object):
         Args:
             article_id (int): id of the article to upload to (from get_article or create_new_article; r.json()['id'])
             path_to_file (str): path to the file to be uploaded. Example: ~/mydatapackage.csv
-            file (bytes, optional): file as a bytes object. Defaults to None.
+            file (file-like, optional): file object or stream with a read method. Defaults to None.
             return_response (bool, optional): Set to True will return the API response. Defaults to False.
 
         Returns:
             bool: Alternative: json if return_response=True
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_figshare.py upload_new_file_to_article_internal")
         try:
-            # in testing we do not have a file object passed in
-            if not test:
-                with open(path_to_file, 'wb') as ff:
-                    ff.write(file.read())
+            return self.upload_session(article_id).upload(path_to_file, file=file, test=test)
+        except Exception as e:
+            log.error("Exception at lib/upload_figshare.py upload_new_file_to_article_internal")
+            log.error(str(e))
 
-            # we will get the latest created article_id
-            article_id = self.get_article_internal(return_response=True).json()[0]['id']
-            article_id = int(article_id)
 
-            file_info = self.initiate_new_upload(article_id, path_to_file)
-            self.upload_parts(file_info, path_to_file)
-            self.complete_upload(article_id, file_info['id'])
+    def upload_files_to_article(self, article_id, files, workers=None):
+        """Uploads many files to an article on Figshare with at most `workers` files at the same time.
 
-            return {"success": True}
-        except Exception as e:
-            log.error(
-                f"Exception at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
-            log.error(str(e))
+        All files go through the upload session of the article, see upload_session. Files, which are
+        already in the article with the same name and md5, are skipped.
+
+        Args:
+            article_id (int): id of the article to upload to
+            files (list): BatchFile objects, see lib/batch.py
+            workers (int, optional): files uploaded at the same time. Defaults to BATCH_UPLOAD_WORKERS.
+
+        Returns:
+            list: one result for every file, see lib.batch.run_batch
+        """
+        session = self.upload_session(article_id)
+        return run_batch(files, lambda batch_file: session.upload(batch_file.filename, file=batch_file.file), workers)
+
+    def remote_files(self, article_id):
+        """Returns all files of the article, page by page.
+
+        Args:
+            article_id (int): id of the article
+
+        Raises:
+            ValueError: if the files cannot be listed.
+
+        Returns:
+            list: RemoteFile objects with the file id, see lib/sync.py
+        """
+        result = []
+        page = 1
+        while True:
+            r = http.get(
+                f"{self.figshare_api_address}/account/articles/{article_id}/files",
+                params={"page": page, "page_size": articles_page_size},
+                headers={"Authorization": f"token {self.api_key}"},
+            )
+            if r.status_code >= 300:
+                raise ValueError(f"Files of article {article_id} answered with status {r.status_code}")
+
+            files = r.json()
+            result.extend(
+                RemoteFile(f["name"], f.get("size"), normalize_checksum(f.get("computed_md5") or f.get("supplied_md5")), f["id"])
+                for f in files
+            )
+            if len(files) < articles_page_size:
+                return result
+            page += 1
+
+    def file_manifest(self, article_id):
+        """Returns the Manifest of the files in the article, see lib/dedupe.py.
+
+        It is empty, if the files cannot be listed, so every file is uploaded."""
+        try:
+            files = self.remote_files(article_id)
+        except ValueError as e:
+            log.debug(str(e))
+            files = []
+        return Manifest((f.name, f.size, f.checksum) for f in files)
+
+    def replace_file(self, article_id, file_id, path_to_file, file):
+        """Replaces the file `file_id` of the article.
+
+        Figshare has no call to replace a file, so the new file is uploaded first and the old one
+        is deleted afterwards. A failed upload leaves the old file in the article.
+
+        Returns:
+            bool: True if successful, False if not
+        """
+        self.upload_session(article_id).upload(path_to_file, file=file)
+        return self.delete_file_from_article_internal(article_id, file_id)
+
+    def sync_article(self, article_id, entries, files, dry_run=False, workers=None):
+        """Makes the article contain exactly the files of the manifest `entries`, see lib/sync.py.
+
+        Only the differences are applied: new files are uploaded like a batch, changed files are
+        replaced, see replace_file, and the other files are deleted.
+
+        Args:
+            article_id (int): id of the article
+            entries (list): SyncEntry objects of the manifest
+            files (dict): path -> BatchFile with the data of the new and changed files
+            dry_run (bool, optional): Set to True will only return the changes. Defaults to False.
+            workers (int, optional): replacements and deletions at the same time. Defaults to SYNC_WORKERS.
 
+        Returns:
+            dict: the changes and the result of every change
+        """
+        try:
+            return sync(
+                entries, self.remote_files(article_id), files,
+                add=lambda batch_files: self.upload_files_to_article(article_id, batch_files),
+                replace=lambda remote, batch_file: self.replace_file(
+                    article_id, remote.id, batch_file.filename, batch_file.file),
+                delete=lambda remote: self.delete_file_from_article_internal(article_id, remote.id),
+                dry_run=dry_run, workers=workers,
+            )
+        finally:
+            # the upload session may belong to another client with the same api-key
+            self.manifests.invalidate(int(article_id))
+            self.upload_session(article_id).figshare.manifests.invalidate(int(article_id))
 
     def get_files_from_article(self, article_id):
         """will get all the files from the article requested.
@@ -608,9 +832,8 @@ class Figshare(object):
         Returns:
             json: json containing all the files from the article
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
-        req = requests.get(
+        log.debug("Entering at lib/upload_figshare.py get_files_from_article")
+        req = http.get(
             f"{self.figshare_api_address}/account/articles/{article_id}/files",
             headers={"Authorization": f"token {self.api_key}"}
         )
@@ -640,8 +863,7 @@ class Figshare(object):
         Returns:
             object: response of the PUT request to the articles endpoint
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_figshare.py change_metadata_in_article_internal")
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"token {self.api_key}",
@@ -650,9 +872,9 @@ class Figshare(object):
         data = {}
         data = metadata
 
-        log.info(f"send data: {data}")
+        log.debug("send data", data=data)
 
-        r = requests.put(
+        r = http.put(
             f"{self.figshare_api_address}/account/articles/{article_id}",
             data=json.dumps(data),
             headers=headers
@@ -670,15 +892,36 @@ class Figshare(object):
         Returns:
             object: response of the POST request to the articles publish endpoint
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
-        r = requests.post(
+        log.debug("Entering at lib/upload_figshare.py publish_article_internal")
+        r = http.post(
             f"{self.figshare_api_address}/account/articles/{article_id}/publish",
             headers={'authorization': f"token {self.api_key}"}
         )
 
         return r.status_code == 201 if not return_response else r
 
+    def delete_files_from_article(self, article_id, workers=None):
+        """Deletes all files from the article with at most `workers` at the same time, see lib/deletion.py.
+
+        Args:
+            article_id (int): id of the article
+            workers (int, optional): deletions at the same time. Defaults to DELETE_WORKERS.
+
+        Raises:
+            ValueError: if the files cannot be listed.
+
+        Returns:
+            list: the result of every file, e.g. {"filename": "a.csv", "success": True}
+        """
+        files = self.remote_files(article_id)
+        log.debug("delete files from article", article_id=article_id, files=len(files))
+        try:
+            return delete_files(
+                files, lambda remote: self.delete_file_from_article_internal(article_id, remote.id), workers)
+        finally:
+            self.manifests.invalidate(int(article_id))
+            self.upload_session(article_id).figshare.manifests.invalidate(int(article_id))
+
     def delete_all_files_from_article_internal(self, article_id):
         """Will delete all files from an article.
 
@@ -688,15 +931,14 @@ class Figshare(object):
         Returns:
             bool: True if successful, False if not
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
-        for file in self.get_files_from_article(article_id):
-            log.debug(f"found file: {file}")
-
-            if not self.delete_file_from_article_internal(article_id, file["id"]):
-                return False
+        log.debug("Entering at lib/upload_figshare.py delete_all_files_from_article_internal")
+        try:
+            results = self.delete_files_from_article(article_id)
+        except ValueError as e:
+            log.error(str(e))
+            return False
 
-        return True
+        return all(result["success"] for result in results)
 
     def delete_file_from_article_internal(self, article_id, file_id):
         """Will delete a file from an article
@@ -708,9 +950,8 @@ class Figshare(object):
         Returns:
             bool: True if successful, False if not
         """
-        log.debug(
-            f"Entering at lib/upload_figshare.py {inspect.getframeinfo(inspect.currentframe()).function}")
-        r = requests.delete(
+        log.debug("Entering at lib/upload_figshare.py delete_file_from_article_internal")
+        r = http.delete(
             f"{self.figshare_api_address}/account/articles/{article_id}/files/{file_id}",
             headers={"Authorization": f"token {self.api_key}"}
         )
@@ -721,6 +962,61 @@ class Figshare(object):
         return False
 
 
+class UploadSession(object):
+    """Uploads the files of one project transfer to an article.
+
+    The session is bound to the article id, which was resolved once when the session was
+    created, so uploading a file only talks to the endpoints of this article and its upload
+    service. Get it with Figshare.upload_session.
+
+    Args:
+        figshare (Figshare): the client for the api-key of the transfer.
+        article_id (int): id of the article to upload to.
+    """
+
+    def __init__(self, figshare, article_id):
+        self.figshare = figshare
+        self.article_id = int(article_id)
+
+    def upload(self, path_to_file, file=None, test=False):
+        """Uploads one file to the article.
+
+        Args:
+            path_to_file (str): path to the file to be uploaded.
+            file (file-like, optional): file object or stream with a read method. Defaults to None.
+            test (bool, optional): in testing we do not have a file object passed in. Defaults to False.
+
+        Returns:
+            dict: {"success": True}, the result of lib.dedupe.skipped if the article has the file already
+        """
+        # figshare stores files by name, directories of the client are not kept
+        name = os.path.basename(path_to_file)
+        if test:
+            return self._send(name, path_to_file)
+
+        # the spool is named by tempfile, never by the client, and removed in any case
+        with tempfile.NamedTemporaryFile(dir=upload_spool_dir) as spool:
+            # hash the incoming stream while writing it, so the file has not to be read again
+            tee = HashingTee(file).copy_to(spool)
+            spool.flush()
+            check_data = tee.hexdigest("md5"), tee.size
+
+            # the same name and md5 as a file in the article, so nothing has to be sent
+            if ("md5", check_data[0]) in self.figshare.manifests.candidate(self.article_id, name, tee.size):
+                log.debug("file is already in the article, skip it", article=self.article_id, name=name)
+                return skipped(tee.size)
+
+            result = self._send(name, spool.name, check_data)
+        self.figshare.manifests.update(self.article_id, name, check_data[1], ("md5", check_data[0]))
+        return result
+
+    def _send(self, name, path, check_data=None):
+        file_info = self.figshare.initiate_new_upload(self.article_id, path, check_data=check_data, name=name)
+        self.figshare.upload_parts(file_info, path)
+        self.figshare.complete_upload(self.article_id, file_info['id'])
+        return {"success": True}
+
+
 if __name__ == "__main__":
     """Below code will test the code that interfaces the uploads to Figshare
     """
@@ -0,0 +1,121 @@
+import threading
+import time
+import unittest
+from urllib.parse import urlparse, parse_qs
+
+from werkzeug.exceptions import HTTPException
+
+from lib.upload_figshare import Figshare
+from stub_server import StubServer
+
+
+class ArticlesStub(object):
+    """Figshare article listing, which serves `count` articles page by page."""
+
+    def __init__(self, count, delay=0.01, status=200):
+        self.count = count
+        self.delay = delay
+        self.status = status
+        self.pages = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def handle(self, request):
+        query = parse_qs(urlparse(request.path).query)
+        page, page_size = int(query["page"][0]), int(query["page_size"][0])
+        with self._lock:
+            self.pages.append(page)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+
+        if self.status != 200:
+            return self.status, {"message": "error"}
+
+        start = (page - 1) * page_size
+        return 200, [
+            {"id": i, "metadata": {"title": f"article {i}", "submitted": i % 10 == 9}}
+            for i in range(start, min(start + page_size, self.count))
+        ]
+
+
+class TestArticlePages(unittest.TestCase):
+    """Tests for the paginated article listing against a local figshare stub."""
+
+    def listing(self, articles):
+        stub = StubServer()
+        stub.route("GET", "^/v2/account/articles\\?", articles.handle)
+        return stub
+
+    def test_all_articles_in_order(self):
+        articles = ArticlesStub(95)
+
+        with self.listing(articles) as stub:
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+            result = list(figshare.iter_articles(page_size=10, prefetch=3))
+
+        self.assertEqual([article["id"] for article in result], list(range(95)))
+        self.assertTrue(set(range(1, 11)) <= set(articles.pages))
+
+    def test_prefetch_is_capped(self):
+        articles = ArticlesStub(200, delay=0.05)
+
+        with self.listing(articles) as stub:
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+            list(figshare.iter_articles(page_size=10, prefetch=3))
+
+        self.assertTrue(1 < articles.max_active <= 3)
+
+    def test_iteration_is_lazy(self):
+        articles = ArticlesStub(1000, delay=0.01)
+
+        with self.listing(articles) as stub:
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+            iterator = figshare.iter_articles(page_size=10, prefetch=2)
+            first = next(iterator)
+            time.sleep(0.1)
+            iterator.close()
+
+        self.assertEqual(first["id"], 0)
+        self.assertLessEqual(len(articles.pages), 3)
+
+    def test_metadata_without_submitted_articles(self):
+        articles = ArticlesStub(25)
+
+        with self.listing(articles) as stub:
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+            result = list(figshare.iter_article_metadata(page_size=10))
+            filtered = list(figshare.iter_article_metadata(metadataFilter={"title": None}, page_size=10))
+            listed = figshare.get_article_internal()
+            listed_filtered = figshare.get_article_internal(metadataFilter={"title": None})
+
+        self.assertEqual(len(result), 23)
+        self.assertNotIn({"title": "article 9", "submitted": True}, result)
+        self.assertEqual(filtered[0], {"title": "article 0"})
+        self.assertEqual(listed, result)
+        # every article is filtered on its own, not merged into one
+        self.assertEqual(listed_filtered, filtered)
+
+    def test_filtered_article(self):
+        with StubServer() as stub:
+            stub.route("GET", "^/v2/account/articles/5$", (200, {"id": 5, "metadata": {"title": "article 5", "doi": ""}}))
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+
+            self.assertEqual(figshare.get_article_internal(id=5, metadataFilter={"title": None}), {"title": "article 5"})
+
+    def test_error_aborts(self):
+        articles = ArticlesStub(25, status=403)
+
+        with self.listing(articles) as stub:
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+            with self.assertRaises(HTTPException) as context:
+                list(figshare.iter_articles())
+
+        self.assertEqual(context.exception.code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import io
+import json
+import threading
+import time
+import unittest
+import zipfile
+
+from flask import Flask, request
+from werkzeug.exceptions import HTTPException
+
+from lib.batch import BatchFile, files_from_request, run_batch
+
+app = Flask(__name__)
+
+
+def zipped(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as bundle:
+        for name, content in files.items():
+            bundle.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+class TestBatch(unittest.TestCase):
+    """Tests for batch uploads, which read many files from one request."""
+
+    def files(self, data):
+        with app.test_request_context("/", method="POST", data=data, content_type="multipart/form-data"):
+            return [(f.filename, f.file and f.file.read(), f.size) for f in files_from_request(request)]
+
+    def test_file_parts(self):
+        files = self.files({
+            "userId": "port://alice:secret",
+            "files": [(io.BytesIO(b"a" * 10), "a.csv"), (io.BytesIO(b"b" * 20), "data/b.csv")],
+        })
+
+        self.assertEqual(files, [("a.csv", b"a" * 10, 10), ("data/b.csv", b"b" * 20, 20)])
+
+    def test_archive_with_manifest(self):
+        archive = zipped({"a.csv": b"a" * 10, "data/b.csv": b"b" * 20, "c.csv": b"c"})
+        files = self.files({
+            "archive": (archive, "files.zip"),
+            "manifest": json.dumps(["data/b.csv", {"filename": "a.csv"}, "missing.csv"]),
+        })
+
+        self.assertEqual(files[:2], [("data/b.csv", b"b" * 20, 20), ("a.csv", b"a" * 10, 10)])
+        self.assertEqual(files[2], ("missing.csv", None, None))
+
+    def test_archive_without_manifest(self):
+        files = self.files({"archive": (zipped({"a.csv": b"a", "data/b.csv": b"b"}), "files.zip")})
+
+        self.assertEqual([f[0] for f in files], ["a.csv", "data/b.csv"])
+
+    def test_request_without_files(self):
+        for data in ({"userId": "port://alice:secret"}, {"archive": (io.BytesIO(b"no zip"), "files.zip")}):
+            with self.assertRaises(HTTPException) as context:
+                self.files(data)
+            self.assertEqual(context.exception.code, 400)
+
+    def test_invalid_manifest(self):
+        for manifest in ("no json", json.dumps("a.csv"), json.dumps({"filename": "a.csv"}),
+                         json.dumps([{"name": "a.csv"}]), json.dumps([""]), json.dumps([1])):
+            with self.assertRaises(HTTPException) as context:
+                self.files({"archive": (zipped({"a.csv": b"a"}), "files.zip"), "manifest": manifest})
+            self.assertEqual(context.exception.code, 400, manifest)
+
+    def test_paths_outside_the_project_are_rejected(self):
+        for name in ("../escape.csv", "data/../../escape.csv", "/etc/passwd", "C:/escape.csv", "..\\escape.csv"):
+            requests = [{"archive": (zipped({"a.csv": b"a", name: b"evil"}), "files.zip")},
+                        {"archive": (zipped({"a.csv": b"a"}), "files.zip"), "manifest": json.dumps([name])}]
+            if "\\" not in name:
+                # the multipart encoder of the test client drops backslashes
+                requests.append({"files": [(io.BytesIO(b"evil"), name)]})
+            for data in requests:
+                with self.assertRaises(HTTPException) as context:
+                    self.files(data)
+                self.assertEqual(context.exception.code, 400, name)
+
+    def test_results_per_file(self):
+        def upload(batch_file):
+            if batch_file.filename == "broken":
+                raise ValueError("upstream is gone")
+            return batch_file.filename != "rejected"
+
+        results = run_batch(
+            [BatchFile(name, io.BytesIO(b"")) for name in ("a", "broken", "rejected")] + [BatchFile("missing", None)],
+            upload,
+        )
+
+        self.assertEqual(results, [
+            {"filename": "a", "success": True},
+            {"filename": "broken", "success": False, "error": "upstream is gone"},
+            {"filename": "rejected", "success": False, "error": "Upload failed."},
+            {"filename": "missing", "success": False, "error": "File not found in the request."},
+        ])
+
+    def test_parallelism_is_bounded(self):
+        lock = threading.Lock()
+        active = []
+        peak = []
+
+        def upload(batch_file):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.pop()
+            return True
+
+        results = run_batch([BatchFile(str(i), io.BytesIO(b"")) for i in range(12)], upload, workers=3)
+
+        self.assertEqual([result["filename"] for result in results], [str(i) for i in range(12)])
+        self.assertEqual(max(peak), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
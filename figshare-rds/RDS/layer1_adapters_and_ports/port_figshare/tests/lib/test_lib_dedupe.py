@@ -0,0 +1,95 @@
+import hashlib
+import io
+import unittest
+from unittest import mock
+
+from lib.batch import BatchFile, run_batch
+from lib.dedupe import Manifest, Manifests, dedupe, normalize_checksum, skipped
+
+data = b"a,b\n1,2\n"
+
+
+def md5(value):
+    return ("md5", hashlib.md5(value).hexdigest())
+
+
+class UnreadableStream(object):
+    def read(self, *args):
+        raise AssertionError("stream was read")
+
+
+class TestDedupe(unittest.TestCase):
+    """Tests for skipping files, which are already in the project."""
+
+    def test_normalize_checksum(self):
+        self.assertEqual(normalize_checksum("ABC", "MD5"), ("md5", "abc"))
+        self.assertEqual(normalize_checksum("abc", "SHA-256"), ("sha256", "abc"))
+        self.assertEqual(normalize_checksum("sha2:" + "q83vEjRWeJA=", "md5"), ("sha256", "abcdef1234567890"))
+        self.assertIsNone(normalize_checksum("abc", "UNF"))
+        self.assertIsNone(normalize_checksum(None))
+
+    def test_candidate_by_name_and_size(self):
+        manifest = Manifest([("a.csv", 8, md5(data)), ("b.csv", None, md5(b"b")), ("c.csv", 1, None)])
+
+        self.assertEqual(manifest.candidate("data/a.csv"), [md5(data)])
+        self.assertEqual(manifest.candidate("a.csv", size=8), [md5(data)])
+        self.assertEqual(manifest.candidate("a.csv", size=9), [])
+        self.assertEqual(manifest.candidate("b.csv", size=9), [md5(b"b")])
+        # files without checksum cannot be compared
+        self.assertEqual(manifest.candidate("c.csv"), [])
+        self.assertEqual(len(manifest), 2)
+
+    def test_manifest_is_loaded_once(self):
+        load = mock.Mock(side_effect=lambda project: Manifest([("a.csv", 8, md5(data))]))
+        manifests = Manifests(load, ttl=60)
+
+        for _ in range(3):
+            self.assertEqual(manifests.candidate("project", "a.csv"), [md5(data)])
+        load.assert_called_once_with("project")
+
+        manifests.update("project", "a.csv")
+        self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        manifests.invalidate("project")
+        self.assertEqual(manifests.candidate("project", "a.csv"), [md5(data)])
+        self.assertEqual(load.call_count, 2)
+
+    def test_failed_load_is_not_cached(self):
+        load = mock.Mock(side_effect=[ValueError("down"), Manifest()])
+        manifests = Manifests(load, ttl=60)
+
+        self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        self.assertEqual(load.call_count, 2)
+
+    def test_new_file_is_streamed(self):
+        manifests = Manifests(lambda project: Manifest([("a.csv", 8, md5(data))]))
+        stream = UnreadableStream()
+
+        with dedupe(manifests, "project", "b.csv", stream) as (file, saved):
+            self.assertIs(file, stream)
+            self.assertIsNone(saved)
+
+    def test_identical_file_is_skipped(self):
+        manifests = Manifests(lambda project: Manifest([("a.csv", 8, md5(data))]))
+
+        with dedupe(manifests, "project", "a.csv", io.BytesIO(data)) as (file, saved):
+            self.assertIsNone(file)
+            self.assertEqual(saved, len(data))
+
+        with dedupe(manifests, "project", "a.csv", io.BytesIO(b"a,b\n1,3\n")) as (file, saved):
+            self.assertEqual(file.read(), b"a,b\n1,3\n")
+            self.assertIsNone(saved)
+
+    def test_disabled(self):
+        manifests = Manifests(mock.Mock())
+        with mock.patch("lib.dedupe.dedupe_enabled", False):
+            self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        manifests.load.assert_not_called()
+
+    def test_batch_reports_bytes_saved(self):
+        results = run_batch([BatchFile("a.csv", io.BytesIO(data))], lambda batch_file: skipped(len(data)))
+        self.assertEqual(results, [{"filename": "a.csv", "success": True, "skipped": True, "bytesSaved": len(data)}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+
+from lib.deletion import delete_files
+from lib.sync import RemoteFile
+from lib.upload_figshare import Figshare
+from stub_server import StubServer
+
+
+def remote(count):
+    return [RemoteFile(f"{i}.csv", id=i) for i in range(count)]
+
+
+class TestDeletion(unittest.TestCase):
+    """Tests for deleting many files of a project."""
+
+    def test_failed_deletion_is_retried(self):
+        sleeps, attempts = [], {}
+
+        def delete(f):
+            attempts[f.id] = attempts.get(f.id, 0) + 1
+            if f.id == 1 and attempts[f.id] < 3:
+                raise ConnectionError("reset")
+            return True
+
+        results = delete_files(remote(2), delete, retries=3, backoff=0.5, sleep=sleeps.append)
+
+        self.assertEqual(results, [{"filename": "0.csv", "success": True}, {"filename": "1.csv", "success": True}])
+        self.assertEqual(attempts, {0: 1, 1: 3})
+        self.assertEqual(sleeps, [0.5, 1.0])
+
+    def test_failed_file_does_not_stop_the_others(self):
+        def delete(f):
+            if f.id == 0:
+                raise ValueError("forbidden")
+            return f.id != 1
+
+        results = delete_files(remote(3), delete, retries=1, backoff=0, sleep=lambda delay: None)
+
+        self.assertEqual(results, [
+            {"filename": "0.csv", "success": False, "error": "forbidden"},
+            {"filename": "1.csv", "success": False, "error": "Delete failed."},
+            {"filename": "2.csv", "success": True},
+        ])
+
+    def test_concurrency_is_bounded(self):
+        lock, running, peak = threading.Lock(), [0], [0]
+
+        def delete(f):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return True
+
+        results = delete_files(remote(40), delete, workers=4)
+
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual([result["filename"] for result in results], [f"{i}.csv" for i in range(40)])
+        self.assertTrue(1 < peak[0] <= 4)
+
+    def test_nothing_to_delete(self):
+        self.assertEqual(delete_files([], mock.Mock()), [])
+
+
+class TestFigshareDeletion(unittest.TestCase):
+    """Tests for deleting all files of an article."""
+
+    def route(self, stub, count):
+        def files(request):
+            query = parse_qs(urlparse(request.path).query)
+            page, page_size = int(query["page"][0]), int(query["page_size"][0])
+            return 200, [{"id": i, "name": f"{i}.csv", "size": 1}
+                         for i in range((page - 1) * page_size, min(page * page_size, count))]
+
+        stub.route("GET", "/account/articles/42/files\\?", files)
+
+    @mock.patch("lib.upload_figshare.articles_page_size", 5)
+    def test_all_files_are_deleted(self):
+        with StubServer() as stub:
+            self.route(stub, 12)
+            stub.route("DELETE", "/account/articles/42/files/\\d+$", (204, ""))
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+
+            results = figshare.delete_files_from_article(42, workers=4)
+
+            self.assertEqual([result["filename"] for result in results], [f"{i}.csv" for i in range(12)])
+            self.assertTrue(all(result["success"] for result in results))
+            self.assertEqual(sorted(call.path for call in stub.calls if call.method == "DELETE"),
+                             sorted(f"/v2/account/articles/42/files/{i}" for i in range(12)))
+            # all pages are listed, not only the first one
+            self.assertEqual(stub.count("GET", "/files\\?"), 3)
+
+    @mock.patch("lib.deletion.delete_backoff", 0)
+    def test_failed_files_are_reported(self):
+        with StubServer() as stub:
+            self.route(stub, 3)
+            attempts = []
+
+            def flaky(request):
+                attempts.append(request.path)
+                return (503, {"message": "unavailable"}) if len(attempts) < 3 else (204, "")
+
+            stub.route("DELETE", "/files/0$", (403, {"message": "forbidden"}))
+            stub.route("DELETE", "/files/1$", flaky)
+            stub.route("DELETE", "/files/2$", (204, ""))
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+
+            results = figshare.delete_files_from_article(42)
+
+            self.assertEqual(results, [
+                {"filename": "0.csv", "success": False, "error": "Delete failed."},
+                {"filename": "1.csv", "success": True},
+                {"filename": "2.csv", "success": True},
+            ])
+            self.assertEqual(len(attempts), 3)
+            self.assertFalse(figshare.delete_all_files_from_article_internal(42))
+
+    def test_article_cannot_be_listed(self):
+        with StubServer() as stub:
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+
+            with self.assertRaises(ValueError):
+                figshare.delete_files_from_article(42)
+            self.assertFalse(figshare.delete_all_files_from_article_internal(42))
+            self.assertEqual(stub.count("DELETE"), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from lib.hashing import HashingTee
+from lib.upload_figshare import Figshare
+from stub_server import StubServer
+
+
+class TestHashingTee(unittest.TestCase):
+    """Tests for the hashing tee and its use in the figshare upload."""
+
+    def test_copy_to(self):
+        data = os.urandom(3 * 1024 * 1024 + 5)
+        target = io.BytesIO()
+
+        tee = HashingTee(io.BytesIO(data), algorithms=("md5", "sha256")).copy_to(target)
+
+        self.assertEqual(target.getvalue(), data)
+        self.assertEqual(tee.size, len(data))
+        self.assertEqual(tee.hexdigest(), hashlib.md5(data).hexdigest())
+        self.assertEqual(tee.hexdigest("sha256"), hashlib.sha256(data).hexdigest())
+
+    def test_drain(self):
+        tee = HashingTee(io.BytesIO(b"abc")).drain()
+
+        self.assertEqual(tee.size, 3)
+        self.assertEqual(tee.hexdigest(), hashlib.md5(b"abc").hexdigest())
+
+    def test_upload_does_not_reread_file(self):
+        data = os.urandom(100 * 1024)
+        initiated = []
+
+        def initiate(request):
+            initiated.append(request.json())
+            return 201, {"location": f"{stub.url}/v2/account/articles/1/files/9"}
+
+        with StubServer() as stub:
+            stub.route("GET", "^/v2/account/articles$", (200, [{"id": 1}]))
+            stub.route("POST", "^/v2/account/articles/1/files$", initiate)
+            stub.route("GET", "^/v2/account/articles/1/files/9$", (200, {"id": 9, "upload_url": f"{stub.url}/upload/abc"}))
+            stub.route("GET", "^/upload/abc$", (200, {"parts": [
+                {"partNo": 1, "startOffset": 0, "endOffset": len(data) - 1, "status": "PENDING"}
+            ]}))
+            stub.route("PUT", "^/upload/abc/1$", (200, {}))
+            stub.route("POST", "^/v2/account/articles/1/files/9$", (202, {}))
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+
+            cwd = os.getcwd()
+            with tempfile.TemporaryDirectory() as tmpdir:
+                os.chdir(tmpdir)
+                try:
+                    with mock.patch.object(Figshare, "get_file_check_data") as check_data:
+                        result = figshare.upload_new_file_to_article(1, "file.bin", io.BytesIO(data))
+                finally:
+                    os.chdir(cwd)
+
+        self.assertEqual(result, {"success": True})
+        check_data.assert_not_called()
+        self.assertEqual(initiated[0]["md5"], hashlib.md5(data).hexdigest())
+        self.assertEqual(initiated[0]["size"], len(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
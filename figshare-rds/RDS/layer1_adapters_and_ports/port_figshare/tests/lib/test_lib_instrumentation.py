@@ -0,0 +1,206 @@
+import io
+import threading
+import unittest
+from unittest import mock
+
+from prometheus_client import REGISTRY
+
+from lib.batch import BatchFile, run_batch
+from lib.instrumentation import endpoint_template, instrumented_session, upstream_call
+from lib.rate_limiter import RateLimiter, LocalBackend
+from lib.upload_figshare import Figshare
+from stub_server import StubServer
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class FakeSpan(object):
+    def __init__(self, operation, tags, parent=None):
+        self.operation = operation
+        self.tags = dict(tags or {})
+        self.parent = parent
+        self.finished = False
+
+    def set_tag(self, key, value):
+        self.tags[key] = value
+
+
+class FakeScope(object):
+    def __init__(self, manager, span, finish_on_close=True):
+        self.manager = manager
+        self.span = span
+        self.finish_on_close = finish_on_close
+        self.previous = manager.active
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.manager.local.span = self.previous
+        if self.finish_on_close:
+            self.span.finished = True
+
+
+class FakeScopeManager(object):
+    """Keeps the active span per thread, like the scope manager of jaeger."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    @property
+    def active(self):
+        return getattr(self.local, "span", None)
+
+    def activate(self, span, finish_on_close):
+        scope = FakeScope(self, span, finish_on_close)
+        self.local.span = span
+        return scope
+
+
+class FakeTracer(object):
+    """Records the spans, which would be sent to jaeger."""
+
+    def __init__(self):
+        self.spans = []
+        self.scope_manager = FakeScopeManager()
+
+    @property
+    def active_span(self):
+        return self.scope_manager.active
+
+    def start_active_span(self, operation, tags=None):
+        span = FakeSpan(operation, tags, self.active_span)
+        self.spans.append(span)
+        return self.scope_manager.activate(span, True)
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Tests for the metrics and spans of calls to the upstream service."""
+
+    def setUp(self):
+        self.tracer = FakeTracer()
+        patcher = mock.patch("lib.instrumentation.opentracing", mock.Mock(global_tracer=lambda: self.tracer))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_endpoint_template(self):
+        self.assertEqual(
+            endpoint_template("https://api.figshare.com/v2/account/articles/123/files/456?page=2"),
+            "/v2/account/articles/{id}/files/{id}",
+        )
+        self.assertEqual(
+            endpoint_template("https://demo.dataverse.nl/api/datasets/:persistentId/add?persistentId=doi:10.5072/FK2/ABC"),
+            "/api/datasets/:persistentId/add",
+        )
+        self.assertEqual(endpoint_template("https://s3.local/bucket/18a9b3c4d5-6e7f?partNumber=1"), "/bucket/{id}")
+        self.assertEqual(endpoint_template("https://irods.local"), "/")
+
+    def test_request_is_measured_and_traced(self):
+        with StubServer() as stub:
+            stub.route("POST", "^/api/files/", (201, {"status": "OK"}))
+            host = stub.url.split("://")[1]
+            labels = dict(host=host, method="POST", endpoint="/api/files/{id}", status="201")
+            before = sample("upstream_request_seconds_count", **labels)
+            sent = sample("upstream_bytes_total", host=host, direction="sent")
+            received = sample("upstream_bytes_total", host=host, direction="received")
+
+            r = instrumented_session().post(f"{stub.url}/api/files/42?signature=secret", data=b"x" * 100)
+
+            self.assertEqual(r.status_code, 201)
+            self.assertEqual(sample("upstream_request_seconds_count", **labels), before + 1)
+            self.assertEqual(sample("upstream_bytes_total", host=host, direction="sent"), sent + 100)
+            self.assertEqual(sample("upstream_bytes_total", host=host, direction="received"), received + len(r.content))
+
+        span = self.tracer.spans[-1]
+        self.assertEqual(span.operation, "POST /api/files/{id}")
+        self.assertEqual(span.tags["http.status_code"], 201)
+        self.assertEqual(span.tags["http.url"], f"{stub.url}/api/files/42")
+        self.assertEqual(span.tags["span.kind"], "client")
+        self.assertTrue(span.finished)
+
+    def test_connection_error_is_measured(self):
+        with StubServer() as stub:
+            url = stub.url
+        host = url.split("://")[1]
+        labels = dict(host=host, method="GET", endpoint="/gone", status="ConnectionError")
+        before = sample("upstream_request_seconds_count", **labels)
+
+        with self.assertRaises(Exception):
+            instrumented_session().get(f"{url}/gone")
+
+        self.assertEqual(sample("upstream_request_seconds_count", **labels), before + 1)
+
+    def test_upstream_call_status(self):
+        labels = dict(host="irods.local", method="get", endpoint="collections")
+        failed = sample("upstream_request_seconds_count", status="KeyError", **labels)
+        ok = sample("upstream_request_seconds_count", status="ok", **labels)
+
+        with self.assertRaises(KeyError):
+            with upstream_call("irods.local", "get", "collections"):
+                raise KeyError("missing")
+        with upstream_call("irods.local", "get", "collections") as call:
+            call.sent(10)
+
+        self.assertEqual(sample("upstream_request_seconds_count", status="KeyError", **labels), failed + 1)
+        self.assertEqual(sample("upstream_request_seconds_count", status="ok", **labels), ok + 1)
+        self.assertEqual([span.operation for span in self.tracer.spans], ["get collections"] * 2)
+
+    def test_spans_of_workers_are_children(self):
+        def upload(batch_file):
+            with upstream_call("upstream.local", "put", "files"):
+                return True
+
+        with upstream_call("upstream.local", "post", "batch"):
+            run_batch([BatchFile(f"{i}.csv", io.BytesIO(b"x"), 1) for i in range(8)], upload, workers=4)
+
+        batch, files = self.tracer.spans[0], self.tracer.spans[1:]
+        self.assertIsNone(batch.parent)
+        self.assertEqual(len(files), 8)
+        self.assertTrue(all(span.parent is batch for span in files))
+        self.assertIsNone(self.tracer.active_span)
+
+    def test_rate_limiter_wait_is_traced(self):
+        limiter = RateLimiter(LocalBackend(), sleep=lambda wait: None)
+        for _ in range(3):
+            limiter.acquire("https://upstream.local/api", "key", per_second=10, burst=2)
+
+        self.assertEqual([span.operation for span in self.tracer.spans], ["rate limiter wait"])
+        self.assertEqual(self.tracer.spans[0].tags["peer.hostname"], "upstream.local")
+
+
+class TestFigshareInstrumentation(unittest.TestCase):
+    """Tests for the metrics of the calls to figshare."""
+
+    def test_figshare_calls_are_measured(self):
+        with StubServer() as stub:
+            stub.route("GET", "^/v2/account$", (200, {"id": 1}))
+            host = stub.url.split("://")[1]
+            labels = dict(host=host, method="GET", endpoint="/v2/account", status="200")
+            before = sample("upstream_request_seconds_count", **labels)
+
+            self.assertTrue(Figshare("key", api_address=f"{stub.url}/v2").probe_token())
+
+            self.assertEqual(sample("upstream_request_seconds_count", **labels), before + 1)
+
+    def test_part_retries_are_counted(self):
+        responses = [(500, {"message": "try again"}), (200, "")]
+
+        with StubServer() as stub:
+            stub.route("PUT", "^/upload/abc/", lambda request: responses.pop(0))
+            host = stub.url.split("://")[1]
+            labels = dict(host=host, method="PUT", endpoint="/upload/abc/{id}")
+            before = sample("upstream_retries_total", **labels)
+
+            Figshare("key").upload_part_with_retry(
+                {"upload_url": f"{stub.url}/upload/abc"}, io.BytesIO(b"x" * 10),
+                {"partNo": 1, "startOffset": 0, "endOffset": 9}, backoff=0,
+            )
+
+            self.assertEqual(stub.count("PUT"), 2)
+            self.assertEqual(sample("upstream_retries_total", **labels), before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
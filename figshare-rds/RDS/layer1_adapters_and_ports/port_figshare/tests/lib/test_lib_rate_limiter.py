@@ -0,0 +1,72 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from prometheus_client import REGISTRY
+
+from lib import rate_limiter
+from lib.rate_limiter import RateLimiter, LocalBackend, FileBackend, rate_limit
+
+
+class Client(object):
+    def __init__(self, api_key, api_address="https://upstream.local/api"):
+        self.api_key = api_key
+        self.api_address = api_address
+
+    @rate_limit(per_second=10, burst=2, address="api_address")
+    def call(self):
+        return True
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Tests for the token bucket rate limiter, which is shared by all instances."""
+
+    def setUp(self):
+        self.waits = []
+        self.limiter = RateLimiter(LocalBackend(), sleep=self.waits.append)
+
+    def test_burst_then_throttle(self):
+        waits = [self.limiter.acquire("https://upstream.local/api", "key", per_second=10, burst=3) for _ in range(5)]
+
+        self.assertEqual(waits[:3], [0, 0, 0])
+        self.assertAlmostEqual(waits[3], 0.1, delta=0.01)
+        self.assertAlmostEqual(waits[4], 0.2, delta=0.01)
+        self.assertEqual(len(self.waits), 2)
+
+    def test_buckets_per_host_and_key(self):
+        self.limiter.acquire("https://upstream.local/api", "key", per_second=1, burst=1)
+
+        self.assertEqual(self.limiter.acquire("https://upstream.local/other", "other", per_second=1, burst=1), 0)
+        self.assertEqual(self.limiter.acquire("https://second.local/api", "key", per_second=1, burst=1), 0)
+        self.assertGreater(self.limiter.acquire("https://upstream.local/other", "key", per_second=1, burst=1), 0.9)
+
+    def test_instances_share_the_bucket(self):
+        with mock.patch.object(rate_limiter, "limiter", self.limiter):
+            for _ in range(4):
+                self.assertTrue(Client("key").call())
+            Client("other").call()
+
+        self.assertEqual(len(self.waits), 2)
+
+    def test_file_backend_is_shared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first = RateLimiter(FileBackend(directory), sleep=self.waits.append)
+            second = RateLimiter(FileBackend(directory), sleep=self.waits.append)
+
+            self.assertEqual(first.acquire("upstream.local", "key", per_second=10, burst=1), 0)
+            self.assertGreater(second.acquire("upstream.local", "key", per_second=10, burst=1), 0.05)
+            self.assertEqual(second.acquire("upstream.local", "other", per_second=10, burst=1), 0)
+
+    def test_wait_is_observed(self):
+        labels = {"host": "metrics.local"}
+        before = REGISTRY.get_sample_value("rate_limiter_wait_seconds_count", labels) or 0
+
+        for _ in range(3):
+            self.limiter.acquire("https://metrics.local/api", "key", per_second=10, burst=1)
+
+        self.assertEqual(REGISTRY.get_sample_value("rate_limiter_wait_seconds_count", labels), before + 3)
+        self.assertGreater(REGISTRY.get_sample_value("rate_limiter_wait_seconds_sum", labels), 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import io
+import json
+import unittest
+from unittest import mock
+
+from flask import Flask, request
+
+from lib.request_data import StreamingRequest, user_id
+
+app = Flask(__name__)
+app.request_class = StreamingRequest
+
+user = "port://alice:secret"
+
+
+def upload(size, **fields):
+    data = dict(fields)
+    data["file"] = (io.BytesIO(b"x" * size), "data.csv")
+    return data
+
+
+class TestRequestData(unittest.TestCase):
+    """Tests for the credentials and the streamed upload of a request."""
+
+    def position(self):
+        return request.environ["wsgi.input"].tell()
+
+    def test_user_id_from_header(self):
+        with app.test_request_context("/", method="POST", data=upload(1024, filename="data.csv"),
+                                      headers={"X-User-Id": user}, content_type="multipart/form-data"):
+            self.assertEqual(user_id(), user)
+            self.assertEqual(self.position(), 0)
+
+    def test_user_id_from_json(self):
+        with app.test_request_context("/", method="GET", data=json.dumps({"userId": user})):
+            self.assertEqual(user_id(), user)
+        with app.test_request_context("/", method="GET", data="no json"):
+            self.assertIsNone(user_id())
+
+    def test_multipart_is_not_decoded_as_json(self):
+        with app.test_request_context("/", method="POST", data=upload(1024, userId=user),
+                                      content_type="multipart/form-data"):
+            with mock.patch.object(StreamingRequest, "get_json") as get_json:
+                self.assertEqual(user_id(), user)
+            get_json.assert_not_called()
+
+    def test_file_is_streamed(self):
+        positions = []
+        for size in (1024 * 1024, 8 * 1024 * 1024):
+            with app.test_request_context("/", method="POST", data=upload(size, userId=user, filename="a.csv"),
+                                          content_type="multipart/form-data"):
+                self.assertEqual(user_id(), user)
+                self.assertEqual(request.form.to_dict(), {"userId": user, "filename": "a.csv"})
+                self.assertEqual(request.get_data(), b"")
+                positions.append(self.position())
+
+                file = request.files["file"]
+                self.assertEqual(file.filename, "data.csv")
+                self.assertEqual(file.read(10), b"x" * 10)
+                self.assertEqual(len(file.read()), size - 10)
+                self.assertEqual(file.read(), b"")
+
+        # only the fields and the first chunk of the file were read, whatever the size of the file
+        self.assertEqual(positions[0], positions[1])
+        self.assertLess(positions[0], 1024 * 1024)
+
+    def test_fields_after_the_file_are_not_read(self):
+        data = (
+            b'--x\r\nContent-Disposition: form-data; name="userId"\r\n\r\n' + user.encode() +
+            b'\r\n--x\r\nContent-Disposition: form-data; name="file"; filename="data.csv"\r\n\r\n' + b"x" * 1024 +
+            b'\r\n--x\r\nContent-Disposition: form-data; name="filename"\r\n\r\nlate.csv\r\n--x--\r\n'
+        )
+        with app.test_request_context("/", method="POST", data=data, content_type="multipart/form-data; boundary=x"):
+            self.assertEqual(request.form.to_dict(), {"userId": user})
+            self.assertEqual(request.files["file"].read(), b"x" * 1024)
+
+    def test_other_file_parts_are_spooled(self):
+        data = {
+            "userId": user,
+            "files": [(io.BytesIO(b"a" * 10), "a.csv"), (io.BytesIO(b"b" * 20), "b.csv")],
+        }
+        with app.test_request_context("/", method="POST", data=data, content_type="multipart/form-data"):
+            files = request.files.getlist("files")
+            self.assertEqual([(f.filename, f.read()) for f in files], [("a.csv", b"a" * 10), ("b.csv", b"b" * 20)])
+            files[0].seek(0)
+            self.assertEqual(files[0].read(), b"a" * 10)
+
+    def test_broken_body(self):
+        with app.test_request_context("/", method="POST", data=b"--x\r\nno headers",
+                                      content_type="multipart/form-data; boundary=x"):
+            self.assertIsNone(user_id())
+            self.assertEqual(len(request.files), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import hashlib
+import io
+import json
+import unittest
+import zipfile
+from unittest import mock
+
+from flask import Flask, request
+from werkzeug.exceptions import HTTPException
+
+from lib.batch import BatchFile
+from lib.sync import RemoteFile, SyncEntry, apply, diff, parse_checksum, parse_manifest, sync, sync_request
+
+app = Flask(__name__)
+
+
+def md5(value):
+    return ("md5", hashlib.md5(value).hexdigest())
+
+
+def entry(path, value):
+    return {"path": path, "size": len(value), "checksum": "md5:" + md5(value)[1]}
+
+
+class TestSync(unittest.TestCase):
+    """Tests for comparing a manifest with the files of a project and applying the changes."""
+
+    def remote(self):
+        return [
+            RemoteFile("same.csv", 4, md5(b"same"), 1),
+            RemoteFile("changed.csv", 3, md5(b"old"), 2),
+            RemoteFile("gone.csv", 4, md5(b"gone"), 3),
+            RemoteFile("twice.csv", 5, md5(b"twice"), 4),
+            RemoteFile("twice.csv", 5, md5(b"twice"), 5),
+        ]
+
+    def manifest(self):
+        return parse_manifest([
+            entry("data/same.csv", b"same"), entry("changed.csv", b"new"), entry("twice.csv", b"twice"),
+            entry("data/new.csv", b"new"),
+        ])
+
+    def test_parse_checksum(self):
+        self.assertEqual(parse_checksum("md5:ABC"), ("md5", "abc"))
+        self.assertEqual(parse_checksum("abc"), ("md5", "abc"))
+        self.assertEqual(parse_checksum("SHA-256:abc"), ("sha256", "abc"))
+        self.assertEqual(parse_checksum("sha2:q83vEjRWeJA="), ("sha256", "abcdef1234567890"))
+        self.assertIsNone(parse_checksum(None))
+
+    def test_invalid_manifest(self):
+        for manifest in ("no json", {"path": "a.csv"}, [{"size": 1}], [{"path": "a/x.csv"}, {"path": "b/x.csv"}],
+                         [{"path": "../x.csv"}], [{"path": "/x.csv"}]):
+            with self.assertRaises(HTTPException):
+                parse_manifest(manifest)
+
+    def test_diff(self):
+        plan = diff(self.manifest(), self.remote())
+
+        self.assertEqual(plan.summary(), {
+            "add": ["data/new.csv"], "replace": ["changed.csv"], "delete": ["twice.csv", "gone.csv"], "unchanged": 2,
+        })
+        self.assertEqual(plan.replace[0][1].id, 2)
+        # the second file with the same name is deleted
+        self.assertEqual([remote.id for remote in plan.delete], [5, 3])
+
+    def test_file_without_checksum_is_replaced(self):
+        plan = diff([SyncEntry("a.csv", 1)], [RemoteFile("a.csv", 1, None)])
+        self.assertEqual(plan.summary()["replace"], ["a.csv"])
+
+    @mock.patch("lib.deletion.delete_retries", 0)
+    def test_apply(self):
+        calls = []
+        plan = diff(self.manifest(), self.remote())
+        files = {"changed.csv": BatchFile("changed.csv", io.BytesIO(b"new"), 3),
+                 "data/new.csv": BatchFile("data/new.csv", io.BytesIO(b"new"), 3)}
+
+        def add(batch_files):
+            calls.append(("add", [(f.filename, f.file.read()) for f in batch_files]))
+            return [{"filename": f.filename, "success": True} for f in batch_files]
+
+        def delete(remote):
+            calls.append(("delete", remote.id))
+            return remote.id != 3
+
+        results = apply(plan, files, add, lambda remote, batch_file: calls.append(("replace", remote.id)) or True,
+                        delete, workers=2)
+
+        self.assertEqual(sorted(calls), [
+            ("add", [("data/new.csv", b"new")]), ("delete", 3), ("delete", 5), ("replace", 2)])
+        self.assertEqual(sorted(results, key=lambda result: result["filename"]), [
+            {"filename": "changed.csv", "action": "replace", "success": True},
+            {"filename": "data/new.csv", "action": "add", "success": True},
+            {"filename": "gone.csv", "action": "delete", "success": False, "error": "Delete failed."},
+            {"filename": "twice.csv", "action": "delete", "success": True},
+        ])
+
+    def test_missing_files_are_reported(self):
+        plan = diff(self.manifest(), self.remote())
+        replace = mock.Mock()
+
+        results = apply(plan, {}, lambda batch_files: [
+            {"filename": f.filename, "success": False, "error": "File not found in the request."} for f in batch_files
+            if f.file is None
+        ], replace, lambda remote: True)
+
+        replace.assert_not_called()
+        self.assertEqual([(r["filename"], r["action"]) for r in results if not r["success"]],
+                         [("changed.csv", "replace"), ("data/new.csv", "add")])
+
+    def test_dry_run(self):
+        add, replace, delete = mock.Mock(), mock.Mock(), mock.Mock()
+        result = sync(self.manifest(), self.remote(), {}, add, replace, delete, dry_run=True)
+
+        self.assertEqual(result["dryRun"], True)
+        self.assertEqual(result["files"], [])
+        self.assertEqual(result["add"], ["data/new.csv"])
+        for change in (add, replace, delete):
+            change.assert_not_called()
+
+    def test_request(self):
+        manifest = [entry("a.csv", b"a"), entry("data/b.csv", b"b")]
+        with app.test_request_context("/", method="POST", data=json.dumps({"manifest": manifest, "dryRun": True})):
+            entries, files, dry_run = sync_request(request)
+            self.assertEqual(([e.path for e in entries], files, dry_run), (["a.csv", "data/b.csv"], {}, True))
+
+        data = {"manifest": json.dumps(manifest), "files": [(io.BytesIO(b"a"), "a.csv")]}
+        with app.test_request_context("/", method="POST", data=data, content_type="multipart/form-data"):
+            entries, files, dry_run = sync_request(request)
+            self.assertEqual((list(files), files["a.csv"].file.read(), dry_run), (["a.csv"], b"a", False))
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as bundle:
+            bundle.writestr("data/b.csv", b"b")
+        archive.seek(0)
+        data = {"manifest": json.dumps(manifest), "archive": (archive, "files.zip")}
+        with app.test_request_context("/", method="POST", data=data, content_type="multipart/form-data"):
+            entries, files, dry_run = sync_request(request)
+            self.assertEqual(files["data/b.csv"].file.read(), b"b")
+
+        with app.test_request_context("/", method="POST", data=json.dumps({})):
+            with self.assertRaises(HTTPException):
+                sync_request(request)
+
+if __name__ == '__main__':
+    unittest.main()
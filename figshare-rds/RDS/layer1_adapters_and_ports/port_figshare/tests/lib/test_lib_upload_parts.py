@@ -0,0 +1,134 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from lib.upload_figshare import Figshare
+from stub_server import StubServer
+
+part_size = 64 * 1024
+
+
+class UploadStub(object):
+    """Figshare upload service, which accepts the parts of one file."""
+
+    def __init__(self, size, complete=(), failures=None, delay=0.02):
+        self.parts = [
+            {
+                "partNo": no + 1,
+                "startOffset": offset,
+                "endOffset": min(offset + part_size, size) - 1,
+                "status": "COMPLETE" if no + 1 in complete else "PENDING",
+            }
+            for no, offset in enumerate(range(0, size, part_size))
+        ]
+        self.received = {}
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def info(self, request):
+        return 200, {"token": "abc", "parts": self.parts}
+
+    def put(self, request):
+        no = int(request.path.split("/")[-1])
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+            if self.failures.get(no, 0) > 0:
+                self.failures[no] -= 1
+                return 500, {"message": "try again"}
+            self.received[no] = request.body
+        return 200, ""
+
+
+class TestUploadParts(unittest.TestCase):
+    """Tests for the concurrent part upload against a local figshare upload stub."""
+
+    def setUp(self):
+        self.data = os.urandom(10 * part_size + 123)
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def upload(self, upload, **kwargs):
+        with StubServer() as stub:
+            stub.route("GET", "^/upload/abc$", upload.info)
+            stub.route("PUT", "^/upload/abc/", upload.put)
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+
+            figshare.upload_parts({"upload_url": f"{stub.url}/upload/abc"}, self.path, **kwargs)
+            return stub
+
+    def assertReceived(self, upload, parts):
+        for part in upload.parts:
+            if part["partNo"] in parts:
+                start, end = part["startOffset"], part["endOffset"]
+                self.assertEqual(upload.received[part["partNo"]], self.data[start:end + 1])
+
+    def test_parts_are_uploaded_concurrently(self):
+        upload = UploadStub(len(self.data))
+
+        self.upload(upload, workers=4)
+
+        self.assertEqual(len(upload.received), 11)
+        self.assertReceived(upload, range(1, 12))
+        self.assertTrue(1 < upload.max_active <= 4)
+
+    def test_single_worker(self):
+        upload = UploadStub(len(self.data))
+
+        self.upload(upload, workers=1)
+
+        self.assertReceived(upload, range(1, 12))
+        self.assertEqual(upload.max_active, 1)
+
+    def test_complete_parts_are_skipped(self):
+        upload = UploadStub(len(self.data), complete=(1, 2, 3))
+
+        stub = self.upload(upload)
+
+        self.assertEqual(sorted(upload.received), list(range(4, 12)))
+        self.assertEqual(stub.count("PUT"), 8)
+
+    def test_failed_part_is_retried(self):
+        upload = UploadStub(len(self.data), failures={5: 2})
+        figshare = Figshare("key")
+        upload_part = figshare.upload_part_with_retry
+
+        with StubServer() as stub:
+            stub.route("GET", "^/upload/abc$", upload.info)
+            stub.route("PUT", "^/upload/abc/", upload.put)
+            figshare.upload_part_with_retry = lambda *args: upload_part(*args, backoff=0)
+
+            figshare.upload_parts({"upload_url": f"{stub.url}/upload/abc"}, self.path)
+
+            self.assertEqual(stub.count("PUT", "/5$"), 3)
+
+        self.assertReceived(upload, range(1, 12))
+
+    def test_failing_part_raises(self):
+        upload = UploadStub(len(self.data), failures={5: 100})
+        figshare = Figshare("key")
+        upload_part = figshare.upload_part_with_retry
+
+        with StubServer() as stub:
+            stub.route("GET", "^/upload/abc$", upload.info)
+            stub.route("PUT", "^/upload/abc/", upload.put)
+            figshare.upload_part_with_retry = lambda *args: upload_part(*args, retries=1, backoff=0)
+
+            with self.assertRaises(Exception):
+                figshare.upload_parts({"upload_url": f"{stub.url}/upload/abc"}, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+
+from lib.batch import BatchFile
+from lib.sync import parse_manifest
+from lib.upload_figshare import Figshare, UploadSession
+from stub_server import StubServer
+
+
+class ArticleStub(object):
+    """Figshare article with its upload service, which accepts files of one part."""
+
+    def __init__(self, stub, article_id):
+        self.stub = stub
+        self.article_id = article_id
+        self.files = []
+        self.deleted = []
+
+    def route(self):
+        base = f"^/v2/account/articles/{self.article_id}/files"
+        self.stub.route("GET", "^/v2/account/articles$", (200, [{"id": 999}]))
+        self.stub.route("GET", f"{base}\\?", self.list_files)
+        self.stub.route("POST", f"{base}$", self.initiate)
+        self.stub.route("GET", f"{base}/\\d+$", self.file_info)
+        self.stub.route("POST", f"{base}/\\d+$", (202, {}))
+        self.stub.route("DELETE", f"{base}/\\d+$", self.delete)
+        self.stub.route("GET", "^/upload/\\d+$", self.upload_info)
+        self.stub.route("PUT", "^/upload/\\d+/1$", (200, {}))
+
+    def initiate(self, request):
+        self.files.append(request.json())
+        file_id = len(self.files)
+        return 201, {"location": f"{self.stub.url}/v2/account/articles/{self.article_id}/files/{file_id}"}
+
+    def list_files(self, request):
+        return 200, [
+            {"id": i + 1, "name": f["name"], "size": f["size"], "computed_md5": f["md5"]}
+            for i, f in enumerate(self.files) if i + 1 not in self.deleted
+        ]
+
+    def delete(self, request):
+        self.deleted.append(int(request.path.split("/")[-1]))
+        return 204, b""
+
+    def file_info(self, request):
+        file_id = int(request.path.split("/")[-1])
+        return 200, {"id": file_id, "upload_url": f"{self.stub.url}/upload/{file_id}"}
+
+    def upload_info(self, request):
+        size = self.files[int(request.path.split("/")[-1]) - 1]["size"]
+        return 200, {"parts": [{"partNo": 1, "startOffset": 0, "endOffset": size - 1, "status": "PENDING"}]}
+
+
+class TestUploadSession(unittest.TestCase):
+    """Tests for uploads, which are bound to the requested article."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmpdir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def test_upload_does_not_list_articles(self):
+        with StubServer() as stub:
+            article = ArticleStub(stub, 42)
+            article.route()
+
+            for i in range(3):
+                figshare = Figshare("key", api_address=f"{stub.url}/v2")
+                result = figshare.upload_new_file_to_article(42, f"file{i}.bin", io.BytesIO(os.urandom(1000)))
+                self.assertEqual(result, {"success": True})
+
+            self.assertEqual(stub.count("GET", "^/v2/account/articles$"), 0)
+            self.assertEqual(stub.count("POST", "^/v2/account/articles/42/files$"), 3)
+            self.assertEqual(stub.count("POST", "^/v2/account/articles/42/files/\\d+$"), 3)
+            # initiate, file info, upload info, one part and complete for every file
+            # and the files of the article are listed once for the transfer
+            self.assertEqual(len(stub.calls), 3 * 5 + 1)
+
+        self.assertEqual([f["name"] for f in article.files], ["file0.bin", "file1.bin", "file2.bin"])
+
+    def test_client_paths_are_not_written(self):
+        os.mkdir("work")
+        os.chdir("work")
+        with StubServer() as stub:
+            article = ArticleStub(stub, 42)
+            article.route()
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+
+            for name in ("data/b.csv", "../escape.csv"):
+                self.assertEqual(figshare.upload_new_file_to_article(42, name, io.BytesIO(name.encode())), {"success": True})
+
+            puts = [call.body for call in stub.calls if call.method == "PUT"]
+
+        self.assertEqual([f["name"] for f in article.files], ["b.csv", "escape.csv"])
+        self.assertEqual(puts, [b"data/b.csv", b"../escape.csv"])
+        # the uploads are spooled into removed temporary files, not below the working directory
+        self.assertEqual(os.listdir("."), [])
+        self.assertEqual(os.listdir(".."), ["work"])
+
+    def test_session_is_reused_for_the_transfer(self):
+        first = Figshare("key", api_address="http://figshare.local/v2").upload_session("42")
+        second = Figshare("key", api_address="http://figshare.local/v2").upload_session(42)
+        other_article = Figshare("key", api_address="http://figshare.local/v2").upload_session(43)
+        other_key = Figshare("other", api_address="http://figshare.local/v2").upload_session(42)
+
+        self.assertIsInstance(first, UploadSession)
+        self.assertIs(first, second)
+        self.assertEqual(first.article_id, 42)
+        self.assertIsNot(first, other_article)
+        self.assertIsNot(first, other_key)
+
+    def test_concurrent_projects_upload_to_their_article(self):
+        with StubServer() as stub:
+            first, second = ArticleStub(stub, 1), ArticleStub(stub, 2)
+            first.route()
+            second.route()
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+
+            figshare.upload_new_file_to_article(1, "a.bin", io.BytesIO(b"a" * 10))
+            figshare.upload_new_file_to_article(2, "b.bin", io.BytesIO(b"b" * 20))
+
+        self.assertEqual([f["name"] for f in first.files], ["a.bin"])
+        self.assertEqual([f["name"] for f in second.files], ["b.bin"])
+
+    def test_batch_uploads_to_the_article(self):
+        with StubServer() as stub:
+            article = ArticleStub(stub, 42)
+            article.route()
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+
+            results = figshare.upload_files_to_article(
+                42, [BatchFile(f"batch{i}.bin", io.BytesIO(os.urandom(100))) for i in range(4)], workers=2
+            )
+
+            self.assertEqual([result["success"] for result in results], [True] * 4)
+            self.assertEqual(stub.count("POST", "^/v2/account/articles/42/files/\\d+$"), 4)
+
+        self.assertEqual(sorted(f["name"] for f in article.files), [f"batch{i}.bin" for i in range(4)])
+
+    def test_file_in_the_article_is_skipped(self):
+        with StubServer() as stub:
+            article = ArticleStub(stub, 42)
+            article.route()
+            data = os.urandom(1000)
+            Figshare("key", api_address=f"{stub.url}/v2").upload_new_file_to_article(42, "a.bin", io.BytesIO(data))
+
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+            results = figshare.upload_files_to_article(
+                42, [BatchFile("a.bin", io.BytesIO(data)), BatchFile("b.bin", io.BytesIO(data))])
+            self.assertEqual(results, [
+                {"filename": "a.bin", "success": True, "skipped": True, "bytesSaved": 1000},
+                {"filename": "b.bin", "success": True},
+            ])
+            # a changed file with the same name is uploaded
+            self.assertEqual(figshare.upload_new_file_to_article(42, "a.bin", io.BytesIO(b"changed")), {"success": True})
+            self.assertEqual(stub.count("GET", "^/v2/account/articles/42/files\\?"), 1)
+
+        self.assertEqual([f["name"] for f in article.files], ["a.bin", "b.bin", "a.bin"])
+
+    def test_sync_article(self):
+        with StubServer() as stub:
+            article = ArticleStub(stub, 42)
+            article.route()
+            figshare = Figshare("key", api_address=f"{stub.url}/v2")
+            for name in ("a.bin", "b.bin"):
+                figshare.upload_new_file_to_article(42, name, io.BytesIO(b"old"))
+
+            manifest = [{"path": "a.bin", "size": 3, "checksum": "md5:" + hashlib.md5(b"new").hexdigest()},
+                        {"path": "c.bin", "size": 3, "checksum": "md5:" + hashlib.md5(b"new").hexdigest()}]
+            files = {name: BatchFile(name, io.BytesIO(b"new"), 3) for name in ("a.bin", "c.bin")}
+            result = figshare.sync_article(42, parse_manifest(manifest), files)
+
+            self.assertTrue(result["success"])
+            self.assertEqual((result["add"], result["replace"], result["delete"]), (["c.bin"], ["a.bin"], ["b.bin"]))
+
+        # the old a.bin is deleted after its new version was uploaded
+        self.assertEqual(sorted(article.deleted), [1, 2])
+        self.assertEqual(sorted(f["name"] for f in article.files[2:]), ["a.bin", "c.bin"])
+
+
+if __name__ == '__main__':
+    unittest.main()
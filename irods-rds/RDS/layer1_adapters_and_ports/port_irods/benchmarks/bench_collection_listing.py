@@ -0,0 +1,59 @@
+"""Lists a research folder with 1k subcollections from a fake iRODS catalog.
+
+Compares the per collection lookups, which get_collection did before, with the bulk
+GenQuery listing. Every query against the fake catalog is delayed by --latency to
+simulate the round-trip to the catalog server.
+
+    python benchmarks/bench_collection_listing.py --subcollections 1000 --latency 0.002
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(f"{os.getcwd()}/src")
+sys.path.append(f"{os.getcwd()}/tests")
+sys.path.append(f"{os.getcwd()}/tests/lib")
+
+from lib.collection_listing import CollectionListing
+from fake_catalog import FakeCatalog
+from test_lib_collection_listing import describe, fill
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subcollections", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds per catalog query")
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    base = "/yoda/home/research-bench"
+    catalog = FakeCatalog()
+    fill(catalog, base, args.subcollections)
+    catalog.latency = args.latency
+    session = catalog.session()
+
+    def per_collection():
+        return [describe(col) for col in session.collections.get(base).subcollections]
+
+    def bulk():
+        return CollectionListing(session).subcollections(base)
+
+    def first_page():
+        return CollectionListing(session).subcollections(base, limit=args.page_size)
+
+    print(f"{args.subcollections} subcollections, {args.latency * 1000:.1f} ms per query")
+    results = {}
+    for name, listing in (("per collection", per_collection), ("bulk", bulk), (f"bulk, first {args.page_size}", first_page)):
+        catalog.queries = 0
+        start = time.perf_counter()
+        results[name] = listing()
+        duration = time.perf_counter() - start
+        print(f"{name:>18}: {catalog.queries:>6} queries, {duration:.2f} s")
+
+    key = lambda c: c["path"]
+    assert sorted(results["per collection"], key=key) == results["bulk"]
+
+
+if __name__ == "__main__":
+    main()
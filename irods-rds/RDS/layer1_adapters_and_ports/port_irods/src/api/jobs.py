@@ -0,0 +1,22 @@
+from lib.Util import require_api_key
+from lib.transfer_jobs import INTERRUPTED, get_runner, owner_of
+from flask import jsonify, g, abort
+from lib.logs import get_logger
+
+logger = get_logger(__name__)
+
+
+@require_api_key
+def get(job_id):
+    logger.debug("Entering at api/jobs.py get")
+
+    runner = get_runner()
+    job = runner.get(job_id, owner_of(g.irods.user, g.irods.api_key))
+    if job is None:
+        abort(404)
+
+    if job.state == INTERRUPTED:
+        logger.debug("Resume transfer job %s", job_id)
+        runner.resume(job, g.irods)
+
+    return jsonify(job.status())
@@ -0,0 +1,23 @@
+from lib.Util import require_api_key, decode_path
+from lib.batch import files_from_request
+from flask import jsonify, request, g
+from lib.logs import get_logger
+
+logger = get_logger(__name__)
+
+
+@require_api_key
+def post(project_id):
+    logger.debug("Entering at api/project/batch.py post")
+    project_id = decode_path(project_id)
+
+    files = files_from_request(request)
+    logger.debug("Start batch upload of %s files", len(files))
+    results = g.irods.upload_files_to_collection(project_id, files)
+    logger.debug("Finished batch upload")
+
+    return jsonify({
+        "success": all(result["success"] for result in results),
+        "bytesSaved": sum(result.get("bytesSaved", 0) for result in results),
+        "files": results,
+    })
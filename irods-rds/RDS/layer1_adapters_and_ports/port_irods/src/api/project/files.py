@@ -1,22 +1,30 @@
-import inspect
-import logging
+import os
 from lib.Util import require_api_key, decode_path
+from lib.dedupe import bytes_saved
+from lib.transfer_jobs import get_runner, owner_of, register, wants_async
 from flask import g, request, jsonify
+from lib.logs import get_logger
 
-logger = logging.getLogger()
+logger = get_logger(__name__)
+
+
+@register("upload")
+def upload_job(irods, params, file):
+    return irods.upload_new_file_to_collection(
+        path=params["project_id"], path_to_file=params["filename"], file=file, size=os.fstat(file.fileno()).st_size)
 
 
 # FIXME: all endpoints need server tests, but POST cannot currently be tested through pactman, because it only supports json as content type
 @require_api_key
 def index(project_id):
-    logger.debug(f"Entering at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/files.py index")
     project_id = decode_path(project_id)
     return g.irods.get_files_from_collection(path=project_id)
 
 
 @require_api_key
 def get(project_id, file_id=None):
-    logger.debug(f"Entering at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/files.py get")
 
     project_id = decode_path(project_id)
     
@@ -31,43 +39,55 @@ def get(project_id, file_id=None):
 
 @require_api_key
 def post(project_id):
-    logger.debug(f"Entering at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/files.py post")
     
     project_id = decode_path(project_id)
 
     logger.debug("Read file from request")
     file = request.files['file']
 
+    # only the fields in front of the file are read, without filename the name of the file part is used
     req = request.form.to_dict()
-    filename = req["filename"]
-    logger.debug("file: {}, filename: {}".format(file, filename))
+    filename = req.get("filename") or file.filename
+    logger.debug("file: %s, filename: %s", file, filename)
+
+    if wants_async(req):
+        job = get_runner().submit(
+            "upload", g.irods, owner_of(g.irods.user, g.irods.api_key),
+            {"project_id": project_id, "filename": filename}, file
+        )
+        logger.debug("Queued file upload as transfer job %s", job.id)
+        return jsonify(job.status()), 202
 
     logger.debug("Start file upload")
     
     resp = g.irods.upload_new_file_to_collection(
-        path=project_id, path_to_file=filename, file=file)
+        path=project_id, path_to_file=filename, file=file, size=request.content_length)
     logger.debug("Finished file upload")
 
     if resp:
-        return jsonify({"success": True})
+        # a file, which is already in the project, is not uploaded again
+        return jsonify({"success": True, "bytesSaved": bytes_saved(resp)})
 
     else:
-        logger.error(f"Exception at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        logger.error("Exception at api/project/files.py post")
         raise ValueError("Upload failed.")
 
 
 @require_api_key
 def patch(project_id, file_id):
-    logger.error(f"Exception at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.error("Exception at api/project/files.py patch")
     raise NotImplementedError()
 
 
 @require_api_key
 def delete(project_id, file_id=None):
-    logger.debug(f"Entering at api/project/files.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/files.py delete")
     project_id = decode_path(project_id)
     if file_id is None:
-        return g.irods.delete_all_files_from_collection(path=project_id)
+        # the result of every file, a failed file does not stop the deletion of the others
+        results = g.irods.delete_files_from_collection(project_id)
+        return jsonify({"success": all(result["success"] for result in results), "files": results})
     else:
         file_id = decode_path(file_id)
         return g.irods.delete_file_from_collection(path=file_id)
\ No newline at end of file
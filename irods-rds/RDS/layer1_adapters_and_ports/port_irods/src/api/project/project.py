@@ -1,21 +1,20 @@
-import inspect
 from RDS import ROParser
-import logging
 from flask import jsonify, request, g
 from werkzeug.exceptions import abort
 from lib.Util import require_api_key, to_jsonld, encode_path, decode_path
+from lib.logs import get_logger
 
-logger = logging.getLogger()
+logger = get_logger(__name__)
 
 
 @require_api_key
 def index():
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py index")
 
     req = request.json.get("metadata")
     
     collectionResponse = g.irods.get_collection(metadataFilter=req)
-    logger.debug("collection response: {}".format(collectionResponse))
+    logger.debug("collection response", collectionResponse=collectionResponse)
 
     output = []
     for collection in collectionResponse:
@@ -23,7 +22,7 @@ def index():
             metadata = to_jsonld(collection)
 
         except Exception as e:
-            logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at api/project/project.py index")
             logger.error(e, exc_info=True)
             metadata = collection
 
@@ -37,31 +36,31 @@ def index():
 
 @require_api_key
 def get(project_id):
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py get")
     req = request.json.get("metadata")
 
     collectionResponse = g.irods.get_collection(
         path=decode_path(project_id), metadataFilter=req)
 
-    logger.debug("collection reponse: {}".format(collectionResponse))
+    logger.debug("collection reponse", collectionResponse=collectionResponse)
 
     output = collectionResponse
     try:
         output = to_jsonld(collectionResponse.get("metadata") or collectionResponse)
 
     except Exception as e:
-        logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        logger.error("Exception at api/project/project.py get")
         logger.error(e, exc_info=True)
         output = collectionResponse
 
-    logger.debug("output: {}".format(output))
+    logger.debug("output", output=output)
 
     return jsonify(output)
 
 
 def irods(res):
-    logger.debug(f"### before: {res}")
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("### before: %s", res)
+    logger.debug("Entering at api/project/project.py irods")
     result = {}
     # {'Affiliation': 'Surf',
     #         'Description': 'Dit is een test 123',
@@ -100,13 +99,13 @@ def irods(res):
 
 @require_api_key
 def post():
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py post")
     try:
         req = request.get_json(force=True)
-        logger.debug(f"### req: {req}")
+        logger.debug("### req", req=req)
         
         metadata = req.get("metadata")
-        logger.debug(f"### got metadata: {metadata}")
+        logger.debug("### got metadata: %s", metadata)
 
         try:
             if metadata is None:
@@ -116,15 +115,15 @@ def post():
                 metadata = irods(doc.getElement(
                     doc.rootIdentifier, expand=True, clean=False))
         except Exception as e:
-            logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            logger.error("Exception at api/project/project.py post")
             logger.error(e, exc_info=True)
 
-        logger.debug("### send metadata: {}".format(metadata))
+        logger.debug("### send metadata", metadata=metadata)
 
         collectionResponse = g.irods.create_new_collection_internal(
             metadata=metadata
         )
-        logger.debug(f"### collectionResponse: {collectionResponse}")
+        logger.debug("### collectionResponse: %s", collectionResponse)
 
         if collectionResponse is not None:
             return jsonify(
@@ -136,14 +135,14 @@ def post():
 
         abort(collectionResponse)
     except Exception as e:
-        logger.error(f"Exception at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}, outer exception")
+        logger.error("Exception at api/project/project.py post, outer exception")
         logger.error(e, exc_info=True)
         abort(500)
 
 
 @require_api_key
 def delete(project_id):
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py delete")
     if g.irods.remove_collection_internal(path=decode_path(project_id)):
         return "", 204
 
@@ -152,13 +151,13 @@ def delete(project_id):
 
 @require_api_key
 def patch(project_id):
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py patch")
     logger.debug("Not implemented")
     return True, 200
 
 
 @require_api_key
 def put(project_id):
-    logger.debug(f"Entering at api/project/project.py {inspect.getframeinfo(inspect.currentframe()).function}")
+    logger.debug("Entering at api/project/project.py put")
     logger.debug("Not implemented")
     return True, 200
@@ -0,0 +1,19 @@
+from lib.Util import require_api_key, decode_path
+from lib.sync import sync_request
+from flask import jsonify, request, g
+from lib.logs import get_logger
+
+logger = get_logger(__name__)
+
+
+@require_api_key
+def post(project_id):
+    logger.debug("Entering at api/project/sync.py post")
+    project_id = decode_path(project_id)
+
+    entries, files, dry_run = sync_request(request)
+    logger.debug("Start sync of %s files", len(entries))
+    result = g.irods.sync_collection(project_id, entries, files, dry_run=dry_run)
+    logger.debug("Finished sync")
+
+    return jsonify(result)
@@ -0,0 +1,149 @@
+import os
+
+from irods.collection import iRODSCollection
+from irods.column import In
+from irods.exception import CollectionDoesNotExist
+from irods.models import Collection, CollectionMeta, DataObject
+
+# number of collection paths in one `in (...)` condition, GenQuery limits the length of its conditions
+batch_size = int(os.getenv("IRODS_LISTING_BATCH_SIZE", 50))
+
+
+def _batches(paths, size):
+    """Splits `paths` into lists of at most `size` paths, which can be used in an `in` condition.
+
+    GenQuery cannot escape quotes, so a path with a quote gets a batch on its own and is queried with `==`."""
+    batch = []
+    for path in paths:
+        if "'" in path:
+            yield [path]
+            continue
+        batch.append(path)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _where(column, paths):
+    return column == paths[0] if len(paths) == 1 else In(column, paths)
+
+
+class CollectionListing(object):
+    """Describes collections with a few bulk GenQuery queries instead of several queries per collection.
+
+    The collection rows, the ids of their data objects, their AVUs and the paths of their
+    subcollections are each fetched for a whole batch of collections and joined in memory.
+    The result has the same shape, which the per collection lookups of Irods.get_collection produced.
+
+        listing = CollectionListing(session)
+        listing.subcollections("/yoda/home", offset=0, limit=100)
+
+    Args:
+        session (iRODSSession): the session to query with.
+        batch_size (int, optional): number of collections per query. Defaults to IRODS_LISTING_BATCH_SIZE.
+    """
+
+    def __init__(self, session, batch_size=batch_size):
+        self.session = session
+        self.batch_size = batch_size
+
+    def subcollections(self, path, offset=0, limit=None):
+        """Returns the dicts of the subcollections of `path` ordered by path.
+
+        Args:
+            path (str): the parent collection.
+            offset (int, optional): number of subcollections to skip. Defaults to 0.
+            limit (int, optional): maximum number of subcollections to return. Defaults to None for all.
+        """
+        query = self.session.query(Collection).filter(Collection.parent_name == path).order_by(Collection.name)
+        if offset:
+            query = query.offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+
+        rows = []
+        for row in query.get_results():
+            if row[Collection.name] == "/":
+                continue
+            rows.append(row)
+            if limit is not None and len(rows) >= limit:
+                break
+        return self.describe(rows)
+
+    def pages(self, path, page_size=1000):
+        """Yields the subcollections of `path` in lists of at most `page_size` dicts."""
+        offset = 0
+        while True:
+            page = self.subcollections(path, offset=offset, limit=page_size)
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            offset += page_size
+
+    def collection(self, path):
+        """Returns the dict of the collection `path` itself, with an empty list of subcollections."""
+        rows = list(self.session.query(Collection).filter(Collection.name == path).get_results())
+        if not rows:
+            raise CollectionDoesNotExist(path)
+        return dict(self.describe(rows[:1], subcollections=False)[0], subcollections=[])
+
+    def describe(self, rows, subcollections=True):
+        paths = [row[Collection.name] for row in rows]
+        data_objects = self.data_object_ids(paths)
+        metadata = self.metadata(paths)
+        children = self.subcollection_paths(paths) if subcollections else {}
+
+        result = []
+        for row in rows:
+            col = iRODSCollection(self.session.collections, row)
+            result.append({'create_time' : str(col.create_time),
+                           'data_objects' : data_objects.get(col.path, []),
+                           'id' : col.id,
+                           'inheritance' : str(col.inheritance),
+                           'manager' : col.id,
+                           'metadata' : metadata.get(col.path, {}),
+                           'modify_time' : str(col.modify_time),
+                           'name' : str(col.name),
+                           'owner_name' : str(col.owner_name),
+                           'owner_zone' : str(col.owner_zone),
+                           'path' : str(col.path),
+                           'subcollections' : children.get(col.path, [])
+                           })
+        return result
+
+    def data_object_ids(self, paths):
+        """Returns {collection path: [data object id]}, every replica only once."""
+        result = {}
+        for batch in _batches(paths, self.batch_size):
+            query = self.session.query(DataObject.id, Collection.name).filter(_where(Collection.name, batch))
+            for row in query.get_results():
+                ids = result.setdefault(row[Collection.name], [])
+                if not ids or ids[-1] != row[DataObject.id]:
+                    ids.append(row[DataObject.id])
+        return result
+
+    def metadata(self, paths):
+        """Returns {collection path: {key: value}} with the first value of every key."""
+        result = {}
+        for batch in _batches(paths, self.batch_size):
+            query = self.session.query(Collection.name, CollectionMeta.name, CollectionMeta.value).filter(
+                _where(Collection.name, batch)
+            )
+            for row in query.get_results():
+                result.setdefault(row[Collection.name], {}).setdefault(row[CollectionMeta.name], row[CollectionMeta.value])
+        return result
+
+    def subcollection_paths(self, paths):
+        """Returns {collection path: [subcollection path]}."""
+        result = {}
+        for batch in _batches(paths, self.batch_size):
+            query = self.session.query(Collection.name, Collection.parent_name).filter(
+                _where(Collection.parent_name, batch)
+            )
+            for row in query.get_results():
+                if row[Collection.name] != "/":
+                    result.setdefault(row[Collection.parent_name], []).append(row[Collection.name])
+        return result
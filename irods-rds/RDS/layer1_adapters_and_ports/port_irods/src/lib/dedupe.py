@@ -0,0 +1,211 @@
+import base64
+import contextlib
+import hashlib
+import os
+import tempfile
+import threading
+
+from cachetools import TTLCache
+
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+# files, which are already in the project with the same name and checksum, are not uploaded again
+dedupe_enabled = os.getenv("UPLOAD_DEDUPE", "True") == "True"
+# the files of a project are looked up once for all files of a transfer, which arrive as separate requests
+manifest_ttl = float(os.getenv("UPLOAD_MANIFEST_TTL", 300))
+chunk_size = 1024 * 1024
+
+# notations of the checksum types of the backends as hashlib names
+_algorithms = {"md5": "md5", "sha-1": "sha1", "sha1": "sha1", "sha-256": "sha256", "sha256": "sha256",
+               "sha-512": "sha512", "sha512": "sha512"}
+
+
+def normalize_checksum(value, algorithm="md5"):
+    """Returns (hashlib name, hex digest) of a checksum or None, if it cannot be compared.
+
+    `value` is a hex digest of `algorithm` (e.g. "MD5", "SHA-256") or an iRODS checksum "sha2:<base64>"."""
+    if not value:
+        return None
+    if value.startswith("sha2:"):
+        return "sha256", base64.b64decode(value[len("sha2:"):]).hex()
+
+    name = _algorithms.get(str(algorithm).lower())
+    return (name, value.lower()) if name else None
+
+
+def skipped(size):
+    """The result of an upload, which was skipped, because the file is already in the project."""
+    return {"success": True, "skipped": True, "bytesSaved": size}
+
+
+
+def bytes_saved(result):
+    """Returns the bytes saved by the upload with the result `result`."""
+    return result.get("bytesSaved", 0) if isinstance(result, dict) else 0
+
+class Manifest(object):
+    """The files of a project by filename with their size and checksum.
+
+    Files are compared by their name without directories, because all backends store them this way.
+
+        manifest = Manifest([("a.csv", 10, ("md5", "..."))])
+        manifest.candidate("data/a.csv", size=10)
+    """
+
+    def __init__(self, files=()):
+        self._files = {}
+        self._lock = threading.Lock()
+        for name, size, checksum in files:
+            self.add(name, size, checksum)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._files.values())
+
+    def add(self, name, size, checksum):
+        if checksum is None:
+            return
+        with self._lock:
+            self._files.setdefault(os.path.basename(name), []).append((size, checksum))
+
+    def replace(self, name, size, checksum):
+        """Sets the file `name` after it was uploaded, a later upload of the same data is skipped."""
+        with self._lock:
+            self._files.pop(os.path.basename(name), None)
+        self.add(name, size, checksum)
+
+    def candidate(self, name, size=None):
+        """Returns the checksums of the files with the name of `name` and the size `size`, if it is known.
+
+        An upload of `name` has only to be hashed, if this list is not empty."""
+        with self._lock:
+            entries = list(self._files.get(os.path.basename(name), ()))
+        return [checksum for remote_size, checksum in entries if size is None or remote_size in (None, size)]
+
+
+class Manifests(object):
+    """Caches the manifest of every project for `ttl` seconds.
+
+    Args:
+        load (callable): returns the Manifest of a project.
+        ttl (float, optional): seconds a manifest is kept. Defaults to UPLOAD_MANIFEST_TTL.
+    """
+
+    def __init__(self, load, ttl=None, maxsize=64):
+        self.load = load
+        self._cache = TTLCache(maxsize=maxsize, ttl=manifest_ttl if ttl is None else ttl)
+        self._lock = threading.Lock()
+
+    def get(self, project):
+        with self._lock:
+            manifest = self._cache.get(project)
+        if manifest is None:
+            try:
+                manifest = self.load(project)
+            except Exception as e:
+                # without a manifest every file is uploaded, like before
+                log.error(f"Could not load the files of {project}: {e}")
+                return Manifest()
+            log.debug("loaded manifest", project=project, files=len(manifest))
+            with self._lock:
+                self._cache[project] = manifest
+        return manifest
+
+    def candidate(self, project, name, size=None):
+        """Returns the checksums of the files in `project`, which an upload of `name` may repeat.
+
+        The manifest is only loaded, if UPLOAD_DEDUPE is enabled."""
+        return self.get(project).candidate(name, size) if dedupe_enabled else []
+
+    def update(self, project, name, size=None, checksum=None):
+        """Sets the file `name` in the cached manifest of `project` after an upload.
+
+        Without a checksum the file is removed, so the next upload of `name` is not skipped by an old checksum."""
+        with self._lock:
+            manifest = self._cache.get(project)
+        if manifest is not None:
+            manifest.replace(name, size, checksum)
+
+    def invalidate(self, project):
+        with self._lock:
+            self._cache.pop(project, None)
+
+
+class HashedUpload(object):
+    """Copies `stream` into an anonymous temporary file and hashes it on the way.
+
+    Use it as a context manager, the file is deleted on exit.
+
+        with HashedUpload(stream, ["md5"]) as upload:
+            if upload.matches(checksums):
+                return skipped(upload.size)
+            send(upload.file)
+
+    Args:
+        stream (file-like): the data of the upload.
+        algorithms (iterable): hashlib names of the checksums to compute.
+        dir (str, optional): directory for the temporary file. Defaults to UPLOAD_SPOOL_DIR.
+    """
+
+    def __init__(self, stream, algorithms=("md5",), dir=None):
+        self.stream = stream
+        self.hashes = {name: hashlib.new(name) for name in set(algorithms)}
+        self.dir = dir or os.getenv("UPLOAD_SPOOL_DIR", None)
+        self.size = 0
+        self.file = None
+
+    def __enter__(self):
+        self.file = tempfile.TemporaryFile(dir=self.dir)
+        try:
+            while True:
+                chunk = self.stream.read(chunk_size)
+                if not chunk:
+                    break
+                for h in self.hashes.values():
+                    h.update(chunk)
+                self.file.write(chunk)
+                self.size += len(chunk)
+            self.file.seek(0)
+        except Exception:
+            self.file.close()
+            raise
+        return self
+
+    def __exit__(self, *args):
+        self.file.close()
+
+    def hexdigest(self, algorithm="md5"):
+        return self.hashes[algorithm].hexdigest()
+
+    def matches(self, checksums):
+        """Returns True, if the data has one of the `checksums` (hashlib name, hex digest)."""
+        return any(
+            name in self.hashes and self.hashes[name].hexdigest() == value for name, value in checksums
+        )
+
+
+@contextlib.contextmanager
+def dedupe(manifests, project, name, stream, size=None):
+    """Yields (file, bytes saved) for the upload of `stream` as `name` into `project`.
+
+    If the project has no file with this name (and size, if known), `stream` is yielded as it is and
+    streamed like before. Otherwise it is hashed into a temporary file first. If it has the checksum
+    of the file in the project, the file is None and the upload can be skipped.
+
+        with dedupe(manifests, project, name, stream) as (file, saved):
+            if file is None:
+                return skipped(saved)
+            send(file)
+    """
+    checksums = manifests.candidate(project, name, size)
+    if not checksums:
+        yield stream, None
+        return
+
+    with HashedUpload(stream, [algorithm for algorithm, _ in checksums]) as upload:
+        if upload.matches(checksums):
+            log.debug("file is already in the project, skip it", project=project, name=name, size=upload.size)
+            yield None, upload.size
+        else:
+            yield upload.file, None
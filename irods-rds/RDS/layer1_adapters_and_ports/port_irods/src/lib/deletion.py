@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.instrumentation import with_active_span
+from lib.logs import get_logger
+from lib.rate_limiter import sleep
+
+log = get_logger(__name__)
+
+# files of a project deleted at the same time
+delete_workers = int(os.getenv("DELETE_WORKERS", 16))
+# a failed deletion is tried again after DELETE_BACKOFF, 2 * DELETE_BACKOFF, ... seconds
+delete_retries = int(os.getenv("DELETE_RETRIES", 3))
+delete_backoff = float(os.getenv("DELETE_BACKOFF", 0.5))
+
+
+def delete_files(files, delete, workers=None, retries=None, backoff=None, sleep=sleep):
+    """Deletes `files` with at most `workers` deletions at the same time.
+
+    A deletion, which returns a falsy value or raises, is tried again up to `retries` times
+    with an exponential backoff. A failed file does not stop the deletion of the others.
+
+        results = delete_files(remote_files, lambda remote: backend.delete(remote.id))
+        all(result["success"] for result in results)
+
+    Args:
+        files (list): RemoteFile objects, see lib.sync.RemoteFile.
+        delete (callable): delete(remote) deletes a file, returns a truthy value on success.
+        workers (int, optional): deletions at the same time. Defaults to DELETE_WORKERS.
+        retries (int, optional): further tries of a failed deletion. Defaults to DELETE_RETRIES.
+        backoff (float, optional): seconds before the first retry. Defaults to DELETE_BACKOFF.
+        sleep (callable, optional): used to pause, tests pass a fake. Defaults to the sleep of gevent.
+
+    Returns:
+        list: one result for every file in the order of `files`, e.g. {"filename": "a.csv", "success": True}
+    """
+    retries = delete_retries if retries is None else retries
+    backoff = delete_backoff if backoff is None else backoff
+
+    def run(remote):
+        result = {"filename": remote.name, "success": False}
+        for attempt in range(retries + 1):
+            if attempt:
+                sleep(backoff * 2 ** (attempt - 1))
+            try:
+                if delete(remote):
+                    result["success"] = True
+                    result.pop("error", None)
+                    break
+                result["error"] = "Delete failed."
+            except Exception as e:
+                result["error"] = str(e) or type(e).__name__
+            log.debug("deletion failed", filename=remote.name, attempt=attempt, error=result["error"])
+
+        if not result["success"]:
+            log.error(f"Delete of {remote.name} failed: {result['error']}")
+        return result
+
+    files = list(files)
+    if not files:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers or delete_workers, len(files)))) as executor:
+        results = list(executor.map(with_active_span(run), files))
+    log.debug("deleted files", files=len(files), failed=sum(not result["success"] for result in results))
+    return results
@@ -0,0 +1,84 @@
+import copy
+import functools
+import json
+import os
+import threading
+
+from pyld import jsonld
+
+lib_dir = os.path.dirname(os.path.abspath(__file__))
+context_dir = os.path.join(lib_dir, "contexts")
+# published context documents in this directory are preferred over the bundled ones
+extra_context_dir = os.getenv("JSONLD_CONTEXT_DIR")
+# seconds until a context, which is not bundled, has to be loaded
+remote_context_timeout = float(os.getenv("JSONLD_CONTEXT_TIMEOUT", 10))
+
+# the published context documents, unchanged. A missing file is loaded from the network.
+bundled_contexts = {
+    "https://w3id.org/ro/crate/1.0/context": "ro-crate-1.0.jsonld",
+    "https://w3id.org/ro/crate/1.1/context": "ro-crate-1.1.jsonld",
+}
+
+remote_loader = jsonld.requests_document_loader(timeout=remote_context_timeout)
+_remote_documents = {}
+_remote_lock = threading.Lock()
+
+
+def _normalize(url):
+    url = url.strip().rstrip("/")
+    if url.startswith("http://"):
+        url = "https://" + url[len("http://"):]
+    return url
+
+
+@functools.lru_cache(maxsize=None)
+def _load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _context_path(filename):
+    for directory in (extra_context_dir, context_dir):
+        if directory is None:
+            continue
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _load_remote(url):
+    key = _normalize(url)
+    with _remote_lock:
+        if key not in _remote_documents:
+            _remote_documents[key] = remote_loader(url)["document"]
+        return _remote_documents[key]
+
+
+def document_loader(url, options=None):
+    """Document loader for pyld, which serves the bundled contexts without network access.
+
+    Any other document is loaded once per process with the requests loader of pyld,
+    a failure raises a JsonLdError. The documents are tagged static, so pyld keeps the
+    resolved contexts in its shared cache and does not ask the loader again."""
+    filename = bundled_contexts.get(_normalize(url))
+    path = _context_path(filename) if filename is not None else None
+    document = _load_json(path) if path is not None else _load_remote(url)
+
+    return {
+        "contentType": "application/ld+json",
+        "contextUrl": None,
+        "documentUrl": url,
+        "document": copy.deepcopy(document),
+        "tag": "static",
+    }
+
+
+def load_frame(filename):
+    """Returns a copy of the frame `filename` in lib, which is parsed only once per process."""
+    return copy.deepcopy(_load_json(os.path.join(lib_dir, filename)))
+
+
+def frame(data, frame_filename):
+    """Frames `data` with the frame `frame_filename` in lib, the contexts are loaded only once per process."""
+    return jsonld.frame(data, load_frame(frame_filename), options={"documentLoader": document_loader})
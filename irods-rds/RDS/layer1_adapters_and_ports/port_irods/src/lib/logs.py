@@ -0,0 +1,116 @@
+import logging
+import os
+import re
+
+# the level of all loggers, which have no level of their own in LOGLEVELS
+log_level = os.getenv("LOGLEVEL", "INFO").upper()
+# per module levels, e.g. "lib.transfer_jobs=DEBUG,urllib3=WARNING"
+module_levels = os.getenv("LOGLEVELS", "")
+# longer field values are cut, so a log line never holds a whole payload
+max_field_length = int(os.getenv("LOG_MAX_FIELD_LENGTH", 200))
+
+log_format = "%(asctime)s %(levelname)s %(name)s %(funcName)s: %(message)s%(fields)s"
+
+# values of these keys never reach the log; userId holds the password in port://user:password
+_secret_key = re.compile(r"(?i)key|token|password|secret|authorization|credential|userid")
+_logger_kwargs = ("exc_info", "stack_info", "stacklevel", "extra")
+
+
+def parse_levels(levels):
+    """Parses "name=LEVEL,name=LEVEL" into a dict. Entries without a level are skipped."""
+    parsed = {}
+    for entry in levels.split(","):
+        name, _, level = entry.partition("=")
+        if name.strip() and level.strip():
+            parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+def truncate(text, length=None):
+    length = max_field_length if length is None else length
+    if len(text) <= length:
+        return text
+    return f"{text[:length]}...({len(text)} chars)"
+
+
+def redact(value, key=None):
+    """Returns `value` with the values of all secret keys replaced, also in nested dicts and lists.
+
+    Long strings are truncated on the way, so a large payload is never copied as a whole."""
+    if key is not None and _secret_key.search(str(key)):
+        return "***"
+    if isinstance(value, str):
+        return truncate(value)
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    return value
+
+
+def _format(value, key):
+    value = redact(value, key)
+    # strings are truncated by redact already
+    return value if isinstance(value, str) else truncate(str(value))
+
+
+class Fields(object):
+    """Key value pairs of a log record, which are only formatted if the record is emitted.
+
+    Secrets are redacted and long values are truncated, e.g.
+    `apiKey=*** metadata={'title': 'My first upload', ...}`."""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return " ".join(f"{key}={_format(value, key)}" for key, value in self.fields.items())
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Logger, which takes the fields of a record as keyword arguments.
+
+        log.debug("upload file", path=path, size=size)
+
+    Nothing is formatted and no frame is inspected, if the level is not enabled."""
+
+    def __init__(self, logger):
+        super().__init__(logger, {})
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in _logger_kwargs}
+        if fields:
+            kwargs["extra"] = dict(kwargs.get("extra") or {}, fields=Fields(fields))
+        return msg, kwargs
+
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(name))
+
+
+class _FieldsFilter(logging.Filter):
+    """Renders the fields of a record after the message, records of other loggers have none."""
+
+    def filter(self, record):
+        fields = getattr(record, "fields", None)
+        if isinstance(fields, Fields):
+            record.fields = f" {fields}"
+        elif fields is None:
+            record.fields = ""
+        return True
+
+
+def configure(level=None, levels=None, handler=None):
+    """Sets up the root handler with the log format and the levels of LOGLEVEL and LOGLEVELS."""
+    handler = handler or logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(log_format))
+    handler.addFilter(_FieldsFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level or log_level)
+
+    for name, module_level in parse_levels(module_levels if levels is None else levels).items():
+        logging.getLogger(name).setLevel(module_level)
@@ -0,0 +1,155 @@
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from cachetools import LRUCache
+from prometheus_client import Histogram
+
+from lib.instrumentation import span
+from lib.logs import get_logger
+
+try:
+    # without monkey patching, time.sleep would block every greenlet of the worker
+    from gevent import sleep
+except ImportError:
+    from time import sleep
+
+log = get_logger(__name__)
+
+# "local" keeps the buckets in this process, "file" shares them between all workers on this host
+backend_name = os.getenv("RATE_LIMIT_BACKEND", "local")
+bucket_dir = os.getenv("RATE_LIMIT_DIR", "/tmp/rds-rate-limit")
+bucket_count = int(os.getenv("RATE_LIMIT_BUCKETS", 10000))
+default_burst = int(os.getenv("RATE_LIMIT_BURST", 5))
+
+rate_limiter_wait = Histogram(
+    "rate_limiter_wait_seconds",
+    "Time a request to the upstream service waited for a token of the rate limiter.",
+    ["host"],
+    buckets=(0, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf")),
+)
+
+
+def credential_hash(api_key):
+    return hashlib.sha256(str(api_key).encode("utf-8")).hexdigest()
+
+
+def host_of(address):
+    """Returns the host of the api address `address`, which may also be a bare hostname."""
+    return (urlsplit(address).netloc or str(address)).lower()
+
+
+def _take(tokens, updated, now, per_second, burst):
+    """Refills a bucket with `tokens` at `updated` until `now` and takes one token.
+
+    The token count may go below zero, then the caller has to wait until the tokens
+    it reserved are refilled. Returns the new token count and the seconds to wait."""
+    tokens = min(burst, tokens + (now - updated) * per_second) - 1
+    return tokens, max(0.0, -tokens / per_second)
+
+
+class LocalBackend(object):
+    """Keeps the buckets in memory, so they are shared by all requests of this process."""
+
+    def __init__(self, maxsize=bucket_count):
+        # an evicted bucket starts full again, which only allows one more burst
+        self._buckets = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def reserve(self, key, per_second, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens, wait = _take(tokens, updated, now, per_second, burst)
+            self._buckets[key] = (tokens, now)
+        return wait
+
+
+class FileBackend(object):
+    """Keeps every bucket in a small json file in `directory`, which is locked while
+    a token is taken. So all workers on this host share the same buckets."""
+
+    def __init__(self, directory=bucket_dir):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def reserve(self, key, per_second, burst):
+        path = os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+        with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), "r+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                try:
+                    state = json.load(f)
+                    tokens, updated = state["tokens"], state["updated"]
+                except ValueError:
+                    tokens, updated = burst, now
+
+                tokens, wait = _take(tokens, updated, now, per_second, burst)
+                f.seek(0)
+                f.truncate()
+                json.dump({"tokens": tokens, "updated": now}, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+
+
+class RateLimiter(object):
+    """Token bucket rate limiter with one bucket for every upstream host and api key.
+
+    A bucket holds up to `burst` tokens and is refilled with `per_second` tokens per second.
+    Every request takes one token and waits cooperatively, if the bucket is empty."""
+
+    def __init__(self, backend=None, sleep=sleep):
+        self.backend = backend if backend is not None else LocalBackend()
+        self.sleep = sleep
+
+    @staticmethod
+    def key(host, api_key):
+        return f"{host}|{credential_hash(api_key)}"
+
+    def acquire(self, address, api_key, per_second=1, burst=default_burst):
+        """Takes one token for `api_key` on `address`. Returns the seconds it waited for it."""
+        host = host_of(address)
+        wait = self.backend.reserve(self.key(host, api_key), per_second, burst)
+        rate_limiter_wait.labels(host).observe(wait)
+
+        if wait > 0:
+            log.debug("rate limiter wait for %ss", wait)
+            with span("rate limiter wait", **{"peer.hostname": host, "wait": wait}):
+                self.sleep(wait)
+        return wait
+
+
+def create_backend(name=backend_name):
+    if name == "file":
+        return FileBackend()
+    if name != "local":
+        log.warning("Unknown rate limit backend %s, use local instead.", name)
+    return LocalBackend()
+
+
+limiter = RateLimiter(create_backend())
+
+
+def rate_limit(func=None, per_second=1, burst=default_burst, address=None):
+    """Limit number of requests made per second to the api of the instance.
+
+    The instance has to provide `api_key` and the api address in the attribute `address`.
+    All instances with the same api address and key share one bucket."""
+
+    if not func:
+        return functools.partial(rate_limit, per_second=per_second, burst=burst, address=address)
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        limiter.acquire(getattr(self, address), self.api_key, per_second=per_second, burst=burst)
+        return func(self, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,229 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from irods.exception import NetworkException
+from irods.session import iRODSSession
+from prometheus_client import Histogram
+
+from lib.instrumentation import span
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+max_per_user = int(os.getenv("IRODS_SESSION_MAX_PER_USER", 4))
+idle_timeout = float(os.getenv("IRODS_SESSION_IDLE_TIMEOUT", 300))
+health_check_interval = float(os.getenv("IRODS_SESSION_HEALTH_CHECK_INTERVAL", 30))
+acquire_timeout = float(os.getenv("IRODS_SESSION_ACQUIRE_TIMEOUT", 300))
+
+session_setup = Histogram(
+    "irods_session_setup_seconds",
+    "Time to create a new iRODS session and open its first authenticated connection.",
+    ["host"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf")),
+)
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+def credential_hash(password):
+    return hashlib.sha256(str(password).encode("utf-8")).hexdigest()
+
+
+def ping(session):
+    """Cheap round-trip to the catalog, which fails if the connection or the login is not usable anymore."""
+    session.collections.get(f"/{session.zone}")
+
+
+def connect(session):
+    """Opens and authenticates the first connection of a new session.
+
+    python-irodsclient would connect lazily on the first call, so the setup time would
+    be hidden in the latency of that call."""
+    with session.pool.get_connection():
+        pass
+
+
+class _Bucket(object):
+    """Idle sessions and the limit of live sessions for one pool key."""
+
+    def __init__(self, max_size):
+        self.idle = []
+        self.users = 0
+        self.semaphore = threading.BoundedSemaphore(max_size)
+
+
+class _Entry(object):
+    def __init__(self, session):
+        self.session = session
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+
+
+class SessionPool(object):
+    """Keeps authenticated iRODS sessions for reuse across requests.
+
+    Sessions are keyed by (host, zone, user, sha256 of the password), so a session is
+    only ever handed out for the credentials it was authenticated with. A session is
+    checked out exclusively by one caller at a time, so greenlets and threads never
+    share a session concurrently. The locks are the threading ones, which become
+    cooperative when gevent has monkey patched the process.
+
+        with session_pool.session(host=host, port=1247, user=user, password=key, zone=zone) as session:
+            session.collections.get(path)
+
+    Args:
+        factory (callable, optional): creates a new session from the keyword arguments. Defaults to iRODSSession.
+        max_per_user (int, optional): live sessions per key. Further callers wait for a free session.
+        idle_timeout (float, optional): seconds after which an unused session is closed.
+        health_check_interval (float, optional): an idle session, which was not used for this many seconds, is pinged before it is handed out again.
+        health_check (callable, optional): called with the session, raises if it is not usable. Defaults to `ping`.
+        connect (callable, optional): called with a new session to open its first connection, e.g. `connect`.
+            Defaults to None, then the session connects on its first call.
+        acquire_timeout (float, optional): seconds to wait for a free session before `PoolExhausted` is raised.
+    """
+
+    def __init__(self, factory=iRODSSession, max_per_user=max_per_user, idle_timeout=idle_timeout,
+                 health_check_interval=health_check_interval, health_check=ping, acquire_timeout=acquire_timeout,
+                 connect=None):
+        self.factory = factory
+        self.max_per_user = max_per_user
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check = health_check
+        self.acquire_timeout = acquire_timeout
+        self.connect = connect
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(host=None, zone=None, user=None, password=None, **kwargs):
+        return (host, zone, user, credential_hash(password))
+
+    @contextmanager
+    def session(self, **kwargs):
+        """Checks out a session for the given iRODSSession arguments and returns it to the pool afterwards.
+
+        A session, which raised a network error, is closed instead of being returned."""
+        key = self.key(**kwargs)
+        bucket = self._bucket(key)
+
+        try:
+            if not bucket.semaphore.acquire(timeout=self.acquire_timeout):
+                raise PoolExhausted(f"no free irods session for {key[2]}@{key[0]} after {self.acquire_timeout}s")
+        except BaseException:
+            self._leave(bucket)
+            raise
+
+        try:
+            entry = self._checkout(bucket) or self._create(**kwargs)
+            try:
+                yield entry.session
+            except (NetworkException, OSError):
+                self._close(entry)
+                raise
+            except BaseException:
+                self._checkin(bucket, entry)
+                raise
+            else:
+                self._checkin(bucket, entry)
+        finally:
+            bucket.semaphore.release()
+            self._leave(bucket)
+            self.evict_idle()
+
+    def _bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = _Bucket(self.max_per_user)
+            bucket.users += 1
+            return bucket
+
+    def _leave(self, bucket):
+        with self._lock:
+            bucket.users -= 1
+
+    def _checkout(self, bucket):
+        while True:
+            with self._lock:
+                if not bucket.idle:
+                    return None
+                entry = bucket.idle.pop()
+
+            now = time.monotonic()
+            if now - entry.last_used > self.idle_timeout:
+                self._close(entry)
+                continue
+
+            if now - entry.last_checked > self.health_check_interval:
+                try:
+                    self.health_check(entry.session)
+                except Exception as e:
+                    log.debug("discard irods session, health check failed: %s", e)
+                    self._close(entry)
+                    continue
+                entry.last_checked = now
+
+            return entry
+
+    def _create(self, **kwargs):
+        start = time.monotonic()
+        with span("irods session setup", **{"peer.hostname": kwargs.get("host")}):
+            session = self.factory(**kwargs)
+            if self.connect is not None:
+                try:
+                    self.connect(session)
+                except BaseException:
+                    session.cleanup()
+                    raise
+        session_setup.labels(kwargs.get("host")).observe(time.monotonic() - start)
+        return _Entry(session)
+
+    def _checkin(self, bucket, entry):
+        entry.last_used = entry.last_checked = time.monotonic()
+        with self._lock:
+            bucket.idle.append(entry)
+
+    def _close(self, entry):
+        try:
+            entry.session.cleanup()
+        except Exception as e:
+            log.debug("cleanup of irods session failed: %s", e)
+
+    def evict_idle(self):
+        """Closes all sessions, which were idle longer than `idle_timeout`."""
+        deadline = time.monotonic() - self.idle_timeout
+        expired = []
+        with self._lock:
+            for bucket in self._buckets.values():
+                expired.extend(entry for entry in bucket.idle if entry.last_used < deadline)
+                bucket.idle = [entry for entry in bucket.idle if entry.last_used >= deadline]
+            self._buckets = {
+                key: bucket for key, bucket in self._buckets.items() if bucket.idle or bucket.users
+            }
+
+        for entry in expired:
+            self._close(entry)
+        return len(expired)
+
+    def idle_count(self, **kwargs):
+        with self._lock:
+            bucket = self._buckets.get(self.key(**kwargs))
+            return len(bucket.idle) if bucket is not None else 0
+
+    def close(self):
+        """Closes all idle sessions."""
+        with self._lock:
+            entries = [entry for bucket in self._buckets.values() for entry in bucket.idle]
+            self._buckets = {}
+
+        for entry in entries:
+            self._close(entry)
+
+
+session_pool = SessionPool(connect=connect)
@@ -0,0 +1,257 @@
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort
+
+from lib.batch import BatchFile, _size, check_path
+from lib.dedupe import normalize_checksum
+from lib.deletion import delete_files
+from lib.instrumentation import with_active_span
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+# replacements and deletions applied at the same time, the adds use BATCH_UPLOAD_WORKERS
+sync_workers = int(os.getenv("SYNC_WORKERS", 8))
+
+
+class RemoteFile(object):
+    """A file in the project of the backend.
+
+    Args:
+        name (str): filename in the project.
+        size (int, optional): size in bytes, if known. Defaults to None.
+        checksum (tuple, optional): (hashlib name, hex digest), see lib.dedupe.normalize_checksum. Defaults to None.
+        id (optional): what the backend needs to replace or delete the file, e.g. its file id. Defaults to None.
+    """
+
+    def __init__(self, name, size=None, checksum=None, id=None):
+        self.name = name
+        self.size = size
+        self.checksum = checksum
+        self.id = id
+
+
+class SyncEntry(object):
+    """A file, which the project has after the sync.
+
+    Args:
+        path (str): path of the file, the project stores it by the name without directories.
+        size (int, optional): size in bytes. Defaults to None.
+        checksum (tuple, optional): (hashlib name, hex digest). Defaults to None.
+    """
+
+    def __init__(self, path, size=None, checksum=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = size
+        self.checksum = checksum
+
+
+class SyncPlan(object):
+    """The changes, which make the project equal to the manifest, see diff."""
+
+    def __init__(self):
+        self.add = []
+        self.replace = []
+        self.delete = []
+        self.unchanged = []
+
+    def summary(self):
+        return {
+            "add": [entry.path for entry in self.add],
+            "replace": [entry.path for entry, _ in self.replace],
+            "delete": [remote.name for remote in self.delete],
+            "unchanged": len(self.unchanged),
+        }
+
+
+def parse_checksum(value):
+    """Returns (hashlib name, hex digest) of "md5:<hex>", "sha256:<hex>", iRODS "sha2:<base64>" or a md5 as hex."""
+    if not value:
+        return None
+    if value.startswith("sha2:"):
+        return normalize_checksum(value)
+    algorithm, _, digest = value.rpartition(":")
+    return normalize_checksum(digest, algorithm or "md5")
+
+
+def parse_manifest(entries):
+    """Returns the SyncEntry of every entry of a json manifest [{"path": ..., "size": ..., "checksum": ...}].
+
+    Aborts with 400, if the manifest is no list of entries with a relative path (see lib.batch.check_path)
+    or has two files with the same name."""
+    if isinstance(entries, str):
+        try:
+            entries = json.loads(entries)
+        except ValueError:
+            abort(400, "manifest is no valid json.")
+    if not isinstance(entries, list):
+        abort(400, "manifest has to be a list of files.")
+
+    result, names = [], set()
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("path"):
+            abort(400, "Every file of the manifest needs a path.")
+        result.append(SyncEntry(check_path(entry["path"]), entry.get("size"), parse_checksum(entry.get("checksum"))))
+        if result[-1].name in names:
+            abort(400, f"{entry['path']} has the same filename as another file of the manifest.")
+        names.add(result[-1].name)
+    return result
+
+
+def sync_request(request):
+    """Returns (entries, files, dry_run) of a sync request.
+
+    The manifest lists all files, which the project has after the sync. It is the field `manifest`
+    of a multipart form, which has the files for the adds and replacements as `files` parts or in
+    a zip file `archive`, or the key `manifest` of a json body without files. `files` maps the
+    paths to BatchFile objects. With `dryRun` the changes are only returned, so a client can send
+    just the files, which are needed.
+    """
+    files = {}
+    if request.mimetype == "multipart/form-data":
+        form = request.form.to_dict()
+        manifest = form.get("manifest")
+        dry_run = form.get("dryRun", "false").lower() == "true"
+
+        archive = request.files.get("archive")
+        if archive is not None:
+            try:
+                bundle = zipfile.ZipFile(archive.stream)
+            except zipfile.BadZipFile:
+                abort(400, "archive is not a zip file.")
+            for info in bundle.infolist():
+                if not info.is_dir():
+                    files[check_path(info.filename)] = BatchFile(info.filename, bundle.open(info), info.file_size)
+        for f in request.files.getlist("files"):
+            files[check_path(f.filename)] = BatchFile(f.filename, f.stream, _size(f.stream))
+    else:
+        body = request.get_json(force=True, silent=True) or {}
+        manifest = body.get("manifest")
+        dry_run = bool(body.get("dryRun", False))
+
+    if manifest is None:
+        abort(400, "No manifest given.")
+    return parse_manifest(manifest), files, dry_run
+
+
+def _same(entry, remote):
+    if entry.size is not None and remote.size is not None and entry.size != remote.size:
+        return False
+    # without comparable checksums the file cannot be proven to be unchanged
+    return entry.checksum is not None and entry.checksum == remote.checksum
+
+
+def diff(entries, remote_files):
+    """Compares the manifest `entries` with the files in the project by filename.
+
+    A file of the manifest, which is not in the project, is added. A file with another size or
+    checksum is replaced. Files of the project, which are not in the manifest, and further
+    files with the name of one in the manifest are deleted.
+
+    Returns:
+        SyncPlan: the changes
+    """
+    remote = {}
+    for f in remote_files:
+        remote.setdefault(f.name, []).append(f)
+
+    plan = SyncPlan()
+    for entry in entries:
+        existing = remote.pop(entry.name, [])
+        if not existing:
+            plan.add.append(entry)
+            continue
+
+        same = [f for f in existing if _same(entry, f)]
+        if same:
+            plan.unchanged.append(entry)
+            keep = same[0]
+        else:
+            plan.replace.append((entry, existing[0]))
+            keep = existing[0]
+        plan.delete.extend(f for f in existing if f is not keep)
+
+    for existing in remote.values():
+        plan.delete.extend(existing)
+    return plan
+
+
+def apply(plan, files, add, replace, delete, workers=None, delete_all=None):
+    """Applies `plan` with the files of the request.
+
+    Deletions run first with retries (see lib.deletion.delete_files), then replacements, each with
+    at most `workers` at the same time. The files to add are passed to `add` at once, so the
+    connector can use its batch upload.
+
+    Args:
+        plan (SyncPlan): the changes, see diff.
+        files (dict): path -> BatchFile with the data of the adds and replacements.
+        add (callable): add(batch_files) uploads new files and returns results like lib.batch.run_batch.
+        replace (callable): replace(remote, batch_file) replaces a RemoteFile, returns a truthy value on success.
+        delete (callable): delete(remote) deletes a RemoteFile, returns a truthy value on success.
+        workers (int, optional): replacements and deletions at the same time. Defaults to SYNC_WORKERS.
+        delete_all (callable, optional): delete_all(remotes, workers) deletes the RemoteFiles and returns
+            results like lib.deletion.delete_files, for connectors, which must not start all deletions at
+            once. Defaults to delete_files with `delete`.
+
+    Returns:
+        list: one result for every change, e.g. {"filename": "a.csv", "action": "replace", "success": True}
+    """
+    def data(entry):
+        return files.get(entry.path) or files.get(entry.name)
+
+    def run(job):
+        action, filename, change = job
+        result = {"filename": filename, "action": action, "success": False}
+        try:
+            result["success"] = bool(change())
+            if not result["success"]:
+                result["error"] = f"{action.capitalize()} failed."
+        except Exception as e:
+            log.error(f"{action.capitalize()} of {filename} failed: {e}")
+            result["error"] = str(e) or type(e).__name__
+        return result
+
+    if delete_all is None:
+        delete_all = lambda remotes, workers: delete_files(remotes, delete, workers)
+    results = [dict(result, action="delete") for result in delete_all(plan.delete, workers or sync_workers)]
+    jobs = []
+    for entry, remote in plan.replace:
+        batch_file = data(entry)
+        if batch_file is None:
+            results.append({"filename": entry.path, "action": "replace", "success": False,
+                            "error": "File not found in the request."})
+            continue
+        jobs.append(("replace", entry.path, lambda remote=remote, batch_file=batch_file: replace(remote, batch_file)))
+
+    if jobs:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers or sync_workers, len(jobs)))) as executor:
+            results.extend(executor.map(with_active_span(run), jobs))
+
+    batch_files = []
+    for entry in plan.add:
+        # a missing file is reported by run_batch
+        batch_file = data(entry)
+        batch_files.append(BatchFile(entry.path, batch_file.file, batch_file.size) if batch_file else BatchFile(entry.path, None))
+    if batch_files:
+        results.extend(dict(result, action="add") for result in add(batch_files))
+    return results
+
+
+def sync(entries, remote_files, files, add, replace, delete, dry_run=False, workers=None, delete_all=None):
+    """Makes the project equal to the manifest `entries`, see diff and apply.
+
+    Returns:
+        dict: the response of the sync endpoint, the changes and with dry_run=False the result of every change
+    """
+    plan = diff(entries, remote_files)
+    log.debug("sync plan", add=len(plan.add), replace=len(plan.replace), delete=len(plan.delete),
+              unchanged=len(plan.unchanged), dry_run=dry_run)
+
+    results = [] if dry_run else apply(plan, files, add, replace, delete, workers, delete_all)
+    return dict(
+        plan.summary(), success=all(result["success"] for result in results), dryRun=dry_run, files=results)
@@ -0,0 +1,98 @@
+import base64
+import os
+import tempfile
+
+from irods import keywords as kw
+from lib.hashing import HashingTee
+from lib.logs import get_logger
+
+log = get_logger(__name__)
+
+# objects of at least this size are put with parallel transfer threads,
+# python-irodsclient itself only parallelizes objects larger than 32 MB
+parallel_threshold = int(os.getenv("IRODS_PARALLEL_THRESHOLD", 32 * 1024 * 1024))
+transfer_threads = int(os.getenv("IRODS_TRANSFER_THREADS", 4))
+upload_spool_dir = os.getenv("IRODS_UPLOAD_SPOOL_DIR")
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+def expected_checksum(checksum, tee):
+    """Returns the checksum of the data read through `tee` in the notation of the registered `checksum`.
+
+    iRODS registers either "sha2:<base64 sha256>" or the md5 as hex, depending on its hash scheme."""
+    if checksum.startswith("sha2:"):
+        return "sha2:" + base64.b64encode(tee.digest("sha256")).decode("ascii")
+    return tee.hexdigest("md5")
+
+
+def verify(session, target, tee):
+    """Compares the checksum, which iRODS registered for `target`, with the data read through `tee`."""
+    checksum = session.data_objects.get(target).checksum
+    if not checksum:
+        raise ChecksumMismatch(f"no checksum registered for {target}")
+
+    expected = expected_checksum(checksum, tee)
+    if checksum != expected:
+        raise ChecksumMismatch(f"checksum of {target} is {checksum}, expected {expected}")
+    return checksum
+
+
+def put_stream(session, stream, target, size=None, threshold=None, threads=None, spool_dir=None, call=None,
+               overwrite=False):
+    """Writes `stream` to the data object `target` and verifies the checksum, which iRODS registers.
+
+    If `size` is known and below `threshold`, the stream is written through a single data object
+    handle, so it never touches the local disk. Otherwise the stream is spooled to a temporary
+    file, because the parallel transfer threads need random access to the data, and put with
+    `threads` threads, if the object reaches `threshold`.
+
+    Args:
+        session (iRODSSession): the session to transfer with.
+        stream (file-like): the data, e.g. the file of the request.
+        target (str): path of the data object.
+        size (int, optional): upper bound of the size, e.g. the content length of the request. Defaults to None.
+        threshold (int, optional): size from which parallel transfer is used. Defaults to IRODS_PARALLEL_THRESHOLD.
+        threads (int, optional): number of transfer threads. Defaults to IRODS_TRANSFER_THREADS.
+        spool_dir (str, optional): directory for the temporary file. Defaults to IRODS_UPLOAD_SPOOL_DIR.
+        call (UpstreamCall, optional): counts the bytes sent, see lib/instrumentation.py. Defaults to None.
+        overwrite (bool, optional): Set to True will overwrite an existing data object in place. Defaults to False.
+
+    Returns:
+        str: the registered checksum
+    """
+    threshold = parallel_threshold if threshold is None else threshold
+    threads = transfer_threads if threads is None else threads
+    options = {kw.REG_CHKSUM_KW: ""}
+    if overwrite:
+        options[kw.FORCE_FLAG_KW] = ""
+    tee = HashingTee(stream, algorithms=("md5", "sha256"))
+
+    if size is not None and size < threshold:
+        with session.data_objects.open(target, "w", **options) as f:
+            tee.copy_to(f)
+    else:
+        with tempfile.NamedTemporaryFile(dir=spool_dir or upload_spool_dir) as spool:
+            tee.copy_to(spool)
+            spool.flush()
+            num_threads = threads if tee.size >= threshold else 1
+            log.debug("put %s bytes to %s with %s threads", tee.size, target, num_threads)
+            session.data_objects.put(spool.name, target, num_threads=num_threads, **options)
+
+    if call is not None:
+        call.sent(tee.size)
+    return verify(session, target, tee)
+
+
+def put_file(session, local_path, target, threshold=None, threads=None):
+    """Puts the local file `local_path` to `target` and verifies the registered checksum."""
+    threshold = parallel_threshold if threshold is None else threshold
+    threads = transfer_threads if threads is None else threads
+
+    num_threads = threads if os.path.getsize(local_path) >= threshold else 1
+    session.data_objects.put(local_path, target, num_threads=num_threads, **{kw.REG_CHKSUM_KW: ""})
+
+    with open(local_path, "rb") as f:
+        return verify(session, target, HashingTee(f, algorithms=("md5", "sha256")).drain())
@@ -1,11 +1,21 @@
-import inspect
+import contextlib
 import os
-import logging
 from flask import abort
-import functools
 import time
-from irods.session import iRODSSession
 from irods.meta import iRODSMeta
+from irods.exception import iRODSException, NetworkException
+from irods.models import Collection, DataObject
+from lib.session_pool import session_pool, ping
+from lib.collection_listing import CollectionListing
+from lib.transfer import put_stream, put_file, ChecksumMismatch
+from lib.rate_limiter import rate_limit
+from lib.token_cache import checked_tokens
+from lib.batch import run_batch
+from lib.dedupe import Manifest, Manifests, dedupe, normalize_checksum, skipped
+from lib.deletion import delete_files
+from lib.sync import RemoteFile, sync
+from lib.instrumentation import upstream_call
+from lib.logs import get_logger
 
 ssl_settings = {'client_server_negotiation': 'request_server_negotiation',
                 'client_server_policy': 'CS_NEG_REQUIRE',
@@ -18,33 +28,7 @@ ssl_settings = {'client_server_negotiation': 'request_server_negotiation',
 zone = os.getenv("ZONE", "yoda")
 folder = os.getenv("BASE_FOLDER", 'research-surfbasic')
 
-log = logging.getLogger()
-
-def _rate_limit(func=None, per_second=1):
-    """Limit number of requests made per second.
-
-    Will sleep for 1/``per_second`` seconds if the last request was
-    made too recently.
-    """
-
-    if not func:
-        return functools.partial(_rate_limit, per_second=per_second)
-
-    @functools.wraps(func)
-    def wrapper(self, *args, **kwargs):
-        if hasattr(self, "last_request") and self.last_request is not None:
-            now = time.time()
-            delta = now - self.last_request
-            if delta < (1 / per_second):
-                waittimer = (1 / per_second) - delta
-                log.debug("rate limiter wait for {}ms", waittimer)
-                time.sleep(waittimer)
-
-        self.last_request = time.time()
-        return func(self, *args, **kwargs)
-
-    return wrapper
-
+log = get_logger(__name__)
 
 class Irods(object):
 
@@ -57,6 +41,8 @@ class Irods(object):
 
         self.api_key = api_key
         self.user = user
+        # the data objects of a collection are looked up once for all uploads of a transfer
+        self.manifests = Manifests(self.file_manifest)
 
         # monkeypatching all functions with internals
         self.get_collection = self.get_collection_internal
@@ -69,6 +55,21 @@ class Irods(object):
             self.delete_all_files_from_collection_internal
         )
 
+    def session(self):
+        """Checks out a pooled session for the credentials of this instance.
+
+        Use it as a context manager, the session goes back to the pool afterwards."""
+        return session_pool.session(host=self.irods_api_address,
+                                    port=1247,
+                                    user=self.user,
+                                    password=self.api_key,
+                                    zone=zone,
+                                    authentication_scheme='pam',
+                                    **ssl_settings)
+
+    def call(self, method, endpoint):
+        """Measures and traces one call to iRODS, e.g. `with self.call("get", "collections"):`"""
+        return upstream_call(self.irods_api_address, method, endpoint, component="python-irodsclient")
 
     @classmethod
     def get_collection(cls, api_key, *args, **kwargs):
@@ -110,15 +111,27 @@ class Irods(object):
 
         Returns `True` if the token is correct and usable, otherwise `False`."""
         log.debug("Check token: Starts")
+        irods = cls(api_key, *args, **kwargs)
+        return checked_tokens.check((irods.irods_api_address, irods.user, api_key), irods.probe_token)
+
+    def probe_token(self):
+        """Logs in with a pooled session and pings the catalog. This call changes nothing.
+
+        Returns `True` if the login works, `False` if iRODS rejects it.
+        Raises on network errors, so they are not cached as invalid."""
         try:
-            r = cls(api_key, *args, **kwargs).get_collection()
-            return True
-        except:
+            with self.session() as session, self.call("ping", "collections"):
+                ping(session)
+        except NetworkException:
+            raise
+        except iRODSException as e:
+            log.debug("Check Token: %s", type(e).__name__)
             return False
+        return True
 
-    @_rate_limit(per_second=5)
+    @rate_limit(per_second=5, address="irods_api_address")
     def get_collection_internal(
-        self, path: str = None, metadataFilter: dict = None
+        self, path: str = None, metadataFilter: dict = None, offset: int = 0, limit: int = None
     ):
         """Get all collections for the account, which owns the api-key.
 
@@ -126,64 +139,26 @@ class Irods(object):
             path (str, optional): The collection path. Defaults to None.
             metadataFilter (dict, optional): filter for selecting what data needs to returned. Defaults to None.
                                                 Currently not implemented.
+            offset (int, optional): number of sub collections to skip. Defaults to 0.
+            limit (int, optional): maximum number of sub collections to return. Defaults to None for all.
 
         Returns:
-            list: : List of paths of sub collections if return_response is set to True
+            list: : List of the sub collections or the collection itself, if it has no sub collections
         """
-        log.debug(
-            f"Entering at lib/upload_irods.py {inspect.getframeinfo(inspect.currentframe()).function}")
-        log.debug(
-            f"get collections from irods, path? {path}, metadata? {metadataFilter}"
-        )
+        log.debug("Entering at lib/upload_irods.py get_collection_internal")
+        log.debug("get collections from irods, path? %s, metadata? %s", path, metadataFilter)
 
         if path is None:
             path = f"/{zone}/home"
 
-        with iRODSSession(host=self.irods_api_address,
-                            port=1247,
-                            user=self.user,
-                            password=self.api_key,
-                            zone=zone,
-                            authentication_scheme='pam',
-                            **ssl_settings) as session:
-            
-            
-            coll = session.collections.get(path)
+        with self.session() as session, self.call("query", "collections"):
+            listing = CollectionListing(session)
+            available_collections = listing.subcollections(path, offset=offset, limit=limit)
 
-            if len(coll.subcollections) > 0:
-                available_collections = []
-                for col in coll.subcollections:                       
-                    available_collection = {'create_time' : str(col.create_time),
-                                            'data_objects' : [data_object.id for data_object in col.data_objects],
-                                            'id' : col.id,
-                                            'inheritance' : str(col.inheritance),
-                                            'manager' : col.manager.get(col.path).id,
-                                            'metadata' : {key : col.metadata.get_all(key)[0].value for key in col.metadata.keys()},
-                                            'modify_time' : str(col.modify_time),
-                                            'name' : str(col.name),
-                                            'owner_name' : str(col.owner_name),
-                                            'owner_zone' : str(col.owner_zone),
-                                            'path' : str(col.path),
-                                            'subcollections' : [col.path for col in col.subcollections]
-                                            }
-                    available_collections.append(available_collection)
+            if len(available_collections) > 0 or offset > 0:
                 return available_collections
-            else:
-                available_collection = {'create_time' : str(coll.create_time),
-                                            'data_objects' : [data_object.id for data_object in coll.data_objects],
-                                            'id' : coll.id,
-                                            'inheritance' : str(coll.inheritance),
-                                            'manager' : coll.manager.get(coll.path).id,
-                                            'metadata' : {key : coll.metadata.get_all(key)[0].value for key in coll.metadata.keys()},
-                                            'modify_time' : str(coll.modify_time),
-                                            'name' : str(coll.name),
-                                            'owner_name' : str(coll.owner_name),
-                                            'owner_zone' : str(coll.owner_zone),
-                                            'path' : str(coll.path),
-                                            'subcollections' : []
-                                            }
-                return available_collection
-            
+            return listing.collection(path)
+
     def create_new_collection_internal(self, metadata:dict = None):
         """Creates a new untitled collection.
         If metadata is specified, it will changes metadata after creating.
@@ -194,8 +169,7 @@ class Irods(object):
         Returns:
             json: API response
         """
-        log.debug(
-            f"Entering at lib/upload_irods.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_irods.py create_new_collection_internal")
         log.debug("Create new collection: Starts")
 
         if metadata is not None and 'Title' in metadata:
@@ -204,32 +178,25 @@ class Irods(object):
         else:
             path = f"/{zone}/home/{folder}/untitled-{str(time.time()).replace('.','')}"
 
-        with iRODSSession(host=self.irods_api_address,
-                            port=1247,
-                            user=self.user,
-                            password=self.api_key,
-                            zone=zone,
-                            authentication_scheme='pam',
-                            **ssl_settings) as session:
+        with self.session() as session, self.call("create", "collections"):
             coll = session.collections.create(path)
 
-          
-        available_collection = {'create_time' : str(coll.create_time),
-                                'data_objects' : [data_object.id for data_object in coll.data_objects],
-                                'id' : coll.id,
-                                'inheritance' : str(coll.inheritance),
-                                'manager' : coll.manager.get(coll.path).id,
-                                'metadata' : {key : coll.metadata.get_all(key)[0].value for key in coll.metadata.keys()},
-                                'modify_time' : str(coll.modify_time),
-                                'name' : str(coll.name),
-                                'owner_name' : str(coll.owner_name),
-                                'owner_zone' : str(coll.owner_zone),
-                                'path' : str(coll.path),
-                                'subcollections' : [coll.path for col in coll.subcollections]
-                                }
-
-
-        log.debug(f"Metadata: {metadata}")
+            available_collection = {'create_time' : str(coll.create_time),
+                                    'data_objects' : [data_object.id for data_object in coll.data_objects],
+                                    'id' : coll.id,
+                                    'inheritance' : str(coll.inheritance),
+                                    'manager' : coll.manager.get(coll.path).id,
+                                    'metadata' : {key : coll.metadata.get_all(key)[0].value for key in coll.metadata.keys()},
+                                    'modify_time' : str(coll.modify_time),
+                                    'name' : str(coll.name),
+                                    'owner_name' : str(coll.owner_name),
+                                    'owner_zone' : str(coll.owner_zone),
+                                    'path' : str(coll.path),
+                                    'subcollections' : [coll.path for col in coll.subcollections]
+                                    }
+
+
+        log.debug("Metadata: %s", metadata)
         if metadata is not None and isinstance(metadata, dict):
             log.debug(metadata)
             self.change_metadata_in_collection_internal(
@@ -247,16 +214,9 @@ class Irods(object):
         Returns:
             json: API response
         """
-        log.debug(
-            f"Entering at lib/upload_irods.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_irods.py remove_collection_internal")
         try:
-            with iRODSSession(host=self.irods_api_address,
-                                port=1247,
-                                user=self.user,
-                                password=self.api_key,
-                                zone=zone,
-                                authentication_scheme='pam',
-                                **ssl_settings) as session:
+            with self.session() as session, self.call("remove", "collections"):
                 r = session.collections.remove(path=path)
             if r is None:
                 return True
@@ -264,42 +224,167 @@ class Irods(object):
             return False
 
     def upload_new_file_to_collection_internal(
-        self, path, path_to_file, file=None, test=False
+        self, path, path_to_file, file=None, test=False, size=None
     ):
         """Uploads a file to an collection on Irods.
 
+        Large files are put with parallel transfer threads, see lib/transfer.py. The checksum,
+        which iRODS registers for the new data object, is compared with the uploaded data.
+        A file, which is already in the collection with the same name and checksum, is not
+        put again, see lib/dedupe.py.
+
         Args:
             path (str): path of the collection to upload to
             path_to_file (str): path to the file to be uploaded. Example: ~/mydatapackage.csv
             file (bytes, optional): file as a bytes object. Defaults to None.
+            size (int, optional): upper bound of the file size, e.g. the content length of the request. Defaults to None.
 
         Returns:
-            json: Response Data of irods API
+            json: Response Data of irods API, the result of lib.dedupe.skipped if the file was skipped
         """
-        log.debug(
-            f"Entering at lib/upload_irods.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_irods.py upload_new_file_to_collection_internal")
+        target = f"{path}/{os.path.basename(path_to_file)}"
         try:
-            # in testing we do not have a file object passed in
-            if not test:
-                with open(path_to_file, 'wb') as ff:
-                    ff.write(file.read())
-
-            with iRODSSession(host=self.irods_api_address,
-                                port=1247,
-                                user=self.user,
-                                password=self.api_key,
-                                zone=zone,
-                                authentication_scheme='pam',
-                                **ssl_settings) as session:
-                session.connection_timeout = 300
-                r = session.data_objects.put(path_to_file, path)
+            with contextlib.ExitStack() as stack:
+                if not test:
+                    # the content length is only an upper bound of the size, so it is not compared
+                    file, saved = stack.enter_context(dedupe(self.manifests, path, path_to_file, file))
+                    if file is None:
+                        return skipped(saved)
+
+                with self.session() as session, self.call("put", "data_objects") as call:
+                    session.connection_timeout = 300
+                    try:
+                        # in testing we do not have a file object passed in
+                        if test:
+                            checksum = put_file(session, path_to_file, target)
+                        else:
+                            checksum = put_stream(session, file, target, size=size, call=call)
+                    except ChecksumMismatch:
+                        session.data_objects.unlink(target, force=True)
+                        raise
+            self.manifests.update(path, target, checksum=normalize_checksum(checksum))
             return {"success": True}
         except Exception as e:
-            log.error(
-                f"Exception at lib/upload_irods.py {inspect.getframeinfo(inspect.currentframe()).function}")
+            log.error("Exception at lib/upload_irods.py upload_new_file_to_collection_internal")
             log.error(str(e))
 
 
+    def upload_files_to_collection(self, path, files, workers=None):
+        """Uploads many files to a collection on Irods with one pooled session.
+
+        At most `workers` files are put at the same time, each with its own connection
+        of the session.
+
+        Args:
+            path (str): path of the collection to upload to
+            files (list): BatchFile objects, see lib/batch.py
+            workers (int, optional): files put at the same time. Defaults to BATCH_UPLOAD_WORKERS.
+
+        Returns:
+            list: one result for every file, see lib.batch.run_batch
+        """
+        # files, which are already in the collection with the same name and checksum, are skipped
+        self.manifests.get(path)
+        with self.session() as session:
+            return self.put_files(session, path, files, workers)
+
+    def put_files(self, session, path, files, workers=None):
+        """Puts the BatchFile objects `files` into the collection with the checked out `session`.
+
+        No further session is checked out, so a caller, which holds one, does not wait for
+        a second one of the same user. Load the manifest of the collection before.
+
+        Returns:
+            list: one result for every file, see lib.batch.run_batch
+        """
+        session.connection_timeout = 300
+
+        def upload(batch_file):
+            target = f"{path}/{os.path.basename(batch_file.filename)}"
+            with dedupe(self.manifests, path, target, batch_file.file, batch_file.size) as (file, saved):
+                if file is None:
+                    return skipped(saved)
+                with self.call("put", "data_objects") as call:
+                    try:
+                        checksum = put_stream(session, file, target, size=batch_file.size, call=call)
+                    except ChecksumMismatch:
+                        session.data_objects.unlink(target, force=True)
+                        raise
+            self.manifests.update(path, target, checksum=normalize_checksum(checksum))
+            return True
+
+        return run_batch(files, upload, workers)
+
+    def remote_files(self, path):
+        """Returns the data objects in the collection with one query.
+
+        Args:
+            path (str): path of the collection
+
+        Returns:
+            list: RemoteFile objects with the path of the data object as id, see lib/sync.py
+        """
+        with self.session() as session, self.call("get", "data_objects"):
+            query = session.query(DataObject.name, DataObject.size, DataObject.checksum).filter(Collection.name == path)
+            result = {}
+            for row in query.get_results():
+                # replicas with another size or checksum are rows of the same data object
+                result.setdefault(row[DataObject.name], RemoteFile(
+                    row[DataObject.name], row[DataObject.size], normalize_checksum(row[DataObject.checksum]),
+                    f"{path}/{row[DataObject.name]}"))
+            return list(result.values())
+
+    def file_manifest(self, path):
+        """Returns the Manifest of the data objects in the collection, see lib/dedupe.py."""
+        return Manifest((f.name, f.size, f.checksum) for f in self.remote_files(path))
+
+    def sync_collection(self, path, entries, files, dry_run=False, workers=None):
+        """Makes the collection contain exactly the files of the manifest `entries`, see lib/sync.py.
+
+        Only the differences are applied: new files are uploaded like a batch, changed data objects
+        are overwritten in place and the other data objects are unlinked.
+
+        Args:
+            path (str): path of the collection
+            entries (list): SyncEntry objects of the manifest
+            files (dict): path -> BatchFile with the data of the new and changed files
+            dry_run (bool, optional): Set to True will only return the changes. Defaults to False.
+            workers (int, optional): replacements and deletions at the same time. Defaults to SYNC_WORKERS.
+
+        Returns:
+            dict: the changes and the result of every change
+        """
+        remote_files = self.remote_files(path)
+        self.manifests.get(path)
+        try:
+            # replacements, deletions and adds share this session, concurrent syncs of the same
+            # user, which wait for a second one, would block each other until PoolExhausted
+            with self.session() as session:
+                session.connection_timeout = 300
+
+                def replace(remote, batch_file):
+                    with self.call("put", "data_objects") as call:
+                        try:
+                            put_stream(session, batch_file.file, remote.id, size=batch_file.size, call=call, overwrite=True)
+                        except ChecksumMismatch:
+                            session.data_objects.unlink(remote.id, force=True)
+                            raise
+                    return True
+
+                def delete(remote):
+                    with self.call("unlink", "data_objects"):
+                        session.data_objects.unlink(remote.id, force=True)
+                    return True
+
+                return sync(
+                    entries, remote_files, files,
+                    add=lambda batch_files: self.put_files(session, path, batch_files),
+                    replace=replace, delete=delete, dry_run=dry_run, workers=workers,
+                )
+        finally:
+            self.manifests.invalidate(path)
+
     def get_files_from_collection(self, path):
         """will get all the files from the collection requested.
 
@@ -309,15 +394,8 @@ class Irods(object):
         Returns:
             list: list containing all the file paths from the collection
         """
-        log.debug(
-            f"Entering at lib/upload_irods.py {inspect.getframeinfo(inspect.currentframe()).function}")
-        with iRODSSession(host=self.irods_api_address,
-                            port=1247,
-                            user=self.user,
-                            password=self.api_key,
-                            zone=zone,
-                            authentication_scheme='pam',
-                            **ssl_settings) as session:
+        log.debug("Entering at lib/upload_irods.py get_files_from_collection")
+        with self.session() as session, self.call("get", "collections"):
             coll = session.collections.get(path)
             result = []
             for obj in coll.data_objects:
@@ -347,16 +425,9 @@ class Irods(object):
         Returns:
             object: response of the PUT request to the collections endpoint
         """
-        log.debug(
-            f"Entering at lib/upload_irods.py {inspect.getframeinfo(inspect.currentframe()).function}")
-
-        with iRODSSession(host=self.irods_api_address,
-                            port=1247,
-                            user=self.user,
-                            password=self.api_key,
-                            zone=zone,
-                            authentication_scheme='pam',
-                            **ssl_settings) as session:
+        log.debug("Entering at lib/upload_irods.py change_metadata_in_collection_internal")
+
+        with self.session() as session, self.call("set", "metadata"):
             session.connection_timeout = 300
             
             obj = session.collections.get(path)
@@ -387,11 +458,36 @@ class Irods(object):
         Returns:
             object: response of the POST request to the collections publish endpoint
         """
-        log.debug(
-            f"Entering at lib/upload_irods.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_irods.py publish_collection_internal")
 
         raise NotImplementedError()
 
+    def delete_files_from_collection(self, path, workers=None):
+        """Deletes all data objects of the collection, see lib/deletion.py.
+
+        The data objects are listed with one query and unlinked with at most `workers` at the
+        same time over the connections of one pooled session. The collection and its metadata stay.
+
+        Args:
+            path (str): path of the collection
+            workers (int, optional): deletions at the same time. Defaults to DELETE_WORKERS.
+
+        Returns:
+            list: the result of every data object, e.g. {"filename": "a.csv", "success": True}
+        """
+        files = self.remote_files(path)
+        log.debug("delete files from collection", path=path, files=len(files))
+        try:
+            with self.session() as session:
+                def delete(remote):
+                    with self.call("unlink", "data_objects"):
+                        session.data_objects.unlink(remote.id, force=True)
+                    return True
+
+                return delete_files(files, delete, workers)
+        finally:
+            self.manifests.invalidate(path)
+
     def delete_all_files_from_collection_internal(self, path):
         """Will delete all files from an collection.
 
@@ -401,23 +497,15 @@ class Irods(object):
         Returns:
             bool: True if successful, False if not
         """
-        log.debug(
-            f"Entering at lib/upload_irods.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_irods.py delete_all_files_from_collection_internal")
         try:
-            with iRODSSession(host=self.irods_api_address,
-                                port=1247,
-                                user=self.user,
-                                password=self.api_key,
-                                zone=zone,
-                                authentication_scheme='pam',
-                                **ssl_settings) as session:
-                coll = session.collections.get(path)
-                for obj in coll.data_objects:
-                    obj.unlink(force=True)
-                return True
-        except:
+            results = self.delete_files_from_collection(path)
+        except Exception as e:
+            log.error(f"Could not delete the files of {path}: {e}")
             return False
 
+        return all(result["success"] for result in results)
+
     def delete_file_from_collection_internal(self, path):
         """Will delete a file from an collection
 
@@ -427,18 +515,12 @@ class Irods(object):
         Returns:
             bool: True if successful, False if not
         """
-        log.debug(
-            f"Entering at lib/upload_irods.py {inspect.getframeinfo(inspect.currentframe()).function}")
+        log.debug("Entering at lib/upload_irods.py delete_file_from_collection_internal")
         try:
-            with iRODSSession(host=self.irods_api_address,
-                                port=1247,
-                                user=self.user,
-                                password=self.api_key,
-                                zone=zone,
-                                authentication_scheme='pam',
-                                **ssl_settings) as session:
+            with self.session() as session, self.call("unlink", "data_objects"):
                 obj = session.data_objects.get(path)
                 r = obj.unlink(force=True)
+            self.manifests.update(os.path.dirname(path), os.path.basename(path))
 
             if r is None:
                 return True
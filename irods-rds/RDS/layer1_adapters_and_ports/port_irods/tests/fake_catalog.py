@@ -0,0 +1,222 @@
+"""In memory stand-in for the GenQuery part of an iRODS catalog.
+
+FakeCatalog.session() returns an object, which can be used like an iRODSSession for
+queries: the python-irodsclient managers for collections and metadata work on top of it,
+so code using `session.collections.get(...)` and code using `session.query(...)` can be
+compared against the same catalog. Every query is counted and can be delayed by a fixed
+latency to simulate the round-trip to the catalog server.
+"""
+import datetime
+import fnmatch
+import itertools
+import threading
+import time
+
+from irods.exception import NoResultFound, MultipleResultsFound
+from irods.manager.collection_manager import CollectionManager
+from irods.manager.data_object_manager import DataObjectManager
+from irods.manager.metadata_manager import MetadataManager
+from irods.models import Model, Collection, CollectionMeta, DataObject
+
+_models = (Collection, CollectionMeta, DataObject)
+
+
+def _model(column):
+    for model in _models:
+        if column in model._columns:
+            return model
+    raise ValueError(f"column {column} is not supported by the fake catalog")
+
+
+def _matches(row, criterion):
+    value = row.get(criterion.query_key)
+    if criterion.op == "=":
+        return value == criterion.value
+    if criterion.op == "!=":
+        return value != criterion.value
+    if criterion.op == "in":
+        return value in criterion.value
+    if criterion.op == "like":
+        return fnmatch.fnmatchcase(str(value), criterion.value.replace("%", "*").replace("_", "?"))
+    raise ValueError(f"operator {criterion.op} is not supported by the fake catalog")
+
+
+class FakeResultSet(list):
+    continue_index = 0
+
+
+class FakeQuery(object):
+    def __init__(self, catalog, columns, criteria=(), order=(), offset=0, limit=None):
+        self.catalog = catalog
+        self.columns = columns
+        self.criteria = list(criteria)
+        self.order = list(order)
+        self._offset = offset
+        self._limit = limit
+
+    def _copy(self, **kwargs):
+        args = dict(columns=self.columns, criteria=self.criteria, order=self.order, offset=self._offset, limit=self._limit)
+        args.update(kwargs)
+        return FakeQuery(self.catalog, **args)
+
+    def filter(self, *criteria):
+        return self._copy(criteria=self.criteria + list(criteria))
+
+    def order_by(self, column, order="asc"):
+        return self._copy(order=self.order + [(column, order == "desc")])
+
+    def offset(self, offset):
+        return self._copy(offset=offset)
+
+    def limit(self, limit):
+        return self._copy(limit=limit)
+
+    def execute(self):
+        return self.catalog.execute(self)
+
+    def get_results(self):
+        return iter(self.execute())
+
+    __iter__ = get_results
+    _all = get_results
+    all = execute
+
+    def one(self):
+        results = self.execute()
+        if not results:
+            raise NoResultFound()
+        if len(results) > 1:
+            raise MultipleResultsFound()
+        return results[0]
+
+    def first(self):
+        results = self.limit(1).execute()
+        return results[0] if results else None
+
+
+class FakeSession(object):
+    server_version = (4, 3, 0)
+
+    def __init__(self, catalog, zone):
+        self.catalog = catalog
+        self.zone = zone
+        self.collections = CollectionManager(self)
+        self.data_objects = DataObjectManager(self)
+        self.metadata = MetadataManager(self)
+
+    def query(self, *args):
+        columns = []
+        for arg in args:
+            if isinstance(arg, type) and issubclass(arg, Model):
+                columns.extend(col for col in arg._columns if self.server_version >= col.min_version)
+            else:
+                columns.append(arg)
+        return FakeQuery(self.catalog, columns)
+
+    def cleanup(self):
+        pass
+
+
+class FakeCatalog(object):
+    """Collections, data objects and collection AVUs of one zone.
+
+    Args:
+        zone (str, optional): the zone name. Defaults to "yoda".
+        latency (float, optional): seconds every query is delayed. Defaults to 0.
+    """
+
+    def __init__(self, zone="yoda", latency=0):
+        self.zone = zone
+        self.latency = latency
+        self.queries = 0
+        self.collections = {}
+        self.data_objects = []
+        self.avus = []
+        self._ids = itertools.count(10000)
+        self._lock = threading.Lock()
+        self.add_collection("/")
+        self.add_collection(f"/{zone}")
+
+    def session(self):
+        return FakeSession(self, self.zone)
+
+    def add_collection(self, path, owner="rods", inheritance="0"):
+        parent = path.rsplit("/", 1)[0] or "/"
+        if path != "/" and parent not in self.collections:
+            self.add_collection(parent, owner)
+
+        if path not in self.collections:
+            now = datetime.datetime(2022, 1, 1) + datetime.timedelta(seconds=len(self.collections))
+            self.collections[path] = {
+                Collection.id: next(self._ids),
+                Collection.name: path,
+                Collection.parent_name: parent if path != "/" else "/",
+                Collection.owner_name: owner,
+                Collection.owner_zone: self.zone,
+                Collection.map_id: "0",
+                Collection.inheritance: inheritance,
+                Collection.comments: "",
+                Collection.create_time: now,
+                Collection.modify_time: now,
+            }
+        return self.collections[path][Collection.id]
+
+    def add_data_object(self, collection, name, replicas=1, size=0, checksum=None):
+        self.add_collection(collection)
+        object_id = next(self._ids)
+        for number in range(replicas):
+            self.data_objects.append({
+                DataObject.id: object_id,
+                DataObject.collection_id: self.collections[collection][Collection.id],
+                DataObject.name: name,
+                DataObject.replica_number: number,
+                DataObject.size: size,
+                DataObject.checksum: checksum,
+                DataObject.resource_name: f"resc{number}",
+                DataObject.path: f"/vault/{number}{collection}/{name}",
+                DataObject.replica_status: "1",
+                DataObject.resc_hier: f"resc{number}",
+                "collection": collection,
+            })
+        return object_id
+
+    def add_avu(self, collection, name, value, units=""):
+        self.add_collection(collection)
+        self.avus.append({
+            CollectionMeta.id: str(next(self._ids)),
+            CollectionMeta.name: name,
+            CollectionMeta.value: value,
+            CollectionMeta.units: units,
+            "collection": collection,
+        })
+
+    def _rows(self, models):
+        if DataObject in models:
+            return [{**self.collections[row["collection"]], **row} for row in self.data_objects]
+        if CollectionMeta in models:
+            return [{**self.collections[row["collection"]], **row} for row in self.avus]
+        return list(self.collections.values())
+
+    def execute(self, query):
+        with self._lock:
+            self.queries += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        models = {_model(col) for col in query.columns} | {_model(c.query_key) for c in query.criteria}
+        rows = [row for row in self._rows(models) if all(_matches(row, c) for c in query.criteria)]
+        for column, descending in reversed(query.order):
+            rows.sort(key=lambda row: row[column], reverse=descending)
+
+        # GenQuery returns distinct rows of the selected columns
+        seen = set()
+        result = FakeResultSet()
+        for row in rows:
+            selected = {col: row.get(col) for col in query.columns}
+            key = tuple(selected.values())
+            if key not in seen:
+                seen.add(key)
+                result.append(selected)
+
+        end = None if query._limit is None or query._limit < 0 else query._offset + query._limit
+        return FakeResultSet(result[query._offset:end])
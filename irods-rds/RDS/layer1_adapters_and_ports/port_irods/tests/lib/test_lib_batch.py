@@ -0,0 +1,166 @@
+import io
+import json
+import threading
+import time
+import unittest
+import zipfile
+from unittest import mock
+
+from flask import Flask, request
+from werkzeug.exceptions import HTTPException
+
+from lib.batch import BatchFile, files_from_request, run_batch
+from lib.session_pool import SessionPool
+from lib.upload_irods import Irods
+from fake_catalog import FakeCatalog
+
+app = Flask(__name__)
+
+
+def zipped(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as bundle:
+        for name, content in files.items():
+            bundle.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+class TestBatch(unittest.TestCase):
+    """Tests for batch uploads, which read many files from one request."""
+
+    def files(self, data):
+        with app.test_request_context("/", method="POST", data=data, content_type="multipart/form-data"):
+            return [(f.filename, f.file and f.file.read(), f.size) for f in files_from_request(request)]
+
+    def test_file_parts(self):
+        files = self.files({
+            "userId": "port://alice:secret",
+            "files": [(io.BytesIO(b"a" * 10), "a.csv"), (io.BytesIO(b"b" * 20), "data/b.csv")],
+        })
+
+        self.assertEqual(files, [("a.csv", b"a" * 10, 10), ("data/b.csv", b"b" * 20, 20)])
+
+    def test_archive_with_manifest(self):
+        archive = zipped({"a.csv": b"a" * 10, "data/b.csv": b"b" * 20, "c.csv": b"c"})
+        files = self.files({
+            "archive": (archive, "files.zip"),
+            "manifest": json.dumps(["data/b.csv", {"filename": "a.csv"}, "missing.csv"]),
+        })
+
+        self.assertEqual(files[:2], [("data/b.csv", b"b" * 20, 20), ("a.csv", b"a" * 10, 10)])
+        self.assertEqual(files[2], ("missing.csv", None, None))
+
+    def test_archive_without_manifest(self):
+        files = self.files({"archive": (zipped({"a.csv": b"a", "data/b.csv": b"b"}), "files.zip")})
+
+        self.assertEqual([f[0] for f in files], ["a.csv", "data/b.csv"])
+
+    def test_request_without_files(self):
+        for data in ({"userId": "port://alice:secret"}, {"archive": (io.BytesIO(b"no zip"), "files.zip")}):
+            with self.assertRaises(HTTPException) as context:
+                self.files(data)
+            self.assertEqual(context.exception.code, 400)
+
+    def test_invalid_manifest(self):
+        for manifest in ("no json", json.dumps("a.csv"), json.dumps({"filename": "a.csv"}),
+                         json.dumps([{"name": "a.csv"}]), json.dumps([""]), json.dumps([1])):
+            with self.assertRaises(HTTPException) as context:
+                self.files({"archive": (zipped({"a.csv": b"a"}), "files.zip"), "manifest": manifest})
+            self.assertEqual(context.exception.code, 400, manifest)
+
+    def test_paths_outside_the_project_are_rejected(self):
+        for name in ("../escape.csv", "data/../../escape.csv", "/etc/passwd", "C:/escape.csv", "..\\escape.csv"):
+            requests = [{"archive": (zipped({"a.csv": b"a", name: b"evil"}), "files.zip")},
+                        {"archive": (zipped({"a.csv": b"a"}), "files.zip"), "manifest": json.dumps([name])}]
+            if "\\" not in name:
+                # the multipart encoder of the test client drops backslashes
+                requests.append({"files": [(io.BytesIO(b"evil"), name)]})
+            for data in requests:
+                with self.assertRaises(HTTPException) as context:
+                    self.files(data)
+                self.assertEqual(context.exception.code, 400, name)
+
+    def test_results_per_file(self):
+        def upload(batch_file):
+            if batch_file.filename == "broken":
+                raise ValueError("upstream is gone")
+            return batch_file.filename != "rejected"
+
+        results = run_batch(
+            [BatchFile(name, io.BytesIO(b"")) for name in ("a", "broken", "rejected")] + [BatchFile("missing", None)],
+            upload,
+        )
+
+        self.assertEqual(results, [
+            {"filename": "a", "success": True},
+            {"filename": "broken", "success": False, "error": "upstream is gone"},
+            {"filename": "rejected", "success": False, "error": "Upload failed."},
+            {"filename": "missing", "success": False, "error": "File not found in the request."},
+        ])
+
+    def test_parallelism_is_bounded(self):
+        lock = threading.Lock()
+        active = []
+        peak = []
+
+        def upload(batch_file):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.pop()
+            return True
+
+        results = run_batch([BatchFile(str(i), io.BytesIO(b"")) for i in range(12)], upload, workers=3)
+
+        self.assertEqual([result["filename"] for result in results], [str(i) for i in range(12)])
+        self.assertEqual(max(peak), 3)
+
+
+class FakeSession(object):
+    """Stands in for an iRODSSession."""
+
+    created = 0
+
+    def __init__(self, **kwargs):
+        FakeSession.created += 1
+        self.zone = kwargs.get("zone")
+
+    def query(self, *columns):
+        # an empty collection, so no file of the batch is skipped
+        return FakeCatalog(self.zone).session().query(*columns)
+
+    def cleanup(self):
+        pass
+
+
+class TestIrodsBatch(unittest.TestCase):
+    """Tests for batch uploads to a collection."""
+
+    def test_files_are_put_with_one_session(self):
+        FakeSession.created = 0
+        puts = []
+
+        def put_stream(session, stream, target, size=None, call=None):
+            puts.append((session, target, stream.read(), size))
+
+        with mock.patch("lib.upload_irods.session_pool", SessionPool(factory=FakeSession)), \
+                mock.patch("lib.upload_irods.put_stream", put_stream):
+            irods = Irods("secret", "alice", api_address="irods.local")
+            results = irods.upload_files_to_collection(
+                "/yoda/home/project", [BatchFile(f"data/file{i}.csv", io.BytesIO(b"x" * i), i) for i in range(5)], workers=3
+            )
+
+        self.assertEqual([result["success"] for result in results], [True] * 5)
+        self.assertEqual(FakeSession.created, 1)
+        self.assertEqual(len({put[0] for put in puts}), 1)
+        self.assertEqual(
+            sorted(put[1:] for put in puts),
+            [(f"/yoda/home/project/file{i}.csv", b"x" * i, i) for i in range(5)],
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
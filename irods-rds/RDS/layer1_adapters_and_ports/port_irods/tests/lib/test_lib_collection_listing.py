@@ -0,0 +1,104 @@
+import unittest
+from unittest import mock
+
+from irods.exception import CollectionDoesNotExist
+
+from lib.collection_listing import CollectionListing
+from lib.session_pool import SessionPool
+from lib.upload_irods import Irods
+from fake_catalog import FakeCatalog
+
+
+def describe(col):
+    """The dict, which get_collection built with one lookup per attribute before the bulk listing."""
+    return {'create_time' : str(col.create_time),
+            'data_objects' : [data_object.id for data_object in col.data_objects],
+            'id' : col.id,
+            'inheritance' : str(col.inheritance),
+            'manager' : col.manager.get(col.path).id,
+            'metadata' : {key : col.metadata.get_all(key)[0].value for key in col.metadata.keys()},
+            'modify_time' : str(col.modify_time),
+            'name' : str(col.name),
+            'owner_name' : str(col.owner_name),
+            'owner_zone' : str(col.owner_zone),
+            'path' : str(col.path),
+            'subcollections' : [col.path for col in col.subcollections]
+            }
+
+
+def fill(catalog, base, count):
+    for i in range(count):
+        path = f"{base}/project-{i:04}"
+        catalog.add_collection(path, inheritance="1" if i % 2 else "0")
+        for j in range(i % 3):
+            catalog.add_data_object(path, f"file-{j}.csv", replicas=2)
+        catalog.add_avu(path, "Title", f"Project {i}")
+        catalog.add_avu(path, "Creator", "Alice")
+        catalog.add_avu(path, "Creator", "Bob")
+        if i % 4 == 0:
+            catalog.add_collection(f"{path}/raw")
+            catalog.add_collection(f"{path}/processed")
+
+
+class TestCollectionListing(unittest.TestCase):
+    """Tests for the bulk collection listing against a fake catalog."""
+
+    def setUp(self):
+        self.catalog = FakeCatalog()
+        self.base = "/yoda/home/research-test"
+        fill(self.catalog, self.base, 25)
+        self.catalog.add_collection(f"{self.base}/it's mine")
+        self.catalog.add_avu(f"{self.base}/it's mine", "Title", "quoted")
+        self.session = self.catalog.session()
+
+    def expected(self, path):
+        subcollections = self.session.collections.get(path).subcollections
+        return sorted((describe(col) for col in subcollections), key=lambda c: c["path"])
+
+    def test_same_output_as_per_collection_lookups(self):
+        listing = CollectionListing(self.session, batch_size=7)
+
+        self.assertEqual(listing.subcollections(self.base), self.expected(self.base))
+
+    def test_few_queries(self):
+        listing = CollectionListing(self.session, batch_size=50)
+
+        self.catalog.queries = 0
+        listing.subcollections(self.base)
+
+        # collection rows, one quoted path queried on its own, 3 queries for each batch
+        self.assertEqual(self.catalog.queries, 1 + 3 * 2)
+
+    def test_pagination(self):
+        listing = CollectionListing(self.session)
+        expected = self.expected(self.base)
+
+        self.assertEqual(listing.subcollections(self.base, offset=5, limit=10), expected[5:15])
+        self.assertEqual(listing.subcollections(self.base, offset=20, limit=10), expected[20:])
+        self.assertEqual([c for page in listing.pages(self.base, page_size=4) for c in page], expected)
+
+    def test_collection_without_subcollections(self):
+        path = f"{self.base}/project-0002"
+        listing = CollectionListing(self.session)
+
+        self.assertEqual(listing.collection(path), dict(describe(self.session.collections.get(path)), subcollections=[]))
+        with self.assertRaises(CollectionDoesNotExist):
+            listing.collection(f"{self.base}/missing")
+
+    def test_get_collection(self):
+        pool = SessionPool(factory=lambda **kwargs: self.catalog.session())
+        irods = Irods("secret", "alice", api_address="irods.local")
+
+        with mock.patch("lib.upload_irods.session_pool", pool):
+            listed = irods.get_collection_internal(self.base)
+            page = irods.get_collection_internal(self.base, offset=10, limit=5)
+            leaf = irods.get_collection_internal(f"{self.base}/project-0001")
+
+        self.assertEqual(listed, self.expected(self.base))
+        self.assertEqual(page, listed[10:15])
+        self.assertEqual(leaf["path"], f"{self.base}/project-0001")
+        self.assertEqual(leaf["subcollections"], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import hashlib
+import io
+import unittest
+from unittest import mock
+
+from lib.batch import BatchFile, run_batch
+from lib.dedupe import Manifest, Manifests, dedupe, normalize_checksum, skipped
+from lib.session_pool import SessionPool
+from lib.upload_irods import Irods
+from fake_catalog import FakeCatalog
+
+data = b"a,b\n1,2\n"
+
+
+def md5(value):
+    return ("md5", hashlib.md5(value).hexdigest())
+
+
+class UnreadableStream(object):
+    def read(self, *args):
+        raise AssertionError("stream was read")
+
+
+class TestDedupe(unittest.TestCase):
+    """Tests for skipping files, which are already in the project."""
+
+    def test_normalize_checksum(self):
+        self.assertEqual(normalize_checksum("ABC", "MD5"), ("md5", "abc"))
+        self.assertEqual(normalize_checksum("abc", "SHA-256"), ("sha256", "abc"))
+        self.assertEqual(normalize_checksum("sha2:" + "q83vEjRWeJA=", "md5"), ("sha256", "abcdef1234567890"))
+        self.assertIsNone(normalize_checksum("abc", "UNF"))
+        self.assertIsNone(normalize_checksum(None))
+
+    def test_candidate_by_name_and_size(self):
+        manifest = Manifest([("a.csv", 8, md5(data)), ("b.csv", None, md5(b"b")), ("c.csv", 1, None)])
+
+        self.assertEqual(manifest.candidate("data/a.csv"), [md5(data)])
+        self.assertEqual(manifest.candidate("a.csv", size=8), [md5(data)])
+        self.assertEqual(manifest.candidate("a.csv", size=9), [])
+        self.assertEqual(manifest.candidate("b.csv", size=9), [md5(b"b")])
+        # files without checksum cannot be compared
+        self.assertEqual(manifest.candidate("c.csv"), [])
+        self.assertEqual(len(manifest), 2)
+
+    def test_manifest_is_loaded_once(self):
+        load = mock.Mock(side_effect=lambda project: Manifest([("a.csv", 8, md5(data))]))
+        manifests = Manifests(load, ttl=60)
+
+        for _ in range(3):
+            self.assertEqual(manifests.candidate("project", "a.csv"), [md5(data)])
+        load.assert_called_once_with("project")
+
+        manifests.update("project", "a.csv")
+        self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        manifests.invalidate("project")
+        self.assertEqual(manifests.candidate("project", "a.csv"), [md5(data)])
+        self.assertEqual(load.call_count, 2)
+
+    def test_failed_load_is_not_cached(self):
+        load = mock.Mock(side_effect=[ValueError("down"), Manifest()])
+        manifests = Manifests(load, ttl=60)
+
+        self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        self.assertEqual(load.call_count, 2)
+
+    def test_new_file_is_streamed(self):
+        manifests = Manifests(lambda project: Manifest([("a.csv", 8, md5(data))]))
+        stream = UnreadableStream()
+
+        with dedupe(manifests, "project", "b.csv", stream) as (file, saved):
+            self.assertIs(file, stream)
+            self.assertIsNone(saved)
+
+    def test_identical_file_is_skipped(self):
+        manifests = Manifests(lambda project: Manifest([("a.csv", 8, md5(data))]))
+
+        with dedupe(manifests, "project", "a.csv", io.BytesIO(data)) as (file, saved):
+            self.assertIsNone(file)
+            self.assertEqual(saved, len(data))
+
+        with dedupe(manifests, "project", "a.csv", io.BytesIO(b"a,b\n1,3\n")) as (file, saved):
+            self.assertEqual(file.read(), b"a,b\n1,3\n")
+            self.assertIsNone(saved)
+
+    def test_disabled(self):
+        manifests = Manifests(mock.Mock())
+        with mock.patch("lib.dedupe.dedupe_enabled", False):
+            self.assertEqual(manifests.candidate("project", "a.csv"), [])
+        manifests.load.assert_not_called()
+
+    def test_batch_reports_bytes_saved(self):
+        results = run_batch([BatchFile("a.csv", io.BytesIO(data))], lambda batch_file: skipped(len(data)))
+        self.assertEqual(results, [{"filename": "a.csv", "success": True, "skipped": True, "bytesSaved": len(data)}])
+
+
+class TestIrodsDedupe(unittest.TestCase):
+    """Tests for uploads to a collection, which has some of the files already."""
+
+    def setUp(self):
+        self.catalog = FakeCatalog()
+        self.catalog.add_data_object("/yoda/home/project", "a.csv", replicas=2, size=len(data), checksum=md5(data)[1])
+        self.catalog.add_data_object("/yoda/home/project", "b.csv", size=1, checksum="sha2:" + "q83vEjRWeJA=")
+        self.puts = []
+
+        def put_stream(session, stream, target, size=None, call=None):
+            self.puts.append((target, stream.read()))
+            return "sha2:AAAA"
+
+        for target, replacement in (("session_pool", SessionPool(factory=lambda **kwargs: self.catalog.session())),
+                                    ("put_stream", put_stream)):
+            patcher = mock.patch(f"lib.upload_irods.{target}", replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_manifest_from_one_query(self):
+        manifest = Irods("secret", "alice", api_address="irods.local").file_manifest("/yoda/home/project")
+
+        # the replicas are one row of the distinct result
+        self.assertEqual(manifest.candidate("a.csv"), [md5(data)])
+        self.assertEqual(manifest.candidate("b.csv"), [("sha256", "abcdef1234567890")])
+        self.assertEqual(self.catalog.queries, 1)
+
+    def test_present_file_is_not_put(self):
+        irods = Irods("secret", "alice", api_address="irods.local")
+
+        self.assertEqual(irods.upload_new_file_to_collection("/yoda/home/project", "data/a.csv", io.BytesIO(data)),
+                         skipped(len(data)))
+        self.assertEqual(irods.upload_new_file_to_collection("/yoda/home/project", "a.csv", io.BytesIO(b"changed")),
+                         {"success": True})
+        results = irods.upload_files_to_collection("/yoda/home/project", [
+            BatchFile("a.csv", io.BytesIO(data), len(data)), BatchFile("c.csv", io.BytesIO(b"c"), 1)])
+
+        # the changed a.csv replaced the one in the manifest
+        self.assertEqual([result["success"] for result in results], [True, True])
+        # the files of the batch are put at the same time
+        self.assertEqual(self.puts[0], ("/yoda/home/project/a.csv", b"changed"))
+        self.assertEqual(sorted(self.puts[1:]), [("/yoda/home/project/a.csv", data), ("/yoda/home/project/c.csv", b"c")])
+        self.assertEqual(self.catalog.queries, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
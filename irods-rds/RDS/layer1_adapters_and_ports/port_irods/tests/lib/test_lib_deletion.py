@@ -0,0 +1,123 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from irods.exception import NetworkException
+
+from lib.deletion import delete_files
+from lib.session_pool import SessionPool
+from lib.sync import RemoteFile
+from lib.upload_irods import Irods
+from fake_catalog import FakeCatalog
+
+collection = "/yoda/home/project"
+
+
+def remote(count):
+    return [RemoteFile(f"{i}.csv", id=i) for i in range(count)]
+
+
+class TestDeletion(unittest.TestCase):
+    """Tests for deleting many files of a project."""
+
+    def test_failed_deletion_is_retried(self):
+        sleeps, attempts = [], {}
+
+        def delete(f):
+            attempts[f.id] = attempts.get(f.id, 0) + 1
+            if f.id == 1 and attempts[f.id] < 3:
+                raise ConnectionError("reset")
+            return True
+
+        results = delete_files(remote(2), delete, retries=3, backoff=0.5, sleep=sleeps.append)
+
+        self.assertEqual(results, [{"filename": "0.csv", "success": True}, {"filename": "1.csv", "success": True}])
+        self.assertEqual(attempts, {0: 1, 1: 3})
+        self.assertEqual(sleeps, [0.5, 1.0])
+
+    def test_failed_file_does_not_stop_the_others(self):
+        def delete(f):
+            if f.id == 0:
+                raise ValueError("forbidden")
+            return f.id != 1
+
+        results = delete_files(remote(3), delete, retries=1, backoff=0, sleep=lambda delay: None)
+
+        self.assertEqual(results, [
+            {"filename": "0.csv", "success": False, "error": "forbidden"},
+            {"filename": "1.csv", "success": False, "error": "Delete failed."},
+            {"filename": "2.csv", "success": True},
+        ])
+
+    def test_concurrency_is_bounded(self):
+        lock, running, peak = threading.Lock(), [0], [0]
+
+        def delete(f):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return True
+
+        results = delete_files(remote(40), delete, workers=4)
+
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual([result["filename"] for result in results], [f"{i}.csv" for i in range(40)])
+        self.assertTrue(1 < peak[0] <= 4)
+
+    def test_nothing_to_delete(self):
+        self.assertEqual(delete_files([], mock.Mock()), [])
+
+
+class TestIrodsDeletion(unittest.TestCase):
+    """Tests for deleting all data objects of a collection."""
+
+    def catalog(self, count):
+        catalog = FakeCatalog()
+        for i in range(count):
+            catalog.add_data_object(collection, f"{i}.csv", size=1)
+        session = catalog.session()
+        session.data_objects = mock.Mock()
+        return session
+
+    def test_all_data_objects_are_unlinked(self):
+        session = self.catalog(20)
+
+        with mock.patch("lib.upload_irods.session_pool", SessionPool(factory=lambda **kwargs: session)):
+            irods = Irods("secret", "alice", api_address="irods.local")
+            results = irods.delete_files_from_collection(collection, workers=4)
+
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual(sorted(call.args[0] for call in session.data_objects.unlink.call_args_list),
+                         sorted(f"{collection}/{i}.csv" for i in range(20)))
+
+    @mock.patch("lib.deletion.delete_backoff", 0)
+    def test_failed_data_objects_are_reported(self):
+        session = self.catalog(3)
+        attempts = []
+
+        def unlink(path, force=False):
+            attempts.append(path)
+            if path.endswith("/0.csv"):
+                raise NetworkException("connection lost")
+
+        session.data_objects.unlink.side_effect = unlink
+
+        with mock.patch("lib.upload_irods.session_pool", SessionPool(factory=lambda **kwargs: session)):
+            irods = Irods("secret", "alice", api_address="irods.local")
+            results = irods.delete_files_from_collection(collection)
+            self.assertEqual(attempts.count(f"{collection}/0.csv"), 4)
+            self.assertFalse(irods.delete_all_files_from_collection_internal(collection))
+
+        self.assertEqual(results, [
+            {"filename": "0.csv", "success": False, "error": "connection lost"},
+            {"filename": "1.csv", "success": True},
+            {"filename": "2.csv", "success": True},
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import io
+import threading
+import unittest
+from unittest import mock
+
+from irods.exception import CollectionDoesNotExist
+from prometheus_client import REGISTRY
+
+from lib.batch import BatchFile, run_batch
+from lib.instrumentation import endpoint_template, upstream_call
+from lib.rate_limiter import RateLimiter, LocalBackend
+from lib.session_pool import SessionPool
+from lib.upload_irods import Irods
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class FakeSpan(object):
+    def __init__(self, operation, tags, parent=None):
+        self.operation = operation
+        self.tags = dict(tags or {})
+        self.parent = parent
+        self.finished = False
+
+    def set_tag(self, key, value):
+        self.tags[key] = value
+
+
+class FakeScope(object):
+    def __init__(self, manager, span, finish_on_close=True):
+        self.manager = manager
+        self.span = span
+        self.finish_on_close = finish_on_close
+        self.previous = manager.active
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.manager.local.span = self.previous
+        if self.finish_on_close:
+            self.span.finished = True
+
+
+class FakeScopeManager(object):
+    """Keeps the active span per thread, like the scope manager of jaeger."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    @property
+    def active(self):
+        return getattr(self.local, "span", None)
+
+    def activate(self, span, finish_on_close):
+        scope = FakeScope(self, span, finish_on_close)
+        self.local.span = span
+        return scope
+
+
+class FakeTracer(object):
+    """Records the spans, which would be sent to jaeger."""
+
+    def __init__(self):
+        self.spans = []
+        self.scope_manager = FakeScopeManager()
+
+    @property
+    def active_span(self):
+        return self.scope_manager.active
+
+    def start_active_span(self, operation, tags=None):
+        span = FakeSpan(operation, tags, self.active_span)
+        self.spans.append(span)
+        return self.scope_manager.activate(span, True)
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Tests for the metrics and spans of calls to the upstream service."""
+
+    def setUp(self):
+        self.tracer = FakeTracer()
+        patcher = mock.patch("lib.instrumentation.opentracing", mock.Mock(global_tracer=lambda: self.tracer))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_endpoint_template(self):
+        self.assertEqual(
+            endpoint_template("https://api.figshare.com/v2/account/articles/123/files/456?page=2"),
+            "/v2/account/articles/{id}/files/{id}",
+        )
+        self.assertEqual(
+            endpoint_template("https://demo.dataverse.nl/api/datasets/:persistentId/add?persistentId=doi:10.5072/FK2/ABC"),
+            "/api/datasets/:persistentId/add",
+        )
+        self.assertEqual(endpoint_template("https://s3.local/bucket/18a9b3c4d5-6e7f?partNumber=1"), "/bucket/{id}")
+        self.assertEqual(endpoint_template("https://irods.local"), "/")
+
+    def test_upstream_call_status(self):
+        labels = dict(host="irods.local", method="get", endpoint="collections")
+        failed = sample("upstream_request_seconds_count", status="KeyError", **labels)
+        ok = sample("upstream_request_seconds_count", status="ok", **labels)
+
+        with self.assertRaises(KeyError):
+            with upstream_call("irods.local", "get", "collections"):
+                raise KeyError("missing")
+        with upstream_call("irods.local", "get", "collections") as call:
+            call.sent(10)
+
+        self.assertEqual(sample("upstream_request_seconds_count", status="KeyError", **labels), failed + 1)
+        self.assertEqual(sample("upstream_request_seconds_count", status="ok", **labels), ok + 1)
+        self.assertEqual([span.operation for span in self.tracer.spans], ["get collections"] * 2)
+
+    def test_spans_of_workers_are_children(self):
+        def upload(batch_file):
+            with upstream_call("upstream.local", "put", "files"):
+                return True
+
+        with upstream_call("upstream.local", "post", "batch"):
+            run_batch([BatchFile(f"{i}.csv", io.BytesIO(b"x"), 1) for i in range(8)], upload, workers=4)
+
+        batch, files = self.tracer.spans[0], self.tracer.spans[1:]
+        self.assertIsNone(batch.parent)
+        self.assertEqual(len(files), 8)
+        self.assertTrue(all(span.parent is batch for span in files))
+        self.assertIsNone(self.tracer.active_span)
+
+    def test_rate_limiter_wait_is_traced(self):
+        limiter = RateLimiter(LocalBackend(), sleep=lambda wait: None)
+        for _ in range(3):
+            limiter.acquire("https://upstream.local/api", "key", per_second=10, burst=2)
+
+        self.assertEqual([span.operation for span in self.tracer.spans], ["rate limiter wait"])
+        self.assertEqual(self.tracer.spans[0].tags["peer.hostname"], "upstream.local")
+
+
+class FakeSession(object):
+    """Stands in for an iRODSSession, which does not know any collection."""
+
+    def __init__(self, **kwargs):
+        self.zone = kwargs.get("zone")
+        self.connected = False
+        self.collections = self
+
+    def get(self, path):
+        raise CollectionDoesNotExist(path)
+
+    def cleanup(self):
+        pass
+
+
+class TestIrodsInstrumentation(unittest.TestCase):
+    """Tests for the metrics of the calls to iRODS and the setup of its sessions."""
+
+    def connect(self, session):
+        session.connected = True
+
+    def test_session_setup_is_measured(self):
+        before = sample("irods_session_setup_seconds_count", host="irods.local")
+        pool = SessionPool(factory=FakeSession, connect=self.connect)
+
+        for _ in range(3):
+            with pool.session(host="irods.local", user="alice", password="secret", zone="yoda") as session:
+                self.assertTrue(session.connected)
+
+        self.assertEqual(sample("irods_session_setup_seconds_count", host="irods.local"), before + 1)
+
+    def test_irods_calls_are_measured(self):
+        labels = dict(host="irods.local", method="get", endpoint="collections", status="CollectionDoesNotExist")
+        before = sample("upstream_request_seconds_count", **labels)
+
+        with mock.patch("lib.upload_irods.session_pool", SessionPool(factory=FakeSession)):
+            with self.assertRaises(CollectionDoesNotExist):
+                Irods("secret", "alice", api_address="irods.local").get_files_from_collection("/yoda/home/missing")
+
+        self.assertEqual(sample("upstream_request_seconds_count", **labels), before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from irods.exception import NetworkException
+
+from lib.session_pool import SessionPool, PoolExhausted
+from lib.upload_irods import Irods
+
+
+class FakeSession(object):
+    """Stands in for an authenticated iRODSSession."""
+
+    created = 0
+
+    def __init__(self, **kwargs):
+        FakeSession.created += 1
+        self.kwargs = kwargs
+        self.zone = kwargs.get("zone")
+        self.closed = False
+        self.healthy = True
+        self.in_use = False
+
+    def cleanup(self):
+        self.closed = True
+
+
+def healthy(session):
+    if not session.healthy:
+        raise NetworkException("connection reset")
+
+
+credentials = dict(host="irods.local", port=1247, user="alice", password="secret", zone="yoda")
+
+
+class TestSessionPool(unittest.TestCase):
+    """Tests for the keyed iRODS session pool with a fake session factory."""
+
+    def setUp(self):
+        FakeSession.created = 0
+
+    def pool(self, **kwargs):
+        kwargs.setdefault("health_check", healthy)
+        return SessionPool(factory=FakeSession, **kwargs)
+
+    def test_session_is_reused(self):
+        pool = self.pool()
+
+        with pool.session(**credentials) as first:
+            pass
+        with pool.session(**credentials) as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(FakeSession.created, 1)
+        self.assertEqual(first.kwargs, credentials)
+
+    def test_sessions_are_keyed_by_credentials(self):
+        pool = self.pool()
+
+        with pool.session(**credentials) as first:
+            pass
+        with pool.session(**dict(credentials, password="other")) as other_password:
+            pass
+        with pool.session(**dict(credentials, user="bob")) as other_user:
+            pass
+
+        self.assertIsNot(first, other_password)
+        self.assertIsNot(first, other_user)
+        self.assertEqual(FakeSession.created, 3)
+        self.assertNotIn("secret", str(list(pool._buckets)))
+
+    def test_idle_sessions_are_evicted(self):
+        pool = self.pool(idle_timeout=0.05)
+
+        with pool.session(**credentials) as first:
+            pass
+        time.sleep(0.1)
+        self.assertEqual(pool.evict_idle(), 1)
+
+        with pool.session(**credentials) as second:
+            pass
+
+        self.assertTrue(first.closed)
+        self.assertIsNot(first, second)
+        self.assertEqual(pool._buckets[pool.key(**credentials)].idle[0].session, second)
+
+    def test_unhealthy_session_is_replaced(self):
+        pool = self.pool(health_check_interval=0)
+
+        with pool.session(**credentials) as first:
+            pass
+        first.healthy = False
+        with pool.session(**credentials) as second:
+            pass
+
+        self.assertTrue(first.closed)
+        self.assertIsNot(first, second)
+
+    def test_health_check_is_skipped_for_fresh_sessions(self):
+        check = mock.Mock()
+        pool = self.pool(health_check=check, health_check_interval=60)
+
+        for _ in range(3):
+            with pool.session(**credentials):
+                pass
+
+        check.assert_not_called()
+
+    def test_session_is_dropped_after_network_error(self):
+        pool = self.pool()
+
+        with self.assertRaises(NetworkException):
+            with pool.session(**credentials) as first:
+                raise NetworkException("broken pipe")
+
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.idle_count(**credentials), 0)
+
+    def test_session_is_kept_after_other_errors(self):
+        pool = self.pool()
+
+        with self.assertRaises(KeyError):
+            with pool.session(**credentials) as first:
+                raise KeyError("no such collection")
+
+        self.assertFalse(first.closed)
+        self.assertEqual(pool.idle_count(**credentials), 1)
+
+    def test_max_per_user(self):
+        pool = self.pool(max_per_user=2, acquire_timeout=5)
+        active = []
+        max_active = []
+        lock = threading.Lock()
+
+        def work():
+            with pool.session(**credentials) as session:
+                with lock:
+                    self.assertFalse(session.in_use)
+                    session.in_use = True
+                    active.append(session)
+                    max_active.append(len(active))
+                time.sleep(0.02)
+                with lock:
+                    active.remove(session)
+                    session.in_use = False
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(max(max_active), 2)
+        self.assertEqual(FakeSession.created, 2)
+
+    def test_acquire_timeout(self):
+        pool = self.pool(max_per_user=1, acquire_timeout=0.05)
+
+        with pool.session(**credentials):
+            with self.assertRaises(PoolExhausted):
+                with pool.session(**credentials):
+                    pass
+
+        with pool.session(**credentials):
+            pass
+
+    def test_irods_uses_the_pool(self):
+        pool = self.pool()
+
+        with mock.patch("lib.upload_irods.session_pool", pool):
+            for _ in range(3):
+                with Irods("secret", "alice", api_address="irods.local").session() as session:
+                    pass
+
+        self.assertEqual(FakeSession.created, 1)
+        self.assertEqual(session.kwargs["authentication_scheme"], "pam")
+        self.assertEqual(session.kwargs["user"], "alice")
+
+
+if __name__ == '__main__':
+    unittest.main()
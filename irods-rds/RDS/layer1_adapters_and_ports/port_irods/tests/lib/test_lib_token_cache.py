@@ -0,0 +1,107 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from lib.token_cache import TokenCache
+from irods.exception import NetworkException, PAM_AUTH_PASSWORD_FAILED
+
+from lib.session_pool import SessionPool
+from lib.upload_irods import Irods
+
+
+class TestTokenCache(unittest.TestCase):
+    """Tests for the cache of token checks."""
+
+    def test_results_are_cached(self):
+        cache = TokenCache()
+        probe = mock.Mock(return_value=True)
+
+        self.assertTrue(cache.check(("address", "key"), probe))
+        self.assertTrue(cache.check(("address", "key"), probe))
+        self.assertEqual(probe.call_count, 1)
+
+        self.assertFalse(cache.check(("address", "other"), mock.Mock(return_value=False)))
+        self.assertFalse(cache.check(("address", "other"), probe))
+        self.assertEqual(probe.call_count, 1)
+
+    def test_invalid_tokens_expire_first(self):
+        cache = TokenCache(positive_ttl=10, negative_ttl=0.05)
+        cache.check(("address", "valid"), lambda: True)
+        cache.check(("address", "invalid"), lambda: False)
+        time.sleep(0.1)
+
+        probe = mock.Mock(return_value=True)
+        self.assertTrue(cache.check(("address", "valid"), probe))
+        self.assertTrue(cache.check(("address", "invalid"), probe))
+        self.assertEqual(probe.call_count, 1)
+
+    def test_errors_are_not_cached(self):
+        cache = TokenCache()
+
+        self.assertFalse(cache.check(("address", "key"), mock.Mock(side_effect=ConnectionError())))
+        self.assertTrue(cache.check(("address", "key"), lambda: True))
+
+    def test_concurrent_checks_share_one_probe(self):
+        cache = TokenCache()
+        calls = []
+
+        def probe():
+            calls.append(1)
+            time.sleep(0.1)
+            return True
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.check(("address", "key"), probe))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [True] * 5)
+        self.assertEqual(len(calls), 1)
+
+
+class FakeSession(object):
+    """Stands in for an iRODSSession, which logs in on the first call."""
+
+    def __init__(self, **kwargs):
+        self.zone = kwargs.get("zone")
+        self.password = kwargs.get("password")
+
+    def cleanup(self):
+        pass
+
+
+class TestIrodsCheckToken(unittest.TestCase):
+    """Tests for check_token, which only pings the catalog with a pooled session."""
+
+    def setUp(self):
+        self.pings = []
+
+    def ping(self, session):
+        self.pings.append(session.password)
+        if session.password == "down":
+            raise NetworkException("connection refused")
+        if session.password != "valid":
+            raise PAM_AUTH_PASSWORD_FAILED()
+
+    def check(self, api_key):
+        return Irods.check_token(api_key=api_key, user="alice", api_address="irods.local")
+
+    def test_check_token(self):
+        with mock.patch("lib.upload_irods.checked_tokens", TokenCache()), \
+                mock.patch("lib.upload_irods.session_pool", SessionPool(factory=FakeSession)), \
+                mock.patch("lib.upload_irods.ping", self.ping):
+            for _ in range(3):
+                self.assertTrue(self.check("valid"))
+                self.assertFalse(self.check("invalid"))
+
+            self.assertFalse(self.check("down"))
+            self.assertFalse(self.check("down"))
+
+        self.assertEqual(self.pings, ["valid", "invalid", "down", "down"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import base64
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from irods import keywords as kw
+
+from lib.session_pool import SessionPool
+from lib.transfer import put_stream, put_file, ChecksumMismatch
+from lib.upload_irods import Irods
+
+
+class NoRead(io.RawIOBase):
+    """A stream, which fails if it is read completely into memory."""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            raise AssertionError("stream was read at once")
+        return self.data.read(size)
+
+
+class FakeDataObjects(object):
+    """Stores data objects in memory and registers sha2 checksums like iRODS."""
+
+    def __init__(self, corrupt=False):
+        self.objects = {}
+        self.puts = []
+        self.opened = []
+        self.unlinked = []
+        self.corrupt = corrupt
+
+    def _store(self, path, data, options):
+        assert kw.REG_CHKSUM_KW in options
+        if self.corrupt:
+            data = data[:-1] + b"x"
+        self.objects[path] = data
+
+    def put(self, local_path, irods_path, num_threads=0, **options):
+        with open(local_path, "rb") as f:
+            self._store(irods_path, f.read(), options)
+        self.puts.append((irods_path, num_threads))
+
+    def open(self, path, mode, **options):
+        objects = self
+
+        class Handle(io.BytesIO):
+            def close(self):
+                objects._store(path, self.getvalue(), options)
+                super().close()
+
+        self.opened.append(path)
+        return Handle()
+
+    def get(self, path):
+        digest = hashlib.sha256(self.objects[path]).digest()
+        return mock.Mock(checksum="sha2:" + base64.b64encode(digest).decode())
+
+    def unlink(self, path, force=False):
+        self.unlinked.append(path)
+        del self.objects[path]
+
+
+class FakeSession(object):
+    def __init__(self, data_objects):
+        self.data_objects = data_objects
+
+    def cleanup(self):
+        pass
+
+
+class TestTransfer(unittest.TestCase):
+    """Tests for the upload of request streams to iRODS with a fake data object manager."""
+
+    def setUp(self):
+        self.data = os.urandom(300 * 1024)
+        self.data_objects = FakeDataObjects()
+        self.session = FakeSession(self.data_objects)
+
+    def test_small_stream_is_written_directly(self):
+        checksum = put_stream(self.session, NoRead(self.data), "/yoda/home/a.bin", size=len(self.data) + 100, threshold=1024 * 1024)
+
+        self.assertEqual(self.data_objects.objects["/yoda/home/a.bin"], self.data)
+        self.assertEqual(self.data_objects.opened, ["/yoda/home/a.bin"])
+        self.assertEqual(self.data_objects.puts, [])
+        self.assertEqual(checksum, "sha2:" + base64.b64encode(hashlib.sha256(self.data).digest()).decode())
+
+    def test_large_stream_is_put_in_parallel(self):
+        put_stream(self.session, NoRead(self.data), "/yoda/home/a.bin", threshold=100 * 1024, threads=8)
+
+        self.assertEqual(self.data_objects.objects["/yoda/home/a.bin"], self.data)
+        self.assertEqual(self.data_objects.puts, [("/yoda/home/a.bin", 8)])
+
+    def test_unknown_size_below_threshold_uses_one_thread(self):
+        put_stream(self.session, NoRead(self.data), "/yoda/home/a.bin", threshold=1024 * 1024, threads=8)
+
+        self.assertEqual(self.data_objects.puts, [("/yoda/home/a.bin", 1)])
+
+    def test_spool_is_removed(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            put_stream(self.session, NoRead(self.data), "/yoda/home/a.bin", threshold=0, spool_dir=spool_dir)
+
+            self.assertEqual(os.listdir(spool_dir), [])
+
+    def test_md5_checksum(self):
+        self.data_objects.get = lambda path: mock.Mock(checksum=hashlib.md5(self.data_objects.objects[path]).hexdigest())
+
+        put_stream(self.session, NoRead(self.data), "/yoda/home/a.bin", threshold=0)
+
+    def test_checksum_mismatch(self):
+        self.data_objects.corrupt = True
+
+        with self.assertRaises(ChecksumMismatch):
+            put_stream(self.session, NoRead(self.data), "/yoda/home/a.bin", threshold=0)
+
+    def test_put_file(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(self.data)
+            f.flush()
+
+            put_file(self.session, f.name, "/yoda/home/a.bin", threshold=100 * 1024, threads=3)
+
+        self.assertEqual(self.data_objects.puts, [("/yoda/home/a.bin", 3)])
+
+    def test_upload_removes_corrupt_object(self):
+        self.data_objects.corrupt = True
+        pool = SessionPool(factory=lambda **kwargs: self.session)
+
+        with mock.patch("lib.upload_irods.session_pool", pool):
+            result = Irods("secret", "alice", api_address="irods.local").upload_new_file_to_collection_internal(
+                "/yoda/home/project", "a.bin", file=NoRead(self.data)
+            )
+
+        self.assertIsNone(result)
+        self.assertEqual(self.data_objects.unlinked, ["/yoda/home/project/a.bin"])
+
+    def test_upload(self):
+        pool = SessionPool(factory=lambda **kwargs: self.session)
+
+        with mock.patch("lib.upload_irods.session_pool", pool):
+            result = Irods("secret", "alice", api_address="irods.local").upload_new_file_to_collection_internal(
+                "/yoda/home/project", "a.bin", file=NoRead(self.data), size=len(self.data)
+            )
+
+        self.assertEqual(result, {"success": True})
+        self.assertEqual(self.data_objects.objects["/yoda/home/project/a.bin"], self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()